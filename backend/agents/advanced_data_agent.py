@@ -2,11 +2,14 @@ import json
 import re
 import pandas as pd
 from typing import Dict, Any, List, AsyncGenerator, Optional
-from services.llm_factory import llm_factory
+from services.llm_factory import llm_factory, llm_scheduler
 from services.python_executor import python_executor
+from services.columnar_result import ColumnarResult
+from services.user_context import get_current_user_id
 from config import ModelProvider, DEFAULT_PROVIDER
 from utils.logger import logger
 from utils.prompt_templates import get_prompt
+from utils.prompt_builder import TokenCounter
 
 class AdvancedDataAgent:
     """
@@ -28,6 +31,8 @@ class AdvancedDataAgent:
         全链路分析流程：流式方案生成 + 静默代码执行
         """
         # 1. 准备上下文
+        if isinstance(df_input, ColumnarResult):
+            df_input = df_input.to_dataframe()
         if isinstance(df_input, dict):
             dataset_context = "【多表数据集变量】\n" if language == "zh" else "[Multi-table Dataset Variables]\n"
             for name, df in df_input.items():
@@ -117,12 +122,14 @@ class AdvancedDataAgent:
             if attempt > 0:
                 print(f"📡 [Agent] 发起重试请求自我修复 (Attempt {attempt})...")
                 
-            # 🚀流式输出：仅初次生成方案时让前端展示
-            async for chunk in llm.astream(messages):
-                content = chunk.content if hasattr(chunk, "content") else str(chunk)
-                full_response += content
-                if attempt == 0:
-                    yield {"event": "summary", "data": {"content": content}}
+            # 🚀流式输出：仅初次生成方案时让前端展示 (经调度器排队，与 SQL 对话共享供应商并发与 TPM 预算)
+            tokens = sum(TokenCounter.count(m["content"]) for m in messages)
+            async with llm_scheduler.slot(self.provider, self.model_name, user_id=get_current_user_id(), tokens=tokens):
+                async for chunk in llm.astream(messages):
+                    content = chunk.content if hasattr(chunk, "content") else str(chunk)
+                    full_response += content
+                    if attempt == 0:
+                        yield {"event": "summary", "data": {"content": content}}
 
             # 提取执行代码
             code_match = re.search(r"```python\n([\s\S]*?)```", full_response)
@@ -139,7 +146,8 @@ class AdvancedDataAgent:
                 exec_msg = "正在执行修复后的代码..." if language == "zh" else "Executing fixed code..."
             yield {"event": "thinking", "data": {"content": exec_msg}}
             
-            exec_result = python_executor.execute_analysis(df_input, ai_code)
+            # 在进程池中执行，长时间计算不会阻塞其他用户的流式响应
+            exec_result = await python_executor.run_analysis(df_input, ai_code)
             
             if exec_result["success"]:
                 break  # 运行成功，跳出重试循环
@@ -188,11 +196,14 @@ class AdvancedDataAgent:
 
     async def generate_ai_title(self, question: str, provider: str = None, model_name: str = None, language: str = "zh") -> str:
         """生成极简的会话标题"""
-        llm = llm_factory.get_langchain_model(provider=provider or self.provider, model_name=model_name or self.model_name, temperature=0)
+        provider, model_name = provider or self.provider, model_name or self.model_name
+        llm = llm_factory.get_langchain_model(provider=provider, model_name=model_name, temperature=0)
         prompt_tmpl = get_prompt("SESSION_TITLE", language)
         prompt = prompt_tmpl.format(question=question)
         try:
-            res = await llm.ainvoke(prompt)
+            async with llm_scheduler.slot(provider, model_name, user_id=get_current_user_id(),
+                                          tokens=TokenCounter.count(prompt)):
+                res = await llm.ainvoke(prompt)
             return res.content.strip()
         except:
             return "数据科学分析" if language == "zh" else "Data Science Analysis"
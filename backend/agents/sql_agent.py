@@ -1,17 +1,306 @@
 """
 SQL Agent 核心模块
 """
+import asyncio
+import hashlib
 import json
+import math
 import re
+import threading
 import httpx
-from typing import Dict, Any, Optional, List, AsyncGenerator
-from config import API_KEY, API_BASE_URL, CHAT_MODEL, REASONER_MODEL, MAX_RETRY_COUNT, ModelProvider, DEFAULT_PROVIDER
-from services.llm_factory import llm_factory
+from collections import Counter, OrderedDict
+from typing import Dict, Any, Optional, List, AsyncGenerator, Tuple
+from config import (
+    API_KEY, API_BASE_URL, CHAT_MODEL, REASONER_MODEL, MAX_RETRY_COUNT, ModelProvider, DEFAULT_PROVIDER,
+    SQL_SEMANTIC_CACHE_ENABLED, SQL_SEMANTIC_CACHE_THRESHOLD, SQL_SEMANTIC_CACHE_MAX_ENTRIES,
+    INTENT_CLASSIFIER_ENABLED, INTENT_CLASSIFIER_THRESHOLD
+)
+from services.llm_factory import llm_factory, llm_scheduler
+from services.user_context import get_current_user_id
+from services.llm_router import llm_router
+from services.metrics_service import metrics_service
 from services.schema_service import SchemaService
-from services.sql_executor import SQLExecutor
+from services.schema_retriever import SchemaRetriever
+from services.sql_executor import SQLExecutor, QueryResultCache
+from services.sql_rewriter import SQLRewriter
+from services.columnar_result import ColumnarResult
+from services.intent_classifier import intent_classifier
+from services.chart_builders import LocalChartBuilder
+from services.chart_downsampling import ChartDownsampler
 from utils.prompt_templates import get_prompt
+from utils.logger import logger, log_prompt
+from utils.prompt_builder import PromptBuilder, TokenCounter, get_token_budget
+
+
+class SemanticSQLCache:
+    """
+    问题 → SQL 的语义缓存 (LRU)
+    键：问题向量 + db_key + 表结构指纹 + 对话上下文摘要；值：执行成功过的 SQL、chart_type、viz_config。
+    追问 (如“那上海呢”) 依赖前文，只有上下文完全相同时才会命中；问题中的数字、引号内短语与筛选值也必须一致。
+    筛选值取自缓存 SQL 中出现在原问题里的字符串常量 (如 WHERE city = '北京' 中的“北京”)。
+    有嵌入模型时，措辞与语言的差异 (如“上个月各城市销售额”与 “last month's sales by city”) 交给向量相似度判断；
+    没有嵌入模型时退化为字符 n-gram 向量，并要求去掉虚词后的实体词完全一致 (相当于归一化后的精确匹配)。
+    在方案确认后查找，命中时跳过 SQL 生成的 LLM 调用，但 SQL 仍会重新执行以获取最新数据。
+    """
+
+    # 提问用字与虚词 (不区分查询对象)
+    _FILLER_CHARS = frozenset("的了吗呢吧啊呀么请帮我们你给一下看查询问显示列出统计是多少有哪些个各每所和与及")
+
+    def __init__(self, max_entries: int = SQL_SEMANTIC_CACHE_MAX_ENTRIES, threshold: float = SQL_SEMANTIC_CACHE_THRESHOLD):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self._entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _numbers(question: str) -> Tuple[str, ...]:
+        """问题中的数字 (年份、Top N 等) 必须完全一致，避免“2023年”命中“2024年”"""
+        return tuple(re.findall(r'\d+', question))
+
+    @staticmethod
+    def _entities(question: str) -> frozenset:
+        """
+        问题中的实体词 (引号内短语、英文单词、去掉虚词后的汉字)，n-gram 模式下必须一致，避免“北京销售额”命中“上海销售额”
+        没有分词器，汉字按单字比较；只忽略不影响查询含义的虚词与提问用字。
+        """
+        quoted = list(SemanticSQLCache._quoted(question))
+        words = [w.lower() for w in re.findall(r'[A-Za-z_][A-Za-z0-9_]*', question)]
+        chars = [c for c in re.findall(r'[\u4e00-\u9fff]', question) if c not in SemanticSQLCache._FILLER_CHARS]
+        return frozenset(quoted + words + chars)
+
+    @staticmethod
+    def _quoted(question: str) -> frozenset:
+        return frozenset(re.findall(r'[\'"“‘「]([^\'"”’」]+)[\'"”’」]', question))
+
+    @staticmethod
+    def _literals(sql: str, question: str) -> frozenset:
+        """SQL 中出现在问题原文里的字符串常量 (小写)，作为该条目的筛选值"""
+        lowered = question.lower()
+        values = (m.replace("''", "'").strip("%").strip().lower() for m in re.findall(r"'((?:[^']|'')*)'", sql))
+        return frozenset(v for v in values if len(v) >= 2 and v in lowered)
+
+    @staticmethod
+    def context_key(history_str: str, question: str = "") -> str:
+        """对话上下文摘要：空上下文为 ""；末尾的当前问题本身不计入"""
+        text = (history_str or "").strip()
+        current = f"用户: {question.strip()}"
+        if question and text.endswith(current):
+            text = text[:-len(current)].strip()
+        return hashlib.sha1(text.encode("utf-8")).hexdigest() if text else ""
+
+    @staticmethod
+    def _ngram_vector(question: str) -> Dict[str, float]:
+        text = re.sub(r'\s+', '', question.lower())
+        grams = Counter(text[i:i + 2] for i in range(max(len(text) - 1, 1)))
+        norm = math.sqrt(sum(v * v for v in grams.values())) or 1.0
+        return {g: v / norm for g, v in grams.items()}
+
+    @staticmethod
+    def _similarity(a: Any, b: Any) -> float:
+        if isinstance(a, dict):
+            return sum(v * b.get(k, 0.0) for k, v in a.items())
+        return sum(x * y for x, y in zip(a, b))
+
+    async def _embed(self, question: str) -> Tuple[str, Any]:
+        embedder = SchemaRetriever.get_embedder()
+        if embedder is not None:
+            try:
+                return "embedding", await asyncio.to_thread(embedder.embed_query, question)
+            except Exception as e:
+                logger.warning("⚠️ [SemanticCache] 问题向量化失败，退化为 n-gram: %s", e)
+        return "ngram", self._ngram_vector(question)
+
+    async def lookup(self, question: str, db_key: str, schema_fp: str, context: str = "") -> Optional[Dict[str, Any]]:
+        """返回命中的 {"sql", "chart_type", "viz_config", "question", "similarity"}，未命中返回 None"""
+        kind, vector = await self._embed(question)
+        numbers = self._numbers(question)
+        quoted = self._quoted(question)
+        entities = self._entities(question)
+        lowered = question.lower()
+        best_id, best_score = None, 0.0
+        with self._lock:
+            # 该库已缓存 SQL 用过的筛选值中，新问题提到了哪些 (多出或缺少筛选值都不能命中)
+            vocabulary = {v for e in self._entries.values() if e["db_key"] == db_key for v in e["literals"]}
+            values = frozenset(v for v in vocabulary if v in lowered)
+            for entry_id, entry in self._entries.items():
+                if entry["db_key"] != db_key or entry["kind"] != kind or entry["numbers"] != numbers:
+                    continue
+                if entry["schema_fp"] != schema_fp or entry["context"] != context:
+                    continue
+                if entry["quoted"] != quoted or entry["literals"] != values:
+                    continue
+                if kind == "ngram" and entry["entities"] != entities:
+                    continue
+                score = self._similarity(vector, entry["vector"])
+                if score > best_score:
+                    best_id, best_score = entry_id, score
+            if best_id is None or best_score < self.threshold:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best_id)
+            self.hits += 1
+            entry = self._entries[best_id]
+            return {
+                "sql": entry["sql"],
+                "chart_type": entry["chart_type"],
+                "viz_config": entry["viz_config"],
+                "question": entry["question"],
+                "similarity": round(best_score, 4)
+            }
+
+    async def store(
+        self, question: str, db_key: str, schema_fp: str, sql: str, chart_type: str,
+        viz_config: Dict[str, Any], context: str = ""
+    ) -> None:
+        kind, vector = await self._embed(question)
+        with self._lock:
+            # 同一上下文下的同一问题只保留最新的 SQL
+            for entry_id, entry in list(self._entries.items()):
+                if entry["db_key"] == db_key and entry["question"] == question and entry["context"] == context:
+                    del self._entries[entry_id]
+            self._next_id += 1
+            self._entries[self._next_id] = {
+                "question": question,
+                "db_key": db_key,
+                "schema_fp": schema_fp,
+                "kind": kind,
+                "vector": vector,
+                "numbers": self._numbers(question),
+                "quoted": self._quoted(question),
+                "literals": self._literals(sql, question),
+                "entities": self._entities(question),
+                "context": context,
+                "sql": sql,
+                "chart_type": chart_type,
+                "viz_config": viz_config or {}
+            }
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def evict_sql(self, sql: str) -> int:
+        """移除所有使用该 SQL 的条目 (用户点踩或执行失败时调用)，返回移除数量"""
+        target = QueryResultCache.normalize_sql(sql)
+        with self._lock:
+            doomed = [i for i, e in self._entries.items() if QueryResultCache.normalize_sql(e["sql"]) == target]
+            for entry_id in doomed:
+                del self._entries[entry_id]
+            self.evictions += len(doomed)
+        if doomed:
+            print(f"🧹 [SemanticCache] 已移除 {len(doomed)} 条缓存 SQL")
+        return len(doomed)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0
+            }
+
+
+semantic_sql_cache = SemanticSQLCache()
+
 
 class SQLAgent:
+    # 提示词前缀缓存命中统计 (进程级累计)
+    usage_totals: Dict[str, int] = {"requests": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0}
+
+    @staticmethod
+    def _prefix_cached_messages(system_msg: str, prefix: str, suffix: str) -> List[Dict[str, Any]]:
+        """
+        稳定部分 (系统指令 + 规则 + Schema) 放在最前面的 system 消息并标记 cache，
+        可变部分 (知识库 / 历史 / 问题) 放在 user 消息，便于命中供应商的前缀缓存
+        """
+        return [
+            {"role": "system", "content": f"{system_msg}\n\n{prefix}", "cache": True},
+            {"role": "user", "content": suffix}
+        ]
+
+    @staticmethod
+    def _to_openai_messages(messages: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+        """DeepSeek / OpenAI 对前缀自动缓存，去掉内部使用的 cache 标记"""
+        return [{"role": m["role"], "content": m["content"]} for m in messages]
+
+    @staticmethod
+    def _estimate_tokens(messages: List[Dict[str, Any]]) -> int:
+        """输入 token 估算 (用于调度器的 TPM 预算)"""
+        return sum(TokenCounter.count(m["content"]) for m in messages)
+
+    def _scheduler_slot(self, messages: List[Dict[str, Any]]):
+        """交由路由在计时前获取调度许可 (交互优先级)，排队时间不计入供应商延迟"""
+        user_id, tokens = get_current_user_id(), self._estimate_tokens(messages)
+        return lambda p, m: llm_scheduler.slot(p, m, user_id=user_id, tokens=tokens)
+
+    @staticmethod
+    def _to_lc_messages(messages: List[Dict[str, Any]], provider: str = None) -> List[Any]:
+        """转换为 LangChain 消息；Claude 需要显式的 cache_control 断点才会缓存前缀"""
+        from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
+        message_types = {"system": SystemMessage, "user": HumanMessage, "assistant": AIMessage}
+        lc_messages = []
+        for m in messages:
+            message_type = message_types.get(m["role"])
+            if message_type is None:
+                continue
+            content = m["content"]
+            if m.get("cache") and provider == ModelProvider.CLAUDE:
+                content = [{"type": "text", "text": content, "cache_control": {"type": "ephemeral"}}]
+            lc_messages.append(message_type(content=content))
+        return lc_messages
+
+    @staticmethod
+    def _usage_from_openai(usage: Any) -> Optional[Dict[str, int]]:
+        """OpenAI: prompt_tokens_details.cached_tokens；DeepSeek: prompt_cache_hit_tokens"""
+        if usage is None:
+            return None
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = getattr(details, "cached_tokens", None) if details is not None else None
+        if cached is None:
+            cached = getattr(usage, "prompt_cache_hit_tokens", None)
+        if cached is None:
+            cached = (getattr(usage, "model_extra", None) or {}).get("prompt_cache_hit_tokens")
+        return {
+            "prompt_tokens": getattr(usage, "prompt_tokens", 0) or 0,
+            "cached_tokens": cached or 0,
+            "completion_tokens": getattr(usage, "completion_tokens", 0) or 0,
+        }
+
+    @staticmethod
+    def _usage_from_langchain(usage_metadata: Optional[Dict[str, Any]]) -> Optional[Dict[str, int]]:
+        """LangChain usage_metadata：input_token_details.cache_read 为命中缓存的输入 token"""
+        if not usage_metadata:
+            return None
+        details = usage_metadata.get("input_token_details") or {}
+        return {
+            "prompt_tokens": usage_metadata.get("input_tokens", 0) or 0,
+            "cached_tokens": details.get("cache_read", 0) or 0,
+            "completion_tokens": usage_metadata.get("output_tokens", 0) or 0,
+        }
+
+    @classmethod
+    def _record_usage(cls, provider: str, model_name: str, usage: Optional[Dict[str, int]]):
+        if not usage:
+            return
+        metrics_service.add_tokens(usage["prompt_tokens"], usage["completion_tokens"])
+        cls.usage_totals["requests"] += 1
+        for key in ("prompt_tokens", "cached_tokens", "completion_tokens"):
+            cls.usage_totals[key] += usage.get(key, 0)
+        prompt_tokens = usage["prompt_tokens"]
+        hit_rate = usage["cached_tokens"] / prompt_tokens if prompt_tokens else 0
+        total_prompt = cls.usage_totals["prompt_tokens"]
+        total_rate = cls.usage_totals["cached_tokens"] / total_prompt if total_prompt else 0
+        logger.debug("💾 [Usage] %s/%s | 输入 %s (缓存命中 %s, %.0f%%) | 输出 %s | 累计命中率 %.0f%%",
+                     provider, model_name, prompt_tokens, usage["cached_tokens"], hit_rate * 100,
+                     usage["completion_tokens"], total_rate * 100)
+
     async def _chat_completion(
         self, 
         messages: List[Dict[str, str]], 
@@ -22,23 +311,27 @@ class SQLAgent:
         provider = provider or DEFAULT_PROVIDER
         model_name = model_name or llm_factory.get_model_params(provider)["model"]
         
-        # 🚀 调试：打印发送给模型的全量 Prompt
-        print(f"\n📤 [Prompt ({provider})] >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>")
-        import json
-        print(json.dumps(messages, ensure_ascii=False, indent=2))
-        print(f"<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<\n")
+        # 全量 Prompt 按采样率写入提示词日志 (后台线程序列化，不阻塞事件循环)
+        log_prompt(provider, messages)
+
+        # 主供应商超过 p95 延迟未返回时，对冲到下一个可用供应商
+        content, provider, model_name = await llm_router.call(
+            lambda p, m: self._invoke(messages, temperature, p, m), provider, model_name,
+            slot=self._scheduler_slot(messages)
+        )
+
+        logger.debug("📡 [%s/%s 响应]: %.200s", provider, model_name, content)
 
-        # 使用 LangChain 统一调用
+        return content
+
+    async def _invoke(self, messages: List[Dict[str, Any]], temperature: float, provider: str, model_name: str) -> str:
+        """对单个供应商发起一次非流式调用 (使用 LangChain 统一调用)"""
+        metrics_service.llm_call(provider, model_name)
         llm = llm_factory.get_langchain_model(provider=provider, model_name=model_name, temperature=temperature)
-        from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
-        
-        lc_messages = []
-        for m in messages:
-            if m["role"] == "system": lc_messages.append(SystemMessage(content=m["content"]))
-            elif m["role"] == "user": lc_messages.append(HumanMessage(content=m["content"]))
-            elif m["role"] == "assistant": lc_messages.append(AIMessage(content=m["content"]))
-        
+        lc_messages = self._to_lc_messages(messages, provider)
+
         response = await llm.ainvoke(lc_messages)
+        self._record_usage(provider, model_name, self._usage_from_langchain(getattr(response, "usage_metadata", None)))
         content = response.content
         # Gemini 思考模型返回 list 格式，提取 text 部分
         if isinstance(content, list):
@@ -46,14 +339,8 @@ class SQLAgent:
                 part.get("text", "") for part in content
                 if isinstance(part, dict) and part.get("type") == "text"
             )
-
-        print(f"\n📡 [{provider} 交互详情]")
-        print(f"📥 [模型]: {model_name}")
-        print(f"📥 [响应]: {str(content)[:200]}...")
-        print("-" * 30)
-
         return content
-    
+
     async def _chat_completion_stream(
         self,
         messages: List[Dict[str, str]],
@@ -69,13 +356,27 @@ class SQLAgent:
             params = llm_factory.get_model_params(provider, is_reasoning=enable_thinking)
             model_name = params["model"]
 
-        print(f"\n📤 [Prompt ({provider}) 流式请求] >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>")
-        import json
-        print(json.dumps(messages, ensure_ascii=False, indent=2))
-        print(f"<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<\n")
+        log_prompt(provider, messages, stream=True)
 
-        print(f"\n📡 [{provider} 流式请求发起]")
-        print(f"📤 [模型]: {model_name} | [思考模式]: {enable_thinking}")
+        # 首 token 到达前失败或超时时切换到下一个可用供应商
+        async for delta in llm_router.stream(
+            lambda p, m: self._provider_stream(messages, temperature, enable_thinking, p, m),
+            provider, model_name, is_reasoning=enable_thinking, slot=self._scheduler_slot(messages)
+        ):
+            metrics_service.mark_first_token()
+            yield delta
+
+    async def _provider_stream(
+        self,
+        messages: List[Dict[str, Any]],
+        temperature: float,
+        enable_thinking: bool,
+        provider: str,
+        model_name: str
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """对单个供应商发起一次流式调用"""
+        metrics_service.llm_call(provider, model_name)
+        logger.debug("📡 [%s 流式请求发起] 模型: %s | 思考模式: %s", provider, model_name, enable_thinking)
 
         full_content = ""
         full_reasoning = ""
@@ -85,11 +386,15 @@ class SQLAgent:
             client = llm_factory.get_openai_client(provider)
             stream = await client.chat.completions.create(
                 model=model_name,
-                messages=messages,
+                messages=self._to_openai_messages(messages),
                 temperature=temperature,
-                stream=True
+                stream=True,
+                stream_options={"include_usage": True}
             )
             async for chunk in stream:
+                # include_usage 时最后一个 chunk 只携带 usage，choices 为空
+                if getattr(chunk, "usage", None):
+                    self._record_usage(provider, model_name, self._usage_from_openai(chunk.usage))
                 if not chunk.choices:
                     continue
                 delta = chunk.choices[0].delta
@@ -110,14 +415,14 @@ class SQLAgent:
                 temperature=temperature,
                 streaming=True
             )
-            from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
-            lc_messages = []
-            for m in messages:
-                if m["role"] == "system": lc_messages.append(SystemMessage(content=m["content"]))
-                elif m["role"] == "user": lc_messages.append(HumanMessage(content=m["content"]))
-                elif m["role"] == "assistant": lc_messages.append(AIMessage(content=m["content"]))
+            from langchain_core.messages.ai import add_usage
+            lc_messages = self._to_lc_messages(messages, provider)
 
+            usage_metadata = None
             async for chunk in llm.astream(lc_messages):
+                if getattr(chunk, "usage_metadata", None):
+                    # 流式 usage 分散在多个 chunk 中 (如 Claude 首块为输入、末块为输出)，需累加
+                    usage_metadata = add_usage(usage_metadata, chunk.usage_metadata)
                 raw = chunk.content if hasattr(chunk, "content") else str(chunk)
                 if isinstance(raw, list):
                     content = "".join(
@@ -135,13 +440,13 @@ class SQLAgent:
                 if content:
                     full_content += content
                     yield {"reasoning_content": "", "content": content}
+            self._record_usage(provider, model_name, self._usage_from_langchain(usage_metadata))
 
         # 请求结束时日志
         if full_content:
-            print(f"\n📥 [{provider} 完整回答]:\n{full_content[:500]}...")
+            logger.debug("📥 [%s 完整回答]: %.500s", provider, full_content)
         if full_reasoning:
-            print(f"\n🤔 [{provider} 思考过程]:\n{full_reasoning[:200]}...")
-        print("-" * 30)
+            logger.debug("🤔 [%s 思考过程]: %.200s", provider, full_reasoning)
     async def generate_ai_title(self, question: str, provider: str = None, model_name: str = None, language: str = "zh") -> str:
         """根据对话内容生成专业标题 (AI 智能版)"""
         prompt_tmpl = get_prompt("SESSION_TITLE", language)
@@ -170,7 +475,33 @@ class SQLAgent:
         except:
             return question
 
-    async def _classify_intent(self, question: str, provider: str = None, model_name: str = None, language: str = "zh") -> str:
+    @staticmethod
+    def _prompt_budget(provider: Optional[str], model_name: Optional[str], enable_thinking: bool = False) -> int:
+        """当前调用模型的提示词 token 预算"""
+        if not model_name:
+            model_name = llm_factory.get_model_params(provider or DEFAULT_PROVIDER, is_reasoning=enable_thinking)["model"]
+        return get_token_budget(model_name)
+
+    async def _classify_intent(
+        self,
+        question: str,
+        provider: str = None,
+        model_name: str = None,
+        language: str = "zh",
+        tables: Optional[List[str]] = None,
+        after_plan: bool = False
+    ) -> str:
+        # 本地分类器 (规则 + 线性模型) 置信度足够时直接返回，省去一次 LLM 往返
+        if INTENT_CLASSIFIER_ENABLED:
+            try:
+                intent, confidence = intent_classifier.predict(question, tables, after_plan=after_plan)
+                if confidence >= INTENT_CLASSIFIER_THRESHOLD:
+                    logger.debug("⚡ [Intent] 本地分类: %s (置信度 %.2f)", intent, confidence)
+                    return intent
+                logger.debug("🤔 [Intent] 本地分类置信度不足 (%s, %.2f)，回退 LLM", intent, confidence)
+            except Exception as e:
+                logger.warning("⚠️ [Intent] 本地分类失败，回退 LLM: %s", e)
+
         prompt_tmpl = get_prompt("INTENT_CLASSIFICATION", language)
         prompt = prompt_tmpl.format(question=question)
         system_msg = "你是一个智能助手，负责根据用户问题判断其意图。" if language == "zh" else "You are an AI assistant classified user intent."
@@ -201,24 +532,24 @@ class SQLAgent:
         model_name: str = None,
         language: str = "zh"
     ) -> AsyncGenerator[Dict[str, Any], None]:
-        prompt_tmpl = get_prompt("SQL_GENERATION", language)
-        prompt = prompt_tmpl.format(
+        # 超出预算时依次压缩：历史对话 -> 知识库 -> Schema
+        builder = PromptBuilder("SQL_GENERATION", self._prompt_budget(provider, model_name, enable_thinking))
+        builder.section("schema", schema, priority=3, strategy="schema")
+        builder.section("knowledge_context", knowledge_context, priority=2, strategy="head")
+        builder.section("history", history, priority=1, strategy="history")
+        prefix, suffix = builder.build_split(
+            get_prompt("SQL_GENERATION_PREFIX", language),
+            get_prompt("SQL_GENERATION_SUFFIX", language),
             database_name=database_name,
             database_type_info=database_type_info,
             database_version=database_version,
-            schema=schema,
-            history=history,
             question=question,
-            knowledge_context=knowledge_context, # 🚀 注入提示词
             table_list_query=table_list_query,
             quote_char=quote_char
         )
 
         system_msg = "你是一个专业的数据分析助手。" if language == "zh" else "You are a professional data analysis assistant."
-        messages = [
-            {"role": "system", "content": system_msg},
-            {"role": "user", "content": prompt}
-        ]
+        messages = self._prefix_cached_messages(system_msg, prefix, suffix)
 
         full_content = ""
         async for delta in self._chat_completion_stream(messages, temperature=0.1, enable_thinking=enable_thinking, provider=provider, model_name=model_name):
@@ -243,21 +574,21 @@ class SQLAgent:
         model_name: str = None,
         language: str = "zh"
     ) -> AsyncGenerator[Dict[str, Any], None]:
-        prompt_tmpl = get_prompt("CHAT_RESPONSE", language)
-        prompt = prompt_tmpl.format(
-            history=history,
+        # 闲聊更依赖上下文：优先压缩表清单与知识库，最后才压缩历史对话
+        builder = PromptBuilder("CHAT_RESPONSE", self._prompt_budget(provider, model_name, enable_thinking))
+        builder.section("history", history, priority=3, strategy="history")
+        builder.section("knowledge_context", knowledge_context, priority=2, strategy="head")
+        builder.section("tables", tables, priority=1, strategy="head")
+        prefix, suffix = builder.build_split(
+            get_prompt("CHAT_RESPONSE_PREFIX", language),
+            get_prompt("CHAT_RESPONSE_SUFFIX", language),
             question=question,
-            knowledge_context=knowledge_context, # 🚀 注入提示词
             database_name=database_name,
-            database_type=database_type,
-            tables=tables
+            database_type=database_type
         )
 
         system_msg = "你是一个智能数据分析助手。" if language == "zh" else "You are an intelligent data analysis assistant."
-        messages = [
-            {"role": "system", "content": system_msg},
-            {"role": "user", "content": prompt}
-        ]
+        messages = self._prefix_cached_messages(system_msg, prefix, suffix)
 
         full_content = ""
         async for delta in self._chat_completion_stream(messages, temperature=0.7, enable_thinking=enable_thinking, provider=provider, model_name=model_name):
@@ -306,12 +637,13 @@ class SQLAgent:
         ]
 
         full_content = ""
-        async for delta in self._chat_completion_stream(messages, temperature=0.3, enable_thinking=enable_thinking, provider=provider, model_name=model_name):
-            if delta["reasoning_content"]:
-                yield {"type": "reasoning", "content": delta["reasoning_content"]}
-            if delta["content"]:
-                full_content += delta["content"]
-                yield {"type": "content", "content": delta["content"]}
+        with metrics_service.span("summary", provider=provider, model=model_name):
+            async for delta in self._chat_completion_stream(messages, temperature=0.3, enable_thinking=enable_thinking, provider=provider, model_name=model_name):
+                if delta["reasoning_content"]:
+                    yield {"type": "reasoning", "content": delta["reasoning_content"]}
+                if delta["content"]:
+                    full_content += delta["content"]
+                    yield {"type": "content", "content": delta["content"]}
         
         yield {"type": "done", "result": full_content or ""}
 
@@ -326,15 +658,40 @@ class SQLAgent:
     ) -> Dict[str, Any]:
         """
         根据 SQL 结果和 AI 建议生成图表配置
+        结果超过点数预算时先降采样，原始行数等信息记录在配置的 _meta 字段中
         """
+        if chart_type not in ("card", "table"):
+            sql_result, sample_meta = ChartDownsampler.downsample(sql_result, chart_type, viz_config)
+        else:
+            sample_meta = None
+        chart_config = await self._build_chart_config(sql_result, chart_type, viz_config, provider=provider, model_name=model_name, language=language)
+        if sample_meta and chart_config.get("series"):
+            chart_config["_meta"] = sample_meta
+        return chart_config
+
+    async def _build_chart_config(
+        self,
+        sql_result: Dict[str, Any],
+        chart_type: str,
+        viz_config: Optional[Dict[str, Any]] = None,
+        provider: str = None,
+        model_name: str = None,
+        language: str = "zh"
+    ) -> Dict[str, Any]:
         try:
             columns = sql_result.get("columns", [])
-            rows = sql_result.get("rows", [])
+            columnar = isinstance(sql_result, ColumnarResult)
+            rows = [] if columnar else sql_result.get("rows", [])
+            row_count = sql_result.get("row_count", len(rows))
             viz_config = viz_config or {}
-            
+
+            def column_values(col: str) -> List[Any]:
+                # 列式结果直接取列数组，避免逐行物化 dict
+                return sql_result.column(col) if columnar else [row.get(col) for row in rows]
+
             # 特殊处理：单行单列 -> card
-            if chart_type == "card" or (len(rows) == 1 and len(columns) == 1):
-                val = rows[0][columns[0]]
+            if chart_type == "card" or (row_count == 1 and len(columns) == 1):
+                val = column_values(columns[0])[0]
                 return {
                     "chart_type": "card",
                     "value": val,
@@ -345,7 +702,7 @@ class SQLAgent:
             if chart_type == "table":
                 return {"chart_type": "table"}
 
-            if not rows or not columns:
+            if not row_count or not columns:
                 return self._get_default_chart_config(chart_type)
 
             # 对于复杂图表，调用 AI 生成配置
@@ -354,6 +711,11 @@ class SQLAgent:
                 "treemap", "sankey", "boxplot", "waterfall", "candlestick"
             ]
             if chart_type in complex_types:
+                # 优先按列类型在本地构建，推断失败时才交给 LLM
+                local_config = LocalChartBuilder.build(sql_result, chart_type, viz_config)
+                if local_config:
+                    return local_config
+                print(f"🤔 [ChartBuilder] 无法在本地推断 {chart_type} 图表结构，回退 LLM 生成")
                 ai_config = await self._generate_complex_chart_config(sql_result, chart_type, provider=provider, model_name=model_name, language=language)
                 if ai_config:
                     return ai_config
@@ -364,28 +726,33 @@ class SQLAgent:
 
             if not x_axis or not y_axis:
                 # 降级：启发式匹配
-                numeric_cols = [c for c in columns if isinstance(rows[0].get(c), (int, float))]
+                if columnar:
+                    numeric_cols = [c for c in columns if sql_result.is_numeric(c)]
+                else:
+                    numeric_cols = [c for c in columns if isinstance(rows[0].get(c), (int, float))]
                 category_cols = [c for c in columns if c not in numeric_cols]
                 
                 x_axis = x_axis or (category_cols[0] if category_cols else columns[0])
                 y_axis = y_axis or (numeric_cols[0] if numeric_cols else (columns[1] if len(columns) > 1 else columns[0]))
 
             title = viz_config.get("title") or "分析结果"
+            x_values = [str(v) for v in column_values(x_axis)]
+            y_values = column_values(y_axis)
 
             if chart_type == "bar":
                 return {
                     "title": {"text": title, "left": "center", "top": 10},
                     "tooltip": {"trigger": "axis"},
                     "grid": {"top": 60, "bottom": 40, "left": 60, "right": 20},
-                    "xAxis": {"type": "category", "data": [str(row[x_axis]) for row in rows], "axisLabel": {"rotate": 30 if len(rows) > 5 else 0}},
+                    "xAxis": {"type": "category", "data": x_values, "axisLabel": {"rotate": 30 if row_count > 5 else 0}},
                     "yAxis": {"type": "value"},
-                    "series": [{"name": y_axis, "type": "bar", "data": [row[y_axis] for row in rows], "itemStyle": {"borderRadius": [4, 4, 0, 0]}}]
+                    "series": [{"name": y_axis, "type": "bar", "data": y_values, "itemStyle": {"borderRadius": [4, 4, 0, 0]}}]
                 }
             elif chart_type == "line" or chart_type == "area":
                 series_config = {
                     "name": y_axis, 
                     "type": "line", 
-                    "data": [row[y_axis] for row in rows], 
+                    "data": y_values, 
                     "smooth": True, 
                     "symbol": "circle", 
                     "symbolSize": 8
@@ -397,7 +764,7 @@ class SQLAgent:
                     "title": {"text": title, "left": "center", "top": 10},
                     "tooltip": {"trigger": "axis"},
                     "grid": {"top": 60, "bottom": 40, "left": 60, "right": 20},
-                    "xAxis": {"type": "category", "data": [str(row[x_axis]) for row in rows]},
+                    "xAxis": {"type": "category", "data": x_values},
                     "yAxis": {"type": "value"},
                     "series": [series_config]
                 }
@@ -411,7 +778,7 @@ class SQLAgent:
                         "radius": ["40%", "70%"],
                         "avoidLabelOverlap": True,
                         "itemStyle": {"borderRadius": 10, "borderColor": "#fff", "borderWidth": 2},
-                        "data": [{"value": row[y_axis], "name": str(row[x_axis])} for row in rows]
+                        "data": [{"value": y, "name": x} for x, y in zip(x_values, y_values)]
                     }]
                 }
             
@@ -465,12 +832,76 @@ class SQLAgent:
             print(f"❌ AI 复杂图表生成失败: {str(e)}")
             return None
 
+    async def _chart_config_stream(self, *args, **kwargs) -> AsyncGenerator[Dict[str, Any], None]:
+        """把 generate_chart_config 包装成单事件流，便于与摘要流合并"""
+        with metrics_service.span("chart_config", provider=kwargs.get("provider"), model=kwargs.get("model_name")):
+            config = await self.generate_chart_config(*args, **kwargs)
+        yield {"type": "chart", "config": config}
+
+    @staticmethod
+    async def _merge_streams(*streams: AsyncGenerator[Dict[str, Any], None]) -> AsyncGenerator[Dict[str, Any], None]:
+        """
+        并发消费多个异步生成器，按到达顺序产出事件
+        任一来源抛出异常时取消其余来源并向上抛出；调用方提前退出时同样会取消全部来源。
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        finished = object()
+
+        async def pump(stream):
+            try:
+                async for item in stream:
+                    await queue.put(item)
+            except BaseException as e:
+                await queue.put(e)
+                raise
+            finally:
+                await queue.put(finished)
+
+        tasks = [asyncio.create_task(pump(stream)) for stream in streams]
+        pending = len(tasks)
+        try:
+            while pending:
+                item = await queue.get()
+                if item is finished:
+                    pending -= 1
+                elif isinstance(item, BaseException):
+                    raise item
+                else:
+                    yield item
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
     def _get_default_chart_config(self, chart_type: str) -> Dict[str, Any]:
         return {
             "title": {"text": "暂无有效数据", "left": "center"},
             "series": []
         }
 
+    @staticmethod
+    def _follows_plan(history_str: str) -> bool:
+        """上一条助手回复是否为待用户确认的分析方案"""
+        turns = re.split(r'^(?=(?:用户|助手): )', history_str or "", flags=re.M)
+        for turn in reversed(turns):
+            if turn.startswith("助手: "):
+                lowered = turn.lower()
+                return any(marker in lowered for marker in ("方案", "思路", "关联逻辑", "plan"))
+        return False
+
+    @staticmethod
+    def _original_question(history_str: str, question: str) -> Tuple[str, str]:
+        """
+        确认执行方案时，取方案之前用户提出的原始问题 (作为语义缓存的键)
+        返回 (原始问题, 原始问题之前的对话)，后者用于计算缓存的上下文摘要。
+        """
+        history_str = history_str or ""
+        for match in reversed(list(re.finditer(r'^用户: (.+)$', history_str, re.M))):
+            if match.group(1).strip() != question.strip():
+                return match.group(1).strip(), history_str[:match.start()]
+        return question, history_str
+
     async def process_question_with_history(
         self,
         question: str,
@@ -479,19 +910,23 @@ class SQLAgent:
         enable_thinking: bool = False,
         provider: str = None,
         model_name: str = None,
-        language: str = "zh"
+        language: str = "zh",
+        include_total_count: bool = False,
+        db_key: Optional[str] = None
     ) -> AsyncGenerator[Dict[str, Any], None]:
-        """增强的处理逻辑：集成 SQL 引擎与 RAG 知识库"""
+        """增强的处理逻辑：集成 SQL 引擎与 RAG 知识库 (db_key 为空时使用当前请求绑定的数据库)"""
         from config import DATABASES
         
         # 统一 provider
         provider = provider or DEFAULT_PROVIDER
         
-        schema = await SchemaService.get_full_schema(include_sample=True)
-        tables = await SchemaService.get_table_names()
-        db_version = await SchemaService.get_db_version()
+        current_db_key = db_key or SchemaService.get_current_db_key()
+        labels = {"provider": provider, "model": model_name, "db_key": current_db_key}
+        with metrics_service.span("schema_load", **labels):
+            schema = await SchemaService.get_full_schema(include_sample=True, db_key=current_db_key)
+            tables = await SchemaService.get_table_names(current_db_key)
+            db_version = await SchemaService.get_db_version(current_db_key)
         
-        current_db_key = SchemaService.get_current_db_key()
         database_name = "业务数据库"
         db_type = "mysql"
         
@@ -515,7 +950,11 @@ class SQLAgent:
         yield {"event": "thinking", "data": {"content": "正在理解您的问题..."}}
         yield {"event": "schema_loaded", "data": {"tables": tables}}
 
-        intent = await self._classify_intent(question, provider=provider, model_name=model_name, language=language)
+        with metrics_service.span("intent", **labels):
+            intent = await self._classify_intent(
+                question, provider=provider, model_name=model_name, language=language, tables=tables,
+                after_plan=self._follows_plan(history_str)
+            )
 
         if intent == "chat":
             full_summary_reasoning = ""
@@ -544,30 +983,51 @@ class SQLAgent:
         # HITL 逻辑：分支 1 - 生成方案
         is_executing_after_plan = (intent == "confirmation")
         if intent == "sql_query" and not is_executing_after_plan:
-            plan_prompt_tmpl = get_prompt("PLAN_GENERATION", language)
-            plan_prompt = plan_prompt_tmpl.format(
-                database_name=database_name, 
-                database_type=db_type, 
-                schema=schema, 
-                history=history_str, 
-                question=question,
-                knowledge_context=knowledge_context
+            # 只把与问题相关的表放入提示词
+            plan_schema = await SchemaRetriever.build_schema_context(question, history_str, db_key=current_db_key)
+            builder = PromptBuilder("PLAN_GENERATION", self._prompt_budget(provider, model_name, enable_thinking))
+            builder.section("schema", plan_schema, priority=3, strategy="schema")
+            builder.section("knowledge_context", knowledge_context, priority=2, strategy="head")
+            builder.section("history", history_str, priority=1, strategy="history")
+            plan_prefix, plan_suffix = builder.build_split(
+                get_prompt("PLAN_GENERATION_PREFIX", language),
+                get_prompt("PLAN_GENERATION_SUFFIX", language),
+                database_name=database_name, database_type=db_type, question=question
             )
             full_plan = ""
             full_reasoning = ""
             system_msg = "你是一个专业的数据分析顾问。" if language == "zh" else "You are a professional data analysis consultant."
-            async for delta in self._chat_completion_stream([{"role": "system", "content": system_msg}, {"role": "user", "content": plan_prompt}], temperature=0.3, enable_thinking=enable_thinking, provider=provider, model_name=model_name):
-                if delta["reasoning_content"]:
-                    full_reasoning += delta["reasoning_content"]
-                    yield {"event": "model_thinking", "data": {"content": delta["reasoning_content"]}}
-                if delta["content"]:
-                    full_plan += delta["content"]
-                    yield {"event": "summary", "data": {"content": delta["content"]}}
+            plan_messages = self._prefix_cached_messages(system_msg, plan_prefix, plan_suffix)
+            with metrics_service.span("plan", **labels):
+                async for delta in self._chat_completion_stream(plan_messages, temperature=0.3, enable_thinking=enable_thinking, provider=provider, model_name=model_name):
+                    if delta["reasoning_content"]:
+                        full_reasoning += delta["reasoning_content"]
+                        yield {"event": "model_thinking", "data": {"content": delta["reasoning_content"]}}
+                    if delta["content"]:
+                        full_plan += delta["content"]
+                        yield {"event": "summary", "data": {"content": delta["content"]}}
             yield {"event": "done", "data": {"summary": full_plan, "reasoning": full_reasoning}}
             return
 
         # HITL 逻辑：分支 2 - 执行方案 (当用户说“可以”时)
         execution_question = question
+        if is_executing_after_plan:
+            cache_question, cache_history = self._original_question(history_str, question)
+        else:
+            cache_question, cache_history = question, history_str
+        cache_context = SemanticSQLCache.context_key(cache_history, cache_question)
+
+        # 语义缓存：方案确认后，相似的原始问题直接复用已验证的 SQL，跳过 SQL 生成 (仍会重新执行 SQL)
+        # 查找放在方案步骤之后，命中缓存不会绕过方案展示与用户确认
+        cached_sql = None
+        schema_fp = ""
+        if SQL_SEMANTIC_CACHE_ENABLED:
+            schema_fp = await SchemaService.get_schema_fingerprint(current_db_key)
+            cached_sql = await semantic_sql_cache.lookup(cache_question, current_db_key, schema_fp, context=cache_context)
+        if cached_sql:
+            logger.info("⚡ [SemanticCache] 命中相似问题 (相似度 %s): %s", cached_sql["similarity"], cached_sql["question"])
+            yield {"event": "thinking", "data": {"content": "命中相似问题缓存，复用已验证的 SQL..."}}
+
         if is_executing_after_plan:
             # 🚀 增强逻辑：从历史中提取“分析方案”
             plan_context = ""
@@ -588,23 +1048,40 @@ class SQLAgent:
             else:
                 execution_question = f"根据你刚才提出的分析方案，请立即生成最终的 SELECT SQL 语句并执行查询。严禁使用 DROP/CREATE 等操作。当前指令：{question}"
 
+        schema = None
         last_error = ""
-        for attempt in range(MAX_RETRY_COUNT + 1):
+        # 缓存的 SQL 执行失败时额外允许一次正常生成
+        max_attempts = MAX_RETRY_COUNT + 1 + (1 if cached_sql else 0)
+        for attempt in range(max_attempts):
+            using_cache = cached_sql is not None
+            sql_done = False
             try:
-                # 如果是重试，将错误信息加入上下文
-                current_question = execution_question
-                if last_error:
-                    current_question = f"你上一次生成的 SQL 执行失败了，错误信息是：{last_error}。请修正 SQL 并重新生成。只允许 SELECT 语句。原始指令：{execution_question}"
-
                 full_reasoning = ""
                 sql_response = None
-                # 🚀 关键：注入 SQL 生成过程
-                async for stream_event in self.generate_sql_stream(current_question, schema, history_str, knowledge_context, enable_thinking, database_name, database_type_info, db_version, table_list_query, quote_char, provider=provider, model_name=model_name, language=language):
-                    if stream_event["type"] == "reasoning":
-                        full_reasoning += stream_event["content"]
-                        yield {"event": "model_thinking", "data": {"content": stream_event["content"]}}
-                    elif stream_event["type"] == "done":
-                        sql_response = stream_event["result"]
+                if using_cache:
+                    sql_response = {
+                        "sql": cached_sql["sql"],
+                        "chart_type": cached_sql["chart_type"],
+                        "viz_config": cached_sql["viz_config"]
+                    }
+                else:
+                    if schema is None:
+                        # 只把与问题 (含已确认的方案) 相关的表放入 SQL 生成提示词
+                        schema = await SchemaRetriever.build_schema_context(execution_question, history_str, db_key=current_db_key)
+
+                    # 如果是重试，将错误信息加入上下文
+                    current_question = execution_question
+                    if last_error:
+                        current_question = f"你上一次生成的 SQL 执行失败了，错误信息是：{last_error}。请修正 SQL 并重新生成。只允许 SELECT 语句。原始指令：{execution_question}"
+
+                    # 🚀 关键：注入 SQL 生成过程
+                    with metrics_service.span("sql_generation", retries=attempt, **labels):
+                        async for stream_event in self.generate_sql_stream(current_question, schema, history_str, knowledge_context, enable_thinking, database_name, database_type_info, db_version, table_list_query, quote_char, provider=provider, model_name=model_name, language=language):
+                            if stream_event["type"] == "reasoning":
+                                full_reasoning += stream_event["content"]
+                                yield {"event": "model_thinking", "data": {"content": stream_event["content"]}}
+                            elif stream_event["type"] == "done":
+                                sql_response = stream_event["result"]
                 
                 if not sql_response: raise ValueError("未能生成有效的 SQL JSON 响应")
                 
@@ -617,17 +1094,47 @@ class SQLAgent:
                 yield {"event": "sql_generated", "data": {"sql": sql}}
                 yield {"event": "sql_executing", "data": {"content": "正在查询数据库..."}}
 
-                sql_result = await SQLExecutor.execute_sql(sql)
-                yield {"event": "sql_result", "data": sql_result}
-                
-                # 关键：传递 viz_config
-                chart_config = await self.generate_chart_config(sql_result, chart_type, viz_config, provider=provider, model_name=model_name, language=language)
-                yield {"event": "chart_ready", "data": {"option": chart_config, "chart_type": chart_config.get("chart_type", chart_type)}}
+                sql_result = None
+                streamed = False
+                with metrics_service.span("sql_execution", retries=attempt, **labels):
+                    async for exec_event in SQLExecutor.execute_sql_stream(
+                        sql,
+                        row_cap=SQLRewriter.cap_for_chart(chart_type),
+                        include_total=include_total_count,
+                        db_key=current_db_key
+                    ):
+                        if exec_event["type"] == "progress":
+                            # 逐批转发行数据，sql_result 不再一次性携带全部行
+                            offset = exec_event["row_count"] - len(exec_event["rows"])
+                            yield {"event": "sql_result_batch", "data": {
+                                "columns": exec_event["columns"], "rows": exec_event["rows"], "offset": offset
+                            }}
+                            streamed = True
+                            yield {"event": "sql_executing", "data": {"content": f"已读取 {exec_event['row_count']} 行数据...", "row_count": exec_event["row_count"]}}
+                        elif exec_event["type"] == "done":
+                            sql_result = exec_event["result"]
+                yield {"event": "sql_result", "data": SQLExecutor.result_meta(sql_result) if streamed else sql_result}
+                sql_done = True
+
+                # 执行成功且有数据的 SQL 才写入语义缓存
+                if SQL_SEMANTIC_CACHE_ENABLED and not using_cache and sql_result and sql_result.get("row_count"):
+                    await semantic_sql_cache.store(
+                        cache_question, current_db_key, schema_fp, sql, chart_type, viz_config, context=cache_context
+                    )
                 
+                # 图表配置与摘要互不依赖：并发生成，事件按到达顺序输出 (复杂图表的 LLM 调用不再阻塞摘要首 token)
                 formatted_result = SQLExecutor.format_sql_result(sql_result)
+                chart_config = None
                 summary = ""
-                async for stream_event in self.generate_summary_stream(formatted_result, chart_type, enable_thinking, provider=provider, model_name=model_name, language=language):
-                    if stream_event["type"] == "reasoning":
+                async for stream_event in self._merge_streams(
+                    self._chart_config_stream(sql_result, chart_type, viz_config, provider=provider, model_name=model_name, language=language),
+                    self.generate_summary_stream(formatted_result, chart_type, enable_thinking, provider=provider, model_name=model_name, language=language)
+                ):
+                    if stream_event["type"] == "chart":
+                        # 关键：传递 viz_config
+                        chart_config = stream_event["config"]
+                        yield {"event": "chart_ready", "data": {"option": chart_config, "chart_type": chart_config.get("chart_type", chart_type)}}
+                    elif stream_event["type"] == "reasoning":
                         yield {"event": "model_thinking", "data": {"content": stream_event["content"]}}
                     elif stream_event["type"] == "content":
                         summary += stream_event["content"]
@@ -645,6 +1152,13 @@ class SQLAgent:
                 break
 
             except Exception as e:
+                if using_cache and not sql_done:
+                    # 缓存的 SQL 已失效：移除后按正常流程重新生成
+                    logger.warning("⚠️ [SemanticCache] 缓存 SQL 执行失败，改为重新生成: %s", e)
+                    semantic_sql_cache.evict_sql(cached_sql["sql"])
+                    cached_sql = None
+                    continue
+
                 last_error = str(e)
                 print(f"❌ [Agent] SQL 执行尝试 {attempt + 1} 失败: {last_error}")
                 
@@ -654,6 +1168,6 @@ class SQLAgent:
                     yield {"event": "error", "data": {"message": f"分析失败：请求的表不存在。错误详情: {last_error}"}}
                     return
 
-                if attempt >= MAX_RETRY_COUNT:
+                if attempt >= max_attempts - 1:
                     yield {"event": "error", "data": {"message": f"分析失败（已达最大重试次数）: {last_error}"}}
                     return
@@ -60,6 +60,7 @@ class ModelProvider:
     OPENAI = "openai"
     GEMINI = "gemini"
     CLAUDE = "claude"
+    MOCK = "mock"  # 离线回放录制响应，用于基准测试
 
 # 默认供应商
 DEFAULT_PROVIDER = os.getenv("DEFAULT_LLM_PROVIDER", ModelProvider.DEEPSEEK)
@@ -76,6 +77,16 @@ MYSQL_USER = os.getenv("MYSQL_USER", "root")
 MYSQL_PASSWORD = os.getenv("MYSQL_PASSWORD", "root")
 MYSQL_SESSION_DATABASE = os.getenv("MYSQL_SESSION_DATABASE", "data_pulse_sessions")
 
+# 连接池默认参数 (可在 DATABASES 每个条目中单独覆盖：
+# pool_size / max_overflow / pool_timeout / pool_recycle / statement_timeout_ms / warmup_connections)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", 30))  # 等待空闲连接的最长时间（秒）
+DB_POOL_RECYCLE = 3600
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", 0))  # 会话级语句超时，0 表示不设置
+DB_POOL_WARMUP = int(os.getenv("DB_POOL_WARMUP", 0))  # 启动时预热的连接数
+DB_CANCEL_TIMEOUT = int(os.getenv("DB_CANCEL_TIMEOUT", 5))  # 发送 KILL QUERY / pg_cancel_backend 的最长等待（秒）
+
 # 多数据库配置 (移除 SQLite)
 DATABASES = {
     "classic_business": {
@@ -110,6 +121,96 @@ DATABASES = {
 # 默认业务数据库 ID (设为 None 强制用户手动选择)
 DEFAULT_BUSINESS_DB = None
 
+# Schema 构建时并发抓取样本数据的最大并发数
+SCHEMA_SAMPLE_CONCURRENCY = int(os.getenv("SCHEMA_SAMPLE_CONCURRENCY", 4))
+# Schema 磁盘缓存目录与指纹校验间隔（秒）
+SCHEMA_CACHE_DIR = DATA_DIR / "schema_cache"
+SCHEMA_CACHE_CHECK_INTERVAL = int(os.getenv("SCHEMA_CACHE_CHECK_INTERVAL", 60))
+# 样本数据是业务数据，默认只保存在内存中；设为 true 时才一并写入磁盘缓存
+SCHEMA_CACHE_PERSIST_SAMPLES = os.getenv("SCHEMA_CACHE_PERSIST_SAMPLES", "false").lower() == "true"
+
+# Schema 检索：表数量超过阈值时只把与问题相关的 top-k 张表 (及其外键邻居) 放入提示词
+SCHEMA_RETRIEVAL_ENABLED = os.getenv("SCHEMA_RETRIEVAL_ENABLED", "true").lower() == "true"
+SCHEMA_RETRIEVAL_MIN_TABLES = int(os.getenv("SCHEMA_RETRIEVAL_MIN_TABLES", 12))
+SCHEMA_RETRIEVAL_TOP_K = int(os.getenv("SCHEMA_RETRIEVAL_TOP_K", 6))
+SCHEMA_RETRIEVAL_MAX_TABLES = int(os.getenv("SCHEMA_RETRIEVAL_MAX_TABLES", 15))  # 含外键邻居的上限
+SCHEMA_RETRIEVAL_USE_EMBEDDINGS = os.getenv("SCHEMA_RETRIEVAL_USE_EMBEDDINGS", "true").lower() == "true"
+
+# 本地意图分类器：置信度不低于阈值时跳过 LLM 意图识别
+INTENT_CLASSIFIER_ENABLED = os.getenv("INTENT_CLASSIFIER_ENABLED", "true").lower() == "true"
+INTENT_CLASSIFIER_THRESHOLD = float(os.getenv("INTENT_CLASSIFIER_THRESHOLD", 0.8))
+INTENT_MODEL_PATH = DATA_DIR / "intent_model.json"
+
+# 语义 SQL 缓存：方案确认后，相似问题直接复用已验证的 SQL (跳过 SQL 生成，方案与确认步骤不变)
+SQL_SEMANTIC_CACHE_ENABLED = os.getenv("SQL_SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+SQL_SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SQL_SEMANTIC_CACHE_THRESHOLD", 0.93))
+SQL_SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SQL_SEMANTIC_CACHE_MAX_ENTRIES", 500))
+
+# 提示词 token 预算 (按模型名前缀最长匹配，未匹配时使用默认值)：超出时按优先级压缩历史对话 / 知识库 / Schema
+PROMPT_TOKEN_BUDGET_DEFAULT = int(os.getenv("PROMPT_TOKEN_BUDGET_DEFAULT", 24000))
+PROMPT_TOKEN_BUDGETS = {
+    "deepseek": 24000,
+    "gpt-4o": 32000,
+    "gemini": 48000,
+    "claude": 32000,
+}
+PROMPT_TOKENIZER = os.getenv("PROMPT_TOKENIZER", "cl100k_base")  # tiktoken 编码名，设为 heuristic 则只用字符估算
+
+# 用户自定义 API Key 的 LLM 客户端缓存 (LRU + 空闲 TTL)，复用连接池，淘汰时关闭
+LLM_CLIENT_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CLIENT_CACHE_MAX_ENTRIES", 64))
+LLM_CLIENT_CACHE_TTL = int(os.getenv("LLM_CLIENT_CACHE_TTL", 900))  # 空闲超过该时长 (秒) 即淘汰
+LLM_CLIENT_CLOSE_DELAY = int(os.getenv("LLM_CLIENT_CLOSE_DELAY", 1800))  # 淘汰后延迟关闭，等待仍在进行的流式请求结束 (与流式读超时一致)
+
+# LLM 共享 HTTP 连接池 (按供应商主机共享，需安装 h2 才能启用 HTTP/2)
+LLM_HTTP2_ENABLED = os.getenv("LLM_HTTP2_ENABLED", "true").lower() == "true"
+LLM_HTTP_MAX_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", 100))
+LLM_HTTP_MAX_KEEPALIVE = int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", 20))
+LLM_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("LLM_HTTP_KEEPALIVE_EXPIRY", 120))  # 空闲连接保留时长 (秒)
+
+# LLM 多供应商路由：熔断、非流式请求对冲、流式请求首 token 前故障转移
+LLM_FAILOVER_ENABLED = os.getenv("LLM_FAILOVER_ENABLED", "true").lower() == "true"
+LLM_FAILOVER_PROVIDERS = [p.strip() for p in os.getenv("LLM_FAILOVER_PROVIDERS", "deepseek,openai,claude,gemini").split(",") if p.strip()]
+LLM_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("LLM_CIRCUIT_FAILURE_THRESHOLD", 3))  # 连续失败次数达到后熔断
+LLM_CIRCUIT_COOLDOWN = float(os.getenv("LLM_CIRCUIT_COOLDOWN", 60))  # 熔断后多久 (秒) 放行一次试探请求
+LLM_HEDGE_DELAY_MIN = float(os.getenv("LLM_HEDGE_DELAY_MIN", 1.0))  # 对冲等待下限 (秒)，实际取主供应商 p95 延迟
+LLM_HEDGE_DELAY_MAX = float(os.getenv("LLM_HEDGE_DELAY_MAX", 4.0))  # 对冲等待上限 (秒)，样本不足时使用
+LLM_FIRST_TOKEN_TIMEOUT = float(os.getenv("LLM_FIRST_TOKEN_TIMEOUT", 30))  # 流式请求等待首 token 的超时 (秒)
+LLM_LATENCY_WINDOW = int(os.getenv("LLM_LATENCY_WINDOW", 100))  # 每个模型保留的最近延迟样本数
+
+# LLM 调度：按供应商 / 模型限制并发与每分钟 token (TPM)，交互请求优先于后台报告任务，同优先级按用户轮转
+LLM_PROVIDER_CONCURRENCY_DEFAULT = int(os.getenv("LLM_PROVIDER_CONCURRENCY_DEFAULT", 16))
+LLM_PROVIDER_CONCURRENCY = {
+    "deepseek": int(os.getenv("DEEPSEEK_MAX_CONCURRENCY", 32)),
+    "openai": int(os.getenv("OPENAI_MAX_CONCURRENCY", 32)),
+}
+LLM_MODEL_CONCURRENCY = int(os.getenv("LLM_MODEL_CONCURRENCY", 16))  # 单个模型的并发上限
+LLM_PROVIDER_TPM = {  # 0 表示不限制，按账户等级配置
+    "deepseek": int(os.getenv("DEEPSEEK_TPM", 0)),
+    "openai": int(os.getenv("OPENAI_TPM", 0)),
+    "claude": int(os.getenv("CLAUDE_TPM", 0)),
+    "gemini": int(os.getenv("GEMINI_TPM", 0)),
+}
+LLM_BACKGROUND_MAX_SHARE = float(os.getenv("LLM_BACKGROUND_MAX_SHARE", 0.5))  # 后台任务最多占用供应商并发的比例
+
+# Mock LLM (ModelProvider.MOCK)：回放录制的响应，模拟首 token 延迟与输出速率
+MOCK_LLM_RESPONSES_PATH = Path(os.getenv("MOCK_LLM_RESPONSES_PATH", Path(__file__).parent / "tests" / "fixtures" / "mock_llm_responses.json"))
+MOCK_LLM_TTFT = float(os.getenv("MOCK_LLM_TTFT", 0.4))  # 首 token 延迟 (秒)
+MOCK_LLM_TOKENS_PER_SECOND = float(os.getenv("MOCK_LLM_TOKENS_PER_SECOND", 60))
+
+# 分阶段耗时指标 (GET /api/observability/metrics，Prometheus 文本格式)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+METRICS_LATENCY_BUCKETS = [
+    float(b) for b in os.getenv("METRICS_LATENCY_BUCKETS", "0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10,30,60").split(",")
+]
+
+# 数据科学家模式的代码执行进程池 (工作进程预先导入 pandas / numpy / matplotlib / seaborn)
+PYTHON_EXECUTOR_WORKERS = int(os.getenv("PYTHON_EXECUTOR_WORKERS", min(4, os.cpu_count() or 1)))  # 0 表示在线程中执行 (不隔离)
+PYTHON_EXECUTOR_PREFORK = os.getenv("PYTHON_EXECUTOR_PREFORK", "true").lower() == "true"  # 启动时预先创建工作进程
+PYTHON_EXECUTOR_TIMEOUT = float(os.getenv("PYTHON_EXECUTOR_TIMEOUT", 60))  # 单次执行的墙钟超时 (秒)
+PYTHON_EXECUTOR_CPU_SECONDS = int(os.getenv("PYTHON_EXECUTOR_CPU_SECONDS", 60))  # 单次执行的 CPU 时间上限 (秒)
+PYTHON_EXECUTOR_MAX_RSS_MB = int(os.getenv("PYTHON_EXECUTOR_MAX_RSS_MB", 1024))  # 工作进程常驻内存上限
+PYTHON_EXECUTOR_MAX_JOBS = int(os.getenv("PYTHON_EXECUTOR_MAX_JOBS", 200))  # 每个工作进程执行多少次后回收 (防止泄漏累积)
+
 # 内存配置
 MEMORY_WINDOW_SIZE = 10  # 保留最近 N 轮对话
 
@@ -128,11 +229,48 @@ ALLOWED_ORIGINS = [
 MAX_SQL_EXECUTION_TIME = 30  # SQL 最长执行时间（秒）
 MAX_RETRY_COUNT = 2  # SQL 执行失败最大重试次数
 
+# SQL 查询结果缓存
+SQL_RESULT_CACHE_ENABLED = os.getenv("SQL_RESULT_CACHE_ENABLED", "true").lower() == "true"
+SQL_RESULT_CACHE_TTL = int(os.getenv("SQL_RESULT_CACHE_TTL", 300))  # 缓存有效期（秒）
+SQL_RESULT_CACHE_MAX_ENTRIES = int(os.getenv("SQL_RESULT_CACHE_MAX_ENTRIES", 256))  # LRU 最大条目数
+SQL_RESULT_CACHE_MAX_ROWS = 5000  # 超过该行数的结果不进入缓存，防止内存膨胀
+
+# SQL 流式读取 (服务端游标)
+SQL_STREAM_BATCH_SIZE = 500  # 每批读取行数
+SQL_MAX_RESULT_ROWS = int(os.getenv("SQL_MAX_RESULT_ROWS", 100000))  # 单次查询最多读取行数
+SQL_MAX_RESULT_BYTES = int(os.getenv("SQL_MAX_RESULT_BYTES", 64 * 1024 * 1024))  # 单次查询最多读取字节数 (估算)
+# 列式结果：列名只传一次，sql_result 事件与 messages.data 使用 {columns, data: [[...]]} 紧凑格式
+# (需前端支持该格式，默认关闭)
+SQL_RESULT_COLUMNAR = os.getenv("SQL_RESULT_COLUMNAR", "false").lower() == "true"
+
+# LIMIT 下推：按图表类型限制最外层返回行数 (摘要只看前 50 行，图表只需有限的点)
+SQL_ROW_CAP_DEFAULT = int(os.getenv("SQL_ROW_CAP_DEFAULT", 1000))
+SQL_ROW_CAPS_BY_CHART = {
+    "card": 10,
+    "pie": 100,
+    "funnel": 100,
+    "bar": 200,
+    "radar": 200,
+    "table": 500,
+    "line": 5000,
+    "area": 5000,
+    "scatter": 5000,
+}
+
+# 图表降采样：结果超过点数预算时在构建图表前缩减数据 (原始行数记录在图表配置的 _meta 中)
+CHART_MAX_POINTS = int(os.getenv("CHART_MAX_POINTS", 2000))  # line / area / scatter 的最大点数 (LTTB / 网格抽稀)
+CHART_MAX_CATEGORIES = int(os.getenv("CHART_MAX_CATEGORIES", 30))  # bar / pie 的最大分类数 (top-N + 其他)
+CHART_HEATMAP_MAX_BINS = int(os.getenv("CHART_HEATMAP_MAX_BINS", 40))  # heatmap 每个坐标轴的最大分箱数
+
 # 频率限制
 RATE_LIMIT_REQUESTS = 10000  # 增大限制以禁用频率拦截
 RATE_LIMIT_WINDOW = 60
 
 # 日志配置
-LOG_LEVEL = "DEBUG"  # 日志级别: DEBUG, INFO, WARNING, ERROR, CRITICAL
+LOG_LEVEL = os.getenv("LOG_LEVEL", "DEBUG")  # 日志级别: DEBUG, INFO, WARNING, ERROR, CRITICAL
 LOG_FILE = Path(__file__).parent.parent / "logs" / "app.log"  # 日志文件路径
 LOG_JSON_FORMAT = False  # 是否使用 JSON 格式日志
+# LLM 提示词转储：按比例采样写入独立的滚动日志 (与 app.log 同目录的 llm_prompts.log)，0 表示关闭
+PROMPT_LOG_SAMPLE_RATE = float(os.getenv("PROMPT_LOG_SAMPLE_RATE", 0.05))
+PROMPT_LOG_MAX_BYTES = int(os.getenv("PROMPT_LOG_MAX_BYTES", 10 * 1024 * 1024))
+PROMPT_LOG_BACKUP_COUNT = int(os.getenv("PROMPT_LOG_BACKUP_COUNT", 5))
@@ -13,6 +13,7 @@ from sqlalchemy import delete as sqlalchemy_delete
 from config import (
     MYSQL_HOST, MYSQL_PORT, MYSQL_USER, MYSQL_PASSWORD, MYSQL_SESSION_DATABASE
 )
+from services.metrics_service import metrics_service
 
 Base = declarative_base()
 
@@ -358,6 +359,10 @@ class SessionDatabase:
             return result.scalar_one_or_none()
 
     async def create_message(self, message_data: Dict[str, Any]) -> str:
+        with metrics_service.span("db_persist"):
+            return await self._create_message(message_data)
+
+    async def _create_message(self, message_data: Dict[str, Any]) -> str:
         message_id = message_data.get("id", str(uuid.uuid4()))
         parent_id = message_data.get("parent_id")
         session_id = message_data.get("session_id")
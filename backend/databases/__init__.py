@@ -1,4 +1,4 @@
 from .database_manager import DatabaseManager, DatabaseType
-from .base_adapter import BaseDatabaseAdapter
+from .base_adapter import BaseDatabaseAdapter, ResultBatch
 
-__all__ = ["DatabaseManager", "DatabaseType", "BaseDatabaseAdapter"]
+__all__ = ["DatabaseManager", "DatabaseType", "BaseDatabaseAdapter", "ResultBatch"]
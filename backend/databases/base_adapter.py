@@ -1,8 +1,18 @@
+import asyncio
+import time
 from abc import ABC, abstractmethod
-from typing import Any, Dict, List, Optional
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, NamedTuple, Optional, Tuple
 from pydantic import BaseModel
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine, AsyncConnection
-from sqlalchemy import text, inspect, MetaData
+from sqlalchemy import text, inspect, MetaData, event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import NullPool
+from config import (
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE,
+    DB_STATEMENT_TIMEOUT_MS, DB_POOL_WARMUP, DB_CANCEL_TIMEOUT
+)
 
 
 class DatabaseType:
@@ -16,12 +26,50 @@ class ColumnInfo(BaseModel):
     type: str
     nullable: bool = True
     primary_key: bool = False
+    default: Optional[str] = None
+    extra: Optional[str] = None
+    comment: Optional[str] = None
+
+
+class ForeignKeyInfo(BaseModel):
+    name: str
+    columns: List[str]
+    referred_table: str
+    referred_columns: List[str]
 
 
 class TableInfo(BaseModel):
     name: str
     columns: List[ColumnInfo]
     row_count: Optional[int] = None
+    comment: Optional[str] = None
+    foreign_keys: List[ForeignKeyInfo] = []
+
+
+class ResultBatch(NamedTuple):
+    """流式查询的一批结果 (行以元组形式返回，避免逐行构造 dict)"""
+    columns: List[str]
+    rows: List[Tuple[Any, ...]]
+    truncated: bool = False
+
+
+def _estimate_row_bytes(row: Tuple[Any, ...]) -> int:
+    """粗略估算一行数据占用的字节数 (用于结果大小上限)"""
+    size = 0
+    for value in row:
+        if isinstance(value, (str, bytes)):
+            size += len(value)
+        else:
+            size += 8
+    return size
+
+
+def table_filter(column: str, table_names: Optional[List[str]]) -> Tuple[str, Dict[str, Any]]:
+    """只查询指定表的目录查询条件 (" AND column IN (:t0, ...)") 与绑定参数；table_names 为 None 时不过滤"""
+    if table_names is None:
+        return "", {}
+    params = {f"t{i}": name for i, name in enumerate(table_names)}
+    return f" AND {column} IN (" + ", ".join(f":{k}" for k in params) + ")", params
 
 
 class BaseDatabaseAdapter(ABC):
@@ -30,24 +78,201 @@ class BaseDatabaseAdapter(ABC):
     def __init__(self, config: Dict[str, Any]):
         self.config = config
         self.engine: Optional[AsyncEngine] = None
+        # 取消查询专用引擎 (不走连接池，连接池占满时也能发出取消语句)
+        self._cancel_engine: Optional[AsyncEngine] = None
+        self._cancel_tasks: set = set()
         self._connected = False
+        self.pool_size = int(config.get("pool_size", DB_POOL_SIZE))
+        self.max_overflow = int(config.get("max_overflow", DB_MAX_OVERFLOW))
+        self.pool_timeout = int(config.get("pool_timeout", DB_POOL_TIMEOUT))
+        self.pool_recycle = int(config.get("pool_recycle", DB_POOL_RECYCLE))
+        self.statement_timeout_ms = int(config.get("statement_timeout_ms", DB_STATEMENT_TIMEOUT_MS))
+        self.warmup_connections = int(config.get("warmup_connections", DB_POOL_WARMUP))
+        self._reset_pool_stats()
 
     @abstractmethod
     def get_connection_string(self) -> str:
         """获取 SQLAlchemy 连接字符串"""
         pass
 
+    def get_connect_args(self) -> Dict[str, Any]:
+        """驱动级连接参数 (子类可覆盖，例如 asyncpg 的 server_settings)"""
+        return {}
+
+    def get_session_init_statements(self) -> List[str]:
+        """每个新建物理连接上执行的会话级语句 (子类可覆盖，例如 MySQL 的 MAX_EXECUTION_TIME)"""
+        return []
+
+    def get_backend_id_sql(self) -> Optional[str]:
+        """查询当前会话服务端连接 ID 的语句 (子类覆盖；返回 None 表示不支持服务端取消)"""
+        return None
+
+    def get_cancel_sql(self, backend_id: int) -> Optional[str]:
+        """取消指定会话正在执行语句的 SQL (子类覆盖)"""
+        return None
+
+    def _reset_pool_stats(self) -> None:
+        self._wait_count = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._wait_recent: deque = deque(maxlen=200)
+        self._pool_timeouts = 0
+        self._connections_created = 0
+
+    def _install_pool_listeners(self) -> None:
+        """在物理连接建立时执行会话级初始化语句，并统计新建连接数"""
+        init_statements = self.get_session_init_statements()
+        backend_id_sql = self.get_backend_id_sql()
+
+        @event.listens_for(self.engine.sync_engine, "connect")
+        def _on_connect(dbapi_connection, connection_record):
+            self._connections_created += 1
+            if not init_statements and not backend_id_sql:
+                return
+            cursor = dbapi_connection.cursor()
+            try:
+                for statement in init_statements:
+                    cursor.execute(statement)
+                if backend_id_sql:
+                    # 记录服务端连接 ID，查询超时或客户端断开时据此取消语句
+                    cursor.execute(backend_id_sql)
+                    row = cursor.fetchone()
+                    if row:
+                        connection_record.info["backend_id"] = row[0]
+            finally:
+                cursor.close()
+
+    async def _get_backend_id(self, conn: AsyncConnection) -> Optional[int]:
+        try:
+            raw = await conn.get_raw_connection()
+            return raw.info.get("backend_id")
+        except Exception:
+            return None
+
+    async def cancel_backend(self, backend_id: int) -> bool:
+        """在独立连接上取消指定会话正在执行的语句 (MySQL KILL QUERY / PostgreSQL pg_cancel_backend)"""
+        cancel_sql = self.get_cancel_sql(backend_id)
+        if not cancel_sql or not self.engine:
+            return False
+        if self._cancel_engine is None:
+            self._cancel_engine = create_async_engine(
+                self.get_connection_string(),
+                poolclass=NullPool,
+                connect_args=self.get_connect_args()
+            )
+
+        async def _cancel():
+            async with self._cancel_engine.connect() as conn:
+                await conn.execute(text(cancel_sql))
+
+        try:
+            await asyncio.wait_for(_cancel(), timeout=DB_CANCEL_TIMEOUT)
+            print(f"🛑 [Database] 已取消服务端查询 / Cancelled server-side query: backend={backend_id}")
+            return True
+        except Exception as e:
+            print(f"⚠️ [Database] 取消服务端查询失败 / Failed to cancel query (backend={backend_id}): {str(e)}")
+            return False
+
+    async def _abort(self, conn: AsyncConnection, backend_id: Optional[int]) -> None:
+        """
+        中止连接上未完成的语句：先在服务端取消，再废弃该连接
+        只用于取消、超时或结果未读完即关闭的场景；语句本身执行出错时连接仍可复用，应正常归还连接池。
+        取消放在独立任务中并用 shield 保护，调用方被再次取消 (如客户端断开) 时也会执行完。
+        """
+        if backend_id is not None:
+            task = asyncio.ensure_future(self.cancel_backend(backend_id))
+            self._cancel_tasks.add(task)
+            task.add_done_callback(self._cancel_tasks.discard)
+            try:
+                await asyncio.shield(task)
+            except asyncio.CancelledError:
+                pass
+        try:
+            await conn.invalidate()
+        except Exception:
+            pass
+
+    @asynccontextmanager
+    async def _acquire(self) -> AsyncIterator[AsyncConnection]:
+        """从连接池获取连接，并记录排队等待时间"""
+        if not self.engine:
+            raise Exception("数据库未连接")
+        start = time.perf_counter()
+        try:
+            conn = await self.engine.connect()
+        except PoolTimeoutError:
+            self._pool_timeouts += 1
+            raise
+        waited = time.perf_counter() - start
+        self._wait_count += 1
+        self._wait_total += waited
+        self._wait_max = max(self._wait_max, waited)
+        self._wait_recent.append(waited)
+        try:
+            yield conn
+        finally:
+            await conn.close()
+
+    def get_pool_stats(self) -> Dict[str, Any]:
+        """连接池状态：占用/空闲连接数与获取连接的等待耗时"""
+        stats: Dict[str, Any] = {
+            "connected": self._connected,
+            "pool_size": self.pool_size,
+            "max_overflow": self.max_overflow,
+            "pool_timeout": self.pool_timeout,
+            "statement_timeout_ms": self.statement_timeout_ms,
+            "connections_created": self._connections_created,
+            "acquire_count": self._wait_count,
+            "pool_timeouts": self._pool_timeouts,
+            "wait_avg_ms": round(self._wait_total / self._wait_count * 1000, 2) if self._wait_count else 0.0,
+            "wait_max_ms": round(self._wait_max * 1000, 2),
+        }
+        if self._wait_recent:
+            recent = sorted(self._wait_recent)
+            stats["wait_p95_ms"] = round(recent[min(len(recent) - 1, int(len(recent) * 0.95))] * 1000, 2)
+        pool = self.engine.pool if self.engine else None
+        if pool is not None and hasattr(pool, "checkedout"):
+            stats.update({
+                "checked_out": pool.checkedout(),
+                "idle": pool.checkedin(),
+                "overflow": pool.overflow(),
+            })
+        return stats
+
+    async def warmup(self, count: Optional[int] = None) -> int:
+        """预先建立 count 个连接放入连接池，返回成功建立的数量"""
+        count = self.warmup_connections if count is None else count
+        if not self.engine or count <= 0:
+            return 0
+        conns = []
+        try:
+            for _ in range(min(count, self.pool_size)):
+                conn = await self.engine.connect()
+                await conn.execute(text("SELECT 1"))
+                conns.append(conn)
+        except Exception as e:
+            print(f"⚠️ 连接池预热中断: {str(e)}")
+        finally:
+            for conn in conns:
+                await conn.close()
+        return len(conns)
+
     async def connect(self) -> bool:
         """连接数据库"""
         try:
             conn_str = self.get_connection_string()
-            # 增加连接池优化参数
+            # 连接池参数可在数据库配置中单独指定
             self.engine = create_async_engine(
                 conn_str, 
                 echo=False,
-                pool_recycle=3600,
-                pool_pre_ping=True
+                pool_size=self.pool_size,
+                max_overflow=self.max_overflow,
+                pool_timeout=self.pool_timeout,
+                pool_recycle=self.pool_recycle,
+                pool_pre_ping=True,
+                connect_args=self.get_connect_args()
             )
+            self._install_pool_listeners()
             async with self.engine.connect() as conn:
                 await conn.execute(text("SELECT 1"))
             self._connected = True
@@ -62,7 +287,11 @@ class BaseDatabaseAdapter(ABC):
         if self.engine:
             await self.engine.dispose()
             self.engine = None
+        if self._cancel_engine:
+            await self._cancel_engine.dispose()
+            self._cancel_engine = None
         self._connected = False
+        self._reset_pool_stats()
 
     async def is_connected(self) -> bool:
         """检查是否已连接"""
@@ -99,6 +328,31 @@ class BaseDatabaseAdapter(ABC):
         async with self.engine.connect() as conn:
             return await conn.run_sync(_get_tables_sync)
 
+    async def get_create_table_sqls(self, table_names: Optional[List[str]] = None) -> Dict[str, str]:
+        """
+        获取建表语句 {表名: DDL}，table_names 为 None 时返回所有表，否则只查询指定的表
+        默认逐表调用 get_create_table_sql；MySQL / PostgreSQL 覆盖为基于系统目录的批量查询。
+        """
+        if table_names is None:
+            table_names = [table.name for table in await self.get_tables()]
+        ddls = {}
+        for name in table_names:
+            ddls[name] = await self.get_create_table_sql(name)
+        return ddls
+
+    async def get_table_fingerprints(self) -> Dict[str, str]:
+        """
+        每张表的结构指纹 {表名: 指纹}，用于 Schema 缓存的增量刷新
+        返回空字典表示不支持 (每次都完整重建)。
+        """
+        return {}
+
+    def quote_identifier(self, name: str) -> str:
+        """按方言给标识符加引号 (MySQL 反引号，PostgreSQL 双引号)"""
+        if self.engine:
+            return self.engine.dialect.identifier_preparer.quote_identifier(name)
+        return f'"{name}"'
+
     async def get_table_schema(self, table_name: str) -> List[ColumnInfo]:
         """获取表结构"""
         tables = await self.get_tables()
@@ -112,11 +366,76 @@ class BaseDatabaseAdapter(ABC):
         if not self.engine:
             raise Exception("数据库未连接")
         
-        async with self.engine.connect() as conn:
-            result = await conn.execute(text(query), params or {})
-            if result.returns_rows:
-                return [dict(row._mapping) for row in result.all()]
-            return []
+        async with self._acquire() as conn:
+            backend_id = await self._get_backend_id(conn)
+            try:
+                result = await conn.execute(text(query), params or {})
+                if result.returns_rows:
+                    return [dict(row._mapping) for row in result.all()]
+                return []
+            except asyncio.CancelledError:
+                # 调用方超时 (asyncio.wait_for) 或被取消：服务端语句仍在执行，需要显式取消
+                await self._abort(conn, backend_id)
+                raise
+
+    async def stream_query(
+        self,
+        query: str,
+        params: Optional[Dict[str, Any]] = None,
+        batch_size: int = 500,
+        max_rows: Optional[int] = None,
+        max_bytes: Optional[int] = None
+    ) -> AsyncIterator[ResultBatch]:
+        """
+        使用服务端游标流式执行查询，按批返回结果
+        aiomysql 走 SSCursor，asyncpg 走命名游标 (均由 SQLAlchemy stream_results 启用)。
+        超过 max_rows / max_bytes 时停止读取，最后一批的 truncated 为 True。
+        未读完即被取消、超时或关闭时，会在服务端取消仍在执行的语句。
+        """
+        if not self.engine:
+            raise Exception("数据库未连接")
+
+        async with self._acquire() as conn:
+            backend_id = await self._get_backend_id(conn)
+            result = None
+            total_rows = 0
+            total_bytes = 0
+            emitted = False
+            truncated = False
+            exhausted = False
+            failed = False
+            try:
+                result = await conn.stream(text(query), params or {})
+                columns = list(result.keys())
+                async for partition in result.partitions(batch_size):
+                    rows = []
+                    for row in partition:
+                        row = tuple(row)
+                        total_bytes += _estimate_row_bytes(row)
+                        if (max_rows and total_rows >= max_rows) or (max_bytes and total_bytes > max_bytes):
+                            truncated = True
+                            break
+                        rows.append(row)
+                        total_rows += 1
+                    emitted = True
+                    yield ResultBatch(columns, rows, truncated)
+                    if truncated:
+                        break
+                else:
+                    exhausted = True
+                if not emitted:
+                    yield ResultBatch(columns, [], False)
+            except Exception:
+                # 语句本身执行出错：服务端已无运行中的查询，连接正常归还连接池 (归还时回滚)
+                failed = True
+                raise
+            finally:
+                if exhausted:
+                    await result.close()
+                elif not failed:
+                    # 截断、超时或被调用方提前关闭：未读完的服务端游标关闭时需要把剩余行读空 (MySQL)，
+                    # 因此先在服务端取消语句，再直接废弃连接
+                    await self._abort(conn, backend_id)
 
     async def get_database_version(self) -> str:
         """获取数据库版本信息"""
@@ -77,3 +77,22 @@ class DatabaseManager:
     def get_config(cls, db_key: str) -> Optional[Dict[str, Any]]:
         """获取指定数据库配置"""
         return cls._configs.get(db_key)
+
+    @classmethod
+    async def warmup_all(cls) -> Dict[str, int]:
+        """为配置了 warmup_connections 的数据库预热连接池"""
+        warmed = {}
+        for db_key in list(cls._configs.keys()):
+            adapter = cls.get_adapter(db_key)
+            if not adapter or adapter.warmup_connections <= 0:
+                continue
+            if not await adapter.is_connected() and not await adapter.connect():
+                continue
+            warmed[db_key] = await adapter.warmup()
+            print(f"🔥 [Database] 连接池预热完成 / Pool warmed up: {db_key} ({warmed[db_key]} connections)")
+        return warmed
+
+    @classmethod
+    def get_pool_stats(cls) -> Dict[str, Dict[str, Any]]:
+        """获取所有已创建适配器的连接池状态"""
+        return {db_key: adapter.get_pool_stats() for db_key, adapter in cls._adapters.items()}
@@ -1,8 +1,50 @@
 """
 MySQL 数据库适配器 (SQLAlchemy 实现)
 """
-from typing import Dict, Any
-from .base_adapter import BaseDatabaseAdapter
+import asyncio
+from typing import Dict, Any, List, Optional
+from .base_adapter import BaseDatabaseAdapter, ColumnInfo, ForeignKeyInfo, TableInfo, table_filter
+
+# 一次性读取当前库所有表 (或指定表) 的表 / 列 / 键信息 (代替逐表的 inspect 与 SHOW CREATE TABLE)
+_TABLES_SQL = """
+SELECT TABLE_NAME AS table_name, TABLE_COMMENT AS table_comment
+FROM information_schema.TABLES
+WHERE TABLE_SCHEMA = DATABASE() AND TABLE_TYPE = 'BASE TABLE'{table_filter}
+ORDER BY TABLE_NAME
+"""
+
+_COLUMNS_SQL = """
+SELECT TABLE_NAME AS table_name, COLUMN_NAME AS column_name, COLUMN_TYPE AS column_type,
+       IS_NULLABLE AS is_nullable, COLUMN_DEFAULT AS column_default, COLUMN_KEY AS column_key,
+       EXTRA AS extra, COLUMN_COMMENT AS column_comment
+FROM information_schema.COLUMNS
+WHERE TABLE_SCHEMA = DATABASE(){table_filter}
+ORDER BY TABLE_NAME, ORDINAL_POSITION
+"""
+
+_FOREIGN_KEYS_SQL = """
+SELECT TABLE_NAME AS table_name, CONSTRAINT_NAME AS constraint_name, COLUMN_NAME AS column_name,
+       REFERENCED_TABLE_NAME AS referred_table, REFERENCED_COLUMN_NAME AS referred_column
+FROM information_schema.KEY_COLUMN_USAGE
+WHERE TABLE_SCHEMA = DATABASE() AND REFERENCED_TABLE_NAME IS NOT NULL{table_filter}
+ORDER BY TABLE_NAME, CONSTRAINT_NAME, ORDINAL_POSITION
+"""
+
+# 表级指纹：创建/更新时间 + 列数 + 列定义校验和 + 键数量 (列定义来自数据字典，不受统计缓存影响)
+_FINGERPRINT_SQL = """
+SELECT t.TABLE_NAME AS table_name, t.CREATE_TIME AS create_time, t.UPDATE_TIME AS update_time,
+       COUNT(c.COLUMN_NAME) AS column_count,
+       COALESCE(SUM(CRC32(CONCAT_WS(':', c.COLUMN_NAME, c.COLUMN_TYPE, c.IS_NULLABLE, c.ORDINAL_POSITION,
+                                    c.COLUMN_DEFAULT, c.COLUMN_COMMENT))), 0) AS column_checksum,
+       (SELECT COUNT(*) FROM information_schema.KEY_COLUMN_USAGE k
+        WHERE k.TABLE_SCHEMA = t.TABLE_SCHEMA AND k.TABLE_NAME = t.TABLE_NAME) AS key_count
+FROM information_schema.TABLES t
+LEFT JOIN information_schema.COLUMNS c ON c.TABLE_SCHEMA = t.TABLE_SCHEMA AND c.TABLE_NAME = t.TABLE_NAME
+WHERE t.TABLE_SCHEMA = DATABASE() AND t.TABLE_TYPE = 'BASE TABLE'
+GROUP BY t.TABLE_SCHEMA, t.TABLE_NAME, t.CREATE_TIME, t.UPDATE_TIME
+"""
+
+_DEFAULT_EXPRESSIONS = ("CURRENT_TIMESTAMP", "NOW()", "NULL", "(")
 
 
 class MySQLAdapter(BaseDatabaseAdapter):
@@ -19,6 +61,120 @@ class MySQLAdapter(BaseDatabaseAdapter):
         # 使用 aiomysql 作为驱动
         return f"mysql+aiomysql://{self.user}:{self.password}@{self.host}:{self.port}/{self.database}?charset=utf8mb4"
 
+    def get_session_init_statements(self) -> List[str]:
+        """会话级 SELECT 超时 (毫秒)，由服务端强制中止超时查询"""
+        if self.statement_timeout_ms > 0:
+            return [f"SET SESSION MAX_EXECUTION_TIME = {self.statement_timeout_ms}"]
+        return []
+
+    def get_backend_id_sql(self) -> Optional[str]:
+        return "SELECT CONNECTION_ID()"
+
+    def get_cancel_sql(self, backend_id: int) -> Optional[str]:
+        # KILL QUERY 只终止语句，不断开会话
+        return f"KILL QUERY {int(backend_id)}"
+
+    async def _load_catalog(self, table_names: Optional[List[str]] = None) -> List[TableInfo]:
+        """三次批量查询 information_schema，组装所有表 (或 table_names 指定的表) 的列、主键与外键"""
+        condition, params = table_filter("TABLE_NAME", table_names)
+        table_rows, column_rows, fk_rows = await asyncio.gather(
+            self.execute_query(_TABLES_SQL.format(table_filter=condition), params),
+            self.execute_query(_COLUMNS_SQL.format(table_filter=condition), params),
+            self.execute_query(_FOREIGN_KEYS_SQL.format(table_filter=condition), params),
+        )
+        tables: Dict[str, TableInfo] = {
+            r["table_name"]: TableInfo(name=r["table_name"], columns=[], comment=r["table_comment"] or None)
+            for r in table_rows
+        }
+        for r in column_rows:
+            table = tables.get(r["table_name"])
+            if table is None:
+                continue  # 视图
+            extra = (r["extra"] or "").replace("DEFAULT_GENERATED", "").strip()
+            table.columns.append(ColumnInfo(
+                name=r["column_name"],
+                type=r["column_type"],
+                nullable=r["is_nullable"] == "YES",
+                primary_key=r["column_key"] == "PRI",
+                default=None if r["column_default"] is None else str(r["column_default"]),
+                extra=extra or None,
+                comment=r["column_comment"] or None
+            ))
+        foreign_keys: Dict[tuple, ForeignKeyInfo] = {}
+        for r in fk_rows:
+            if r["table_name"] not in tables:
+                continue
+            key = (r["table_name"], r["constraint_name"])
+            fk = foreign_keys.get(key)
+            if fk is None:
+                fk = ForeignKeyInfo(name=r["constraint_name"], columns=[], referred_table=r["referred_table"], referred_columns=[])
+                foreign_keys[key] = fk
+                tables[r["table_name"]].foreign_keys.append(fk)
+            fk.columns.append(r["column_name"])
+            fk.referred_columns.append(r["referred_column"])
+        return list(tables.values())
+
+    @staticmethod
+    def _quote_literal(value: str) -> str:
+        return "'" + value.replace("\\", "\\\\").replace("'", "''") + "'"
+
+    @classmethod
+    def render_create_table(cls, table: TableInfo) -> str:
+        """由目录信息合成 CREATE TABLE 语句 (与 SHOW CREATE TABLE 的结构一致，省略索引与存储参数)"""
+        lines = []
+        for c in table.columns:
+            line = f"  `{c.name}` {c.type}"
+            if not c.nullable:
+                line += " NOT NULL"
+            if c.default is not None:
+                is_literal = not (c.default.upper().startswith(_DEFAULT_EXPRESSIONS) or c.default.replace(".", "", 1).lstrip("-").isdigit())
+                line += f" DEFAULT {cls._quote_literal(c.default) if is_literal else c.default}"
+            if c.extra:
+                line += f" {c.extra}"
+            if c.comment:
+                line += f" COMMENT {cls._quote_literal(c.comment)}"
+            lines.append(line)
+        pk = [c.name for c in table.columns if c.primary_key]
+        if pk:
+            lines.append("  PRIMARY KEY (" + ", ".join(f"`{n}`" for n in pk) + ")")
+        for fk in table.foreign_keys:
+            lines.append(
+                f"  CONSTRAINT `{fk.name}` FOREIGN KEY (" + ", ".join(f"`{n}`" for n in fk.columns) + ") "
+                f"REFERENCES `{fk.referred_table}` (" + ", ".join(f"`{n}`" for n in fk.referred_columns) + ")"
+            )
+        ddl = f"CREATE TABLE `{table.name}` (\n" + ",\n".join(lines) + "\n)"
+        if table.comment:
+            ddl += f" COMMENT={cls._quote_literal(table.comment)}"
+        return ddl
+
+    async def get_tables(self) -> List[TableInfo]:
+        """批量读取 information_schema (失败时回退到 SQLAlchemy inspector)"""
+        if not self.engine:
+            raise Exception("数据库未连接")
+        try:
+            return await self._load_catalog()
+        except Exception as e:
+            print(f"⚠️ 批量读取 information_schema 失败，回退到逐表检查: {str(e)}")
+            return await super().get_tables()
+
+    async def get_table_fingerprints(self) -> Dict[str, str]:
+        rows = await self.execute_query(_FINGERPRINT_SQL)
+        return {
+            r["table_name"]: "|".join(str(r[k]) for k in ("create_time", "update_time", "column_count", "column_checksum", "key_count"))
+            for r in rows
+        }
+
+    async def get_create_table_sqls(self, table_names: Optional[List[str]] = None) -> Dict[str, str]:
+        if table_names is None:
+            return {t.name: self.render_create_table(t) for t in await self.get_tables()}
+        if not table_names:
+            return {}
+        try:
+            return {t.name: self.render_create_table(t) for t in await self._load_catalog(table_names)}
+        except Exception as e:
+            print(f"⚠️ 批量读取 information_schema 失败，回退到逐表检查: {str(e)}")
+            return await super().get_create_table_sqls(table_names)
+
     async def get_create_table_sql(self, table_name: str) -> str:
         """获取 MySQL 的 CREATE TABLE 语句"""
         try:
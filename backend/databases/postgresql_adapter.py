@@ -1,8 +1,65 @@
 """
 PostgreSQL 数据库适配器 (SQLAlchemy 实现)
 """
-from typing import Dict, Any
-from .base_adapter import BaseDatabaseAdapter
+import asyncio
+from typing import Dict, Any, List, Optional
+from .base_adapter import BaseDatabaseAdapter, ColumnInfo, ForeignKeyInfo, TableInfo, table_filter
+
+# 基于 pg_catalog 一次性读取当前 schema 所有表 (或指定表) 的表 / 列 / 约束 (代替逐表 inspect)
+_TABLES_SQL = """
+SELECT c.relname AS table_name, obj_description(c.oid, 'pg_class') AS table_comment
+FROM pg_catalog.pg_class c
+JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+WHERE c.relkind IN ('r', 'p') AND n.nspname = current_schema() AND NOT c.relispartition{table_filter}
+ORDER BY c.relname
+"""
+
+_COLUMNS_SQL = """
+SELECT c.relname AS table_name, a.attname AS column_name,
+       format_type(a.atttypid, a.atttypmod) AS column_type,
+       a.attnotnull AS not_null,
+       pg_get_expr(d.adbin, d.adrelid) AS column_default,
+       col_description(c.oid, a.attnum) AS column_comment
+FROM pg_catalog.pg_class c
+JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+JOIN pg_catalog.pg_attribute a ON a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+LEFT JOIN pg_catalog.pg_attrdef d ON d.adrelid = c.oid AND d.adnum = a.attnum
+WHERE c.relkind IN ('r', 'p') AND n.nspname = current_schema(){table_filter}
+ORDER BY c.relname, a.attnum
+"""
+
+# 表级指纹：列定义摘要 + 约束数量 + 写入计数 (PostgreSQL 没有 UPDATE_TIME，以 pg_stat 的写入量代替)
+_FINGERPRINT_SQL = """
+SELECT c.relname AS table_name,
+       md5(string_agg(a.attname || ':' || format_type(a.atttypid, a.atttypmod) || ':' || a.attnotnull::text,
+                      ',' ORDER BY a.attnum)) AS column_hash,
+       count(a.attnum) AS column_count,
+       (SELECT count(*) FROM pg_catalog.pg_constraint con WHERE con.conrelid = c.oid) AS constraint_count,
+       COALESCE(max(s.n_tup_ins + s.n_tup_upd + s.n_tup_del), 0) AS write_count
+FROM pg_catalog.pg_class c
+JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+JOIN pg_catalog.pg_attribute a ON a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+LEFT JOIN pg_catalog.pg_stat_user_tables s ON s.relid = c.oid
+WHERE c.relkind IN ('r', 'p') AND n.nspname = current_schema() AND NOT c.relispartition
+GROUP BY c.oid, c.relname
+"""
+
+_CONSTRAINTS_SQL = """
+SELECT c.relname AS table_name, con.conname AS constraint_name, con.contype AS constraint_type,
+       ARRAY(SELECT a.attname::text FROM unnest(con.conkey) WITH ORDINALITY AS k(attnum, ord)
+             JOIN pg_catalog.pg_attribute a ON a.attrelid = con.conrelid AND a.attnum = k.attnum
+             ORDER BY k.ord) AS columns,
+       rc.relname AS referred_table,
+       ARRAY(SELECT a.attname::text FROM unnest(con.confkey) WITH ORDINALITY AS k(attnum, ord)
+             JOIN pg_catalog.pg_attribute a ON a.attrelid = con.confrelid AND a.attnum = k.attnum
+             ORDER BY k.ord) AS referred_columns
+FROM pg_catalog.pg_constraint con
+JOIN pg_catalog.pg_class c ON c.oid = con.conrelid
+JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+LEFT JOIN pg_catalog.pg_class rc ON rc.oid = con.confrelid
+WHERE n.nspname = current_schema() AND con.contype IN ('p', 'f'){table_filter}
+ORDER BY c.relname, con.conname
+"""
 
 
 class PostgreSQLAdapter(BaseDatabaseAdapter):
@@ -19,8 +76,120 @@ class PostgreSQLAdapter(BaseDatabaseAdapter):
         # 使用 asyncpg 作为驱动
         return f"postgresql+asyncpg://{self.user}:{self.password}@{self.host}:{self.port}/{self.database}"
 
+    def get_connect_args(self) -> Dict[str, Any]:
+        """asyncpg 通过 server_settings 设置会话级 statement_timeout (毫秒)"""
+        if self.statement_timeout_ms > 0:
+            return {"server_settings": {"statement_timeout": str(self.statement_timeout_ms)}}
+        return {}
+
+    def get_backend_id_sql(self) -> Optional[str]:
+        return "SELECT pg_backend_pid()"
+
+    def get_cancel_sql(self, backend_id: int) -> Optional[str]:
+        return f"SELECT pg_cancel_backend({int(backend_id)})"
+
+    async def _load_catalog(self, table_names: Optional[List[str]] = None) -> List[TableInfo]:
+        """三次批量查询 pg_catalog，组装所有表 (或 table_names 指定的表) 的列、主键与外键"""
+        condition, params = table_filter("c.relname", table_names)
+        table_rows, column_rows, constraint_rows = await asyncio.gather(
+            self.execute_query(_TABLES_SQL.format(table_filter=condition), params),
+            self.execute_query(_COLUMNS_SQL.format(table_filter=condition), params),
+            self.execute_query(_CONSTRAINTS_SQL.format(table_filter=condition), params),
+        )
+        tables: Dict[str, TableInfo] = {
+            r["table_name"]: TableInfo(name=r["table_name"], columns=[], comment=r["table_comment"] or None)
+            for r in table_rows
+        }
+        primary_keys: Dict[str, set] = {}
+        for r in constraint_rows:
+            table = tables.get(r["table_name"])
+            if table is None:
+                continue
+            if r["constraint_type"] == "p":
+                primary_keys[table.name] = set(r["columns"])
+            elif r["referred_table"]:
+                table.foreign_keys.append(ForeignKeyInfo(
+                    name=r["constraint_name"],
+                    columns=list(r["columns"]),
+                    referred_table=r["referred_table"],
+                    referred_columns=list(r["referred_columns"])
+                ))
+        for r in column_rows:
+            table = tables.get(r["table_name"])
+            if table is None:
+                continue
+            table.columns.append(ColumnInfo(
+                name=r["column_name"],
+                type=r["column_type"],
+                nullable=not r["not_null"],
+                primary_key=r["column_name"] in primary_keys.get(table.name, ()),
+                default=r["column_default"],
+                comment=r["column_comment"] or None
+            ))
+        return list(tables.values())
+
+    @staticmethod
+    def render_create_table(table: TableInfo) -> str:
+        """由目录信息合成 CREATE TABLE 语句 (注释以 -- 行内形式附在列后)"""
+        q = lambda name: '"' + name.replace('"', '""') + '"'
+        items = []
+        for c in table.columns:
+            line = f"  {q(c.name)} {c.type}"
+            if not c.nullable:
+                line += " NOT NULL"
+            if c.default is not None:
+                line += f" DEFAULT {c.default}"
+            items.append((line, c.comment))
+        pk = [c.name for c in table.columns if c.primary_key]
+        if pk:
+            items.append(("  PRIMARY KEY (" + ", ".join(q(n) for n in pk) + ")", None))
+        for fk in table.foreign_keys:
+            items.append((
+                f"  CONSTRAINT {q(fk.name)} FOREIGN KEY (" + ", ".join(q(n) for n in fk.columns) + ") "
+                f"REFERENCES {q(fk.referred_table)} (" + ", ".join(q(n) for n in fk.referred_columns) + ")",
+                None
+            ))
+        lines = []
+        for i, (line, comment) in enumerate(items):
+            if i < len(items) - 1:
+                line += ","
+            if comment:
+                line += f" -- {' '.join(comment.split())}"
+            lines.append(line)
+        header = f"-- {' '.join(table.comment.split())}\n" if table.comment else ""
+        return f"{header}CREATE TABLE {q(table.name)} (\n" + "\n".join(lines) + "\n)"
+
+    async def get_tables(self) -> List[TableInfo]:
+        """批量读取 pg_catalog (失败时回退到 SQLAlchemy inspector)"""
+        if not self.engine:
+            raise Exception("数据库未连接")
+        try:
+            return await self._load_catalog()
+        except Exception as e:
+            print(f"⚠️ 批量读取 pg_catalog 失败，回退到逐表检查: {str(e)}")
+            return await super().get_tables()
+
+    async def get_table_fingerprints(self) -> Dict[str, str]:
+        rows = await self.execute_query(_FINGERPRINT_SQL)
+        return {
+            r["table_name"]: "|".join(str(r[k]) for k in ("column_hash", "column_count", "constraint_count", "write_count"))
+            for r in rows
+        }
+
+    async def get_create_table_sqls(self, table_names: Optional[List[str]] = None) -> Dict[str, str]:
+        if table_names is None:
+            return {t.name: self.render_create_table(t) for t in await self.get_tables()}
+        if not table_names:
+            return {}
+        try:
+            return {t.name: self.render_create_table(t) for t in await self._load_catalog(table_names)}
+        except Exception as e:
+            print(f"⚠️ 批量读取 pg_catalog 失败，回退到逐表检查: {str(e)}")
+            return await super().get_create_table_sqls(table_names)
+
     async def get_create_table_sql(self, table_name: str) -> str:
-        """获取 PostgreSQL 的 CREATE TABLE 语句（简化版）"""
-        # PostgreSQL 没有直接的 SHOW CREATE TABLE，通常由 pg_dump 生成
-        # 这里返回表结构的基本信息或留空，Agent 通常能通过列信息理解
-        return f"-- Schema information for {table_name} is available via column inspection."
+        """获取 PostgreSQL 的 CREATE TABLE 语句 (PostgreSQL 没有 SHOW CREATE TABLE，由系统目录合成)"""
+        for table in await self.get_tables():
+            if table.name == table_name:
+                return self.render_create_table(table)
+        return ""
@@ -10,7 +10,7 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 
-from config import ALLOWED_ORIGINS, LOG_LEVEL, LOG_FILE, LOG_JSON_FORMAT
+from config import ALLOWED_ORIGINS, LOG_LEVEL, LOG_FILE, LOG_JSON_FORMAT, PYTHON_EXECUTOR_PREFORK
 from database.session_db import session_db
 from database.user_db import user_db
 from database.knowledge_db import knowledge_db
@@ -39,12 +39,25 @@ async def lifespan(app: FastAPI):
     await user_db.init_db()
     await knowledge_db.init_db() 
     print("✅ 数据库初始化完成")
+    # 在线程中加载 tiktoken 编码 (首次可能需要下载)，避免阻塞事件循环
+    from utils.prompt_builder import TokenCounter
+    await TokenCounter.preload()
+    # Schema 检索 / 语义 SQL 缓存使用的嵌入模型在后台线程中加载，加载完成前退化为词法匹配
+    from services.schema_retriever import SchemaRetriever
+    SchemaRetriever.preload_embedder()
+    # 预先创建数据科学家模式的代码执行进程 (导入 pandas / matplotlib 较慢)
+    from services.python_executor import executor_pool
+    if PYTHON_EXECUTOR_PREFORK:
+        await executor_pool.start()
     try:
         yield
     finally:
         # 🚀 关键修复: 在关闭时静默取消所有协程任务，防止 SSE 导致的 CancelledError 刷屏
         import asyncio
         print("📥 正在退出系统...")
+        from services.llm_factory import llm_factory
+        await llm_factory.aclose()
+        await executor_pool.aclose()
         tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
         for t in tasks: t.cancel()
         print("👋 系统安全关闭")
@@ -45,3 +45,4 @@ class ChatRequest(BaseModel):
     model_provider: Optional[str] = None # 可选：deepseek, openai, gemini, claude
     model_name: Optional[str] = None # 可选：具体模型名称
     language: Optional[str] = "zh" # 🚀 新增：支持多语言 prompt (zh, en)
+    include_total_count: bool = False # 需要展示总行数时额外执行 COUNT(*)
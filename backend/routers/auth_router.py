@@ -11,6 +11,7 @@ from database.user_db import user_db
 from utils.security import get_password_hash, verify_password, create_access_token, decode_access_token
 from config import ACCESS_TOKEN_EXPIRE_MINUTES
 from utils.email import send_verification_email
+from utils.logger import logger
 
 router = APIRouter(prefix="/auth", tags=["认证管理"])
 
@@ -20,9 +21,6 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login")
 
 async def get_current_user(token: str = Depends(oauth2_scheme)):
     """获取当前登录用户的依赖项 / Get current logged-in user dependency"""
-    print(f"\n🔍 [AUTH] 验证 Token... / Verifying Token...")
-    print(f"   收到 Token: {token[:30]}...")
-    
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Invalid authentication credentials (无效的认证凭证)",
@@ -31,31 +29,26 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
     
     try:
         payload = decode_access_token(token)
-        print(f"   Token 解码结果 / Token payload: {payload}")
     except Exception as e:
-        print(f"   ❌ Token 解码失败 / Token decoding failed: {e}")
+        logger.debug("❌ [AUTH] Token 解码失败 / Token decoding failed: %s", e)
         raise credentials_exception
     
     if payload is None:
-        print(f"   ❌ Token 解码返回 None / Token payload is None")
+        logger.debug("❌ [AUTH] Token 解码返回 None / Token payload is None")
         raise credentials_exception
     
     email: str = payload.get("sub")
-    print(f"   Token sub (email): {email}")
-    
     if email is None:
-        print(f"   ❌ Token 中不包含 email / No email in token")
+        logger.debug("❌ [AUTH] Token 中不包含 email / No email in token")
         raise credentials_exception
     
-    print(f"\n🔍 [AUTH] 查找用户... / Finding user...")
     user = await user_db.get_user_by_email(email)
     
     if user is None:
-        print(f"   ❌ 用户不存在 / User not found: {email}")
+        logger.debug("❌ [AUTH] 用户不存在 / User not found: %s", email)
         raise credentials_exception
     
-    print(f"   ✅ 找到用户 / User found: {user['username']} ({user['email']})")
-    print(f"{'='*60}\n")
+    logger.debug("✅ [AUTH] 验证通过 / Authenticated: %s (%s)", user['username'], user['email'])
     return user
 
 # ==================== API 路由 ====================
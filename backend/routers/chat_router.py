@@ -22,7 +22,9 @@ from agents.sql_agent import SQLAgent
 from agents.memory_manager import get_memory_manager
 from services.stream_service import StreamableHTTPService
 from services.pdf_service import pdf_service
-from services.user_context import set_user_api_keys
+from services.user_context import set_user_api_keys, set_current_user_id
+from services.schema_service import SchemaService
+from services.metrics_service import metrics_service
 from utils.json_utils import json_dumps
 
 class ExportPDFRequest(BaseModel):
@@ -46,25 +48,49 @@ def get_sql_agent():
 
 # ==================== 0. 辅助函数 (Helpers) ====================
 
+class _SqlResultCollector:
+    """
+    把逐批发送的 sql_result_batch 与最终只含元数据的 sql_result (streamed) 合并为完整结果，写入 messages.data
+    offset 为 0 的批次表示重新开始 (上一次执行尝试失败后重试)。
+    """
+
+    def __init__(self):
+        self.rows: List[Dict[str, Any]] = []
+
+    def feed(self, event_type: str, event_data: Any) -> Any:
+        if event_type == "sql_result_batch":
+            if not event_data.get("offset"):
+                self.rows = []
+            columns = event_data["columns"]
+            self.rows.extend(dict(zip(columns, row)) for row in event_data["rows"])
+            return None
+        if not event_data.get("streamed"):
+            return event_data
+        data = {k: v for k, v in event_data.items() if k != "streamed"}
+        data["rows"] = self.rows
+        return data
+
+
 async def _handle_session_auto_title(session_id: str, user_id: int, question: str, agent_instance, language: str, provider: str = None, model_name: str = None):
     """
     [Shared Helper] 异步生成并更新会话标题
     逻辑：仅当会话标题为空或为默认占位符时，触发 AI 生成新标题。
     """
     try:
-        async with session_db.async_session() as session:
-            # 1. 检查当前标题
-            result = await session.execute(
-                select(SessionModel.title).where(SessionModel.id == session_id)
-            )
-            current_title = result.scalar_one_or_none()
-
-            # 2. 如果标题为空，则由 AI 生成新标题
-            if not current_title or current_title.strip() == "":
-                new_title = await agent_instance.generate_ai_title(question, provider=provider, model_name=model_name, language=language)
-                if new_title:
-                    await session_db.update_session_title(session_id, user_id, new_title)
-                    print(f"✅ [Auto-Rename] 会话 {session_id[:8]} 已自动重命名: {new_title}")
+        with metrics_service.span("title", provider=provider, model=model_name):
+            async with session_db.async_session() as session:
+                # 1. 检查当前标题
+                result = await session.execute(
+                    select(SessionModel.title).where(SessionModel.id == session_id)
+                )
+                current_title = result.scalar_one_or_none()
+
+                # 2. 如果标题为空，则由 AI 生成新标题
+                if not current_title or current_title.strip() == "":
+                    new_title = await agent_instance.generate_ai_title(question, provider=provider, model_name=model_name, language=language)
+                    if new_title:
+                        await session_db.update_session_title(session_id, user_id, new_title)
+                        print(f"✅ [Auto-Rename] 会话 {session_id[:8]} 已自动重命名: {new_title}")
     except Exception as e:
         print(f"⚠️ [Auto-Rename] 自动生成标题失败: {e}")
 
@@ -124,6 +150,10 @@ async def run_scientist_mode(request: ChatRequest, current_user: dict):
                                     if "rows" in parsed and parsed["rows"]:
                                         last_data = parsed["rows"]
                                         break
+                                    # 列式紧凑格式 {columns, data: [[...]]}
+                                    if parsed.get("format") == "columnar" and parsed.get("data"):
+                                        last_data = [dict(zip(parsed["columns"], r)) for r in parsed["data"]]
+                                        break
                                 except: pass
                     df_to_analyze = pd.DataFrame(last_data)
                 except: df_to_analyze = pd.DataFrame()
@@ -189,7 +219,7 @@ async def run_scientist_mode(request: ChatRequest, current_user: dict):
     return StreamingResponse(StreamableHTTPService.generate_stream(event_generator()), media_type="text/event-stream")
 
 
-async def run_thinking_mode(request: ChatRequest, current_user: dict):
+async def run_thinking_mode(request: ChatRequest, current_user: dict, db_key: Optional[str] = None):
     """
     思考模式处理器 (Thinking Processor)
     规格：深度推理 SQL 生成，必须完整捕获并存储思维链 (Reasoning Capture)
@@ -208,6 +238,7 @@ async def run_thinking_mode(request: ChatRequest, current_user: dict):
         assistant_chart_cfg = ""
         assistant_reasoning = ""
         assistant_data_obj = {}
+        sql_results = _SqlResultCollector()
 
         try:
             await session_db.create_message({
@@ -227,7 +258,9 @@ async def run_thinking_mode(request: ChatRequest, current_user: dict):
                 enable_thinking=True, # 强制开启
                 provider=request.model_provider,
                 model_name=request.model_name,
-                language=request.language
+                language=request.language,
+                include_total_count=request.include_total_count,
+                db_key=db_key
             ):
                 event_type = event["event"]
                 event_data = event.get("data", {})
@@ -235,7 +268,8 @@ async def run_thinking_mode(request: ChatRequest, current_user: dict):
                 if event_type == "model_thinking": assistant_reasoning += event_data.get("content", "")
                 elif event_type == "summary": assistant_content += event_data.get("content", "")
                 elif event_type == "sql_generated": assistant_sql = event_data.get("sql", "")
-                elif event_type == "sql_result": assistant_data_obj = event_data
+                elif event_type == "sql_result_batch": sql_results.feed(event_type, event_data)
+                elif event_type == "sql_result": assistant_data_obj = sql_results.feed(event_type, event_data)
                 elif event_type == "chart_ready": assistant_chart_cfg = json_dumps(event_data.get("option", {}))
 
                 if event_type != "done":
@@ -273,7 +307,7 @@ async def run_thinking_mode(request: ChatRequest, current_user: dict):
     return StreamingResponse(StreamableHTTPService.generate_stream(event_generator()), media_type="text/event-stream")
 
 
-async def run_rag_mode(request: ChatRequest, current_user: dict):
+async def run_rag_mode(request: ChatRequest, current_user: dict, db_key: Optional[str] = None):
     """
     RAG 模式处理器 (RAG Processor)
     规格：结合向量数据库检索结果进行回答
@@ -333,7 +367,9 @@ async def run_rag_mode(request: ChatRequest, current_user: dict):
                 request.question, history_str, 
                 knowledge_context=rag_context, # 注入 RAG 背景
                 enable_thinking=request.enable_thinking,
-                language=request.language
+                language=request.language,
+                include_total_count=request.include_total_count,
+                db_key=db_key
             ):
                 event_type = event["event"]
                 event_data = event.get("data", {})
@@ -372,7 +408,7 @@ async def run_rag_mode(request: ChatRequest, current_user: dict):
     return StreamingResponse(StreamableHTTPService.generate_stream(event_generator()), media_type="text/event-stream")
 
 
-async def run_depth_mode(request: ChatRequest, current_user: dict):
+async def run_depth_mode(request: ChatRequest, current_user: dict, db_key: Optional[str] = None):
     """
     深度模式处理器 (Depth Processor)
     规格：针对复杂任务进行多步分析 (当前通过强化 Prompt 的 SQLAgent 实现，后续可接入 LangGraph)
@@ -390,6 +426,7 @@ async def run_depth_mode(request: ChatRequest, current_user: dict):
         assistant_sql = ""
         assistant_reasoning = ""
         assistant_data_obj = {}
+        sql_results = _SqlResultCollector()
 
         try:
             await session_db.create_message({
@@ -408,7 +445,9 @@ async def run_depth_mode(request: ChatRequest, current_user: dict):
                 f"【深度分析指令】请针对该问题进行多维度建模。用户问题：{request.question}", 
                 history_str, 
                 enable_thinking=True, 
-                language=request.language
+                language=request.language,
+                include_total_count=request.include_total_count,
+                db_key=db_key
             ):
                 event_type = event["event"]
                 event_data = event.get("data", {})
@@ -416,7 +455,8 @@ async def run_depth_mode(request: ChatRequest, current_user: dict):
                 if event_type == "model_thinking": assistant_reasoning += event_data.get("content", "")
                 elif event_type == "summary": assistant_content += event_data.get("content", "")
                 elif event_type == "sql_generated": assistant_sql = event_data.get("sql", "")
-                elif event_type == "sql_result": assistant_data_obj = event_data
+                elif event_type == "sql_result_batch": sql_results.feed(event_type, event_data)
+                elif event_type == "sql_result": assistant_data_obj = sql_results.feed(event_type, event_data)
 
                 if event_type != "done":
                     yield event
@@ -449,7 +489,7 @@ async def run_depth_mode(request: ChatRequest, current_user: dict):
 
     return StreamingResponse(StreamableHTTPService.generate_stream(event_generator()), media_type="text/event-stream")
 
-async def run_standard_mode(request: ChatRequest, current_user: dict):
+async def run_standard_mode(request: ChatRequest, current_user: dict, db_key: Optional[str] = None):
     """
     标准模式处理器 (Standard Processor)
     规格：普通 SQL 查询与简单对话
@@ -468,6 +508,7 @@ async def run_standard_mode(request: ChatRequest, current_user: dict):
         assistant_chart_cfg = ""
         assistant_reasoning = ""
         assistant_data_obj = {}
+        sql_results = _SqlResultCollector()
 
         try:
             await session_db.create_message({
@@ -487,7 +528,9 @@ async def run_standard_mode(request: ChatRequest, current_user: dict):
                 enable_thinking=request.enable_thinking,
                 provider=request.model_provider,
                 model_name=request.model_name,
-                language=request.language
+                language=request.language,
+                include_total_count=request.include_total_count,
+                db_key=db_key
             ):
                 event_type = event["event"]
                 event_data = event.get("data", {})
@@ -495,7 +538,8 @@ async def run_standard_mode(request: ChatRequest, current_user: dict):
                 if event_type == "model_thinking": assistant_reasoning += event_data.get("content", "")
                 elif event_type == "summary": assistant_content += event_data.get("content", "")
                 elif event_type == "sql_generated": assistant_sql = event_data.get("sql", "")
-                elif event_type == "sql_result": assistant_data_obj = event_data
+                elif event_type == "sql_result_batch": sql_results.feed(event_type, event_data)
+                elif event_type == "sql_result": assistant_data_obj = sql_results.feed(event_type, event_data)
                 elif event_type == "chart_ready": assistant_chart_cfg = json_dumps(event_data.get("option", {}))
 
                 if event_type != "done":
@@ -604,6 +648,8 @@ async def chat_stream(request: ChatRequest, current_user: dict = Depends(get_cur
     多模式分发入口 (Multi-mode Dispatcher)
     """
     user_id = current_user["id"]
+    # 查询结果缓存等组件按用户隔离
+    set_current_user_id(user_id)
 
     # 🔑 1. 从 Session 中读取用户选择的模型 (前端传来的优先，Session 存储作兜底)
     if not request.model_provider:
@@ -639,14 +685,19 @@ async def chat_stream(request: ChatRequest, current_user: dict = Depends(get_cur
         set_user_api_keys(ctx_keys)
         print(f"🔑 [ChatStream] 已为用户 {user_id} 注入 {provider} 自定义 API Key")
 
-    # 🌟 3. 核心分发逻辑
+    # 🔑 3. 绑定本次请求使用的数据库 (按会话隔离，避免并发会话互相切换全局数据库)
+    db_key = SchemaService.use_database(await session_db.get_session_database(request.session_id))
+    # 本次请求各阶段耗时指标的默认标签
+    metrics_service.bind(provider=provider, model=request.model_name, db_key=db_key)
+
+    # 🌟 4. 核心分发逻辑
     if request.enable_data_science_agent:
         return await run_scientist_mode(request, current_user)
     elif request.enable_depth:
-        return await run_depth_mode(request, current_user)
+        return await run_depth_mode(request, current_user, db_key)
     elif request.enable_rag:
-        return await run_rag_mode(request, current_user)
+        return await run_rag_mode(request, current_user, db_key)
     elif request.enable_thinking:
-        return await run_thinking_mode(request, current_user)
+        return await run_thinking_mode(request, current_user, db_key)
     else:
-        return await run_standard_mode(request, current_user)
+        return await run_standard_mode(request, current_user, db_key)
@@ -39,6 +39,11 @@ async def startup_event():
     """启动时初始化 DatabaseManager"""
     for db_key, config in DATABASES.items():
         DatabaseManager.register_database(db_key, config)
+    # 预热配置了 warmup_connections 的连接池，避免首个请求承担建连开销
+    try:
+        await DatabaseManager.warmup_all()
+    except Exception as e:
+        print(f"⚠️ [Database] 连接池预热失败 / Pool warmup failed: {str(e)}")
 
 
 @router.get("/databases")
@@ -93,6 +98,12 @@ async def switch_database(request: SwitchDatabaseRequest, current_user: dict = D
     }
 
 
+@router.get("/databases/pool/stats")
+async def get_pool_stats(current_user: dict = Depends(get_current_user)):
+    """获取各数据库连接池状态 / Get connection pool statistics"""
+    return {"pools": DatabaseManager.get_pool_stats()}
+
+
 @router.get("/databases/list", response_model=List[Dict[str, Any]])
 async def get_databases_list():
     """获取所有可用数据库（详细列表） / Get all available databases (Detailed list)"""
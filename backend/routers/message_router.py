@@ -6,6 +6,7 @@ from typing import List
 
 from models.session import Message, MessageCreate
 from database.session_db import session_db
+from agents.sql_agent import semantic_sql_cache
 from routers.auth_router import get_current_user
 from pydantic import BaseModel
 from typing import Optional
@@ -37,6 +38,12 @@ async def update_message_feedback(
     )
     if not success:
         raise HTTPException(status_code=404, detail="消息不存在")
+
+    # 点踩的回答不再作为语义缓存复用
+    if request.feedback == -1:
+        message = await session_db.get_message(session_id, message_id)
+        if message and message.get("sql"):
+            semantic_sql_cache.evict_sql(message["sql"])
     
     return {"status": "success"}
 
@@ -1,6 +1,7 @@
 from fastapi import APIRouter
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from services.observability_service import observability_service
+from services.metrics_service import metrics_service
 
 router = APIRouter(prefix="/api/observability", tags=["可观测性"])
 
@@ -16,3 +17,8 @@ async def stream_logs():
             "X-Accel-Buffering": "no"
         }
     )
+
+@router.get("/metrics")
+async def metrics():
+    """聊天链路分阶段耗时指标 (Prometheus 文本格式)"""
+    return PlainTextResponse(metrics_service.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,638 @@
+"""
+本地图表构建 - 按列类型推断把查询结果映射为复杂图表的 ECharts 配置
+推断失败时返回 None，由 SQLAgent 回退到 LLM 生成。
+"""
+import math
+import re
+from collections import OrderedDict
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from services.columnar_result import ColumnarResult
+
+NUMERIC = "numeric"
+TEMPORAL = "temporal"
+CATEGORY = "category"
+
+_TIME_NAME_RE = re.compile(r'(date|time|day|week|month|year|quarter|period|dt$|日期|时间|年|月|日|周|季度)', re.IGNORECASE)
+_DATE_STR_RE = re.compile(r'^\d{4}([-/]\d{1,2}([-/]\d{1,2})?|[-/]?Q[1-4]|年)')
+_RATE_NAME_RE = re.compile(r'(rate|ratio|pct|percent|share|率|占比|比例)', re.IGNORECASE)
+
+_OHLC_PATTERNS = OrderedDict([
+    ("open", re.compile(r'(^|_)open|开盘', re.IGNORECASE)),
+    ("close", re.compile(r'(^|_)close|收盘', re.IGNORECASE)),
+    ("low", re.compile(r'(^|_)low|最低', re.IGNORECASE)),
+    ("high", re.compile(r'(^|_)high|最高', re.IGNORECASE)),
+])
+_BOX_PATTERNS = OrderedDict([
+    ("min", re.compile(r'(^|_)min|最小', re.IGNORECASE)),
+    ("q1", re.compile(r'q1|p25|lower_quartile|下四分位', re.IGNORECASE)),
+    ("median", re.compile(r'median|p50|中位', re.IGNORECASE)),
+    ("q3", re.compile(r'q3|p75|upper_quartile|上四分位', re.IGNORECASE)),
+    ("max", re.compile(r'(^|_)max|最大', re.IGNORECASE)),
+])
+_TOTAL_LABEL_RE = re.compile(r'^(total|sum|合计|总计|总额)$', re.IGNORECASE)
+
+_GRID = {"top": 60, "bottom": 40, "left": 60, "right": 20, "containLabel": True}
+
+
+def to_number(value: Any) -> Optional[float]:
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return None if isinstance(value, float) and math.isnan(value) else value
+    if isinstance(value, (Decimal, np.number)):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return None
+
+
+def _label(value: Any) -> str:
+    if value is None:
+        return "-"
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+def _nice_max(value: float) -> float:
+    """向上取整到一个便于阅读的刻度 (留 10% 余量)"""
+    if value <= 0:
+        return 1
+    magnitude = 10 ** math.floor(math.log10(value * 1.1))
+    return math.ceil(value * 1.1 / magnitude) * magnitude
+
+
+class ChartData:
+    """对 dict 结果与 ColumnarResult 的统一只读访问，并缓存列类型推断"""
+
+    def __init__(self, sql_result: Dict[str, Any]):
+        self.columns: List[str] = list(sql_result.get("columns", []))
+        self._result = sql_result
+        self._columnar = isinstance(sql_result, ColumnarResult)
+        self._rows = None if self._columnar else sql_result.get("rows", [])
+        self.row_count = sql_result.get("row_count", 0) if self._columnar else len(self._rows)
+        self._values: Dict[str, List[Any]] = {}
+        self._kinds: Dict[str, str] = {}
+
+    def column(self, name: str) -> List[Any]:
+        if name not in self._values:
+            if self._columnar:
+                self._values[name] = self._result.column(name)
+            else:
+                self._values[name] = [row.get(name) for row in self._rows]
+        return self._values[name]
+
+    def numbers(self, name: str) -> List[Optional[float]]:
+        return [to_number(v) for v in self.column(name)]
+
+    def labels(self, name: str) -> List[str]:
+        return [_label(v) for v in self.column(name)]
+
+    def kind(self, name: str) -> str:
+        if name not in self._kinds:
+            self._kinds[name] = self._infer_kind(name)
+        return self._kinds[name]
+
+    def _infer_kind(self, name: str) -> str:
+        sample = [v for v in self.column(name) if v is not None][:200]
+        if not sample:
+            return CATEGORY
+        if all(isinstance(v, (datetime, date)) for v in sample):
+            return TEMPORAL
+        if all(to_number(v) is not None for v in sample):
+            # 年份/月份等整数时间维度 (如 year=2024, month=3)
+            if _TIME_NAME_RE.search(name) and all(float(to_number(v)).is_integer() for v in sample):
+                return TEMPORAL
+            return NUMERIC
+        if all(isinstance(v, str) and _DATE_STR_RE.match(v) for v in sample):
+            return TEMPORAL
+        return CATEGORY
+
+    def of_kind(self, *kinds: str, exclude: Sequence[str] = ()) -> List[str]:
+        return [c for c in self.columns if c not in exclude and self.kind(c) in kinds]
+
+    def pick(self, hint: Any, *kinds: str, exclude: Sequence[str] = ()) -> Optional[str]:
+        """优先使用 viz_config 中的字段提示 (类型匹配时)，否则取第一个该类型的列"""
+        if isinstance(hint, str) and hint in self.columns and hint not in exclude and self.kind(hint) in kinds:
+            return hint
+        candidates = self.of_kind(*kinds, exclude=exclude)
+        return candidates[0] if candidates else None
+
+    def dimensions(self, exclude: Sequence[str] = ()) -> List[str]:
+        return self.of_kind(CATEGORY, TEMPORAL, exclude=exclude)
+
+    def measures(self, exclude: Sequence[str] = ()) -> List[str]:
+        return self.of_kind(NUMERIC, exclude=exclude)
+
+    def match_columns(self, patterns: "OrderedDict[str, re.Pattern]") -> Optional[Dict[str, str]]:
+        """按列名模式匹配一组数值列 (如 OHLC、五数概括)，缺任一项返回 None"""
+        matched = {}
+        for role, pattern in patterns.items():
+            col = next((c for c in self.measures(exclude=list(matched.values())) if pattern.search(c)), None)
+            if col is None:
+                return None
+            matched[role] = col
+        return matched
+
+
+class LocalChartBuilder:
+    """
+    复杂图表的本地构建器 (area / scatter / radar / funnel / gauge / heatmap / treemap /
+    sankey / boxplot / waterfall / candlestick)
+    样式与 SQLAgent.generate_chart_config 中的基础图表保持一致。
+    """
+
+    SUPPORTED_TYPES = (
+        "area", "scatter", "radar", "funnel", "gauge", "heatmap",
+        "treemap", "sankey", "boxplot", "waterfall", "candlestick"
+    )
+
+    @classmethod
+    def build(cls, sql_result: Dict[str, Any], chart_type: str, viz_config: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        if chart_type not in cls.SUPPORTED_TYPES:
+            return None
+        data = ChartData(sql_result)
+        if not data.row_count or not data.columns:
+            return None
+        viz_config = viz_config or {}
+        try:
+            return getattr(cls, f"_build_{chart_type}")(data, viz_config)
+        except Exception as e:
+            print(f"⚠️ [ChartBuilder] 本地构建 {chart_type} 失败: {str(e)}")
+            return None
+
+    # ---------- 公共部分 ----------
+
+    @staticmethod
+    def _base(viz_config: Dict[str, Any], trigger: str = "axis") -> Dict[str, Any]:
+        return {
+            "title": {"text": viz_config.get("title") or "分析结果", "left": "center", "top": 10},
+            "tooltip": {"trigger": trigger}
+        }
+
+    @staticmethod
+    def _with_legend(option: Dict[str, Any], names: List[str]) -> Dict[str, Any]:
+        if len(names) > 1:
+            option["legend"] = {"top": 35, "type": "scroll", "data": names}
+            if "grid" in option:
+                option["grid"] = dict(option["grid"], top=75)
+        return option
+
+    @staticmethod
+    def _pivot(xs: List[str], groups: List[str], values: List[Optional[float]]) -> Tuple[List[str], List[str], Dict[Tuple[str, str], float]]:
+        """长表转透视表：返回 (x 标签, 分组标签, {(x, 分组): 求和值})，标签按首次出现顺序"""
+        x_labels = list(OrderedDict.fromkeys(xs))
+        group_labels = list(OrderedDict.fromkeys(groups))
+        cells: Dict[Tuple[str, str], float] = {}
+        for x, g, v in zip(xs, groups, values):
+            if v is not None:
+                cells[(x, g)] = cells.get((x, g), 0) + v
+        return x_labels, group_labels, cells
+
+    # ---------- 各图表类型 ----------
+
+    @classmethod
+    def _build_area(cls, data: ChartData, viz: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        x = data.pick(viz.get("x"), TEMPORAL, CATEGORY)
+        if not x:
+            return None
+        measures = data.measures(exclude=[x])
+        ys = [c for c in (viz.get("y_multi") or []) if c in measures] or \
+             ([viz["y"]] if viz.get("y") in measures else measures)
+        if not ys:
+            return None
+
+        group = data.pick(viz.get("series"), CATEGORY, exclude=[x])
+        if group and len(ys) == 1:
+            # 长表 (x, 分组, 值)：每个分组一条面积线
+            x_labels, names, cells = cls._pivot(data.labels(x), data.labels(group), data.numbers(ys[0]))
+            series_data = [(name, [cells.get((xl, name)) for xl in x_labels]) for name in names[:20]]
+        else:
+            x_labels = data.labels(x)
+            series_data = [(y, data.numbers(y)) for y in ys]
+
+        dense = len(x_labels) > 50
+        option = cls._base(viz)
+        option.update({
+            "grid": dict(_GRID),
+            "xAxis": {"type": "category", "boundaryGap": False, "data": x_labels},
+            "yAxis": {"type": "value"},
+            "series": [{
+                "name": name, "type": "line", "data": values, "smooth": True,
+                "symbol": "none" if dense else "circle", "areaStyle": {"opacity": 0.3}
+            } for name, values in series_data]
+        })
+        return cls._with_legend(option, [name for name, _ in series_data])
+
+    @classmethod
+    def _build_scatter(cls, data: ChartData, viz: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        x = data.pick(viz.get("x"), NUMERIC)
+        y = data.pick(viz.get("y"), NUMERIC, exclude=[x] if x else ())
+        if not x or not y:
+            return None
+        size_col = next(iter(data.measures(exclude=[x, y])), None)
+        label_col = next(iter(data.dimensions()), None)
+
+        xs, ys = data.numbers(x), data.numbers(y)
+        sizes = data.numbers(size_col) if size_col else None
+        labels = data.labels(label_col) if label_col else None
+        size_range = None
+        if sizes:
+            valid = [s for s in sizes if s is not None]
+            size_range = (min(valid), max(valid)) if valid else None
+
+        groups: "OrderedDict[str, List[Any]]" = OrderedDict()
+        group_by_label = labels is not None and len(set(labels)) <= 20 and len(set(labels)) < data.row_count
+        for i, (xv, yv) in enumerate(zip(xs, ys)):
+            if xv is None or yv is None:
+                continue
+            point: Dict[str, Any] = {"value": [xv, yv]}
+            if labels:
+                point["name"] = labels[i]
+            if size_range and sizes[i] is not None:
+                low, high = size_range
+                point["value"].append(sizes[i])
+                point["symbolSize"] = round(8 + 22 * ((sizes[i] - low) / (high - low) if high > low else 0.5), 1)
+            groups.setdefault(labels[i] if group_by_label else y, []).append(point)
+
+        option = cls._base(viz, trigger="item")
+        option.update({
+            "grid": dict(_GRID),
+            "xAxis": {"type": "value", "name": x, "scale": True},
+            "yAxis": {"type": "value", "name": y, "scale": True},
+            "series": [{"name": name, "type": "scatter", "data": points, "symbolSize": 10}
+                       for name, points in groups.items()]
+        })
+        return cls._with_legend(option, list(groups.keys()))
+
+    @classmethod
+    def _build_radar(cls, data: ChartData, viz: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        dim = data.pick(viz.get("x"), CATEGORY, TEMPORAL)
+        measures = [c for c in (viz.get("y_multi") or []) if c in data.measures()] or data.measures()
+        if len(measures) >= 3:
+            # 每行一个对象，每个数值列一个维度
+            names = data.labels(dim) if dim else [f"#{i + 1}" for i in range(data.row_count)]
+            columns = {m: data.numbers(m) for m in measures}
+            indicator = [{"name": m, "max": _nice_max(max((v for v in columns[m] if v is not None), default=0))}
+                         for m in measures]
+            series_data = [{"name": names[i], "value": [columns[m][i] for m in measures]}
+                           for i in range(min(data.row_count, 10))]
+        elif dim and measures and data.row_count >= 3:
+            # 单个数值列：每个分类值一个维度
+            values = data.numbers(measures[0])[:20]
+            names = data.labels(dim)[:20]
+            top = _nice_max(max((v for v in values if v is not None), default=0))
+            indicator = [{"name": n, "max": top} for n in names]
+            series_data = [{"name": measures[0], "value": values}]
+        else:
+            return None
+
+        option = cls._base(viz, trigger="item")
+        option.update({
+            "radar": {"indicator": indicator, "radius": "60%", "center": ["50%", "55%"]},
+            "series": [{"type": "radar", "data": series_data, "areaStyle": {"opacity": 0.15}}]
+        })
+        return cls._with_legend(option, [d["name"] for d in series_data])
+
+    @classmethod
+    def _build_funnel(cls, data: ChartData, viz: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        stage = data.pick(viz.get("x"), CATEGORY, TEMPORAL)
+        value = data.pick(viz.get("y"), NUMERIC)
+        if not stage or not value:
+            return None
+        items = [{"name": n, "value": v} for n, v in zip(data.labels(stage), data.numbers(value)) if v is not None]
+        if not items:
+            return None
+        top = max(item["value"] for item in items)
+        option = cls._base(viz, trigger="item")
+        option["series"] = [{
+            "name": value, "type": "funnel", "left": "10%", "width": "80%", "top": 60, "bottom": 20,
+            "min": 0, "max": top, "sort": "descending", "gap": 2,
+            "label": {"show": True, "position": "inside", "fontSize": 10},
+            "data": sorted(items, key=lambda item: item["value"], reverse=True)
+        }]
+        return option
+
+    @classmethod
+    def _build_gauge(cls, data: ChartData, viz: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        col = data.pick(viz.get("y"), NUMERIC)
+        if not col:
+            return None
+        value = next((v for v in data.numbers(col) if v is not None), None)
+        if value is None:
+            return None
+        formatter = "{value}"
+        if _RATE_NAME_RE.search(col) and 0 <= value <= 100:
+            if value <= 1:
+                value = round(value * 100, 2)
+            max_value, formatter = 100, "{value}%"
+        else:
+            max_value = _nice_max(abs(value))
+        option = cls._base(viz, trigger="item")
+        option["series"] = [{
+            "name": col, "type": "gauge", "min": min(0, value), "max": max_value,
+            "progress": {"show": True}, "splitLine": {"length": 10},
+            "detail": {"fontSize": 18, "valueAnimation": True, "formatter": formatter},
+            "data": [{"value": value, "name": viz.get("title") or col}]
+        }]
+        return option
+
+    @classmethod
+    def _build_heatmap(cls, data: ChartData, viz: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        dims = data.dimensions()
+        value = data.pick(viz.get("y"), NUMERIC)
+        if len(dims) >= 2 and value:
+            # 长表 (x, y, 值) -> 透视
+            x = data.pick(viz.get("x"), CATEGORY, TEMPORAL)
+            y = data.pick(viz.get("y"), CATEGORY, TEMPORAL, exclude=[x])
+            x_labels, y_labels, cells = cls._pivot(data.labels(x), data.labels(y), data.numbers(value))
+            x_pos = {label: i for i, label in enumerate(x_labels)}
+            y_pos = {label: i for i, label in enumerate(y_labels)}
+            points = [[x_pos[xl], y_pos[yl], v] for (xl, yl), v in cells.items()]
+        elif len(dims) == 1 and len(data.measures()) >= 2:
+            # 宽表 (分类 + 多个数值列)：数值列名作为 y 轴
+            x_labels = data.labels(dims[0])
+            y_labels = data.measures()
+            points = []
+            for yi, col in enumerate(y_labels):
+                for xi, v in enumerate(data.numbers(col)):
+                    if v is not None:
+                        points.append([xi, yi, v])
+        else:
+            return None
+        if not points:
+            return None
+
+        values = [p[2] for p in points]
+        option = cls._base(viz, trigger="item")
+        option.update({
+            "grid": dict(_GRID, bottom=80),
+            "xAxis": {"type": "category", "data": x_labels, "splitArea": {"show": True}},
+            "yAxis": {"type": "category", "data": y_labels, "splitArea": {"show": True}},
+            "visualMap": {
+                "min": min(values), "max": max(values), "calculable": True,
+                "orient": "horizontal", "left": "center", "bottom": 10
+            },
+            "series": [{
+                "name": value or "value", "type": "heatmap", "data": points,
+                "label": {"show": len(points) <= 100},
+                "emphasis": {"itemStyle": {"shadowBlur": 10, "shadowColor": "rgba(0, 0, 0, 0.5)"}}
+            }]
+        })
+        return option
+
+    @classmethod
+    def _build_treemap(cls, data: ChartData, viz: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        dims = data.dimensions()
+        value = data.pick(viz.get("y"), NUMERIC)
+        if not dims or not value:
+            return None
+        leaf = data.pick(viz.get("x"), CATEGORY, TEMPORAL)
+        parent = next((d for d in dims if d != leaf), None)
+        values = data.numbers(value)
+
+        if parent:
+            tree: "OrderedDict[str, OrderedDict[str, float]]" = OrderedDict()
+            for p, c, v in zip(data.labels(parent), data.labels(leaf), values):
+                if v is not None and v > 0:
+                    children = tree.setdefault(p, OrderedDict())
+                    children[c] = children.get(c, 0) + v
+            nodes = [{
+                "name": p, "value": sum(children.values()),
+                "children": [{"name": c, "value": v} for c, v in children.items()]
+            } for p, children in tree.items()]
+        else:
+            totals: "OrderedDict[str, float]" = OrderedDict()
+            for n, v in zip(data.labels(leaf), values):
+                if v is not None and v > 0:
+                    totals[n] = totals.get(n, 0) + v
+            nodes = [{"name": n, "value": v} for n, v in totals.items()]
+        if not nodes:
+            return None
+
+        series = {
+            "name": value, "type": "treemap", "top": 50, "roam": False,
+            "label": {"show": True}, "breadcrumb": {"show": bool(parent)}, "data": nodes
+        }
+        if parent:
+            series["leafDepth"] = 1
+        option = cls._base(viz, trigger="item")
+        option["series"] = [series]
+        return option
+
+    @staticmethod
+    def _has_cycle(links: Dict[Tuple[str, str], float]) -> bool:
+        graph: Dict[str, List[str]] = {}
+        for source, target in links:
+            graph.setdefault(source, []).append(target)
+        state: Dict[str, int] = {}
+        for start in graph:
+            if state.get(start):
+                continue
+            stack = [(start, iter(graph.get(start, ())))]
+            state[start] = 1
+            while stack:
+                node, children = stack[-1]
+                child = next(children, None)
+                if child is None:
+                    state[node] = 2
+                    stack.pop()
+                elif state.get(child) == 1:
+                    return True
+                elif not state.get(child):
+                    state[child] = 1
+                    stack.append((child, iter(graph.get(child, ()))))
+        return False
+
+    @classmethod
+    def _build_sankey(cls, data: ChartData, viz: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        stages = data.of_kind(CATEGORY)
+        if isinstance(viz.get("x"), str) and viz["x"] in stages:
+            stages.remove(viz["x"])
+            stages.insert(0, viz["x"])
+        if len(stages) < 2:
+            return None
+        value = data.pick(viz.get("y"), NUMERIC)
+        weights = data.numbers(value) if value else [1] * data.row_count
+        columns = [data.labels(s) for s in stages]
+
+        def build_links(suffix_stages: bool) -> Dict[Tuple[str, str], float]:
+            links: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+            for level in range(len(stages) - 1):
+                for source, target, w in zip(columns[level], columns[level + 1], weights):
+                    if w is None or w <= 0:
+                        continue
+                    if suffix_stages:
+                        source = source if level == 0 else f"{source} ({stages[level]})"
+                        target = f"{target} ({stages[level + 1]})"
+                    if source == target:
+                        continue
+                    links[(source, target)] = links.get((source, target), 0) + w
+            return links
+
+        links = build_links(False)
+        if cls._has_cycle(links):
+            # 同名节点出现在不同层级形成环 (ECharts 不支持)：按层级区分节点名
+            links = build_links(True)
+        if not links:
+            return None
+
+        nodes = list(OrderedDict.fromkeys(n for pair in links for n in pair))
+        option = cls._base(viz, trigger="item")
+        option["series"] = [{
+            "type": "sankey", "top": 50, "bottom": 20, "left": 20, "right": 80,
+            "emphasis": {"focus": "adjacency"},
+            "lineStyle": {"color": "gradient", "curveness": 0.5},
+            "data": [{"name": n} for n in nodes],
+            "links": [{"source": s, "target": t, "value": v} for (s, t), v in links.items()]
+        }]
+        return option
+
+    @staticmethod
+    def _box_stats(values: List[float]) -> Tuple[List[float], List[float]]:
+        """Tukey 箱线：返回 ([下须, Q1, 中位数, Q3, 上须], 离群点)"""
+        arr = np.sort(np.asarray(values, dtype=np.float64))
+        q1, median, q3 = np.percentile(arr, [25, 50, 75])
+        iqr = q3 - q1
+        inside = arr[(arr >= q1 - 1.5 * iqr) & (arr <= q3 + 1.5 * iqr)]
+        low, high = float(inside.min()), float(inside.max())
+        outliers = [float(v) for v in arr if v < low or v > high]
+        return [round(float(v), 4) for v in (low, q1, median, q3, high)], outliers
+
+    @classmethod
+    def _build_boxplot(cls, data: ChartData, viz: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        group = data.pick(viz.get("x"), CATEGORY, TEMPORAL)
+        summary_cols = data.match_columns(_BOX_PATTERNS)
+        outlier_points: List[List[Any]] = []
+
+        if summary_cols:
+            # 结果已是五数概括 (min/q1/median/q3/max)
+            labels = data.labels(group) if group else [f"#{i + 1}" for i in range(data.row_count)]
+            columns = [data.numbers(summary_cols[role]) for role in _BOX_PATTERNS]
+            boxes = [list(row) for row in zip(*columns)]
+        else:
+            if group:
+                value = data.pick(viz.get("y"), NUMERIC)
+                if not value:
+                    return None
+                grouped: "OrderedDict[str, List[float]]" = OrderedDict()
+                for g, v in zip(data.labels(group), data.numbers(value)):
+                    if v is not None:
+                        grouped.setdefault(g, []).append(v)
+            else:
+                grouped = OrderedDict(
+                    (m, [v for v in data.numbers(m) if v is not None]) for m in data.measures()[:10]
+                )
+            grouped = OrderedDict((k, v) for k, v in grouped.items() if v)
+            # 每组只有一个值 (已聚合的数据) 画箱线图没有意义
+            if not grouped or max(len(v) for v in grouped.values()) < 2:
+                return None
+            labels, boxes = [], []
+            for i, (name, values) in enumerate(grouped.items()):
+                box, outliers = cls._box_stats(values)
+                labels.append(name)
+                boxes.append(box)
+                outlier_points.extend([i, v] for v in outliers)
+
+        option = cls._base(viz, trigger="item")
+        option.update({
+            "grid": dict(_GRID),
+            "xAxis": {"type": "category", "data": labels, "boundaryGap": True},
+            "yAxis": {"type": "value", "scale": True},
+            "series": [{"name": "boxplot", "type": "boxplot", "data": boxes}]
+        })
+        if outlier_points:
+            option["series"].append({"name": "outlier", "type": "scatter", "data": outlier_points})
+        return option
+
+    @classmethod
+    def _build_waterfall(cls, data: ChartData, viz: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        x = data.pick(viz.get("x"), CATEGORY, TEMPORAL)
+        value = data.pick(viz.get("y"), NUMERIC)
+        if not x or not value:
+            return None
+        labels = data.labels(x)
+        deltas = data.numbers(value)
+
+        running = 0
+        bases, increases, decreases, totals = [], [], [], []
+        for label, delta in zip(labels, deltas):
+            delta = delta or 0
+            if _TOTAL_LABEL_RE.match(label.strip()):
+                # 合计行：从 0 画到当前累计值
+                bases.append(0)
+                totals.append(running)
+                increases.append("-")
+                decreases.append("-")
+                continue
+            if delta >= 0:
+                bases.append(running)
+                increases.append(delta)
+                decreases.append("-")
+            else:
+                bases.append(running + delta)
+                increases.append("-")
+                decreases.append(-delta)
+            totals.append("-")
+            running += delta
+            # 透明辅助柱的堆叠方式无法表达累计值为负的情况，交给 LLM
+            if running < 0:
+                return None
+
+        option = cls._base(viz)
+        option.update({
+            "grid": dict(_GRID),
+            "xAxis": {"type": "category", "data": labels, "axisLabel": {"rotate": 30 if len(labels) > 5 else 0}},
+            "yAxis": {"type": "value"},
+            "series": [
+                {
+                    "name": "Base", "type": "bar", "stack": "total", "silent": True, "data": bases,
+                    "itemStyle": {"borderColor": "transparent", "color": "transparent"},
+                    "emphasis": {"itemStyle": {"borderColor": "transparent", "color": "transparent"}}
+                },
+                {"name": "Increase", "type": "bar", "stack": "total", "data": increases, "itemStyle": {"color": "#91cc75"}},
+                {"name": "Decrease", "type": "bar", "stack": "total", "data": decreases, "itemStyle": {"color": "#ee6666"}}
+            ]
+        })
+        names = ["Increase", "Decrease"]
+        if any(t != "-" for t in totals):
+            option["series"].append({"name": "Total", "type": "bar", "stack": "total", "data": totals, "itemStyle": {"color": "#5470c6"}})
+            names.append("Total")
+        return cls._with_legend(option, names)
+
+    @classmethod
+    def _build_candlestick(cls, data: ChartData, viz: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        ohlc = data.match_columns(_OHLC_PATTERNS)
+        if not ohlc:
+            return None
+        x = data.pick(viz.get("x"), TEMPORAL, CATEGORY)
+        labels = data.labels(x) if x else [str(i + 1) for i in range(data.row_count)]
+        # ECharts K 线数据顺序: [open, close, lowest, highest]
+        columns = [data.numbers(ohlc[role]) for role in ("open", "close", "low", "high")]
+        candles = [list(row) for row in zip(*columns)]
+
+        option = cls._base(viz)
+        option["tooltip"]["axisPointer"] = {"type": "cross"}
+        option.update({
+            "grid": dict(_GRID, bottom=70 if len(candles) > 60 else 40),
+            "xAxis": {"type": "category", "data": labels, "boundaryGap": True},
+            "yAxis": {"type": "value", "scale": True},
+            "series": [{
+                "name": viz.get("title") or "K",
+                "type": "candlestick",
+                "data": candles,
+                "itemStyle": {"color": "#ec0000", "color0": "#00da3c", "borderColor": "#8A0000", "borderColor0": "#008F28"}
+            }]
+        })
+        if len(candles) > 60:
+            option["dataZoom"] = [
+                {"type": "inside", "start": 100 - 6000 / len(candles), "end": 100},
+                {"type": "slider", "bottom": 10}
+            ]
+        return option
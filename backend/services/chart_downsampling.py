@@ -0,0 +1,305 @@
+"""
+图表数据降采样 - 结果行数超过点数预算时，在构建 ECharts 配置之前缩减数据
+line / area (及时间轴柱状图): LTTB (Largest-Triangle-Three-Buckets)
+scatter: 网格抽稀 (保留稀疏区域的离群点)
+bar / pie: top-N + "其他" 聚合
+heatmap: 坐标轴分箱后求和
+"""
+import math
+from collections import OrderedDict
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from config import CHART_MAX_POINTS, CHART_MAX_CATEGORIES, CHART_HEATMAP_MAX_BINS
+from services.chart_builders import ChartData, NUMERIC, TEMPORAL, CATEGORY, to_number
+from utils.logger import logger
+
+OTHER_LABEL = "其他"
+
+
+def lttb_indices(xs: np.ndarray, ys: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    LTTB 降采样，返回保留点的下标 (含首尾两点)
+    每个桶中选取与「上一个选中点」和「下一个桶均值点」构成三角形面积最大的点。
+    """
+    n = len(xs)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    ys = np.nan_to_num(ys.astype(np.float64))
+    xs = xs.astype(np.float64)
+    every = (n - 2) / (threshold - 2)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    a = 0
+    for i in range(threshold - 2):
+        start = int(math.floor(i * every)) + 1
+        end = int(math.floor((i + 1) * every)) + 1
+        next_start = end
+        next_end = min(int(math.floor((i + 2) * every)) + 1, n)
+        if next_start >= next_end:
+            avg_x, avg_y = xs[n - 1], ys[n - 1]
+        else:
+            avg_x = xs[next_start:next_end].mean()
+            avg_y = ys[next_start:next_end].mean()
+        area = np.abs(
+            (xs[a] - avg_x) * (ys[start:end] - ys[a]) - (xs[a] - xs[start:end]) * (avg_y - ys[a])
+        )
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    selected[-1] = n - 1
+    return selected
+
+
+def grid_thin_indices(xs: np.ndarray, ys: np.ndarray, budget: int) -> np.ndarray:
+    """散点网格抽稀：每个网格单元只保留第一个点，仍超预算时再等间隔抽取"""
+    n = len(xs)
+    if n <= budget:
+        return np.arange(n)
+    valid = ~(np.isnan(xs) | np.isnan(ys))
+    cells = max(int(math.sqrt(budget)), 1)
+
+    def cell_of(values: np.ndarray) -> np.ndarray:
+        low, high = np.nanmin(values), np.nanmax(values)
+        span = (high - low) or 1.0
+        return np.minimum(((values - low) / span * cells).astype(np.int64), cells - 1)
+
+    idx = np.flatnonzero(valid)
+    keys = cell_of(xs[idx]) * cells + cell_of(ys[idx])
+    _, first = np.unique(keys, return_index=True)
+    kept = np.sort(idx[first])
+    if len(kept) > budget:
+        kept = kept[np.linspace(0, len(kept) - 1, budget).astype(np.int64)]
+    return kept
+
+
+def _axis_numbers(data: ChartData, col: Optional[str]) -> Optional[np.ndarray]:
+    """
+    把坐标轴转成可计算的数值：数值/日期按实际值，日期字符串按排序后的序号；
+    分类轴返回 None
+    """
+    if col is None:
+        return None
+    values = data.column(col)
+    non_null = [v for v in values if v is not None]
+    if non_null and all(to_number(v) is not None for v in non_null):
+        return np.asarray([np.nan if to_number(v) is None else float(to_number(v)) for v in values], dtype=np.float64)
+    if non_null and all(isinstance(v, (datetime, date)) for v in non_null):
+        return np.asarray([
+            np.nan if v is None else (v.timestamp() if isinstance(v, datetime) else float(v.toordinal()))
+            for v in values
+        ], dtype=np.float64)
+    if data.kind(col) == TEMPORAL:
+        rank = {label: i for i, label in enumerate(sorted(set(data.labels(col))))}
+        return np.asarray([rank[label] for label in data.labels(col)], dtype=np.float64)
+    return None
+
+
+class ChartDownsampler:
+    """按图表类型缩减查询结果，返回 (新结果, 元数据)；无需降采样时原样返回且元数据为 None"""
+
+    @classmethod
+    def downsample(
+        cls,
+        sql_result: Dict[str, Any],
+        chart_type: str,
+        viz_config: Optional[Dict[str, Any]] = None
+    ) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+        data = ChartData(sql_result)
+        viz_config = viz_config or {}
+        if not data.columns or data.row_count <= min(CHART_MAX_POINTS, CHART_MAX_CATEGORIES, CHART_HEATMAP_MAX_BINS):
+            return sql_result, None
+        try:
+            if chart_type in ("line", "area"):
+                reduced, method = cls._lttb(data, viz_config), "lttb"
+            elif chart_type == "scatter":
+                reduced, method = cls._scatter(data, viz_config), "grid"
+            elif chart_type in ("bar", "pie"):
+                x = data.pick(viz_config.get("x"), CATEGORY, TEMPORAL)
+                if chart_type == "bar" and x and data.kind(x) == TEMPORAL:
+                    reduced, method = cls._lttb(data, viz_config), "lttb"
+                else:
+                    reduced, method = cls._top_n(data, viz_config), "top_n"
+            elif chart_type == "heatmap":
+                reduced, method = cls._heatmap_bins(data, viz_config), "binning"
+            else:
+                return sql_result, None
+        except Exception as e:
+            logger.warning("⚠️ [Downsample] %s 降采样失败，使用原始数据: %s", chart_type, e)
+            return sql_result, None
+
+        if reduced is None:
+            return sql_result, None
+        meta = {
+            "original_row_count": data.row_count,
+            "point_count": reduced["row_count"],
+            "method": method
+        }
+        if "total_count" in sql_result:
+            meta["total_count"] = sql_result.get("total_count")
+        logger.debug("📉 [Downsample] %s: %s 行 -> %s 行 (%s)", chart_type, data.row_count, reduced["row_count"], method)
+        return reduced, meta
+
+    # ---------- 工具 ----------
+
+    @staticmethod
+    def _take(data: ChartData, indices: Sequence[int]) -> Dict[str, Any]:
+        columns = {c: data.column(c) for c in data.columns}
+        rows = [{c: columns[c][i] for c in data.columns} for i in indices]
+        return {"columns": list(data.columns), "rows": rows, "row_count": len(rows)}
+
+    @staticmethod
+    def _value_columns(data: ChartData, viz_config: Dict[str, Any], exclude: Sequence[str]) -> List[str]:
+        measures = data.measures(exclude=exclude)
+        hinted = [c for c in (viz_config.get("y_multi") or []) if c in measures]
+        if not hinted and viz_config.get("y") in measures:
+            hinted = [viz_config["y"]]
+        return hinted or measures[:1]
+
+    # ---------- 各策略 ----------
+
+    @classmethod
+    def _lttb(cls, data: ChartData, viz_config: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        if data.row_count <= CHART_MAX_POINTS:
+            return None
+        x = data.pick(viz_config.get("x"), TEMPORAL, CATEGORY) or data.pick(viz_config.get("x"), NUMERIC)
+        ys = cls._value_columns(data, viz_config, exclude=[x] if x else ())
+        if not ys:
+            return None
+        xs = _axis_numbers(data, x)
+        if xs is None:
+            xs = np.arange(data.row_count, dtype=np.float64)
+        group = data.pick(viz_config.get("series"), CATEGORY, exclude=[x]) if x else None
+        if group and len(np.unique(xs)) < data.row_count:
+            return cls._lttb_by_group(data, xs, ys, group)
+        # 多条序列平分点数预算，保留各自的特征点
+        budget = max(CHART_MAX_POINTS // len(ys), 3)
+        kept = set()
+        for y in ys:
+            values = np.asarray([np.nan if v is None else v for v in data.numbers(y)], dtype=np.float64)
+            kept.update(lttb_indices(xs, values, budget).tolist())
+        return cls._take(data, sorted(kept))
+
+    @classmethod
+    def _lttb_by_group(cls, data: ChartData, xs: np.ndarray, ys: List[str], group: str) -> Optional[Dict[str, Any]]:
+        """
+        长表 (x, 分组, 值)：先按分组透视到共同的 x 轴，每个分组按 x 顺序各自做 LTTB，
+        再保留所有分组选中 x 的并集对应的行，保证每条序列都在同一组 x 上有值 (图上不出现断点)。
+        """
+        axis, x_pos = np.unique(xs, return_inverse=True)
+        labels = data.labels(group)
+        names = list(OrderedDict.fromkeys(labels))
+        # 画出的点数 = 保留的 x 数 × 分组数，按分组数缩小 x 的预算
+        target = max(CHART_MAX_POINTS // len(names), 3)
+        if len(axis) <= target:
+            return None
+        budget = max(target // (len(names) * len(ys)), 3)
+        position = {name: i for i, name in enumerate(names)}
+        group_pos = np.asarray([position[label] for label in labels])
+        kept = set()
+        for y in ys:
+            values = np.asarray([np.nan if v is None else v for v in data.numbers(y)], dtype=np.float64)
+            grid = np.full((len(names), len(axis)), np.nan)
+            grid[group_pos, x_pos] = values
+            for series in grid:
+                present = np.flatnonzero(~np.isnan(series))
+                if len(present):
+                    kept.update(present[lttb_indices(axis[present], series[present], budget)].tolist())
+        keep_x = np.zeros(len(axis), dtype=bool)
+        keep_x[sorted(kept)] = True
+        return cls._take(data, np.flatnonzero(keep_x[x_pos]).tolist())
+
+    @classmethod
+    def _scatter(cls, data: ChartData, viz_config: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        if data.row_count <= CHART_MAX_POINTS:
+            return None
+        x = data.pick(viz_config.get("x"), NUMERIC)
+        y = data.pick(viz_config.get("y"), NUMERIC, exclude=[x] if x else ())
+        if not x or not y:
+            return None
+        xs = np.asarray([np.nan if v is None else v for v in data.numbers(x)], dtype=np.float64)
+        ys = np.asarray([np.nan if v is None else v for v in data.numbers(y)], dtype=np.float64)
+        return cls._take(data, grid_thin_indices(xs, ys, CHART_MAX_POINTS).tolist())
+
+    @classmethod
+    def _top_n(cls, data: ChartData, viz_config: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        x = data.pick(viz_config.get("x"), CATEGORY, TEMPORAL)
+        if not x:
+            return None
+        values = cls._value_columns(data, viz_config, exclude=[x])
+        if not values:
+            return None
+        totals: "OrderedDict[str, List[float]]" = OrderedDict()
+        numbers = [data.numbers(v) for v in values]
+        for i, label in enumerate(data.labels(x)):
+            bucket = totals.setdefault(label, [0.0] * len(values))
+            for j, col in enumerate(numbers):
+                bucket[j] += col[i] or 0
+        if len(totals) <= CHART_MAX_CATEGORIES:
+            return None
+        ranked = sorted(totals.items(), key=lambda item: item[1][0], reverse=True)
+        keep, rest = ranked[:CHART_MAX_CATEGORIES - 1], ranked[CHART_MAX_CATEGORIES - 1:]
+        other = [sum(item[1][j] for item in rest) for j in range(len(values))]
+        rows = [{x: label, **dict(zip(values, sums))} for label, sums in keep]
+        rows.append({x: f"{OTHER_LABEL} ({len(rest)})", **dict(zip(values, other))})
+        return {"columns": [x] + values, "rows": rows, "row_count": len(rows)}
+
+    @staticmethod
+    def _bin_axis(data: ChartData, col: str, weights: List[float], max_bins: int) -> Optional[List[str]]:
+        """把一个坐标轴的取值映射为分箱标签；分类轴保留权重最高的 max_bins-1 项，其余并入「其他」"""
+        labels = data.labels(col)
+        distinct = list(OrderedDict.fromkeys(labels))
+        if len(distinct) <= max_bins:
+            return labels
+        numeric = _axis_numbers(data, col) if data.kind(col) != CATEGORY else None
+        if numeric is not None:
+            low, high = np.nanmin(numeric), np.nanmax(numeric)
+            width = (high - low) / max_bins or 1.0
+            bins = np.minimum(((numeric - low) / width).astype(np.int64), max_bins - 1)
+            # 每个分箱用该箱内的首/末标签命名 (保持原始格式，如日期)
+            bounds: Dict[int, List[str]] = {}
+            for b, label, v in sorted(zip(bins.tolist(), labels, numeric.tolist()), key=lambda t: t[2]):
+                bounds.setdefault(b, [label, label])[1] = label
+            return [f"{bounds[b][0]}~{bounds[b][1]}" if bounds[b][0] != bounds[b][1] else bounds[b][0]
+                    for b in bins.tolist()]
+        totals: Dict[str, float] = {}
+        for label, w in zip(labels, weights):
+            totals[label] = totals.get(label, 0) + abs(w or 0)
+        top = set(sorted(totals, key=totals.get, reverse=True)[:max_bins - 1])
+        return [label if label in top else OTHER_LABEL for label in labels]
+
+    @classmethod
+    def _heatmap_bins(cls, data: ChartData, viz_config: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        dims = data.dimensions()
+        value = data.pick(viz_config.get("y"), NUMERIC)
+        if not value:
+            return None
+        weights = data.numbers(value)
+        if len(dims) >= 2:
+            x = data.pick(viz_config.get("x"), CATEGORY, TEMPORAL)
+            y = data.pick(viz_config.get("y"), CATEGORY, TEMPORAL, exclude=[x])
+            x_bins = cls._bin_axis(data, x, weights, CHART_HEATMAP_MAX_BINS)
+            y_bins = cls._bin_axis(data, y, weights, CHART_HEATMAP_MAX_BINS)
+            cells: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+            for xb, yb, w in zip(x_bins, y_bins, weights):
+                if w is not None:
+                    cells[(xb, yb)] = cells.get((xb, yb), 0) + w
+            if len(cells) >= data.row_count:
+                return None
+            rows = [{x: xb, y: yb, value: w} for (xb, yb), w in cells.items()]
+            return {"columns": [x, y, value], "rows": rows, "row_count": len(rows)}
+        if len(dims) == 1:
+            # 宽表：按行维度分箱，各数值列求和
+            x = dims[0]
+            measures = data.measures()
+            x_bins = cls._bin_axis(data, x, weights, CHART_HEATMAP_MAX_BINS)
+            grouped: "OrderedDict[str, List[float]]" = OrderedDict()
+            columns = [data.numbers(m) for m in measures]
+            for i, xb in enumerate(x_bins):
+                bucket = grouped.setdefault(xb, [0.0] * len(measures))
+                for j, col in enumerate(columns):
+                    bucket[j] += col[i] or 0
+            if len(grouped) >= data.row_count:
+                return None
+            rows = [{x: xb, **dict(zip(measures, sums))} for xb, sums in grouped.items()]
+            return {"columns": [x] + measures, "rows": rows, "row_count": len(rows)}
+        return None
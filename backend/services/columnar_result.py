@@ -0,0 +1,230 @@
+"""
+列式查询结果 - 列名只保存一份，每列一个 NumPy 数组
+"""
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+import numpy as np
+
+
+def _to_column_array(values: List[Any]) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    把一列 Python 值转成带类型的 NumPy 数组
+    返回 (数组, 空值掩码)；整数列 -> int64 (含 None 时空位填 0 + 掩码)，
+    超出 int64 的无符号整数 (如 BIGINT UNSIGNED) -> uint64，仍然放不下的 -> object 数组，
+    其他数值列 (含 Decimal/None) -> float64 + 掩码，
+    其余 (字符串、日期、混合类型) 保留为 object 数组。
+    """
+    mask = None
+    non_null = [v for v in values if v is not None]
+    if len(non_null) != len(values):
+        mask = np.fromiter((v is None for v in values), dtype=bool, count=len(values))
+
+    if non_null and all(isinstance(v, (int, np.integer)) and not isinstance(v, bool) for v in non_null):
+        filled = [v if v is not None else 0 for v in values]
+        try:
+            return np.asarray(filled, dtype=np.int64), mask
+        except OverflowError:
+            pass
+        # 负数转 uint64 会被 NumPy 静默回绕，只有全部非负时才使用 uint64
+        if min(non_null) >= 0:
+            try:
+                return np.asarray(filled, dtype=np.uint64), mask
+            except OverflowError:
+                pass
+        # 超大整数不能退化为 float64 (会丢精度)，下面保留为 object
+    elif non_null and all(isinstance(v, (int, float, Decimal, np.number)) and not isinstance(v, bool) for v in non_null):
+        return np.asarray([float(v) if v is not None else np.nan for v in values], dtype=np.float64), mask
+
+    arr = np.empty(len(values), dtype=object)
+    arr[:] = values
+    return arr, None
+
+
+class ColumnarResultBuilder:
+    """按批追加行元组，最后一次性构造 ColumnarResult (不为每行创建 dict)"""
+
+    def __init__(self, columns: Sequence[str]):
+        self.columns = list(columns)
+        self._values: List[List[Any]] = [[] for _ in self.columns]
+        self.row_count = 0
+
+    def append_rows(self, rows: Iterable[Sequence[Any]]) -> None:
+        values = self._values
+        for row in rows:
+            for i, v in enumerate(row):
+                values[i].append(v)
+            self.row_count += 1
+
+    def build(self) -> "ColumnarResult":
+        arrays = []
+        masks = []
+        for values in self._values:
+            arr, mask = _to_column_array(values)
+            arrays.append(arr)
+            masks.append(mask)
+        return ColumnarResult(self.columns, arrays, masks)
+
+
+class ColumnarResult:
+    """
+    列式查询结果
+    与 SQLExecutor 返回的 dict 结构兼容 (支持 result["columns"] / result["rows"] / result.get(...))，
+    但只有在访问 rows 时才按需物化为行字典。
+    序列化为紧凑格式 {columns, data: [[...]], row_count}，或 Arrow IPC (需安装 pyarrow)。
+    """
+
+    def __init__(
+        self,
+        columns: Sequence[str],
+        arrays: Sequence[np.ndarray],
+        masks: Optional[Sequence[Optional[np.ndarray]]] = None,
+        meta: Optional[Dict[str, Any]] = None
+    ):
+        self.columns = list(columns)
+        self.arrays = list(arrays)
+        self.masks = list(masks) if masks is not None else [None] * len(self.arrays)
+        self.meta: Dict[str, Any] = dict(meta or {})
+        self._rows_cache: Optional[List[Dict[str, Any]]] = None
+
+    @classmethod
+    def from_rows(cls, rows: List[Dict[str, Any]], columns: Optional[Sequence[str]] = None) -> "ColumnarResult":
+        columns = list(columns) if columns is not None else (list(rows[0].keys()) if rows else [])
+        builder = ColumnarResultBuilder(columns)
+        builder.append_rows(tuple(row.get(c) for c in columns) for row in rows)
+        return builder.build()
+
+    @property
+    def row_count(self) -> int:
+        return len(self.arrays[0]) if self.arrays else 0
+
+    def column(self, name: str) -> List[Any]:
+        """返回某列的 Python 值列表 (空值还原为 None)"""
+        idx = self.columns.index(name)
+        values = self.arrays[idx].tolist()
+        mask = self.masks[idx]
+        if mask is not None:
+            values = [None if m else v for v, m in zip(values, mask.tolist())]
+        return values
+
+    def column_array(self, name: str) -> np.ndarray:
+        return self.arrays[self.columns.index(name)]
+
+    def is_numeric(self, name: str) -> bool:
+        return self.column_array(name).dtype.kind in ("i", "u", "f")
+
+    def _column_lists(self, limit: Optional[int] = None) -> List[List[Any]]:
+        lists = []
+        for arr, mask in zip(self.arrays, self.masks):
+            values = (arr[:limit] if limit is not None else arr).tolist()
+            if mask is not None:
+                m = (mask[:limit] if limit is not None else mask).tolist()
+                values = [None if flag else v for v, flag in zip(values, m)]
+            lists.append(values)
+        return lists
+
+    def iter_records(self, limit: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        columns = self.columns
+        for values in zip(*self._column_lists(limit)):
+            yield dict(zip(columns, values))
+
+    def head(self, n: int) -> List[Dict[str, Any]]:
+        return list(self.iter_records(limit=n))
+
+    @property
+    def rows(self) -> List[Dict[str, Any]]:
+        """兼容旧接口：按需物化为行字典 (结果较大时请优先使用 column / head)"""
+        if self._rows_cache is None:
+            self._rows_cache = list(self.iter_records())
+        return self._rows_cache
+
+    # ---------- dict 兼容接口 ----------
+
+    def __getitem__(self, key: str) -> Any:
+        if key == "columns":
+            return self.columns
+        if key == "rows":
+            return self.rows
+        if key == "row_count":
+            return self.row_count
+        return self.meta[key]
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key in ("columns", "rows", "row_count"):
+            raise KeyError(f"{key} 为只读字段")
+        self.meta[key] = value
+
+    def __contains__(self, key: str) -> bool:
+        return key in ("columns", "rows", "row_count") or key in self.meta
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def copy(self) -> "ColumnarResult":
+        return ColumnarResult(self.columns, self.arrays, self.masks, self.meta)
+
+    # ---------- 序列化 ----------
+
+    def to_compact(self) -> Dict[str, Any]:
+        """紧凑格式：列名一次 + 行数组"""
+        payload = {
+            "format": "columnar",
+            "columns": self.columns,
+            "data": [list(values) for values in zip(*self._column_lists())],
+            "row_count": self.row_count
+        }
+        payload.update(self.meta)
+        return payload
+
+    def to_dict(self) -> Dict[str, Any]:
+        """供 CustomJSONEncoder 使用"""
+        return self.to_compact()
+
+    def to_dataframe(self):
+        """直接由列数组构造 DataFrame (不经过行字典)"""
+        import pandas as pd
+        data = {}
+        for name, arr, mask in zip(self.columns, self.arrays, self.masks):
+            if mask is not None and arr.dtype.kind == "f":
+                data[name] = arr
+            elif mask is not None and arr.dtype.kind in ("i", "u"):
+                data[name] = pd.arrays.IntegerArray(arr, mask)
+            elif mask is not None:
+                col = arr.astype(object)
+                col[mask] = None
+                data[name] = col
+            else:
+                data[name] = arr
+        return pd.DataFrame(data, columns=self.columns)
+
+    def to_arrow_table(self):
+        try:
+            import pyarrow as pa
+        except ImportError as e:
+            raise ImportError("Arrow 序列化需要安装 pyarrow") from e
+        arrays = []
+        for arr, mask in zip(self.arrays, self.masks):
+            if arr.dtype == object:
+                values = [v.isoformat() if isinstance(v, (datetime, date)) else v for v in arr.tolist()]
+                arrays.append(pa.array(values, from_pandas=True))
+            else:
+                arrays.append(pa.array(arr, mask=mask))
+        return pa.Table.from_arrays(arrays, names=self.columns)
+
+    def to_arrow_ipc(self) -> bytes:
+        """序列化为 Arrow IPC Stream 字节"""
+        import pyarrow as pa
+        table = self.to_arrow_table()
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+
+    def __len__(self) -> int:
+        return self.row_count
+
+    def __repr__(self) -> str:
+        return f"ColumnarResult(columns={self.columns}, row_count={self.row_count})"
@@ -0,0 +1,247 @@
+"""
+本地意图分类器 - 关键词规则 + 字符 n-gram 线性模型 (softmax 回归)
+置信度足够时直接返回意图，否则由 SQLAgent 回退到 LLM 分类。
+"""
+import json
+import math
+import random
+import re
+import zlib
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from config import INTENT_MODEL_PATH
+
+LABELS = ("chat", "sql_query", "confirmation")
+
+# 只由肯定词组成的短回复 -> confirmation (仅当上一条助手回复是待确认的分析方案时可信)
+_CONFIRM_RE = re.compile(
+    r'(可以|好的|好|行|嗯|对|是的|没问题|确认|同意|执行|开始|去做|做吧|按这个来|就这样|就按这个|吧|啊|呀|的|了|'
+    r'ok|okay|yes|yep|sure|go|ahead|doit|do|it|proceed|run|please)+'
+)
+# 数据分析类关键词，作为额外特征帮助线性模型识别 sql_query
+_SQL_CUE_RE = re.compile(
+    r'(统计|多少|几个|排名|排行|前\d+|前[十五三]|趋势|占比|同比|环比|分布|汇总|总数|总额|平均|最高|最低|'
+    r'销售|销量|收入|利润|订单|用户数|增长|对比|每月|每天|每年|季度|按|各|列出|查询|筛选|'
+    r'\b(top|total|sum|count|average|avg|max|min|trend|by|per|list|show|how many|how much|monthly|daily)\b)'
+)
+# 只由问候/致谢组成 -> chat
+_GREETING_RE = re.compile(r'(你好|您好|嗨|哈喽|谢谢|多谢|感谢|再见|拜拜|hi|hello|hey|thanks|thankyou|thx|bye)+')
+
+# 未训练历史数据时使用的种子样本
+_SEED_SAMPLES: List[Tuple[str, str]] = [
+    ("上个月各城市销售额", "sql_query"),
+    ("统计每个月的订单数量", "sql_query"),
+    ("销量前十的产品有哪些", "sql_query"),
+    ("查询2024年的总收入", "sql_query"),
+    ("各部门平均工资是多少", "sql_query"),
+    ("最近一周新增用户趋势", "sql_query"),
+    ("哪个地区的利润最高", "sql_query"),
+    ("按季度对比今年和去年的销售额", "sql_query"),
+    ("客户复购率是多少", "sql_query"),
+    ("列出库存低于100的商品", "sql_query"),
+    ("分析一下各渠道的转化率", "sql_query"),
+    ("帮我看看退货率的变化", "sql_query"),
+    ("show me total sales by region", "sql_query"),
+    ("how many orders were placed last month", "sql_query"),
+    ("top 10 customers by revenue", "sql_query"),
+    ("average order value per city", "sql_query"),
+    ("monthly revenue trend for 2024", "sql_query"),
+    ("list products with low stock", "sql_query"),
+    ("可以", "confirmation"),
+    ("好的，执行吧", "confirmation"),
+    ("按这个来", "confirmation"),
+    ("没问题，开始吧", "confirmation"),
+    ("行，就这样做", "confirmation"),
+    ("确认执行", "confirmation"),
+    ("可以的，去做吧", "confirmation"),
+    ("就按这个方案来", "confirmation"),
+    ("ok", "confirmation"),
+    ("yes, go ahead", "confirmation"),
+    ("sure, run it", "confirmation"),
+    ("proceed with the plan", "confirmation"),
+    ("你好", "chat"),
+    ("你是谁", "chat"),
+    ("谢谢你的帮助", "chat"),
+    ("你能做什么", "chat"),
+    ("刚才我问了什么问题", "chat"),
+    ("解释一下什么是同比和环比", "chat"),
+    ("这个结论是什么意思", "chat"),
+    ("给我讲个笑话", "chat"),
+    ("你用的是什么模型", "chat"),
+    ("hello", "chat"),
+    ("who are you", "chat"),
+    ("what can you do", "chat"),
+    ("thanks a lot", "chat"),
+    ("what did I ask before", "chat"),
+    ("explain what year over year means", "chat"),
+]
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r'\s+', ' ', text.strip().lower())
+
+
+def _compact(text: str) -> str:
+    """去掉空白与标点，用于规则匹配"""
+    return re.sub(r'[\s\W_]+', '', text.lower())
+
+
+class IntentClassifier:
+    """
+    chat / sql_query / confirmation 三分类
+    特征：字符 1-3 gram + 英文单词，按 crc32 哈希到固定维度 (跨进程稳定)，L2 归一化。
+    模型：多分类 softmax 回归，SGD 训练，权重以稀疏 JSON 保存在 INTENT_MODEL_PATH。
+    """
+
+    def __init__(self, model_path: Path = INTENT_MODEL_PATH, dim: int = 1 << 18):
+        self.model_path = Path(model_path)
+        self.dim = dim
+        self.weights: Dict[str, Dict[int, float]] = {label: {} for label in LABELS}
+        self.bias: Dict[str, float] = {label: 0.0 for label in LABELS}
+        self.trained_samples = 0
+        self._loaded = False
+
+    # ---------- 特征 ----------
+
+    def _features(self, text: str) -> Dict[int, float]:
+        text = _normalize(text)
+        padded = f"^{text}$"
+        counts: Counter = Counter()
+        for n in (1, 2, 3):
+            for i in range(len(padded) - n + 1):
+                counts[zlib.crc32(padded[i:i + n].encode("utf-8")) % self.dim] += 1
+        for word in re.findall(r'[a-z]+', text):
+            counts[zlib.crc32(f"w:{word}".encode("utf-8")) % self.dim] += 1
+        cues = len(_SQL_CUE_RE.findall(text))
+        if cues:
+            counts[zlib.crc32(b"cue:sql") % self.dim] += 2 * min(cues, 3)
+        norm = math.sqrt(sum(v * v for v in counts.values())) or 1.0
+        return {k: v / norm for k, v in counts.items()}
+
+    # ---------- 推理 ----------
+
+    def _probabilities(self, features: Dict[int, float]) -> Dict[str, float]:
+        scores = {}
+        for label in LABELS:
+            w = self.weights[label]
+            scores[label] = self.bias[label] + sum(w.get(k, 0.0) * v for k, v in features.items())
+        top = max(scores.values())
+        exp = {label: math.exp(s - top) for label, s in scores.items()}
+        total = sum(exp.values())
+        return {label: v / total for label, v in exp.items()}
+
+    @staticmethod
+    def match_rules(question: str) -> Optional[str]:
+        """高精度规则：短肯定回复 -> confirmation，纯问候/致谢 -> chat"""
+        compact = _compact(question)
+        if not compact or len(compact) > 16:
+            return None
+        if _CONFIRM_RE.fullmatch(compact):
+            return "confirmation"
+        if _GREETING_RE.fullmatch(compact):
+            return "chat"
+        return None
+
+    def predict(
+        self, question: str, tables: Optional[Sequence[str]] = None, after_plan: bool = False
+    ) -> Tuple[str, float]:
+        """
+        返回 (意图, 置信度)
+        after_plan 表示上一条助手回复是待确认的分析方案；否则“对”、“go”之类的短回复并不是确认执行，
+        confirmation 的置信度记为 0 (低于任何回退阈值)，交给 LLM 判断。
+        """
+        rule = self.match_rules(question)
+        if rule == "confirmation" and not after_plan:
+            return rule, 0.0
+        if rule:
+            return rule, 1.0
+        self.ensure_loaded()
+        probs = self._probabilities(self._features(question))
+        label = max(probs, key=probs.get)
+        confidence = probs[label]
+        if label == "confirmation" and not after_plan:
+            return label, 0.0
+        # 问题中直接出现了表名，是明确的数据查询信号
+        if label == "sql_query" and tables:
+            lowered = question.lower()
+            if any(len(t) >= 3 and t.lower() in lowered for t in tables):
+                confidence = max(confidence, 0.9)
+        return label, confidence
+
+    # ---------- 训练与持久化 ----------
+
+    def train(self, samples: Iterable[Tuple[str, str]], epochs: int = 30, lr: float = 0.5,
+              l2: float = 1e-5, seed: int = 42, include_seeds: bool = True) -> None:
+        data = [(q, label) for q, label in samples if label in LABELS and q and q.strip()]
+        if include_seeds:
+            data += _SEED_SAMPLES
+        featurized = [(self._features(q), label) for q, label in data]
+        self.weights = {label: {} for label in LABELS}
+        self.bias = {label: 0.0 for label in LABELS}
+        rng = random.Random(seed)
+        for epoch in range(epochs):
+            rng.shuffle(featurized)
+            step = lr / (1 + epoch * 0.1)
+            for features, target in featurized:
+                probs = self._probabilities(features)
+                for label in LABELS:
+                    grad = probs[label] - (1.0 if label == target else 0.0)
+                    if abs(grad) < 1e-6:
+                        continue
+                    w = self.weights[label]
+                    for k, v in features.items():
+                        w[k] = w.get(k, 0.0) - step * (grad * v + l2 * w.get(k, 0.0))
+                    self.bias[label] -= step * grad
+        self.trained_samples = len(featurized)
+        self._loaded = True
+
+    def save(self) -> None:
+        payload = {
+            "dim": self.dim,
+            "labels": list(LABELS),
+            "trained_samples": self.trained_samples,
+            "bias": self.bias,
+            "weights": {
+                label: {str(k): round(v, 6) for k, v in w.items() if abs(v) > 1e-6}
+                for label, w in self.weights.items()
+            }
+        }
+        self.model_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.model_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(payload, f)
+        tmp_path.replace(self.model_path)
+
+    def load(self) -> bool:
+        if not self.model_path.exists():
+            return False
+        try:
+            with open(self.model_path, "r", encoding="utf-8") as f:
+                payload = json.load(f)
+            self.dim = payload["dim"]
+            self.bias = {label: float(payload["bias"].get(label, 0.0)) for label in LABELS}
+            self.weights = {
+                label: {int(k): v for k, v in payload["weights"].get(label, {}).items()}
+                for label in LABELS
+            }
+            self.trained_samples = payload.get("trained_samples", 0)
+            self._loaded = True
+            return True
+        except Exception as e:
+            print(f"⚠️ [Intent] 意图模型加载失败，将使用种子样本重新训练: {str(e)}")
+            return False
+
+    def ensure_loaded(self) -> None:
+        """优先加载磁盘模型；不存在时用种子样本训练并保存"""
+        if self._loaded:
+            return
+        if not self.load():
+            self.train([])
+            try:
+                self.save()
+            except Exception as e:
+                print(f"⚠️ [Intent] 意图模型保存失败: {str(e)}")
+
+
+intent_classifier = IntentClassifier()
@@ -9,7 +9,9 @@ from concurrent.futures import ThreadPoolExecutor
 from utils.logger import logger
 from utils.prompt_templates import VISUALIZATION_REPORT_PROMPT
 from config import API_KEY, API_BASE_URL, CHAT_MODEL, ModelProvider, DEFAULT_PROVIDER
-from services.llm_factory import llm_factory
+from services.llm_factory import llm_factory, llm_scheduler, BACKGROUND
+from services.user_context import get_current_user_id
+from utils.prompt_builder import TokenCounter
 
 # 动态定位 external/langextract 并加入 sys.path
 BASE_DIR = Path(__file__).resolve().parent.parent.parent
@@ -153,7 +155,7 @@ class KnowledgeExtractionService:
         chunks = self.splitter.split_text(markdown_text)
         logger.info(f"📊 任务拆解: {len(chunks)} 个章节正在并行审计中...")
 
-        # 2. 并行分析 (注入审计级 Prompt)
+        # 2. 并行分析 (注入审计级 Prompt)；实际并发由 llm_scheduler 按后台优先级限制
         tasks = [self._analyze_single_chunk(c, provider, model_id) for c in chunks]
         results_with_usage = await asyncio.gather(*tasks)
         
@@ -176,13 +178,16 @@ class KnowledgeExtractionService:
             # 只有 OpenAI 和 DeepSeek 支持 AsyncOpenAI 客户端的 response_format
             if provider in [ModelProvider.OPENAI, ModelProvider.DEEPSEEK]:
                 client = llm_factory.get_openai_client(provider)
-                response = await client.chat.completions.create(
-                    model=model_id,
-                    messages=[{"role": "user", "content": final_prompt}],
-                    response_format={"type": "json_object"},
-                    temperature=0.2,
-                    max_tokens=8192
-                )
+                async with llm_scheduler.slot(provider, model_id, priority=BACKGROUND, user_id=get_current_user_id(),
+                                              tokens=TokenCounter.count(final_prompt)) as grant:
+                    response = await client.chat.completions.create(
+                        model=model_id,
+                        messages=[{"role": "user", "content": final_prompt}],
+                        response_format={"type": "json_object"},
+                        temperature=0.2,
+                        max_tokens=8192
+                    )
+                    grant.used_tokens = response.usage.total_tokens
                 
                 # 累加 Token 消耗
                 total_prompt_tokens += response.usage.prompt_tokens
@@ -191,7 +196,9 @@ class KnowledgeExtractionService:
             else:
                 # 其他供应商使用 LangChain
                 llm = llm_factory.get_langchain_model(provider=provider, model_name=model_id, temperature=0.2)
-                response = await llm.ainvoke([{"role": "user", "content": final_prompt + "\\n请务必只返回 JSON 格式结果，不要包含 Markdown 代码块标记。"}])
+                async with llm_scheduler.slot(provider, model_id, priority=BACKGROUND, user_id=get_current_user_id(),
+                                              tokens=TokenCounter.count(final_prompt)):
+                    response = await llm.ainvoke([{"role": "user", "content": final_prompt + "\\n请务必只返回 JSON 格式结果，不要包含 Markdown 代码块标记。"}])
                 raw_content = response.content
             
             # 🚀 增强版安全解析逻辑 (提取最外层 JSON)
@@ -253,12 +260,15 @@ class KnowledgeExtractionService:
         try:
             if provider in [ModelProvider.OPENAI, ModelProvider.DEEPSEEK]:
                 client = llm_factory.get_openai_client(provider)
-                response = await client.chat.completions.create(
-                    model=model_id,
-                    messages=[{"role": "user", "content": prompt}],
-                    response_format={"type": "json_object"},
-                    temperature=0.1
-                )
+                async with llm_scheduler.slot(provider, model_id, priority=BACKGROUND, user_id=get_current_user_id(),
+                                              tokens=TokenCounter.count(prompt)) as grant:
+                    response = await client.chat.completions.create(
+                        model=model_id,
+                        messages=[{"role": "user", "content": prompt}],
+                        response_format={"type": "json_object"},
+                        temperature=0.1
+                    )
+                    grant.used_tokens = response.usage.total_tokens
                 return {
                     "metadata": chunk['metadata'],
                     "analysis": json.loads(response.choices[0].message.content),
@@ -269,7 +279,9 @@ class KnowledgeExtractionService:
                 }
             else:
                 llm = llm_factory.get_langchain_model(provider=provider, model_name=model_id, temperature=0.1)
-                response = await llm.ainvoke([{"role": "user", "content": prompt + "\\n请务必只返回 JSON 格式结果。"}])
+                async with llm_scheduler.slot(provider, model_id, priority=BACKGROUND, user_id=get_current_user_id(),
+                                              tokens=TokenCounter.count(prompt)):
+                    response = await llm.ainvoke([{"role": "user", "content": prompt + "\\n请务必只返回 JSON 格式结果。"}])
                 content = response.content.strip()
                 if content.startswith("```json"):
                     content = content.split("```json")[1].split("```")[0].strip()
@@ -1,23 +1,135 @@
+import asyncio
+import hashlib
+import inspect
 import os
+import time
 import traceback
-from typing import Optional, Any
-import httpx
+from collections import Counter, OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Optional, Any, Dict, List, Tuple
 from langchain_openai import ChatOpenAI
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_anthropic import ChatAnthropic
 from openai import AsyncOpenAI
 
-# 流式请求超时：connect 5s，read 1800s（30分钟）
-_STREAM_TIMEOUT = httpx.Timeout(1800.0, connect=5.0)
-
 from config import (
     API_KEY, API_BASE_URL, CHAT_MODEL,
     OPENAI_API_KEY, OPENAI_BASE_URL, OPENAI_MODEL,
     GEMINI_API_KEY, GEMINI_MODEL,
     CLAUDE_API_KEY, CLAUDE_MODEL,
-    ModelProvider, DEFAULT_PROVIDER
+    ModelProvider, DEFAULT_PROVIDER,
+    LLM_CLIENT_CACHE_MAX_ENTRIES, LLM_CLIENT_CACHE_TTL, LLM_CLIENT_CLOSE_DELAY,
+    LLM_PROVIDER_CONCURRENCY, LLM_PROVIDER_CONCURRENCY_DEFAULT, LLM_MODEL_CONCURRENCY,
+    LLM_PROVIDER_TPM, LLM_BACKGROUND_MAX_SHARE
 )
 from services.user_context import get_user_api_key, get_user_base_url
+from services.llm_http_pool import llm_http_pool, STREAM_TIMEOUT as _STREAM_TIMEOUT
+from services.metrics_service import metrics_service
+from utils.logger import logger
+
+
+async def _close_client(client: Any):
+    """关闭客户端持有的 httpx 连接池 (原生 AsyncOpenAI / LangChain 模型内部的异步客户端)"""
+    candidates = [client, getattr(client, "root_async_client", None)]
+    try:
+        candidates.append(vars(client).get("_async_client"))  # ChatAnthropic (cached_property，未创建时不触发)
+    except TypeError:
+        pass
+    for candidate in candidates:
+        close = getattr(candidate, "close", None)
+        if not callable(close):
+            continue
+        # 共享连接池由 llm_http_pool 统一管理，不随单个客户端关闭
+        if llm_http_pool.is_shared(getattr(candidate, "_client", None)):
+            continue
+        try:
+            result = close()
+            if inspect.isawaitable(result):
+                await result
+        except Exception as e:
+            print(f"⚠️ [LLMFactory] 关闭客户端失败: {str(e)[:100]}")
+
+
+class ClientCache:
+    """
+    用户自定义 API Key 的客户端缓存 (LRU + 空闲 TTL)
+    键中只保存 API Key 的哈希。被淘汰的客户端延迟关闭，避免打断仍在进行的流式请求。
+    """
+
+    def __init__(
+        self,
+        max_entries: int = LLM_CLIENT_CACHE_MAX_ENTRIES,
+        ttl: int = LLM_CLIENT_CACHE_TTL,
+        close_delay: int = LLM_CLIENT_CLOSE_DELAY
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.close_delay = close_delay
+        self._entries: "OrderedDict[Tuple, Tuple[Any, float]]" = OrderedDict()
+        self._closing = set()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(kind: str, provider: str, api_key: str, *parts: Any) -> Tuple:
+        key_hash = hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+        return (kind, provider, key_hash) + parts
+
+    def get(self, key: Tuple) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        client, last_used = entry
+        if time.monotonic() - last_used > self.ttl:
+            self._evict(key)
+            self.misses += 1
+            return None
+        self._entries[key] = (client, time.monotonic())
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return client
+
+    def put(self, key: Tuple, client: Any):
+        if key in self._entries:
+            self._evict(key)
+        self._entries[key] = (client, time.monotonic())
+        now = time.monotonic()
+        for stale_key in [k for k, (_, last_used) in self._entries.items() if now - last_used > self.ttl]:
+            self._evict(stale_key)
+        while len(self._entries) > self.max_entries:
+            self._evict(next(iter(self._entries)))
+
+    def _evict(self, key: Tuple):
+        client, _ = self._entries.pop(key)
+        self.evictions += 1
+        self._schedule_close(client, self.close_delay)
+
+    def _schedule_close(self, client: Any, delay: float):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # 没有事件循环 (如脚本同步调用)，交给垃圾回收
+
+        async def close_later():
+            await asyncio.sleep(delay)
+            await _close_client(client)
+
+        task = loop.create_task(close_later())
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    async def aclose(self):
+        """立即关闭所有缓存及待关闭的客户端 (应用退出时调用)"""
+        for task in list(self._closing):
+            task.cancel()
+        clients = [client for client, _ in self._entries.values()]
+        self._entries.clear()
+        await asyncio.gather(*(_close_client(c) for c in clients), return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
 
 class LLMFactory:
     """
@@ -26,6 +138,7 @@ class LLMFactory:
     """
     _instances = {}
     _openai_clients = {}
+    _user_clients = ClientCache()
 
     @classmethod
     def get_langchain_model(
@@ -44,12 +157,17 @@ class LLMFactory:
         user_api_key = get_user_api_key(provider)
         user_base_url = get_user_base_url(provider)
 
-        # 如果用户提供了自定义 Key，不走缓存，每次新建实例
+        # 用户自定义 Key：按 (Key 哈希, base_url, 模型参数) 缓存，复用连接
         if user_api_key:
-            return cls._build_langchain_model(
-                provider, model_name, temperature, streaming,
-                api_key=user_api_key, base_url=user_base_url
-            )
+            cache_key = ClientCache.make_key("lc", provider, user_api_key, user_base_url, model_name, temperature, streaming)
+            instance = cls._user_clients.get(cache_key)
+            if instance is None:
+                instance = cls._build_langchain_model(
+                    provider, model_name, temperature, streaming,
+                    api_key=user_api_key, base_url=user_base_url
+                )
+                cls._user_clients.put(cache_key, instance)
+            return instance
 
         instance_key = f"lc_{provider}_{model_name}_{temperature}_{streaming}"
 
@@ -79,7 +197,8 @@ class LLMFactory:
                     openai_api_key=api_key or API_KEY,
                     openai_api_base=base_url or API_BASE_URL,
                     temperature=temperature,
-                    streaming=streaming
+                    streaming=streaming,
+                    http_async_client=llm_http_pool.get_client(base_url or API_BASE_URL)
                 )
             elif provider == ModelProvider.OPENAI:
                 return ChatOpenAI(
@@ -87,9 +206,11 @@ class LLMFactory:
                     openai_api_key=api_key or OPENAI_API_KEY,
                     openai_api_base=base_url or OPENAI_BASE_URL,
                     temperature=temperature,
-                    streaming=streaming
+                    streaming=streaming,
+                    http_async_client=llm_http_pool.get_client(base_url or OPENAI_BASE_URL)
                 )
             elif provider == ModelProvider.GEMINI:
+                # Gemini 走 google-genai SDK，无法注入 httpx 客户端
                 return ChatGoogleGenerativeAI(
                     model=model_name or GEMINI_MODEL,
                     google_api_key=api_key or GEMINI_API_KEY,
@@ -97,12 +218,26 @@ class LLMFactory:
                     streaming=streaming
                 )
             elif provider == ModelProvider.CLAUDE:
-                return ChatAnthropic(
+                model = ChatAnthropic(
                     model=model_name or CLAUDE_MODEL,
                     anthropic_api_key=api_key or CLAUDE_API_KEY,
                     temperature=temperature,
                     streaming=streaming
                 )
+                # ChatAnthropic 没有 http_async_client 参数：预先填充其惰性创建的异步客户端
+                # (SDK 不接受 httpx.AsyncClient 时保留其默认客户端，langchain-anthropic 已按 base_url 复用)
+                import anthropic
+                try:
+                    vars(model)["_async_client"] = anthropic.AsyncClient(
+                        **model._client_params,
+                        http_client=llm_http_pool.get_client(model.anthropic_api_url)
+                    )
+                except TypeError as e:
+                    print(f"⚠️ [LLMFactory] Claude 未使用共享连接池: {str(e)[:100]}")
+                return model
+            elif provider == ModelProvider.MOCK:
+                from services.mock_llm import MockChatModel
+                return MockChatModel(model_name=model_name or "mock-chat", temperature=temperature, streaming=streaming)
             else:
                 raise ValueError(f"不支持的供应商: {provider}")
         except Exception as e:
@@ -123,33 +258,70 @@ class LLMFactory:
         user_api_key = get_user_api_key(provider)
         user_base_url = get_user_base_url(provider)
 
-        # 用户自定义 Key：不走缓存
+        # 用户自定义 Key：按 (Key 哈希, base_url) 缓存
         if user_api_key:
             if provider == ModelProvider.DEEPSEEK:
-                return AsyncOpenAI(api_key=user_api_key, base_url=user_base_url or API_BASE_URL, timeout=_STREAM_TIMEOUT)
+                base_url = user_base_url or API_BASE_URL
             elif provider == ModelProvider.OPENAI:
-                return AsyncOpenAI(api_key=user_api_key, base_url=user_base_url or OPENAI_BASE_URL, timeout=_STREAM_TIMEOUT)
+                base_url = user_base_url or OPENAI_BASE_URL
             else:
                 raise ValueError(f"供应商 {provider} 不支持原生 OpenAI 客户端调用")
+            cache_key = ClientCache.make_key("openai", provider, user_api_key, base_url)
+            client = cls._user_clients.get(cache_key)
+            if client is None:
+                client = AsyncOpenAI(
+                    api_key=user_api_key,
+                    base_url=base_url,
+                    timeout=_STREAM_TIMEOUT,
+                    http_client=llm_http_pool.get_client(base_url)
+                )
+                cls._user_clients.put(cache_key, client)
+            return client
 
         if provider not in cls._openai_clients:
             if provider == ModelProvider.DEEPSEEK:
                 cls._openai_clients[provider] = AsyncOpenAI(
                     api_key=API_KEY,
                     base_url=API_BASE_URL,
-                    timeout=_STREAM_TIMEOUT
+                    timeout=_STREAM_TIMEOUT,
+                    http_client=llm_http_pool.get_client(API_BASE_URL)
                 )
             elif provider == ModelProvider.OPENAI:
                 cls._openai_clients[provider] = AsyncOpenAI(
                     api_key=OPENAI_API_KEY,
                     base_url=OPENAI_BASE_URL,
-                    timeout=_STREAM_TIMEOUT
+                    timeout=_STREAM_TIMEOUT,
+                    http_client=llm_http_pool.get_client(OPENAI_BASE_URL)
                 )
             else:
                 raise ValueError(f"供应商 {provider} 不支持原生 OpenAI 客户端调用")
 
         return cls._openai_clients[provider]
 
+    @classmethod
+    async def aclose(cls):
+        """关闭所有缓存的客户端连接池 (应用退出时调用)"""
+        await cls._user_clients.aclose()
+        clients = list(cls._openai_clients.values()) + list(cls._instances.values())
+        cls._openai_clients.clear()
+        cls._instances.clear()
+        for client in clients:
+            await _close_client(client)
+        await llm_http_pool.aclose()
+
+    @classmethod
+    def has_credentials(cls, provider: str) -> bool:
+        """当前请求是否可以调用该供应商 (用户自定义 Key 或服务端 Key)"""
+        default_keys = {
+            ModelProvider.DEEPSEEK: API_KEY,
+            ModelProvider.OPENAI: OPENAI_API_KEY,
+            ModelProvider.GEMINI: GEMINI_API_KEY,
+            ModelProvider.CLAUDE: CLAUDE_API_KEY,
+        }
+        if provider == ModelProvider.MOCK:
+            return True
+        return bool(get_user_api_key(provider) or default_keys.get(provider))
+
     @classmethod
     def get_model_params(cls, provider: str, is_reasoning: bool = False) -> dict:
         """
@@ -164,6 +336,235 @@ class LLMFactory:
             return {"model": GEMINI_MODEL}
         elif provider == ModelProvider.CLAUDE:
             return {"model": CLAUDE_MODEL}
+        elif provider == ModelProvider.MOCK:
+            return {"model": "mock-reasoner" if is_reasoning else "mock-chat"}
         return {"model": CHAT_MODEL}
 
 llm_factory = LLMFactory()
+
+
+# ==================== LLM 调度器 ====================
+
+INTERACTIVE = 0  # 对话 / SQL 生成等交互请求
+BACKGROUND = 1   # 深度报告、知识抽取等后台任务
+_PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+
+class _Grant:
+    """一次调度许可；调用方可在结束前把 used_tokens 更新为实际消耗，用于修正 TPM 统计"""
+
+    def __init__(self, provider: str, model: str, priority: int, user_id: Any, tokens: int):
+        self.provider = provider
+        self.model = model
+        self.priority = priority
+        self.user_id = user_id
+        self.tokens = tokens
+        self.used_tokens: Optional[int] = None
+        self.enqueued_at = time.monotonic()
+        self.future: Optional[asyncio.Future] = None
+        self.usage_entry: Optional[List[float]] = None
+
+
+class LLMScheduler:
+    """
+    LLM 请求调度 (供应商 / 模型并发上限 + 每分钟 token 预算)
+      - 交互请求优先；同一供应商有交互请求排队时不放行后台任务，后台任务最多占用一定比例的并发
+      - 同优先级内按用户轮转，单个用户的大批量任务不会饿死其他用户
+    用法：
+        async with llm_scheduler.slot(provider, model, priority=BACKGROUND, tokens=estimated) as grant:
+            ...
+            grant.used_tokens = response.usage.total_tokens
+    """
+
+    def __init__(
+        self,
+        provider_limits: Dict[str, int] = LLM_PROVIDER_CONCURRENCY,
+        default_provider_limit: int = LLM_PROVIDER_CONCURRENCY_DEFAULT,
+        model_limit: int = LLM_MODEL_CONCURRENCY,
+        tpm_limits: Dict[str, int] = LLM_PROVIDER_TPM,
+        background_share: float = LLM_BACKGROUND_MAX_SHARE
+    ):
+        self.provider_limits = provider_limits
+        self.default_provider_limit = default_provider_limit
+        self.model_limit = model_limit
+        self.tpm_limits = tpm_limits
+        self.background_share = background_share
+        self._active = Counter()  # provider / (provider, model) / (provider, priority) -> 运行中数量
+        self._queues: Dict[Tuple[str, int], "OrderedDict[Any, deque]"] = {}
+        self._usage: Dict[str, deque] = {}  # provider -> [[时间戳, token 数], ...] (最近 60 秒)
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._waits = {p: {"count": 0, "total": 0.0, "max": 0.0} for p in _PRIORITY_NAMES}
+
+    def provider_limit(self, provider: str) -> int:
+        return self.provider_limits.get(provider, self.default_provider_limit)
+
+    @asynccontextmanager
+    async def slot(self, provider: str, model: str, priority: int = INTERACTIVE, user_id: Any = None, tokens: int = 0):
+        grant = _Grant(provider, model, priority, user_id, tokens)
+        await self._acquire(grant)
+        try:
+            yield grant
+        finally:
+            self._release(grant)
+
+    async def _acquire(self, grant: _Grant):
+        grant.future = asyncio.get_running_loop().create_future()
+        queue = self._queues.setdefault((grant.provider, grant.priority), OrderedDict())
+        queue.setdefault(grant.user_id, deque()).append(grant)
+        self._dispatch()
+        try:
+            await grant.future
+        except asyncio.CancelledError:
+            if grant.future.done() and not grant.future.cancelled():
+                self._release(grant)  # 已获得许可但调用方被取消
+            else:
+                self._remove(grant)
+            raise
+        waited = time.monotonic() - grant.enqueued_at
+        stats = self._waits[grant.priority]
+        stats["count"] += 1
+        stats["total"] += waited
+        stats["max"] = max(stats["max"], waited)
+        if waited > 1:
+            logger.info("⏳ [LLMScheduler] %s/%s %s 请求排队 %.1fs",
+                        grant.provider, grant.model, _PRIORITY_NAMES[grant.priority], waited)
+
+    def _remove(self, grant: _Grant):
+        queue = self._queues.get((grant.provider, grant.priority), {})
+        waiting = queue.get(grant.user_id)
+        if waiting and grant in waiting:
+            waiting.remove(grant)
+            if not waiting:
+                del queue[grant.user_id]
+
+    def _release(self, grant: _Grant):
+        self._active[grant.provider] -= 1
+        self._active[(grant.provider, grant.model)] -= 1
+        self._active[(grant.provider, grant.priority)] -= 1
+        if grant.used_tokens is not None and grant.usage_entry is not None:
+            grant.usage_entry[1] = grant.used_tokens
+        self._dispatch()
+
+    def _tpm_used(self, provider: str) -> int:
+        usage = self._usage.setdefault(provider, deque())
+        cutoff = time.monotonic() - 60
+        while usage and usage[0][0] < cutoff:
+            usage.popleft()
+        return int(sum(tokens for _, tokens in usage))
+
+    def _tpm_retry_after(self, grant: _Grant) -> Optional[float]:
+        """超出 TPM 预算时返回需要等待的秒数 (窗口为空时总是放行，避免大请求永远排不上)"""
+        budget = self.tpm_limits.get(grant.provider, 0)
+        if not budget or not grant.tokens:
+            return None
+        used = self._tpm_used(grant.provider)
+        if used == 0 or used + grant.tokens <= budget:
+            return None
+        return max(0.05, self._usage[grant.provider][0][0] + 60 - time.monotonic())
+
+    def _dispatch(self):
+        retry_after: Optional[float] = None
+        for provider in {p for p, _ in self._queues}:
+            limit = self.provider_limit(provider)
+            for priority in sorted(_PRIORITY_NAMES):
+                queue = self._queues.get((provider, priority))
+                if not queue:
+                    continue
+                if priority == BACKGROUND and self._queues.get((provider, INTERACTIVE)):
+                    break  # 交互请求排队时不放行后台任务
+                cap = limit if priority == INTERACTIVE else max(1, int(limit * self.background_share))
+                progressed = True
+                while progressed and queue:
+                    progressed = False
+                    for user_id in list(queue):
+                        if self._active[provider] >= limit or self._active[(provider, priority)] >= cap:
+                            break
+                        grant = queue[user_id][0]
+                        if self._active[(provider, grant.model)] >= self.model_limit:
+                            continue
+                        wait = self._tpm_retry_after(grant)
+                        if wait is not None:
+                            retry_after = wait if retry_after is None else min(retry_after, wait)
+                            continue
+                        queue[user_id].popleft()
+                        if queue[user_id]:
+                            queue.move_to_end(user_id)  # 轮到下一个用户
+                        else:
+                            del queue[user_id]
+                        self._grant(grant)
+                        progressed = True
+        if retry_after is not None and self._timer is None:
+            def fire():
+                self._timer = None
+                self._dispatch()
+            self._timer = asyncio.get_running_loop().call_later(retry_after, fire)
+
+    def _grant(self, grant: _Grant):
+        self._active[grant.provider] += 1
+        self._active[(grant.provider, grant.model)] += 1
+        self._active[(grant.provider, grant.priority)] += 1
+        if grant.tokens:
+            grant.usage_entry = [time.monotonic(), grant.tokens]
+            self._usage.setdefault(grant.provider, deque()).append(grant.usage_entry)
+        grant.future.set_result(True)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """队列深度、运行中请求数、TPM 用量与排队等待时间"""
+        providers: Dict[str, Any] = {}
+        for provider in {p for p, _ in self._queues} | set(self._usage):
+            providers[provider] = {
+                "active": self._active[provider],
+                "limit": self.provider_limit(provider),
+                "queued": {
+                    name: sum(len(q) for q in self._queues.get((provider, priority), {}).values())
+                    for priority, name in _PRIORITY_NAMES.items()
+                },
+                "tpm_used": self._tpm_used(provider),
+                "tpm_limit": self.tpm_limits.get(provider, 0),
+            }
+        waits = {
+            _PRIORITY_NAMES[p]: {
+                "count": w["count"],
+                "avg_ms": round(w["total"] / w["count"] * 1000, 1) if w["count"] else 0.0,
+                "max_ms": round(w["max"] * 1000, 1),
+            }
+            for p, w in self._waits.items()
+        }
+        return {"providers": providers, "wait": waits}
+
+    def register_metrics(self, metrics=metrics_service):
+        """把队列深度、运行中请求数、TPM 用量与排队等待时间导出到 /api/observability/metrics"""
+        def _providers(field: str):
+            return lambda: {(p,): info[field] for p, info in self.snapshot()["providers"].items()}
+
+        def _queued():
+            return {
+                (p, name): count
+                for p, info in self.snapshot()["providers"].items() for name, count in info["queued"].items()
+            }
+
+        def _waits(field: str):
+            return lambda: {(_PRIORITY_NAMES[p],): w[field] for p, w in self._waits.items()}
+
+        metrics.register_collector(
+            "llm_scheduler_queued", "等待调度许可的 LLM 请求数", "gauge", ("provider", "priority"), _queued
+        )
+        metrics.register_collector(
+            "llm_scheduler_active", "已获得调度许可、运行中的 LLM 请求数", "gauge", ("provider",), _providers("active")
+        )
+        metrics.register_collector(
+            "llm_scheduler_tpm_used", "最近 60 秒已占用的 token 预算", "gauge", ("provider",), _providers("tpm_used")
+        )
+        metrics.register_collector(
+            "llm_scheduler_wait_count_total", "获得调度许可的请求数", "counter", ("priority",), _waits("count")
+        )
+        metrics.register_collector(
+            "llm_scheduler_wait_seconds_total", "获得调度许可前的累计排队时间", "counter", ("priority",), _waits("total")
+        )
+        metrics.register_collector(
+            "llm_scheduler_wait_seconds_max", "获得调度许可前的最长排队时间", "gauge", ("priority",), _waits("max")
+        )
+
+
+llm_scheduler = LLMScheduler()
+llm_scheduler.register_metrics()
@@ -0,0 +1,149 @@
+"""
+LLM 共享 HTTP 连接池
+每个供应商主机共用一个 httpx.AsyncClient (HTTP/2 + keep-alive)，同时注入原生 OpenAI 客户端与 LangChain 模型，
+突发并发时复用已建立的 TLS 连接，并统计建连 / TLS 握手耗时。
+"""
+import time
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from config import (
+    LLM_HTTP2_ENABLED, LLM_HTTP_MAX_CONNECTIONS, LLM_HTTP_MAX_KEEPALIVE, LLM_HTTP_KEEPALIVE_EXPIRY
+)
+from services.metrics_service import metrics_service
+
+# 流式请求超时：connect 5s，read 1800s（30分钟）
+STREAM_TIMEOUT = httpx.Timeout(1800.0, connect=5.0)
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class LLMHttpPool:
+    """按主机 (scheme://host:port) 共享的 httpx.AsyncClient"""
+
+    def __init__(
+        self,
+        http2: bool = LLM_HTTP2_ENABLED,
+        max_connections: int = LLM_HTTP_MAX_CONNECTIONS,
+        max_keepalive: int = LLM_HTTP_MAX_KEEPALIVE,
+        keepalive_expiry: float = LLM_HTTP_KEEPALIVE_EXPIRY,
+        timeout: httpx.Timeout = STREAM_TIMEOUT
+    ):
+        if http2 and not _http2_available():
+            print("⚠️ [LLMHttpPool] 未安装 h2，LLM 请求使用 HTTP/1.1 (pip install 'httpx[http2]')")
+            http2 = False
+        self.http2 = http2
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry
+        )
+        self.timeout = timeout
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._stats: Dict[str, Dict[str, float]] = {}
+
+    @staticmethod
+    def host_key(base_url: str) -> str:
+        parts = urlsplit(base_url)
+        return f"{parts.scheme}://{parts.netloc}".lower()
+
+    def get_client(self, base_url: str) -> httpx.AsyncClient:
+        host = self.host_key(base_url)
+        client = self._clients.get(host)
+        if client is None or client.is_closed:
+            self._stats.setdefault(host, {
+                "requests": 0, "connections": 0, "connect_ms": 0.0, "tls_ms": 0.0
+            })
+            client = httpx.AsyncClient(
+                http2=self.http2,
+                limits=self.limits,
+                timeout=self.timeout,
+                event_hooks={"request": [self._request_hook(host)]}
+            )
+            self._clients[host] = client
+            print(f"🔌 [LLMHttpPool] 创建共享连接池: {host} (http2={self.http2}, max_connections={self.limits.max_connections})")
+        return client
+
+    def is_shared(self, client: Optional[Any]) -> bool:
+        return client is not None and any(client is c for c in self._clients.values())
+
+    def _request_hook(self, host: str):
+        stats = self._stats[host]
+        tracer = self.make_tracer(stats)
+
+        async def on_request(request: httpx.Request):
+            stats["requests"] += 1
+            request.extensions["trace"] = tracer
+        return on_request
+
+    @staticmethod
+    def make_tracer(stats: Dict[str, float]):
+        """httpcore trace 回调：只有新建连接时才会出现 connect_tcp / start_tls 事件"""
+        started: Dict[str, float] = {}
+
+        async def trace(event_name: str, info: Dict[str, Any]):
+            name, _, phase = event_name.rpartition(".")
+            if name == "connection.connect_tcp" and phase == "started":
+                stats["connections"] += 1
+            if name not in ("connection.connect_tcp", "connection.start_tls"):
+                return
+            if phase == "started":
+                started[name] = time.perf_counter()
+            elif phase in ("complete", "failed") and name in started:
+                elapsed_ms = (time.perf_counter() - started.pop(name)) * 1000
+                stats["connect_ms" if name == "connection.connect_tcp" else "tls_ms"] += elapsed_ms
+        return trace
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """每个主机的请求数、新建连接数 (越少说明复用越好) 与平均建连 / 握手耗时"""
+        report = {}
+        for host, stats in self._stats.items():
+            connections = stats["connections"] or 1
+            report[host] = {
+                "requests": stats["requests"],
+                "connections": stats["connections"],
+                "avg_connect_ms": round(stats["connect_ms"] / connections, 1),
+                "avg_tls_ms": round(stats["tls_ms"] / connections, 1),
+            }
+        return report
+
+    def register_metrics(self, metrics=metrics_service):
+        """把各主机的请求数、新建连接数与建连 / TLS 握手累计耗时导出到 /api/observability/metrics"""
+        def _collect(field: str, scale: Optional[float] = None):
+            return lambda: {
+                (host,): stats[field] if scale is None else stats[field] * scale for host, stats in self._stats.items()
+            }
+
+        metrics.register_collector(
+            "llm_http_requests_total", "共享连接池发出的 LLM 请求数", "counter", ("host",), _collect("requests")
+        )
+        metrics.register_collector(
+            "llm_http_connections_total", "共享连接池新建的连接数 (越少说明复用越好)", "counter", ("host",),
+            _collect("connections")
+        )
+        metrics.register_collector(
+            "llm_http_connect_seconds_total", "新建连接的 TCP 建连累计耗时", "counter", ("host",),
+            _collect("connect_ms", 0.001)
+        )
+        metrics.register_collector(
+            "llm_http_tls_seconds_total", "新建连接的 TLS 握手累计耗时", "counter", ("host",),
+            _collect("tls_ms", 0.001)
+        )
+
+    async def aclose(self):
+        clients = list(self._clients.values())
+        self._clients.clear()
+        for client in clients:
+            await client.aclose()
+
+
+llm_http_pool = LLMHttpPool()
+llm_http_pool.register_metrics()
@@ -0,0 +1,335 @@
+"""
+LLM 多供应商路由
+按供应商 / 模型统计滚动 p50 / p95 延迟与错误率：
+  - 连续失败达到阈值时熔断该供应商，冷却后只放行一个试探请求 (试探期间其余请求视为熔断)
+  - 非流式请求 (标题、意图识别、RAG 改写等) 超过主供应商 p95 延迟仍未返回时，向下一个供应商发起对冲请求，先返回者胜出
+  - 流式请求在首 token 到达前失败或超时，切换到下一个供应商 (首 token 之后无法无缝切换，直接抛出)
+只有超时、连接错误、429 与 5xx 计入熔断并触发切换；其余错误 (参数错误、鉴权失败等) 直接抛出。
+用户自带 Key 的请求不切换到其他供应商，熔断状态按 (供应商, Key 哈希) 单独记录，不影响其他用户。
+传入 slot 时先取得调度许可 (LLMScheduler) 再开始计时：排队等待不计入供应商延迟，也不会触发对冲、首 token 超时或熔断。
+"""
+import asyncio
+import hashlib
+import time
+from collections import deque
+from contextlib import AsyncExitStack
+from typing import Any, AsyncContextManager, AsyncGenerator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from config import (
+    LLM_FAILOVER_ENABLED, LLM_FAILOVER_PROVIDERS, LLM_CIRCUIT_FAILURE_THRESHOLD, LLM_CIRCUIT_COOLDOWN,
+    LLM_HEDGE_DELAY_MIN, LLM_HEDGE_DELAY_MAX, LLM_FIRST_TOKEN_TIMEOUT, LLM_LATENCY_WINDOW
+)
+from services.llm_factory import llm_factory
+from services.user_context import get_user_api_key
+from utils.logger import logger
+
+# (供应商, 模型) -> 调度许可上下文管理器 (如 LLMScheduler.slot)
+SlotFactory = Callable[[str, str], AsyncContextManager[Any]]
+
+
+class CircuitOpenError(ConnectionError):
+    """供应商处于 half-open 且已有试探请求在途：本次请求不发出，按可切换的故障处理 (不计入熔断)"""
+
+
+def is_retryable(error: BaseException) -> bool:
+    """超时、连接错误、限流 (429) 与服务端错误 (5xx) 视为供应商故障，可切换供应商重试"""
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    if status is None and isinstance(getattr(error, "code", None), int):
+        status = error.code  # google.api_core 异常
+    if isinstance(status, int):
+        return status == 429 or status >= 500
+    # openai / anthropic / httpx 的超时与连接异常 (APITimeoutError、APIConnectionError、ConnectError 等)
+    return any(
+        "Timeout" in cls.__name__ or "Connection" in cls.__name__ or cls.__name__ in ("ConnectError", "NetworkError")
+        for cls in type(error).__mro__
+    )
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class _ModelStats:
+    """单个 (供应商, 模型) 的滚动延迟与成功 / 失败记录"""
+
+    def __init__(self, window: int):
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)  # True = 成功
+
+    def summary(self) -> Dict[str, Any]:
+        latencies = sorted(self.latencies)
+        errors = sum(1 for ok in self.outcomes if not ok)
+        return {
+            "samples": len(self.outcomes),
+            "p50_ms": round(_percentile(latencies, 0.5) * 1000),
+            "p95_ms": round(_percentile(latencies, 0.95) * 1000),
+            "error_rate": round(errors / len(self.outcomes), 3) if self.outcomes else 0.0,
+        }
+
+
+class _Circuit:
+    """供应商级熔断器：closed -> (连续失败) open -> (冷却结束) half-open -> 成功则 closed"""
+
+    def __init__(self):
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probing = False  # half-open 状态下是否已有试探请求在途
+
+    def state(self, cooldown: float) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= cooldown else "open"
+
+
+class LLMRouter:
+    def __init__(
+        self,
+        enabled: bool = LLM_FAILOVER_ENABLED,
+        providers: List[str] = LLM_FAILOVER_PROVIDERS,
+        failure_threshold: int = LLM_CIRCUIT_FAILURE_THRESHOLD,
+        cooldown: float = LLM_CIRCUIT_COOLDOWN,
+        hedge_delay_min: float = LLM_HEDGE_DELAY_MIN,
+        hedge_delay_max: float = LLM_HEDGE_DELAY_MAX,
+        first_token_timeout: float = LLM_FIRST_TOKEN_TIMEOUT,
+        window: int = LLM_LATENCY_WINDOW,
+        has_credentials: Callable[[str], bool] = llm_factory.has_credentials,
+        user_key: Callable[[str], Optional[str]] = get_user_api_key,
+        default_model: Callable[[str, bool], str] = lambda p, r: llm_factory.get_model_params(p, is_reasoning=r)["model"]
+    ):
+        self.enabled = enabled
+        self.providers = providers
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.hedge_delay_min = hedge_delay_min
+        self.hedge_delay_max = hedge_delay_max
+        self.first_token_timeout = first_token_timeout
+        self.window = window
+        self.has_credentials = has_credentials
+        self.user_key = user_key
+        self.default_model = default_model
+        self._stats: Dict[Tuple[str, str], _ModelStats] = {}
+        self._circuits: Dict[str, _Circuit] = {}
+
+    # ---------- 统计 ----------
+
+    def _model_stats(self, provider: str, model_name: str) -> _ModelStats:
+        key = (provider, model_name)
+        if key not in self._stats:
+            self._stats[key] = _ModelStats(self.window)
+        return self._stats[key]
+
+    def _circuit_key(self, provider: str) -> str:
+        """用户自带 Key 时熔断状态按 Key 哈希隔离"""
+        api_key = self.user_key(provider)
+        if not api_key:
+            return provider
+        return f"{provider}#{hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:12]}"
+
+    def _circuit(self, provider: str) -> _Circuit:
+        return self._circuits.setdefault(self._circuit_key(provider), _Circuit())
+
+    def record_success(self, provider: str, model_name: str, latency: float):
+        stats = self._model_stats(provider, model_name)
+        stats.latencies.append(latency)
+        stats.outcomes.append(True)
+        circuit = self._circuit(provider)
+        if circuit.opened_at is not None:
+            logger.info("✅ [LLMRouter] %s 恢复，关闭熔断", provider)
+        circuit.failures = 0
+        circuit.opened_at = None
+
+    def record_failure(self, provider: str, model_name: str, error: BaseException):
+        """记录供应商故障 (调用方只对 is_retryable 的错误调用)"""
+        self._model_stats(provider, model_name).outcomes.append(False)
+        circuit = self._circuit(provider)
+        circuit.failures += 1
+        # half-open 状态下的试探请求失败，重新开始冷却
+        if circuit.failures >= self.failure_threshold or circuit.opened_at is not None:
+            if circuit.opened_at is None:
+                logger.warning("🔌 [LLMRouter] %s 连续失败 %s 次，熔断 %.0fs", provider, circuit.failures, self.cooldown)
+            circuit.opened_at = time.monotonic()
+        logger.warning("⚠️ [LLMRouter] %s/%s 调用失败: %s: %.100s", provider, model_name, type(error).__name__, error)
+
+    def available(self, provider: str) -> bool:
+        circuit = self._circuit(provider)
+        state = circuit.state(self.cooldown)
+        return state == "closed" or (state == "half_open" and not circuit.probing)
+
+    def _enter(self, provider: str, stack: AsyncExitStack) -> None:
+        """
+        请求真正发出前调用：half-open 状态下只放行一个试探请求，试探结束 (stack 退出) 时释放；
+        已有试探在途时抛出 CircuitOpenError
+        """
+        circuit = self._circuit(provider)
+        if circuit.state(self.cooldown) != "half_open":
+            return
+        if circuit.probing:
+            raise CircuitOpenError(f"{provider} 熔断恢复试探中")
+        circuit.probing = True
+        stack.callback(setattr, circuit, "probing", False)
+
+    def hedge_delay(self, provider: str, model_name: str) -> float:
+        """对冲等待时长：取主供应商 p95 延迟 (样本不足时用上限)"""
+        stats = self._stats.get((provider, model_name))
+        if stats is None or len(stats.latencies) < 10:
+            return self.hedge_delay_max
+        p95 = _percentile(sorted(stats.latencies), 0.95)
+        return min(self.hedge_delay_max, max(self.hedge_delay_min, p95))
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "models": {f"{p}/{m}": stats.summary() for (p, m), stats in self._stats.items()},
+            "circuits": {
+                p: {"state": c.state(self.cooldown), "failures": c.failures} for p, c in self._circuits.items()
+            },
+        }
+
+    # ---------- 路由 ----------
+
+    def candidates(self, provider: str, model_name: str, is_reasoning: bool = False) -> List[Tuple[str, str]]:
+        """主供应商 (用户所选) 在前，其余按配置顺序；熔断中或无可用 Key 的供应商跳过"""
+        primary = (provider, model_name)
+        if not self.enabled or self.user_key(provider):
+            # 用户自带 Key：不切换到其他供应商 (避免改用服务端 Key 计费)
+            return [primary]
+        routes = [primary] if self.available(provider) else []
+        for other in self.providers:
+            if other != provider and self.available(other) and self.has_credentials(other):
+                routes.append((other, self.default_model(other, is_reasoning)))
+        # 全部熔断时仍尝试主供应商
+        return routes or [primary]
+
+    async def call(
+        self,
+        fn: Callable[[str, str], Awaitable[Any]],
+        provider: str,
+        model_name: str,
+        is_reasoning: bool = False,
+        slot: Optional[SlotFactory] = None
+    ) -> Tuple[Any, str, str]:
+        """非流式调用 (带对冲)，返回 (结果, 实际供应商, 实际模型)"""
+        routes = self.candidates(provider, model_name, is_reasoning)
+        pending: Dict[asyncio.Task, Tuple[str, str]] = {}
+        started_at: Dict[Tuple[str, str], float] = {}
+        next_route = 0
+        last_error: Optional[BaseException] = None
+
+        async def attempt(p: str, m: str):
+            async with AsyncExitStack() as stack:
+                if slot is not None:
+                    await stack.enter_async_context(slot(p, m))
+                self._enter(p, stack)
+                started = started_at[(p, m)] = time.perf_counter()
+                try:
+                    result = await fn(p, m)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    if is_retryable(e):
+                        self.record_failure(p, m, e)
+                    raise
+                self.record_success(p, m, time.perf_counter() - started)
+                return result
+
+        def launch():
+            nonlocal next_route
+            p, m = routes[next_route]
+            next_route += 1
+            pending[asyncio.create_task(attempt(p, m))] = (p, m)
+
+        launch()
+        try:
+            while pending:
+                # 最多同时两个请求：主请求 + 一个对冲请求
+                can_hedge = next_route < len(routes) and len(pending) == 1
+                timeout = None
+                if can_hedge:
+                    delay = self.hedge_delay(*routes[0])
+                    started = started_at.get(next(iter(pending.values())))
+                    # 仍在排队等待调度许可时不计时
+                    timeout = delay if started is None else max(0.0, started + delay - time.perf_counter())
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    started = started_at.get(next(iter(pending.values())))
+                    if started is None or time.perf_counter() - started < delay:
+                        continue
+                    logger.info("⏱️ [LLMRouter] %s %.1fs 未返回，对冲请求 %s", routes[0][0], delay, routes[next_route][0])
+                    launch()
+                    continue
+                for task in done:
+                    p, m = pending.pop(task)
+                    if task.exception() is None:
+                        if (p, m) != (provider, model_name):
+                            logger.info("🔀 [LLMRouter] 由 %s/%s 响应 (原供应商 %s)", p, m, provider)
+                        return task.result(), p, m
+                    last_error = task.exception()
+                    if not is_retryable(last_error):
+                        # 请求本身有问题，换供应商也无济于事
+                        raise last_error
+                if not pending and next_route < len(routes):
+                    launch()
+            raise last_error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def stream(
+        self,
+        open_stream: Callable[[str, str], AsyncGenerator[Dict[str, Any], None]],
+        provider: str,
+        model_name: str,
+        is_reasoning: bool = False,
+        slot: Optional[SlotFactory] = None
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """流式调用：首 token 前失败或超时则切换供应商 (调度许可在整个流式过程中保持)"""
+        last_error: Optional[BaseException] = None
+        for p, m in self.candidates(provider, model_name, is_reasoning):
+            async with AsyncExitStack() as stack:
+                if slot is not None:
+                    await stack.enter_async_context(slot(p, m))
+                try:
+                    self._enter(p, stack)
+                except CircuitOpenError as e:
+                    last_error = e
+                    continue
+                started = time.perf_counter()
+                stream = open_stream(p, m)
+                try:
+                    first = await asyncio.wait_for(stream.__anext__(), timeout=self.first_token_timeout)
+                except StopAsyncIteration:
+                    self.record_success(p, m, time.perf_counter() - started)
+                    return
+                except Exception as e:
+                    await stream.aclose()
+                    if not is_retryable(e):
+                        raise
+                    self.record_failure(p, m, e)
+                    last_error = e
+                    logger.info("🔀 [LLMRouter] %s/%s 首 token 前失败，尝试下一个供应商", p, m)
+                    continue
+                # 流式请求以首 token 延迟作为延迟样本
+                self.record_success(p, m, time.perf_counter() - started)
+                if (p, m) != (provider, model_name):
+                    logger.info("🔀 [LLMRouter] 流式请求由 %s/%s 响应 (原供应商 %s)", p, m, provider)
+                try:
+                    yield first
+                    async for delta in stream:
+                        yield delta
+                except Exception as e:
+                    if is_retryable(e):
+                        self.record_failure(p, m, e)
+                    raise
+                finally:
+                    # 调用方提前停止读取 (客户端断开等) 时也关闭底层流，释放 HTTP 连接
+                    await stream.aclose()
+                return
+        raise last_error
+
+llm_router = LLMRouter()
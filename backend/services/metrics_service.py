@@ -0,0 +1,234 @@
+"""
+聊天链路分阶段耗时指标
+各阶段用 span 包裹，结束时按 (阶段, 供应商, 模型, db_key, 状态) 聚合到直方图：
+  schema_load / intent / plan / sql_generation / sql_execution / chart_config / summary / db_persist / title
+span 可附带 prompt / completion token 数、重试次数与首 token 延迟 (TTFT)。
+LLM 调用层通过 annotate / add_tokens / mark_first_token 写入当前 span，无需逐层传参。
+连接池、调度器等组件通过 register_collector 注册导出时才读取的指标 (当前状态、累计计数)。
+render() 输出 Prometheus 文本格式，由 GET /api/observability/metrics 暴露。
+"""
+import asyncio
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from config import METRICS_ENABLED, METRICS_LATENCY_BUCKETS
+
+LABEL_NAMES = ("stage", "provider", "model", "db_key", "status")
+INF_LABEL = 'le="+Inf"'
+
+# 当前请求的默认标签 (db_key / provider / model)，由聊天入口绑定
+_bound_labels: ContextVar[Dict[str, str]] = ContextVar("metrics_bound_labels", default={})
+# 当前所在的 span (LLM 调用层据此记录 token、首 token 与实际供应商)
+_current_span: ContextVar[Optional["Span"]] = ContextVar("metrics_current_span", default=None)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+class Span:
+    """一次阶段执行的计时与附加信息"""
+
+    __slots__ = ("stage", "labels", "started", "ttft", "prompt_tokens", "completion_tokens", "retries", "llm_calls")
+
+    def __init__(self, stage: str, labels: Dict[str, str], retries: int = 0):
+        self.stage = stage
+        self.labels = labels
+        self.started = time.perf_counter()
+        self.ttft: Optional[float] = None
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.retries = retries
+        self.llm_calls = 0
+
+    def annotate(self, **labels: Any):
+        self.labels.update({k: str(v) for k, v in labels.items() if v is not None})
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+
+class _Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, buckets: int):
+        self.counts = [0] * buckets
+        self.sum = 0.0
+        self.count = 0
+
+
+class MetricsService:
+    def __init__(self, enabled: bool = METRICS_ENABLED, buckets: List[float] = METRICS_LATENCY_BUCKETS):
+        self.enabled = enabled
+        self.buckets = sorted(buckets)
+        self._lock = threading.Lock()
+        self._durations: Dict[Tuple[str, ...], _Histogram] = {}
+        self._ttft: Dict[Tuple[str, ...], _Histogram] = {}
+        self._tokens: Dict[Tuple[str, ...], int] = {}
+        self._retries: Dict[Tuple[str, ...], int] = {}
+        self._collectors: Dict[str, Tuple[str, str, Tuple[str, ...], Callable[[], Dict[Tuple[str, ...], float]]]] = {}
+
+    # ---------- 记录 ----------
+
+    @staticmethod
+    def bind(**labels: Any):
+        """为当前请求 (及其派生任务) 绑定默认标签"""
+        merged = dict(_bound_labels.get())
+        merged.update({k: str(v) for k, v in labels.items() if v is not None})
+        _bound_labels.set(merged)
+
+    @contextmanager
+    def span(self, stage: str, retries: int = 0, **labels: Any) -> Iterator[Span]:
+        span = Span(stage, dict(_bound_labels.get()), retries)
+        span.annotate(**labels)
+        token = _current_span.set(span)
+        status = "ok"
+        try:
+            yield span
+        except (asyncio.CancelledError, GeneratorExit):
+            status = "cancelled"
+            raise
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            try:
+                _current_span.reset(token)
+            except ValueError:
+                # 异步生成器在其他上下文中被关闭 (如客户端断开后回收)
+                pass
+            self.record(span, status)
+
+    @staticmethod
+    def current() -> Optional[Span]:
+        return _current_span.get()
+
+    @staticmethod
+    def annotate(**labels: Any):
+        span = _current_span.get()
+        if span is not None:
+            span.annotate(**labels)
+
+    @staticmethod
+    def llm_call(provider: str, model_name: str):
+        """记录当前 span 内的一次 LLM 调用 (故障转移 / 对冲产生的额外调用计为重试)"""
+        span = _current_span.get()
+        if span is not None:
+            span.llm_calls += 1
+            span.annotate(provider=provider, model=model_name)
+
+    @staticmethod
+    def add_tokens(prompt_tokens: int = 0, completion_tokens: int = 0):
+        span = _current_span.get()
+        if span is not None:
+            span.prompt_tokens += prompt_tokens or 0
+            span.completion_tokens += completion_tokens or 0
+
+    @staticmethod
+    def mark_first_token():
+        span = _current_span.get()
+        if span is not None and span.ttft is None:
+            span.ttft = span.elapsed()
+
+    def record(self, span: Span, status: str = "ok"):
+        if not self.enabled:
+            return
+        labels = dict(span.labels, stage=span.stage, status=status)
+        key = tuple(labels.get(name, "") for name in LABEL_NAMES)
+        base = key[:-1]  # 去掉 status
+        retries = span.retries + max(0, span.llm_calls - 1)
+        with self._lock:
+            self._observe(self._durations, key, span.elapsed())
+            if span.ttft is not None:
+                self._observe(self._ttft, base, span.ttft)
+            if span.prompt_tokens:
+                self._tokens[base + ("prompt",)] = self._tokens.get(base + ("prompt",), 0) + span.prompt_tokens
+            if span.completion_tokens:
+                self._tokens[base + ("completion",)] = self._tokens.get(base + ("completion",), 0) + span.completion_tokens
+            if retries:
+                self._retries[base] = self._retries.get(base, 0) + retries
+
+    def _observe(self, store: Dict[Tuple[str, ...], _Histogram], key: Tuple[str, ...], value: float):
+        histogram = store.get(key)
+        if histogram is None:
+            histogram = store[key] = _Histogram(len(self.buckets))
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                histogram.counts[i] += 1
+                break
+        histogram.sum += value
+        histogram.count += 1
+
+    def reset(self):
+        with self._lock:
+            self._durations.clear()
+            self._ttft.clear()
+            self._tokens.clear()
+            self._retries.clear()
+
+    # ---------- 导出 ----------
+
+    def register_collector(
+        self, name: str, help_text: str, metric_type: str, label_names: Tuple[str, ...],
+        collect: Callable[[], Dict[Tuple[str, ...], float]]
+    ):
+        """注册导出时才读取的指标 (gauge / counter)，collect 返回 {标签值元组: 数值}；同名重复注册时覆盖"""
+        self._collectors[name] = (help_text, metric_type, label_names, collect)
+
+    def _render_collectors(self) -> List[str]:
+        lines = []
+        for name, (help_text, metric_type, label_names, collect) in sorted(self._collectors.items()):
+            try:
+                samples = collect()
+            except Exception as e:
+                print(f"⚠️ [Metrics] 读取指标 {name} 失败: {str(e)}")
+                continue
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}"]
+            for key, value in sorted(samples.items()):
+                labels = self._format_labels(label_names, key) if label_names else ""
+                value = value if isinstance(value, int) else f"{value:.6f}"
+                lines.append(f"{name}{labels} {value}")
+        return lines
+
+    @staticmethod
+    def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+        pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}"
+
+    def _render_histogram(self, name: str, help_text: str, store: Dict[Tuple[str, ...], _Histogram], names: Tuple[str, ...]) -> List[str]:
+        lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+        for key, histogram in sorted(store.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, histogram.counts):
+                cumulative += count
+                le = 'le="%g"' % bound
+                lines.append(f"{name}_bucket{self._format_labels(names, key, le)} {cumulative}")
+            lines.append(f"{name}_bucket{self._format_labels(names, key, INF_LABEL)} {histogram.count}")
+            lines.append(f"{name}_sum{self._format_labels(names, key)} {histogram.sum:.6f}")
+            lines.append(f"{name}_count{self._format_labels(names, key)} {histogram.count}")
+        return lines
+
+    def render(self) -> str:
+        with self._lock:
+            lines = self._render_histogram(
+                "chat_stage_duration_seconds", "聊天链路各阶段耗时", self._durations, LABEL_NAMES
+            )
+            lines += self._render_histogram(
+                "chat_stage_ttft_seconds", "LLM 阶段首 token 延迟", self._ttft, LABEL_NAMES[:-1]
+            )
+            lines += ["# HELP chat_stage_tokens_total 各阶段 LLM token 用量", "# TYPE chat_stage_tokens_total counter"]
+            for key, value in sorted(self._tokens.items()):
+                lines.append(f"chat_stage_tokens_total{self._format_labels(LABEL_NAMES[:-1] + ('kind',), key)} {value}")
+            lines += ["# HELP chat_stage_retries_total 各阶段重试次数 (SQL 修正重试、LLM 故障转移与对冲)", "# TYPE chat_stage_retries_total counter"]
+            for key, value in sorted(self._retries.items()):
+                lines.append(f"chat_stage_retries_total{self._format_labels(LABEL_NAMES[:-1], key)} {value}")
+        lines += self._render_collectors()
+        return "\n".join(lines) + "\n"
+
+
+metrics_service = MetricsService()
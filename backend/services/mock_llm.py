@@ -0,0 +1,124 @@
+"""
+离线 Mock LLM 供应商 (ModelProvider.MOCK)
+按规则回放录制好的响应，可配置首 token 延迟 (TTFT) 与输出速率，用于在没有真实 API Key 的情况下
+测量 /api/chat 全链路延迟 (见 scripts/benchmark_chat_pipeline.py)。
+
+响应文件为 JSON 列表，按顺序匹配第一条 contains 中子串全部出现在提示词里的规则：
+    [{"name": "intent", "contains": ["判断其意图"], "response": "{\"intent\": \"sql_query\"}"},
+     {"name": "sql", "contains": ["转换为 SQL 查询"], "reasoning": "...", "response": "..."}]
+reasoning 只在模型名包含 "reasoner" 时以 reasoning_content 流式输出 (模拟思考模型)。
+"""
+import asyncio
+import json
+import re
+import time
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from config import MOCK_LLM_RESPONSES_PATH, MOCK_LLM_TTFT, MOCK_LLM_TOKENS_PER_SECOND
+
+_TOKEN_RE = re.compile(r'[\u4e00-\u9fff]|[A-Za-z0-9_]+|\s+|\S')
+_DEFAULT_RESPONSE = "好的。"
+
+
+def split_tokens(text: str) -> List[str]:
+    """把文本切成近似 token 的片段 (中文按字，英文按词)，拼接后与原文一致"""
+    return _TOKEN_RE.findall(text) if text else []
+
+
+class ResponseBook:
+    """录制响应集合 (按文件路径缓存，修改文件后自动重新加载)"""
+
+    _cache: Dict[str, Any] = {}
+
+    @classmethod
+    def load(cls, path: str) -> List[Dict[str, Any]]:
+        file = Path(path)
+        if not file.exists():
+            print(f"⚠️ [MockLLM] 响应文件不存在: {path}，所有请求返回默认响应")
+            return []
+        mtime = file.stat().st_mtime
+        cached = cls._cache.get(path)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, json.loads(file.read_text(encoding="utf-8")))
+            cls._cache[path] = cached
+        return cached[1]
+
+    @staticmethod
+    def match(rules: List[Dict[str, Any]], prompt: str) -> Dict[str, Any]:
+        for rule in rules:
+            if all(fragment in prompt for fragment in rule.get("contains", [])):
+                return rule
+        return {"name": "default", "response": _DEFAULT_RESPONSE}
+
+
+class MockChatModel(BaseChatModel):
+    """LangChain 兼容的 Mock 模型：ainvoke / astream 均按 TTFT + 输出速率模拟耗时"""
+
+    model_name: str = "mock-chat"
+    temperature: float = 0.0
+    streaming: bool = False
+    ttft: float = MOCK_LLM_TTFT
+    tokens_per_second: float = MOCK_LLM_TOKENS_PER_SECOND
+    responses_path: str = str(MOCK_LLM_RESPONSES_PATH)
+
+    @property
+    def _llm_type(self) -> str:
+        return "mock"
+
+    def _reply(self, messages: List[BaseMessage]) -> Dict[str, Any]:
+        prompt = "\n".join(
+            m.content if isinstance(m.content, str) else json.dumps(m.content, ensure_ascii=False)
+            for m in messages
+        )
+        rule = ResponseBook.match(ResponseBook.load(self.responses_path), prompt)
+        reasoning = rule.get("reasoning", "") if "reasoner" in self.model_name else ""
+        return {
+            "name": rule.get("name", ""),
+            "response": rule.get("response", ""),
+            "reasoning": reasoning,
+            "input_tokens": len(split_tokens(prompt)),
+        }
+
+    def _usage(self, reply: Dict[str, Any]) -> Dict[str, int]:
+        output_tokens = len(split_tokens(reply["response"])) + len(split_tokens(reply["reasoning"]))
+        return {
+            "input_tokens": reply["input_tokens"],
+            "output_tokens": output_tokens,
+            "total_tokens": reply["input_tokens"] + output_tokens,
+        }
+
+    def _duration(self, reply: Dict[str, Any]) -> float:
+        output_tokens = len(split_tokens(reply["response"])) + len(split_tokens(reply["reasoning"]))
+        return self.ttft + output_tokens / max(self.tokens_per_second, 1e-6)
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        reply = self._reply(messages)
+        time.sleep(self._duration(reply))
+        return self._result(reply)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        reply = self._reply(messages)
+        await asyncio.sleep(self._duration(reply))
+        return self._result(reply)
+
+    def _result(self, reply: Dict[str, Any]) -> ChatResult:
+        additional = {"reasoning_content": reply["reasoning"]} if reply["reasoning"] else {}
+        message = AIMessage(content=reply["response"], additional_kwargs=additional, usage_metadata=self._usage(reply))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        reply = self._reply(messages)
+        interval = 1 / max(self.tokens_per_second, 1e-6)
+        await asyncio.sleep(self.ttft)
+        for piece in split_tokens(reply["reasoning"]):
+            yield ChatGenerationChunk(message=AIMessageChunk(content="", additional_kwargs={"reasoning_content": piece}))
+            await asyncio.sleep(interval)
+        for piece in split_tokens(reply["response"]):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=piece))
+            await asyncio.sleep(interval)
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=self._usage(reply)))
@@ -1,4 +1,10 @@
 import ast
+import asyncio
+import json
+import os
+import pickle
+import struct
+import sys
 import pandas as pd
 import numpy as np
 import traceback
@@ -9,9 +15,19 @@ import matplotlib
 matplotlib.use('Agg') # 禁用 GUI
 import matplotlib.pyplot as plt
 import seaborn as sns
+from pathlib import Path
 from typing import Dict, Any, List, Optional
+from config import (
+    PYTHON_EXECUTOR_WORKERS, PYTHON_EXECUTOR_TIMEOUT, PYTHON_EXECUTOR_CPU_SECONDS,
+    PYTHON_EXECUTOR_MAX_RSS_MB, PYTHON_EXECUTOR_MAX_JOBS
+)
 from utils.logger import logger
 from utils.json_utils import json_dumps
+from services.columnar_result import ColumnarResult
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+_HEADER = struct.Struct(">I")
+_MAX_FRAME = 512 * 1024 * 1024
 
 class PythonExecutor:
     """
@@ -164,7 +180,14 @@ class PythonExecutor:
         
         # 💡 提示：所有生成的图表标题 (Title)、轴标签 (Labels) 和图例 (Legend) 请务必使用英文。
         
-        # 注入数据集
+        # 注入数据集 (列式结果直接由列数组构造 DataFrame)
+        if isinstance(df_input, ColumnarResult):
+            df_input = df_input.to_dataframe()
+        elif isinstance(df_input, dict):
+            df_input = {
+                name: df.to_dataframe() if isinstance(df, ColumnarResult) else df
+                for name, df in df_input.items()
+            }
         if isinstance(df_input, dict):
             exec_globals.update(df_input)
             if df_input:
@@ -215,6 +238,11 @@ class PythonExecutor:
                 "stdout": stdout.getvalue()
             }
 
+    @staticmethod
+    async def run_analysis(df_input: Any, code: str) -> Dict[str, Any]:
+        """异步执行：在进程池的工作进程中运行 execute_analysis，不占用事件循环"""
+        return await executor_pool.run(df_input, code)
+
     @staticmethod
     def generate_initial_context(df: pd.DataFrame) -> str:
         """为 AI 提供数据集的初始上下文"""
@@ -238,4 +266,358 @@ class PythonExecutor:
 """
         return context
 
+class _Worker:
+    """一个常驻的代码执行子进程 (python -m services.python_executor)，通过 stdin / stdout 收发长度前缀帧"""
+
+    def __init__(self, process: asyncio.subprocess.Process):
+        self.process = process
+        self.jobs = 0
+
+    @property
+    def pid(self) -> int:
+        return self.process.pid
+
+    def rss_mb(self) -> Optional[float]:
+        """当前常驻内存 (仅 Linux 可实时读取)"""
+        try:
+            with open(f"/proc/{self.pid}/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+        except (OSError, ValueError, IndexError):
+            return None
+
+    async def send(self, payload: bytes):
+        self.process.stdin.write(_HEADER.pack(len(payload)) + payload)
+        await self.process.stdin.drain()
+
+    async def receive(self) -> Dict[str, Any]:
+        size, = _HEADER.unpack(await self.process.stdout.readexactly(_HEADER.size))
+        if size > _MAX_FRAME:
+            raise ValueError(f"worker frame too large: {size}")
+        # 工作进程执行的是不可信代码，只接受 JSON 结果 (不反序列化 pickle)
+        return json.loads(await self.process.stdout.readexactly(size))
+
+    def kill(self):
+        if self.process.returncode is None:
+            try:
+                self.process.kill()
+            except ProcessLookupError:
+                pass
+
+
+class _WorkerKilled(Exception):
+    pass
+
+
+# 工作进程只继承运行所需的环境变量，API Key、数据库密码等不暴露给被执行的代码
+_WORKER_ENV_KEYS = {
+    "PATH", "HOME", "USER", "LANG", "LANGUAGE", "TZ", "TMPDIR", "TEMP", "TMP",
+    "PYTHONPATH", "PYTHONHOME", "PYTHONHASHSEED", "PYTHONIOENCODING", "VIRTUAL_ENV",
+    "SYSTEMROOT", "MPLCONFIGDIR", "OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS",
+}
+
+
+def _worker_env() -> Dict[str, str]:
+    env = {k: v for k, v in os.environ.items() if k in _WORKER_ENV_KEYS or k.startswith("LC_")}
+    env["MPLBACKEND"] = "Agg"
+    return env
+
+
+class ExecutorPool:
+    """
+    execute_analysis 的进程池
+    - 工作进程预先导入 pandas / numpy / matplotlib / seaborn，启动后常驻，按空闲队列分配任务
+    - 每个任务限制墙钟时间、CPU 时间 (RLIMIT_CPU) 与内存 (RLIMIT_DATA + 常驻内存轮询)，超限时结束进程并在后台补充新进程
+    - 执行若干次或内存峰值超限后回收进程，防止泄漏累积
+    - 补充进程失败时按指数退避重试；进程全部丢失且重试耗尽时退化为线程执行，避免请求永远等待空闲进程
+    - workers=0 或当前事件循环不支持子进程时，退化为在线程中执行 (不隔离，但不阻塞事件循环)
+    """
+
+    def __init__(
+        self,
+        workers: int = PYTHON_EXECUTOR_WORKERS,
+        timeout: float = PYTHON_EXECUTOR_TIMEOUT,
+        cpu_seconds: int = PYTHON_EXECUTOR_CPU_SECONDS,
+        max_rss_mb: int = PYTHON_EXECUTOR_MAX_RSS_MB,
+        max_jobs: int = PYTHON_EXECUTOR_MAX_JOBS,
+        poll_interval: float = 0.2,
+        respawn_attempts: int = 3,
+        respawn_delay: float = 0.5
+    ):
+        self.workers = workers
+        self.timeout = timeout
+        self.cpu_seconds = cpu_seconds
+        self.max_rss_mb = max_rss_mb
+        self.max_jobs = max_jobs
+        self.poll_interval = poll_interval
+        self.respawn_attempts = respawn_attempts
+        self.respawn_delay = respawn_delay
+        self._idle: Optional[asyncio.Queue] = None
+        self._all: set = set()
+        self._pending: set = set()  # 后台回收 / 补充任务 (保留引用，避免被垃圾回收)
+        self._start_lock: Optional[asyncio.Lock] = None
+        self._fallback = workers <= 0
+        self._closed = False
+        self._stats = {"jobs": 0, "timeouts": 0, "memory_kills": 0, "cpu_kills": 0, "crashes": 0, "recycled": 0}
+
+    async def _spawn(self) -> _Worker:
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, "-m", "services.python_executor", "--worker", str(self.cpu_seconds), str(self.max_rss_mb),
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            cwd=str(BACKEND_DIR),
+            env=_worker_env()
+        )
+        worker = _Worker(process)
+        self._all.add(worker)
+        try:
+            await worker.receive()  # 预导入完成后发送就绪帧
+        except Exception:
+            self._all.discard(worker)
+            worker.kill()
+            raise
+        return worker
+
+    async def start(self):
+        """创建全部工作进程 (首次调用 run 时自动执行，也可在启动阶段预热)"""
+        if self._start_lock is None:
+            self._start_lock = asyncio.Lock()
+        async with self._start_lock:
+            if self._idle is not None or self._fallback:
+                return
+            spawned = await asyncio.gather(*(self._spawn() for _ in range(self.workers)), return_exceptions=True)
+            workers = [w for w in spawned if isinstance(w, _Worker)]
+            errors = [e for e in spawned if isinstance(e, BaseException)]
+            if errors:
+                # 部分进程启动失败：结束已启动的进程，避免在退化模式下遗留孤儿进程
+                for worker in workers:
+                    self._all.discard(worker)
+                    worker.kill()
+                    await worker.process.wait()
+                if not isinstance(errors[0], (NotImplementedError, OSError, asyncio.IncompleteReadError)):
+                    raise errors[0]
+                logger.error(f"❌ [ExecutorPool] 无法创建工作进程，改为在线程中执行: {errors[0]}")
+                self._fallback = True
+                return
+            self._idle = asyncio.Queue()
+            for worker in workers:
+                self._idle.put_nowait(worker)
+            logger.info(f"🧮 [ExecutorPool] 已启动 {len(workers)} 个代码执行进程")
+
+    def _retire_later(self, worker: _Worker, reason: str):
+        task = asyncio.create_task(self._retire(worker, reason))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _retire(self, worker: _Worker, reason: str):
+        """结束工作进程并在后台补充一个新进程"""
+        self._all.discard(worker)
+        worker.kill()
+        await worker.process.wait()
+        logger.info(f"♻️ [ExecutorPool] 回收执行进程 {worker.pid} ({reason})")
+        attempt = 0
+        while True:
+            if self._closed or self._fallback:
+                return
+            try:
+                replacement = await self._spawn()
+                break
+            except Exception as e:
+                attempt += 1
+                if not self._all and attempt >= self.respawn_attempts:
+                    logger.error(f"❌ [ExecutorPool] 补充执行进程失败且已无可用进程，改为在线程中执行: {e}")
+                    self._enter_fallback()
+                    return
+                # 仍有其他进程在工作时持续重试 (退避上限 30s)，直到进程池恢复到配置的大小
+                delay = min(self.respawn_delay * 2 ** (attempt - 1), 30)
+                logger.error(f"❌ [ExecutorPool] 补充执行进程失败 (第 {attempt} 次)，{delay:.1f}s 后重试: {e}")
+                await asyncio.sleep(delay)
+        if self._closed or self._fallback:
+            # 补充期间进程池已关闭或已退化为线程执行
+            self._all.discard(replacement)
+            replacement.kill()
+        else:
+            self._idle.put_nowait(replacement)
+
+    def _enter_fallback(self):
+        self._fallback = True
+        # 唤醒正在等待空闲进程的请求，由它们依次传递哨兵并改为在线程中执行
+        self._idle.put_nowait(None)
+
+    async def run(self, df_input: Any, code: str) -> Dict[str, Any]:
+        if self._idle is None and not self._fallback:
+            await self.start()
+        if self._fallback:
+            return await asyncio.to_thread(PythonExecutor.execute_analysis, df_input, code)
+
+        payload = await asyncio.to_thread(pickle.dumps, (df_input, code), pickle.HIGHEST_PROTOCOL)
+        worker = await self._idle.get()
+        if worker is None:
+            self._idle.put_nowait(None)
+            return await asyncio.to_thread(PythonExecutor.execute_analysis, df_input, code)
+        self._stats["jobs"] += 1
+        loop = asyncio.get_running_loop()
+        reader = None
+        try:
+            await worker.send(payload)
+            reader = asyncio.ensure_future(worker.receive())
+            deadline = loop.time() + self.timeout
+            while True:
+                remaining = deadline - loop.time()
+                done, _ = await asyncio.wait({reader}, timeout=max(0, min(self.poll_interval, remaining)))
+                if done:
+                    break
+                if loop.time() >= deadline:
+                    self._stats["timeouts"] += 1
+                    raise _WorkerKilled(f"Execution timed out after {self.timeout:.0f}s (执行超时)")
+                rss = worker.rss_mb()
+                if rss is not None and rss > self.max_rss_mb:
+                    self._stats["memory_kills"] += 1
+                    raise _WorkerKilled(f"Memory limit exceeded: {rss:.0f}MB > {self.max_rss_mb}MB (内存超限)")
+            result = reader.result()
+        except _WorkerKilled as e:
+            logger.error(f"❌ [ExecutorPool] {e}，终止执行进程 {worker.pid}")
+            self._retire_later(worker, "killed")
+            return {"success": False, "error": str(e), "stdout": ""}
+        except asyncio.CancelledError:
+            # 客户端断开：进程仍在执行，无法中断，直接替换
+            self._retire_later(worker, "cancelled")
+            raise
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError) as e:
+            await worker.process.wait()
+            exit_code = worker.process.returncode
+            if exit_code == -24:  # SIGXCPU
+                self._stats["cpu_kills"] += 1
+                error = f"CPU time limit exceeded: {self.cpu_seconds}s (CPU 时间超限)"
+            else:
+                self._stats["crashes"] += 1
+                error = f"Execution process crashed (执行进程崩溃), exit code {exit_code}: {type(e).__name__}"
+            logger.error(f"❌ [ExecutorPool] {error}")
+            self._retire_later(worker, "crashed")
+            return {"success": False, "error": error, "stdout": ""}
+        finally:
+            if reader is not None and not reader.done():
+                reader.cancel()
+
+        worker.jobs += 1
+        peak = result.pop("peak_rss_mb", None)
+        if result.pop("memory_error", False):
+            # 分配超过 RLIMIT_DATA：代码内抛出 MemoryError，进程仍可响应但堆可能已碎片化，直接回收
+            self._stats["memory_kills"] += 1
+            logger.error(f"❌ [ExecutorPool] 执行进程 {worker.pid} 内存超限")
+            self._retire_later(worker, "memory limit")
+            return {"success": False, "error": f"Memory limit exceeded: > {self.max_rss_mb}MB (内存超限)",
+                    "stdout": result.get("stdout", "")}
+        if worker.jobs >= self.max_jobs or (peak and peak > self.max_rss_mb):
+            self._stats["recycled"] += 1
+            self._retire_later(worker, f"{worker.jobs} jobs, peak {peak or 0:.0f}MB")
+        else:
+            self._idle.put_nowait(worker)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._stats,
+            "workers": len(self._all),
+            "idle": self._idle.qsize() if self._idle is not None else 0,
+            "fallback": self._fallback,
+        }
+
+    async def aclose(self):
+        self._closed = True
+        for task in list(self._pending):
+            task.cancel()
+        await asyncio.gather(*self._pending, return_exceptions=True)
+        for worker in list(self._all):
+            worker.kill()
+            await worker.process.wait()
+        self._all.clear()
+        self._idle = None
+
+
+def _peak_rss_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以 KB 为单位，macOS 以字节为单位
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _limit_cpu(cpu_seconds: int):
+    """把 CPU 时间软上限设为「已用 + cpu_seconds」，超出时内核发送 SIGXCPU 终止进程"""
+    try:
+        import resource
+    except ImportError:
+        return
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    soft = int(usage.ru_utime + usage.ru_stime) + cpu_seconds + 1
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def _limit_memory(max_rss_mb: int):
+    """把数据段 (堆与匿名映射) 上限设为「启动后已用 + max_rss_mb」，超出时分配失败并抛出 MemoryError"""
+    try:
+        import resource
+        with open("/proc/self/status") as f:
+            used_kb = next(int(line.split()[1]) for line in f if line.startswith("VmData:"))
+    except (ImportError, OSError, StopIteration, ValueError):
+        return
+    soft = (used_kb * 1024) + max_rss_mb * 1024 * 1024
+    _, hard = resource.getrlimit(resource.RLIMIT_DATA)
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_DATA, (soft, hard))
+
+
+def _worker_main(cpu_seconds: int, max_rss_mb: int):
+    """工作进程入口：读取 (df_input, code) 帧，执行后以 JSON 帧返回结果"""
+    import signal
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C 由主进程处理
+
+    # 导入 config 时 load_dotenv 会把 .env 中的密钥重新写入环境变量，这里再清理一次
+    scrubbed = _worker_env()
+    os.environ.clear()
+    os.environ.update(scrubbed)
+
+    # 协议使用复制出来的 stdin / stdout，原 fd 1 指向 stderr，避免代码或第三方库的输出破坏帧
+    proto_in = os.fdopen(os.dup(0), "rb")
+    proto_out = os.fdopen(os.dup(1), "wb")
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    os.dup2(2, 1)
+
+    def send(obj: Dict[str, Any]):
+        try:
+            data = json_dumps(obj)
+        except (TypeError, ValueError):
+            data = json.dumps(obj, ensure_ascii=False, default=str)
+        data = data.encode("utf-8")
+        proto_out.write(_HEADER.pack(len(data)) + data)
+        proto_out.flush()
+
+    _limit_memory(max_rss_mb)
+    send({"ready": True})
+    while True:
+        header = proto_in.read(_HEADER.size)
+        if len(header) < _HEADER.size:
+            break
+        size, = _HEADER.unpack(header)
+        df_input, code = pickle.loads(proto_in.read(size))
+        _limit_cpu(cpu_seconds)
+        result = PythonExecutor.execute_analysis(df_input, code)
+        if not result.get("success") and "MemoryError" in result.get("error", "").strip().rsplit("\n", 1)[-1]:
+            result["memory_error"] = True
+        result["peak_rss_mb"] = _peak_rss_mb()
+        send(result)
+
+
 python_executor = PythonExecutor()
+executor_pool = ExecutorPool()
+
+
+if __name__ == "__main__" and len(sys.argv) > 3 and sys.argv[1] == "--worker":
+    _worker_main(int(sys.argv[2]), int(sys.argv[3]))
@@ -0,0 +1,236 @@
+"""
+Schema 检索服务 - 按问题挑选相关的表，只把这些表的结构放入 SQL 生成提示词
+"""
+import asyncio
+import hashlib
+import math
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Set, Tuple
+from config import (
+    SCHEMA_RETRIEVAL_ENABLED, SCHEMA_RETRIEVAL_MIN_TABLES, SCHEMA_RETRIEVAL_TOP_K,
+    SCHEMA_RETRIEVAL_MAX_TABLES, SCHEMA_RETRIEVAL_USE_EMBEDDINGS
+)
+from services.schema_service import SchemaService
+
+# 建表语句中的关键字与类型名，不参与词法匹配
+_STOPWORDS = {
+    "create", "table", "not", "null", "default", "primary", "key", "constraint", "foreign",
+    "references", "comment", "auto", "increment", "unsigned", "int", "integer", "bigint",
+    "smallint", "tinyint", "varchar", "char", "character", "varying", "text", "decimal",
+    "numeric", "float", "double", "date", "datetime", "timestamp", "time", "without", "zone",
+    "boolean", "bool", "json", "current", "on", "update", "nextval", "regclass", "id",
+}
+
+_REFERENCES_RE = re.compile(r'REFERENCES\s+[`"]?([\w$]+)[`"]?', re.IGNORECASE)
+
+
+def _tokenize(text: str) -> List[str]:
+    """英文按单词 (含 snake_case 拆分、简单单复数归一) 切分，中文按字二元组切分"""
+    tokens = []
+    for word in re.findall(r'[A-Z]+(?![a-z])|[A-Za-z][a-z0-9]*|\d+', text):
+        word = word.lower()
+        if word in _STOPWORDS or len(word) < 2:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        tokens.append(word)
+    for run in re.findall(r'[\u4e00-\u9fff]+', text):
+        if len(run) == 1:
+            tokens.append(run)
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+class _SchemaIndex:
+    """单个数据库的表级检索索引 (BM25 + 可选的向量相似度)"""
+
+    def __init__(self, blocks: Dict[str, str]):
+        self.tables = list(blocks.keys())
+        self.blocks = blocks
+        self.doc_tokens: Dict[str, Counter] = {}
+        for table, block in blocks.items():
+            tokens = _tokenize(block)
+            # 表名本身权重更高
+            tokens += _tokenize(table) * 3
+            self.doc_tokens[table] = Counter(tokens)
+        self.doc_len = {t: sum(c.values()) for t, c in self.doc_tokens.items()}
+        self.avg_len = (sum(self.doc_len.values()) / len(self.doc_len)) if self.doc_len else 0.0
+        df: Counter = Counter()
+        for counter in self.doc_tokens.values():
+            df.update(counter.keys())
+        n = len(self.tables)
+        self.idf = {tok: math.log(1 + (n - f + 0.5) / (f + 0.5)) for tok, f in df.items()}
+        # 外键关系 (双向)，用于补充邻居表
+        self.neighbours: Dict[str, Set[str]] = {t: set() for t in self.tables}
+        for table, block in blocks.items():
+            for ref in _REFERENCES_RE.findall(block):
+                if ref in self.neighbours and ref != table:
+                    self.neighbours[table].add(ref)
+                    self.neighbours[ref].add(table)
+        self.embeddings: Optional[Dict[str, List[float]]] = None
+
+    def bm25(self, query: str, k1: float = 1.5, b: float = 0.75) -> Dict[str, float]:
+        terms = [t for t in set(_tokenize(query)) if t in self.idf]
+        scores = {}
+        for table in self.tables:
+            counter = self.doc_tokens[table]
+            norm = k1 * (1 - b + b * self.doc_len[table] / (self.avg_len or 1))
+            score = 0.0
+            for term in terms:
+                tf = counter.get(term, 0)
+                if tf:
+                    score += self.idf[term] * tf * (k1 + 1) / (tf + norm)
+            scores[table] = score
+        return scores
+
+    @staticmethod
+    def embedding_text(table: str, block: str) -> str:
+        """向量化文本：表名 + 建表语句 (去掉样本数据)"""
+        ddl = block.split("/*\n样本数据", 1)[0]
+        return f"{table}\n{ddl}"[:1000]
+
+
+class SchemaRetriever:
+    """
+    按问题从全库 Schema 中选出 top-k 相关表及其外键邻居
+    表数量不超过 SCHEMA_RETRIEVAL_MIN_TABLES 或检索无明确结果时返回完整 Schema。
+    """
+
+    _indexes: Dict[str, Tuple[str, _SchemaIndex]] = {}
+    _embedder = None
+    _embedder_failed = False
+    _embedder_loading: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _signature(blocks: Dict[str, str]) -> str:
+        digest = hashlib.md5()
+        for table, block in blocks.items():
+            digest.update(table.encode("utf-8"))
+            digest.update(block.encode("utf-8"))
+        return digest.hexdigest()
+
+    @classmethod
+    def _get_index(cls, db_key: str, blocks: Dict[str, str]) -> _SchemaIndex:
+        signature = cls._signature(blocks)
+        cached = cls._indexes.get(db_key)
+        if cached and cached[0] == signature:
+            return cached[1]
+        index = _SchemaIndex(blocks)
+        cls._indexes[db_key] = (signature, index)
+        return index
+
+    @classmethod
+    def load_embedder(cls) -> None:
+        """同步加载知识库的本地嵌入模型 (可能需要读取 / 下载模型，不要在事件循环中直接调用)"""
+        if not SCHEMA_RETRIEVAL_USE_EMBEDDINGS or cls._embedder is not None or cls._embedder_failed:
+            return
+        try:
+            from services.vector_store import VectorStore
+            cls._embedder = VectorStore()._get_embeddings()
+        except Exception as e:
+            print(f"⚠️ [SchemaRetriever] 嵌入模型不可用，仅使用词法检索: {str(e)}")
+            cls._embedder_failed = True
+
+    @classmethod
+    def preload_embedder(cls) -> None:
+        """在后台线程中开始加载嵌入模型 (服务启动时调用；已加载、加载中或不可用时不做任何事)"""
+        if not SCHEMA_RETRIEVAL_USE_EMBEDDINGS or cls._embedder is not None or cls._embedder_failed:
+            return
+        if cls._embedder_loading is None:
+            cls._embedder_loading = asyncio.get_running_loop().create_task(asyncio.to_thread(cls.load_embedder))
+
+    @classmethod
+    def get_embedder(cls):
+        """
+        复用知识库的本地嵌入模型
+        尚未加载完成或不可用时返回 None (调用方退化为词法匹配)，不在请求路径上同步加载模型。
+        """
+        if cls._embedder is None:
+            try:
+                cls.preload_embedder()
+            except RuntimeError:
+                # 没有事件循环 (脚本 / 离线任务)：直接加载
+                cls.load_embedder()
+        return cls._embedder
+
+    @classmethod
+    async def _embedding_scores(cls, index: _SchemaIndex, query: str) -> Optional[Dict[str, float]]:
+        embedder = cls.get_embedder()
+        if embedder is None:
+            return None
+        try:
+            if index.embeddings is None:
+                texts = [_SchemaIndex.embedding_text(t, index.blocks[t]) for t in index.tables]
+                vectors = await asyncio.to_thread(embedder.embed_documents, texts)
+                index.embeddings = dict(zip(index.tables, vectors))
+            query_vec = await asyncio.to_thread(embedder.embed_query, query)
+        except Exception as e:
+            print(f"⚠️ [SchemaRetriever] 向量检索失败: {str(e)}")
+            return None
+        # 向量已归一化，点积即余弦相似度
+        return {t: sum(a * b for a, b in zip(query_vec, vec)) for t, vec in index.embeddings.items()}
+
+    @classmethod
+    async def rank_tables(cls, index: _SchemaIndex, question: str, history: str = "") -> List[Tuple[str, float]]:
+        """综合词法与向量得分对表排序 (历史对话权重减半，用于承接追问)"""
+        lexical = index.bm25(question)
+        if history:
+            for table, score in index.bm25(history[-1500:]).items():
+                lexical[table] += 0.5 * score
+        top_lexical = max(lexical.values(), default=0.0)
+        scores = {t: (s / top_lexical if top_lexical else 0.0) for t, s in lexical.items()}
+
+        semantic = await cls._embedding_scores(index, question)
+        if semantic:
+            values = list(semantic.values())
+            low, high = min(values), max(values)
+            span = (high - low) or 1.0
+            for table, sim in semantic.items():
+                scores[table] = 0.6 * scores[table] + 0.4 * (sim - low) / span
+        elif not top_lexical:
+            return []
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+    @classmethod
+    def select_tables(cls, index: _SchemaIndex, ranked: List[Tuple[str, float]]) -> List[str]:
+        """取 top-k，并补充其外键邻居 (总数不超过 SCHEMA_RETRIEVAL_MAX_TABLES)"""
+        selected = [t for t, score in ranked[:SCHEMA_RETRIEVAL_TOP_K] if score > 0]
+        chosen = list(selected)
+        for table in selected:
+            for neighbour in sorted(index.neighbours.get(table, ())):
+                if len(chosen) >= SCHEMA_RETRIEVAL_MAX_TABLES:
+                    break
+                if neighbour not in chosen:
+                    chosen.append(neighbour)
+        return chosen
+
+    @classmethod
+    async def build_schema_context(
+        cls,
+        question: str,
+        history: str = "",
+        db_key: Optional[str] = None,
+        include_sample: bool = True
+    ) -> str:
+        """返回用于 SQL 生成 / 方案生成提示词的 Schema 文本"""
+        db_key = db_key or SchemaService.get_current_db_key()
+        if not SCHEMA_RETRIEVAL_ENABLED:
+            return await SchemaService.get_full_schema(include_sample=include_sample, db_key=db_key)
+
+        blocks = await SchemaService.get_table_blocks(include_sample=include_sample, db_key=db_key)
+        if len(blocks) <= SCHEMA_RETRIEVAL_MIN_TABLES:
+            return await SchemaService.get_full_schema(include_sample=include_sample, db_key=db_key)
+
+        index = cls._get_index(db_key, blocks)
+        chosen = cls.select_tables(index, await cls.rank_tables(index, question, history))
+        if not chosen:
+            print(f"⚠️ [SchemaRetriever] 未检索到相关表，使用完整 Schema")
+            return await SchemaService.get_full_schema(include_sample=include_sample, db_key=db_key)
+
+        print(f"🎯 [SchemaRetriever] {db_key}: 从 {len(blocks)} 张表中选出 {len(chosen)} 张: {', '.join(chosen)}")
+        others = [t for t in index.tables if t not in chosen]
+        parts = [blocks[t] for t in chosen]
+        if others:
+            parts.append("-- 其余表 (Other tables, schema omitted): " + ", ".join(others))
+        return "\n\n".join(parts)
@@ -1,20 +1,42 @@
 """
 Schema 提取服务 (彻底根治缓存污染版)
 """
-from typing import List, Dict, Optional
-from config import DATABASES, DEFAULT_BUSINESS_DB
+import asyncio
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, List, Dict, Optional
+from config import (
+    DATABASES, DEFAULT_BUSINESS_DB, SCHEMA_SAMPLE_CONCURRENCY,
+    SCHEMA_CACHE_DIR, SCHEMA_CACHE_CHECK_INTERVAL, SCHEMA_CACHE_PERSIST_SAMPLES
+)
 from databases.database_manager import DatabaseManager
+from utils.json_utils import CustomJSONEncoder
+from services.user_context import set_current_db_key, get_current_db_key as get_request_db_key
+
+# 磁盘缓存格式版本，结构变化时递增以废弃旧文件 (2: 样本数据默认不再落盘)
+_CACHE_VERSION = 2
 
 
 class SchemaService:
+    """
+    当前数据库的解析顺序：显式传入的 db_key > 请求上下文 (use_database) > 进程默认库 (set_database)。
+    并发请求各自通过 use_database 绑定会话数据库，互不影响。
+    """
     # 改为字典存储，确保不同数据库的缓存互不干扰
     _cached_schemas: Dict[str, str] = {}
     _cached_tables: Dict[str, List[str]] = {}
+    # 逐表缓存 (含指纹) 与上次校验时间，磁盘上对应 SCHEMA_CACHE_DIR/<db_key>.json
+    _entries: Dict[str, Dict[str, Any]] = {}
+    _checked_at: Dict[str, float] = {}
+    _locks: Dict[str, asyncio.Lock] = {}
     _current_db_key: str = DEFAULT_BUSINESS_DB
 
     @classmethod
     def set_database(cls, db_key: str = DEFAULT_BUSINESS_DB):
-        """设置当前使用的数据库"""
+        """设置进程默认数据库 (未绑定请求上下文时使用)"""
         if db_key in DATABASES:
             if cls._current_db_key != db_key:
                 print(f"🔄 [Schema] 数据库切换: {cls._current_db_key} -> {db_key}")
@@ -22,14 +44,29 @@ class SchemaService:
             # 强制注册
             DatabaseManager.register_database(db_key, DATABASES[db_key])
 
+    @classmethod
+    def use_database(cls, db_key: Optional[str]) -> Optional[str]:
+        """为当前请求绑定数据库 (ContextVar，不影响其他并发请求)，返回最终生效的 db_key"""
+        if db_key in DATABASES:
+            DatabaseManager.register_database(db_key, DATABASES[db_key])
+            set_current_db_key(db_key)
+        else:
+            # 未知的库 (如旧会话的默认值) 回退到进程默认库
+            set_current_db_key(None)
+        return cls.get_current_db_key()
+
     @classmethod
     def get_current_db_key(cls) -> str:
-        return cls._current_db_key
+        return get_request_db_key() or cls._current_db_key
+
+    @classmethod
+    def _resolve(cls, db_key: Optional[str]) -> str:
+        return db_key or cls.get_current_db_key()
 
     @classmethod
-    async def get_table_names(cls) -> List[str]:
+    async def get_table_names(cls, db_key: Optional[str] = None) -> List[str]:
         """获取所有表名 (支持多库独立缓存)"""
-        db_key = cls._current_db_key
+        db_key = cls._resolve(db_key)
         if db_key in cls._cached_tables:
             return cls._cached_tables[db_key]
 
@@ -45,37 +82,206 @@ class SchemaService:
         return []
 
     @classmethod
-    async def get_full_schema(cls, include_sample: bool = True) -> str:
-        """获取完整数据库结构 (强制匹配当前 DB)"""
-        db_key = cls._current_db_key
-        
-        # 增加严格校验，如果缓存中的 DB Key 不匹配，则强制刷新
-        if db_key in cls._cached_schemas:
-            return cls._cached_schemas[db_key]
+    def _cache_path(cls, db_key: str) -> Path:
+        return SCHEMA_CACHE_DIR / f"{db_key}.json"
+
+    @classmethod
+    def _load_entry(cls, db_key: str) -> Optional[Dict[str, Any]]:
+        """读取磁盘上的 Schema 缓存 {"tables": {表名: {fingerprint, ddl}}} (开启 SCHEMA_CACHE_PERSIST_SAMPLES 时含 sample)"""
+        path = cls._cache_path(db_key)
+        if not path.exists():
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            if entry.get("version") != _CACHE_VERSION:
+                return None
+            return entry
+        except Exception as e:
+            print(f"⚠️ [Schema] 读取缓存失败 {path.name}: {str(e)}")
+            return None
 
-        print(f"🔍 [Schema] 正在为 {db_key} 构建全新 Schema...")
-        tables = await cls.get_table_names()
+    @classmethod
+    def _save_entry(cls, db_key: str, entry: Dict[str, Any]) -> None:
+        """原子写入磁盘缓存 (先写临时文件再替换)；样本数据默认不落盘"""
+        path = cls._cache_path(db_key)
+        if not SCHEMA_CACHE_PERSIST_SAMPLES:
+            entry = {**entry, "tables": {
+                table: {k: v for k, v in info.items() if k != "sample"}
+                for table, info in entry["tables"].items()
+            }}
+        try:
+            SCHEMA_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False, cls=CustomJSONEncoder)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"⚠️ [Schema] 写入缓存失败 {path.name}: {str(e)}")
+
+    @staticmethod
+    def _render(tables: Dict[str, Dict[str, Any]]) -> str:
         schemas = []
-        for table in tables:
-            table_schema = await cls.get_table_schema(table)
-            if include_sample:
-                sample_data = await cls.get_sample_data(table, limit=3)
-                if sample_data:
-                    table_schema += f"\n\n/*\n样本数据 ({table}):\n{sample_data}\n*/"
+        for table, info in tables.items():
+            table_schema = info.get("ddl") or f"-- 无法获取 {table} 结构"
+            if info.get("sample"):
+                table_schema += f"\n\n/*\n样本数据 ({table}):\n{info['sample']}\n*/"
             schemas.append(table_schema)
 
         full_schema = "\n\n".join(schemas)
-        
+
         # 限制大小
         if len(full_schema) > 40000:
             full_schema = full_schema[:40000] + "\n\n-- (内容过长已截断)"
-        
-        cls._cached_schemas[db_key] = full_schema
         return full_schema
 
     @classmethod
-    async def get_table_schema(cls, table_name: str) -> str:
-        adapter = DatabaseManager.get_adapter(cls._current_db_key)
+    async def get_full_schema(cls, include_sample: bool = True, db_key: Optional[str] = None) -> str:
+        """
+        获取完整数据库结构 (强制匹配当前 DB)
+        内存缓存每 SCHEMA_CACHE_CHECK_INTERVAL 秒用一次指纹查询校验；磁盘缓存使重启后无需重新内省。
+        只有指纹变化的表才会重新查询建表语句；样本数据默认不落盘，重启后按需重新抓取。
+        """
+        db_key = cls._resolve(db_key)
+
+        now = time.monotonic()
+        if db_key in cls._cached_schemas and now - cls._checked_at.get(db_key, 0) < SCHEMA_CACHE_CHECK_INTERVAL:
+            return cls._cached_schemas[db_key]
+
+        adapter = DatabaseManager.get_adapter(db_key)
+        if not adapter:
+            return ""
+
+        lock = cls._locks.setdefault(db_key, asyncio.Lock())
+        async with lock:
+            # 等锁期间其他请求可能已完成刷新
+            if db_key in cls._cached_schemas and time.monotonic() - cls._checked_at.get(db_key, 0) < SCHEMA_CACHE_CHECK_INTERVAL:
+                return cls._cached_schemas[db_key]
+            if not adapter.connected:
+                await adapter.connect()
+
+            try:
+                fingerprints = await adapter.get_table_fingerprints()
+            except Exception as e:
+                print(f"⚠️ [Schema] 读取表指纹失败，将完整重建: {str(e)}")
+                fingerprints = {}
+
+            entry = cls._entries.get(db_key)
+            if entry is None and fingerprints:
+                entry = cls._load_entry(db_key)
+            cached_tables = (entry or {}).get("tables", {})
+
+            if fingerprints:
+                changed = [
+                    t for t, fp in fingerprints.items()
+                    if t not in cached_tables or cached_tables[t].get("fingerprint") != fp
+                ]
+                removed = [t for t in cached_tables if t not in fingerprints]
+                unsampled = include_sample and any(
+                    "sample" not in info for t, info in cached_tables.items() if t in fingerprints
+                )
+            else:
+                # 不支持指纹 (或读取失败)：每次都完整重建，仅保留内存缓存
+                if db_key in cls._cached_schemas:
+                    cls._checked_at[db_key] = time.monotonic()
+                    return cls._cached_schemas[db_key]
+                changed, removed, unsampled = None, [], False
+
+            if changed == [] and not removed and not unsampled and db_key in cls._cached_schemas:
+                cls._checked_at[db_key] = time.monotonic()
+                return cls._cached_schemas[db_key]
+
+            if changed is None or changed or removed or unsampled:
+                if changed is None:
+                    print(f"🔍 [Schema] 正在为 {db_key} 构建全新 Schema...")
+                elif changed or removed:
+                    print(f"🔍 [Schema] {db_key} 增量刷新 {len(changed)} 张表，移除 {len(removed)} 张表")
+                else:
+                    print(f"⚡ [Schema] {db_key} 命中磁盘缓存，表结构未变化，仅重新抓取样本数据")
+                cached_tables = await cls._refresh_tables(
+                    adapter, db_key, cached_tables, changed, fingerprints, include_sample
+                )
+            else:
+                print(f"⚡ [Schema] {db_key} 命中磁盘缓存，表结构未变化")
+
+            entry = {"version": _CACHE_VERSION, "db_key": db_key, "tables": cached_tables}
+            cls._entries[db_key] = entry
+            if fingerprints and (changed or removed or (unsampled and SCHEMA_CACHE_PERSIST_SAMPLES)):
+                cls._save_entry(db_key, entry)
+
+            full_schema = cls._render(cached_tables)
+            cls._cached_tables[db_key] = list(cached_tables.keys())
+            cls._cached_schemas[db_key] = full_schema
+            cls._checked_at[db_key] = time.monotonic()
+            return full_schema
+
+    @classmethod
+    async def get_schema_fingerprint(cls, db_key: Optional[str] = None) -> str:
+        """表结构指纹 (只基于建表语句，不受样本数据变化影响)"""
+        db_key = cls._resolve(db_key)
+        await cls.get_full_schema(db_key=db_key)
+        tables = cls._entries.get(db_key, {}).get("tables", {})
+        digest = hashlib.md5()
+        for table in sorted(tables):
+            digest.update(table.encode("utf-8"))
+            digest.update((tables[table].get("ddl") or "").encode("utf-8"))
+        return digest.hexdigest()
+
+    @classmethod
+    async def get_table_blocks(cls, include_sample: bool = True, db_key: Optional[str] = None) -> Dict[str, str]:
+        """每张表的 Schema 片段 {表名: 建表语句 + 样本数据}，供 SchemaRetriever 按问题筛选"""
+        db_key = cls._resolve(db_key)
+        await cls.get_full_schema(include_sample=include_sample, db_key=db_key)
+        tables = cls._entries.get(db_key, {}).get("tables", {})
+        return {table: cls._render({table: info}) for table, info in tables.items()}
+
+    @classmethod
+    async def _refresh_tables(
+        cls,
+        adapter,
+        db_key: str,
+        cached_tables: Dict[str, Dict[str, Any]],
+        changed: Optional[List[str]],
+        fingerprints: Dict[str, str],
+        include_sample: bool
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        重新生成 changed 中各表的建表语句 (changed 为 None 表示全部)，并为缺少样本的表抓取样本，返回新的表集合
+        增量刷新时只查询变化的表，未变化的表沿用缓存中的建表语句。
+        """
+        if changed is None:
+            # 一次批量目录查询拿到所有表的建表语句
+            ddls = await adapter.get_create_table_sqls()
+            names = list(ddls)
+        else:
+            ddls = await adapter.get_create_table_sqls(changed) if changed else {}
+            # 保持原有表的顺序，新表追加在末尾；查询不到建表语句的表 (刷新期间被删除) 直接移除
+            names = [t for t in cached_tables if t in fingerprints and (t not in changed or t in ddls)]
+            names += sorted(t for t in changed if t not in cached_tables and t in ddls)
+
+        tables: Dict[str, Dict[str, Any]] = {}
+        for table in names:
+            if table in ddls:
+                tables[table] = {"fingerprint": fingerprints.get(table), "ddl": ddls[table]}
+            else:
+                tables[table] = dict(cached_tables[table])
+
+        if include_sample:
+            targets = [t for t, info in tables.items() if "sample" not in info]
+            # 样本数据并发抓取，用信号量限制同时占用的连接数
+            semaphore = asyncio.Semaphore(SCHEMA_SAMPLE_CONCURRENCY)
+
+            async def _fetch(table: str) -> str:
+                async with semaphore:
+                    return await cls.get_sample_data(table, limit=3, db_key=db_key)
+
+            for table, sample in zip(targets, await asyncio.gather(*(_fetch(t) for t in targets))):
+                tables[table]["sample"] = sample
+        return tables
+
+    @classmethod
+    async def get_table_schema(cls, table_name: str, db_key: Optional[str] = None) -> str:
+        adapter = DatabaseManager.get_adapter(cls._resolve(db_key))
         if adapter:
             if not adapter.connected:
                 await adapter.connect()
@@ -83,9 +289,9 @@ class SchemaService:
         return ""
 
     @classmethod
-    async def get_db_version(cls) -> str:
+    async def get_db_version(cls, db_key: Optional[str] = None) -> str:
         """获取当前数据库版本"""
-        adapter = DatabaseManager.get_adapter(cls._current_db_key)
+        adapter = DatabaseManager.get_adapter(cls._resolve(db_key))
         if adapter:
             if not adapter.connected:
                 await adapter.connect()
@@ -93,11 +299,11 @@ class SchemaService:
         return "unknown"
 
     @classmethod
-    async def get_sample_data(cls, table_name: str, limit: int = 3) -> str:
-        adapter = DatabaseManager.get_adapter(cls._current_db_key)
+    async def get_sample_data(cls, table_name: str, limit: int = 3, db_key: Optional[str] = None) -> str:
+        adapter = DatabaseManager.get_adapter(cls._resolve(db_key))
         if not adapter or not adapter.connected: return ""
         try:
-            rows = await adapter.execute_query(f"SELECT * FROM `{table_name}` LIMIT {limit}")
+            rows = await adapter.execute_query(f"SELECT * FROM {adapter.quote_identifier(table_name)} LIMIT {limit}")
             if not rows: return ""
             return "\n".join([f"  {list(row.values())}" for row in rows])
         except:
@@ -105,7 +311,12 @@ class SchemaService:
 
     @classmethod
     def clear_cache(cls):
-        """手动清空所有缓存"""
+        """手动清空所有缓存 (含磁盘缓存)"""
         cls._cached_schemas.clear()
         cls._cached_tables.clear()
+        cls._entries.clear()
+        cls._checked_at.clear()
+        if SCHEMA_CACHE_DIR.exists():
+            for path in SCHEMA_CACHE_DIR.glob("*.json"):
+                path.unlink(missing_ok=True)
         print("🧹 [Schema] 所有数据库缓存已清空")
@@ -3,10 +3,145 @@ SQL 执行服务
 """
 import asyncio
 import re
-from typing import List, Dict, Any, Optional
-from config import MAX_SQL_EXECUTION_TIME
+import time
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple, AsyncGenerator
+from config import (
+    MAX_SQL_EXECUTION_TIME, DATABASES,
+    SQL_RESULT_CACHE_ENABLED, SQL_RESULT_CACHE_TTL,
+    SQL_RESULT_CACHE_MAX_ENTRIES, SQL_RESULT_CACHE_MAX_ROWS,
+    SQL_STREAM_BATCH_SIZE, SQL_MAX_RESULT_ROWS, SQL_MAX_RESULT_BYTES,
+    SQL_RESULT_COLUMNAR
+)
 from services.schema_service import SchemaService
+from services.columnar_result import ColumnarResult, ColumnarResultBuilder
+from services.sql_rewriter import SQLRewriter
+from services.user_context import get_current_user_id
 from databases.database_manager import DatabaseManager
+from utils.logger import logger
+
+
+class QueryResultCache:
+    """
+    SQL 查询结果缓存 (TTL + LRU)
+    缓存键：规范化后的 SQL + db_key + 用户 ID，不同数据库/用户之间互不可见。
+    MySQL 下额外记录所涉及表的 information_schema.TABLES.UPDATE_TIME，
+    命中时若表已更新则视为失效。
+    """
+
+    def __init__(
+        self,
+        ttl: int = SQL_RESULT_CACHE_TTL,
+        max_entries: int = SQL_RESULT_CACHE_MAX_ENTRIES,
+        max_rows: int = SQL_RESULT_CACHE_MAX_ROWS
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self._entries: "OrderedDict[Tuple[str, str, Optional[int]], Dict[str, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def normalize_sql(sql: str) -> str:
+        """去除注释、折叠空白、去掉末尾分号，字符串字面量之外统一小写"""
+        # 先按字面量 / 注释切分，保证引号内的 -- 或 /* 不会被当成注释删掉
+        parts = re.split(r"""('(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*"|--[^\n]*|/\*[\s\S]*?\*/)""", sql)
+        normalized, code = [], ""
+        for i, part in enumerate(parts):
+            if i % 2 == 0:
+                code += part
+            elif part[0] in "'\"":
+                normalized += [re.sub(r'\s+', ' ', code).lower(), part]
+                code = ""
+            else:
+                code += " "
+        normalized.append(re.sub(r'\s+', ' ', code).lower())
+        return re.sub(r'[\s;]+$', '', "".join(normalized)).strip()
+
+    @staticmethod
+    def extract_tables(sql: str) -> List[str]:
+        """粗略提取 FROM / JOIN 之后引用的表名 (用于 UPDATE_TIME 失效校验)"""
+        tables = []
+        for match in re.finditer(r'\b(?:from|join)\s+([`"\w.]+)', sql, re.IGNORECASE):
+            name = match.group(1).replace('`', '').replace('"', '').split('.')[-1]
+            if name and name.lower() not in tables:
+                tables.append(name.lower())
+        return tables
+
+    def make_key(self, sql: str, db_key: str, user_id: Optional[int]) -> Tuple[str, str, Optional[int]]:
+        return (self.normalize_sql(sql), db_key or "", user_id)
+
+    def get(self, key: Tuple[str, str, Optional[int]]) -> Optional[Dict[str, Any]]:
+        """读取缓存条目 (已过期则删除并返回 None)"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry["expires_at"] < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def set(
+        self,
+        key: Tuple[str, str, Optional[int]],
+        result: Dict[str, Any],
+        tables: List[str],
+        versions: Dict[str, str]
+    ) -> None:
+        if result.get("row_count", 0) > self.max_rows:
+            return
+        self._entries[key] = {
+            "result": result,
+            "tables": tables,
+            "versions": versions,
+            "expires_at": time.monotonic() + self.ttl
+        }
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def discard(self, key: Tuple[str, str, Optional[int]]) -> None:
+        if self._entries.pop(key, None) is not None:
+            self.invalidations += 1
+
+    def invalidate(self, db_key: Optional[str] = None, tables: Optional[List[str]] = None) -> int:
+        """
+        失效钩子：按数据库和/或表名批量清除缓存
+        不传参数时清空全部缓存，返回被清除的条目数。
+        """
+        table_set = {t.lower() for t in tables} if tables else None
+        removed = 0
+        for key in list(self._entries.keys()):
+            entry = self._entries[key]
+            if db_key is not None and key[1] != db_key:
+                continue
+            if table_set is not None and not table_set.intersection(entry["tables"]):
+                continue
+            del self._entries[key]
+            removed += 1
+        self.invalidations += removed
+        return removed
+
+    def get_stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations
+        }
+
+
+query_cache = QueryResultCache()
 
 
 class SQLExecutor:
@@ -31,60 +166,228 @@ class SQLExecutor:
         return True, None
 
     @staticmethod
-    async def execute_sql(sql: str, timeout: int = MAX_SQL_EXECUTION_TIME) -> Dict[str, Any]:
+    async def _get_table_versions(db_key: str, tables: List[str]) -> Dict[str, str]:
+        """读取 MySQL 表的 UPDATE_TIME 作为版本号 (其他数据库返回空，仅依赖 TTL)"""
+        if not tables or DATABASES.get(db_key, {}).get("type") != "mysql":
+            return {}
+        adapter = DatabaseManager.get_adapter(db_key)
+        if not adapter or not adapter.connected:
+            return {}
+        params = {f"t{i}": t for i, t in enumerate(tables)}
+        placeholders = ", ".join(f":t{i}" for i in range(len(tables)))
+        rows = await adapter.execute_query(
+            "SELECT TABLE_NAME, UPDATE_TIME FROM information_schema.TABLES "
+            f"WHERE TABLE_SCHEMA = DATABASE() AND LOWER(TABLE_NAME) IN ({placeholders})",
+            params
+        )
+        return {str(r["TABLE_NAME"]).lower(): str(r["UPDATE_TIME"]) for r in rows}
+
+    @staticmethod
+    async def _get_cached_result(key: Tuple[str, str, Optional[int]]) -> Optional[Dict[str, Any]]:
+        entry = query_cache.get(key)
+        if entry is None:
+            query_cache.misses += 1
+            return None
+        if entry["versions"]:
+            try:
+                versions = await SQLExecutor._get_table_versions(key[1], entry["tables"])
+            except Exception:
+                versions = None
+            if versions != entry["versions"]:
+                query_cache.discard(key)
+                query_cache.misses += 1
+                return None
+        query_cache.hits += 1
+        logger.debug("⚡ [SQLCache] 命中缓存 (db=%s, rows=%s)", key[1], entry["result"].get("row_count", 0))
+        return entry["result"].copy()
+
+    @staticmethod
+    async def _store_result(key: Tuple[str, str, Optional[int]], sql: str, result: Dict[str, Any]) -> None:
+        tables = QueryResultCache.extract_tables(sql)
+        try:
+            versions = await SQLExecutor._get_table_versions(key[1], tables)
+        except Exception:
+            versions = {}
+        query_cache.set(key, result.copy(), tables, versions)
+
+    @staticmethod
+    async def _count_total(sql: str, db_key: str, timeout: float) -> Optional[int]:
+        """单独执行 COUNT(*) 获取总行数 (失败时返回 None，不影响主查询)"""
+        count_sql = SQLRewriter.build_count_sql(sql)
+        adapter = DatabaseManager.get_adapter(db_key)
+        if not count_sql or not adapter or timeout <= 0:
+            return None
+        if "mysql" in db_key.lower():
+            count_sql = count_sql.replace("%", "%%")
+        try:
+            rows = await asyncio.wait_for(adapter.execute_query(count_sql), timeout=timeout)
+            return int(rows[0]["total_count"]) if rows else None
+        except Exception as e:
+            logger.warning("⚠️ [Database] 统计总行数失败: %s", e)
+            return None
+
+    @staticmethod
+    async def execute_sql_stream(
+        sql: str,
+        timeout: int = MAX_SQL_EXECUTION_TIME,
+        use_cache: bool = True,
+        row_cap: Optional[int] = None,
+        include_total: bool = False,
+        columnar: bool = SQL_RESULT_COLUMNAR,
+        batch_size: int = SQL_STREAM_BATCH_SIZE,
+        max_rows: int = SQL_MAX_RESULT_ROWS,
+        max_bytes: int = SQL_MAX_RESULT_BYTES,
+        db_key: Optional[str] = None
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """
+        流式执行 SQL (服务端游标)
+        逐批读取结果并产出 {"type": "progress", "row_count": n, "columns": [...], "rows": [行元组...]}
+        (rows 为本批新读取的行，调用方可逐批转发而不必等待完整结果)，
+        最后产出 {"type": "done", "result": {...}}；命中结果缓存时只产出 done。
+        读取量超过 max_rows / max_bytes 时停止读取，结果中 truncated 为 True。
+        传入 row_cap 时先对最外层 LIMIT 做下推/收紧；include_total 为 True 时
+        在结果被 LIMIT 截断的情况下额外执行一次 COUNT(*) 得到 total_count。
+        columnar 为 True 时返回 ColumnarResult (列式存储，兼容 dict 访问)。
+        db_key 未传入时使用当前请求绑定的数据库 (SchemaService.get_current_db_key)。
+        """
         is_valid, error_msg = SQLExecutor.validate_sql(sql)
         if not is_valid:
             raise ValueError(error_msg)
 
-        try:
-            async def execute():
-                db_key = SchemaService.get_current_db_key()
+        original_sql = sql
+        row_limit = None
+        if row_cap:
+            sql, row_limit = SQLRewriter.apply_limit(sql, row_cap)
+            if row_limit is not None:
+                logger.debug("✂️ [Database] 已下推 LIMIT %s", row_limit)
+
+        db_key = db_key or SchemaService.get_current_db_key()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+
+        cache_key = None
+        result = None
+        if use_cache and SQL_RESULT_CACHE_ENABLED:
+            cache_key = query_cache.make_key(sql, db_key, get_current_user_id())
+            result = await SQLExecutor._get_cached_result(cache_key)
+
+        if result is None:
+            try:
                 adapter = DatabaseManager.get_adapter(db_key)
-                
                 if not adapter:
                     raise ValueError(f"无法获取数据库适配器: {db_key}")
-                
                 if not adapter.connected:
                     await adapter.connect()
-                
+
                 # 只有 MySQL 需要转义 % (防止 aiomysql 占位符解析错误)
                 escaped_sql = sql
                 if "mysql" in db_key.lower():
                     escaped_sql = sql.replace("%", "%%")
-                
+
                 print(f"📡 [Database] 准备执行 SQL: {escaped_sql}")
-                
-                rows = await adapter.execute_query(escaped_sql)
-                
-                if not rows:
-                    return {
-                        "columns": [],
-                        "rows": [],
-                        "row_count": 0
-                    }
-                
-                columns = list(rows[0].keys()) if rows else []
-                
-                return {
+
+                columns: List[str] = []
+                rows: List[Dict[str, Any]] = []
+                builder: Optional[ColumnarResultBuilder] = None
+                truncated = False
+                batches = adapter.stream_query(
+                    escaped_sql, batch_size=batch_size, max_rows=max_rows, max_bytes=max_bytes
+                )
+                try:
+                    while True:
+                        remaining = deadline - loop.time()
+                        if remaining <= 0:
+                            raise asyncio.TimeoutError()
+                        try:
+                            batch = await asyncio.wait_for(batches.__anext__(), timeout=remaining)
+                        except StopAsyncIteration:
+                            break
+                        columns = batch.columns
+                        truncated = truncated or batch.truncated
+                        if columnar:
+                            # 列式模式：行元组直接追加到列数组，不构造行字典
+                            if builder is None:
+                                builder = ColumnarResultBuilder(columns)
+                            builder.append_rows(batch.rows)
+                            read_rows = builder.row_count
+                        else:
+                            rows.extend(dict(zip(columns, row)) for row in batch.rows)
+                            read_rows = len(rows)
+                        if batch.rows:
+                            yield {"type": "progress", "row_count": read_rows, "columns": columns, "rows": batch.rows}
+                finally:
+                    await batches.aclose()
+            except asyncio.TimeoutError:
+                raise TimeoutError(f"SQL 查询超时（超过 {timeout} 秒），请优化查询条件")
+            except Exception as e:
+                raise RuntimeError(f"SQL 执行失败: {str(e)}")
+
+            if columnar:
+                result = (builder or ColumnarResultBuilder(columns)).build()
+            else:
+                result = {
                     "columns": columns,
                     "rows": rows,
                     "row_count": len(rows)
                 }
-            
-            result = await asyncio.wait_for(execute(), timeout=timeout)
-            return result
-        except asyncio.TimeoutError:
-            raise TimeoutError(f"SQL 查询超时（超过 {timeout} 秒），请优化查询条件")
-        except Exception as e:
-            raise RuntimeError(f"SQL 执行失败: {str(e)}")
+            if truncated:
+                result["truncated"] = True
+                logger.info("⚠️ [Database] 结果超过读取上限，已截断为 %s 行", result["row_count"])
+            elif cache_key is not None:
+                await SQLExecutor._store_result(cache_key, sql, result)
+
+        if row_limit is not None:
+            result["row_limit"] = row_limit
+            if result["row_count"] >= row_limit:
+                result["limited"] = True
+        if include_total:
+            if result.get("limited") or result.get("truncated"):
+                result["total_count"] = await SQLExecutor._count_total(original_sql, db_key, deadline - loop.time())
+            else:
+                result["total_count"] = result["row_count"]
+
+        yield {"type": "done", "result": result}
+
+    @staticmethod
+    async def execute_sql(
+        sql: str,
+        timeout: int = MAX_SQL_EXECUTION_TIME,
+        use_cache: bool = True,
+        row_cap: Optional[int] = None,
+        include_total: bool = False,
+        db_key: Optional[str] = None
+    ) -> Dict[str, Any]:
+        result: Dict[str, Any] = {"columns": [], "rows": [], "row_count": 0}
+        async for event in SQLExecutor.execute_sql_stream(
+            sql, timeout=timeout, use_cache=use_cache, row_cap=row_cap,
+            include_total=include_total, db_key=db_key
+        ):
+            if event["type"] == "done":
+                result = event["result"]
+        return result
+
+    @staticmethod
+    def result_meta(result: Dict[str, Any]) -> Dict[str, Any]:
+        """结果的元数据部分 (列名、行数、截断标记等，不含行数据)，用于已逐批发送过行的 sql_result 事件"""
+        meta = dict(result.meta) if isinstance(result, ColumnarResult) else {
+            k: v for k, v in result.items() if k not in ("columns", "rows", "row_count")
+        }
+        return {"columns": list(result["columns"]), "row_count": result["row_count"], **meta, "streamed": True}
 
     @staticmethod
     def format_sql_result(result: Dict[str, Any], max_rows: int = 50) -> str:
-        if not result or not result["rows"]:
+        if not result:
             return "查询结果为空"
-        
+        # 列式结果访问 rows 会物化全部行字典，优先使用 row_count
+        total_rows = result["row_count"] if "row_count" in result else len(result["rows"])
+        if not total_rows:
+            return "查询结果为空"
+
         columns = result["columns"]
-        rows = result["rows"][:max_rows]
+        if isinstance(result, ColumnarResult):
+            rows = result.head(max_rows)
+        else:
+            rows = result["rows"][:max_rows]
         
         lines = []
         lines.append("| " + " | ".join(columns) + " |")
@@ -94,7 +397,10 @@ class SQLExecutor:
             values = [str(row.get(col, "")) for col in columns]
             lines.append("| " + " | ".join(values) + " |")
         
-        if len(result["rows"]) > max_rows:
-            lines.append(f"\n... 还有 {len(result['rows']) - max_rows} 行数据")
+        if total_rows > max_rows:
+            lines.append(f"\n... 还有 {total_rows - max_rows} 行数据")
+        total_count = result.get("total_count")
+        if total_count and total_count > total_rows:
+            lines.append(f"\n(结果已按 LIMIT 截断，查询总行数为 {total_count})")
         
         return "\n".join(lines)
@@ -0,0 +1,134 @@
+"""
+SQL 改写服务 - 为 LLM 生成的查询注入/收紧最外层 LIMIT
+"""
+import re
+from typing import Optional, Tuple
+from config import SQL_ROW_CAP_DEFAULT, SQL_ROW_CAPS_BY_CHART
+
+
+class SQLRewriter:
+    """
+    仅处理最外层 (括号深度为 0、字符串与注释之外) 的子句，
+    子查询、CTE 内部的 LIMIT 保持不变。
+    """
+
+    @staticmethod
+    def _mask(sql: str) -> str:
+        """
+        返回与原 SQL 等长的掩码串：字符串字面量、注释以及括号内的内容全部替换为空格，
+        只保留最外层的文本，便于用正则定位顶层关键字。
+        """
+        out = list(sql)
+        n = len(sql)
+        depth = 0
+        i = 0
+        while i < n:
+            ch = sql[i]
+            if ch in ("'", '"', '`'):
+                j = i + 1
+                while j < n:
+                    if sql[j] == '\\' and ch != '`':
+                        j += 2
+                        continue
+                    if sql[j] == ch:
+                        # 连续两个引号表示转义
+                        if j + 1 < n and sql[j + 1] == ch:
+                            j += 2
+                            continue
+                        break
+                    j += 1
+                end = min(j, n - 1)
+                for k in range(i, end + 1):
+                    out[k] = ' '
+                i = end + 1
+                continue
+            if sql.startswith('--', i):
+                j = sql.find('\n', i)
+                end = n if j == -1 else j
+                for k in range(i, end):
+                    out[k] = ' '
+                i = end
+                continue
+            if sql.startswith('/*', i):
+                j = sql.find('*/', i + 2)
+                end = n if j == -1 else j + 2
+                for k in range(i, end):
+                    out[k] = ' '
+                i = end
+                continue
+            if ch == '(':
+                depth += 1
+                out[i] = ' '
+            elif ch == ')':
+                depth = max(depth - 1, 0)
+                out[i] = ' '
+            elif depth > 0:
+                out[i] = ' '
+            i += 1
+        return "".join(out)
+
+    @staticmethod
+    def _strip_trailing(sql: str) -> str:
+        return sql.strip().rstrip(';').rstrip()
+
+    @staticmethod
+    def is_rewritable(sql: str) -> bool:
+        """只有 SELECT / WITH 查询才做 LIMIT 改写"""
+        clean_sql = re.sub(r'(--.*|/\*[\s\S]*?\*/)', '', sql).strip().lower()
+        return clean_sql.startswith(('select', 'with'))
+
+    @staticmethod
+    def cap_for_chart(chart_type: Optional[str]) -> int:
+        """根据图表类型返回行数上限"""
+        return SQL_ROW_CAPS_BY_CHART.get(chart_type or "", SQL_ROW_CAP_DEFAULT)
+
+    @staticmethod
+    def apply_limit(sql: str, cap: int) -> Tuple[str, Optional[int]]:
+        """
+        注入或收紧最外层 LIMIT
+        返回 (改写后的 SQL, 注入/收紧后的 LIMIT)；无法改写或用户自带的 LIMIT
+        已不超过上限时第二项为 None (结果不应标记为被截断)。
+        """
+        if cap <= 0 or not SQLRewriter.is_rewritable(sql):
+            return sql, None
+
+        body = SQLRewriter._strip_trailing(sql)
+        masked = SQLRewriter._mask(body)
+
+        # FETCH FIRST / FOR UPDATE / INTO 等写法不做改写，避免生成非法语句
+        if re.search(r'\b(fetch|for\s+update|into)\b', masked, re.IGNORECASE):
+            return sql, None
+
+        match = re.search(
+            r'\blimit\s+(\d+|all)(?:\s*,\s*(\d+))?(?:\s+offset\s+\d+)?\s*$',
+            masked, re.IGNORECASE
+        )
+        if match:
+            # MySQL 的 LIMIT offset, count 写法：第二个数字才是行数
+            group = 2 if match.group(2) else 1
+            value = match.group(group)
+            if value.lower() != 'all' and int(value) <= cap:
+                return sql, None
+            start, end = match.span(group)
+            return body[:start] + str(cap) + body[end:], cap
+
+        if re.search(r'\blimit\b', masked, re.IGNORECASE):
+            # LIMIT 不在语句末尾 (如带参数占位符)，保持原样
+            return sql, None
+
+        # 换行追加，防止末尾的 -- 注释吞掉 LIMIT
+        return f"{body}\nLIMIT {cap}", cap
+
+    @staticmethod
+    def build_count_sql(sql: str) -> Optional[str]:
+        """
+        构造统计总行数的 COUNT(*) 查询 (去掉最外层 ORDER BY / LIMIT，降低开销)
+        """
+        if not SQLRewriter.is_rewritable(sql):
+            return None
+        body = SQLRewriter._strip_trailing(sql)
+        masked = SQLRewriter._mask(body)
+        match = re.search(r'\b(order\s+by|limit)\b', masked, re.IGNORECASE)
+        if match:
+            body = body[:match.start()].rstrip()
+        return f"SELECT COUNT(*) AS total_count FROM (\n{body}\n) AS _total_q"
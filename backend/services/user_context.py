@@ -24,3 +24,35 @@ def get_user_api_key(provider: str) -> Optional[str]:
 def get_user_base_url(provider: str) -> Optional[str]:
     """获取当前请求中指定供应商的 Base URL (如果用户自定义了)"""
     return _user_api_key_ctx.get().get(f"{provider}_base_url")
+
+
+# 当前请求的用户 ID (供查询结果缓存等按用户隔离的组件使用)
+_current_user_id_ctx: contextvars.ContextVar[Optional[int]] = contextvars.ContextVar(
+    'current_user_id_ctx', default=None
+)
+
+
+def set_current_user_id(user_id: Optional[int]):
+    """设置当前请求的用户 ID"""
+    _current_user_id_ctx.set(user_id)
+
+
+def get_current_user_id() -> Optional[int]:
+    """获取当前请求的用户 ID"""
+    return _current_user_id_ctx.get()
+
+
+# 当前请求使用的业务数据库 (由会话决定，并发会话之间互不影响)
+_current_db_key_ctx: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar(
+    'current_db_key_ctx', default=None
+)
+
+
+def set_current_db_key(db_key: Optional[str]):
+    """设置当前请求使用的数据库 key"""
+    _current_db_key_ctx.set(db_key)
+
+
+def get_current_db_key() -> Optional[str]:
+    """获取当前请求使用的数据库 key (未设置时返回 None)"""
+    return _current_db_key_ctx.get()
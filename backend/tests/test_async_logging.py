@@ -0,0 +1,103 @@
+"""
+测试异步日志：QueueListener 后台写出、延迟格式化与提示词采样转储
+"""
+import logging
+import sys
+import tempfile
+import threading
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from utils import logger as log_module
+from utils.logger import DeferredQueueHandler, LazyJSON, log_prompt, setup_logging, stop_logging
+
+
+class _Recorder(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append((threading.current_thread().name, self.format(record)))
+
+
+class _Expensive:
+    calls = 0
+
+    def __str__(self):
+        _Expensive.calls += 1
+        return "expensive"
+
+
+def _with_logging(tmp: str):
+    setup_logging(level="DEBUG", log_file=str(Path(tmp) / "app.log"))
+    return logging.getLogger()
+
+
+def _teardown():
+    stop_logging()
+    logging.getLogger().handlers.clear()
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger(log_module.PROMPT_LOGGER_NAME).handlers.clear()
+
+
+def test_root_logger_only_enqueues():
+    with tempfile.TemporaryDirectory() as tmp:
+        root = _with_logging(tmp)
+        try:
+            assert [type(h) for h in root.handlers] == [DeferredQueueHandler]
+            logging.getLogger("app").info("hello %s", "queue")
+        finally:
+            _teardown()
+        assert "hello queue" in (Path(tmp) / "app.log").read_text(encoding="utf-8")
+
+
+def test_formatting_happens_on_listener_thread():
+    with tempfile.TemporaryDirectory() as tmp:
+        root = _with_logging(tmp)
+        recorder = _Recorder()
+        log_module._listeners[0].handlers += (recorder,)
+        try:
+            logging.getLogger("app").info("value=%s", _Expensive())
+        finally:
+            _teardown()
+        thread_name, message = recorder.records[0]
+        assert message == "value=expensive"
+        assert thread_name != threading.current_thread().name
+
+
+def test_disabled_level_skips_formatting():
+    _Expensive.calls = 0
+    quiet = logging.getLogger("test.quiet")
+    quiet.setLevel(logging.INFO)
+    quiet.debug("value=%s", _Expensive())
+    assert _Expensive.calls == 0
+
+
+def test_prompt_dump_is_sampled_to_separate_file():
+    with tempfile.TemporaryDirectory() as tmp:
+        _with_logging(tmp)
+        messages = [{"role": "user", "content": "各城市销售额"}]
+        try:
+            assert log_prompt("deepseek", messages, sample_rate=1.0)
+            assert not log_prompt("deepseek", messages, sample_rate=0.0)
+        finally:
+            _teardown()
+        dump = (Path(tmp) / "llm_prompts.log").read_text(encoding="utf-8")
+        assert "📤 [Prompt (deepseek)]" in dump and "各城市销售额" in dump
+        assert "各城市销售额" not in (Path(tmp) / "app.log").read_text(encoding="utf-8")
+
+
+def test_lazy_json():
+    assert str(LazyJSON({"a": "中文"})) == '{\n  "a": "中文"\n}'
+
+
+if __name__ == "__main__":
+    test_root_logger_only_enqueues()
+    test_formatting_happens_on_listener_thread()
+    test_disabled_level_skips_formatting()
+    test_prompt_dump_is_sampled_to_separate_file()
+    test_lazy_json()
+    print("✅ 异步日志测试通过")
@@ -0,0 +1,96 @@
+"""
+测试复杂图表的本地构建 (列类型推断 + viz_config 提示)
+"""
+import sys
+from datetime import date
+from decimal import Decimal
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from services.chart_builders import LocalChartBuilder
+from services.columnar_result import ColumnarResult
+
+
+def _result(rows):
+    return {"columns": list(rows[0].keys()), "rows": rows, "row_count": len(rows)}
+
+
+def test_boxplot_quartiles_and_outliers():
+    rows = [{"region": "East", "amount": v} for v in (1, 2, 3, 4, 5, 100)]
+    rows += [{"region": "West", "amount": v} for v in (10, 20, 30)]
+    option = LocalChartBuilder.build(_result(rows), "boxplot", {"x": "region", "y": "amount"})
+    assert option["xAxis"]["data"] == ["East", "West"]
+    east, west = option["series"][0]["data"]
+    assert east == [1.0, 2.25, 3.5, 4.75, 5.0]
+    assert west == [10.0, 15.0, 20.0, 25.0, 30.0]
+    assert option["series"][1]["data"] == [[0, 100.0]]
+
+
+def test_boxplot_needs_raw_values():
+    rows = [{"region": "East", "amount": 1}, {"region": "West", "amount": 2}]
+    assert LocalChartBuilder.build(_result(rows), "boxplot", {}) is None
+
+
+def test_heatmap_pivots_long_table():
+    rows = [
+        {"weekday": "Mon", "hour_slot": "AM", "orders": 3},
+        {"weekday": "Mon", "hour_slot": "PM", "orders": 5},
+        {"weekday": "Tue", "hour_slot": "AM", "orders": Decimal("7")},
+        {"weekday": "Mon", "hour_slot": "AM", "orders": 1},
+    ]
+    option = LocalChartBuilder.build(_result(rows), "heatmap", {"x": "weekday", "y": "orders"})
+    assert option["xAxis"]["data"] == ["Mon", "Tue"]
+    assert option["yAxis"]["data"] == ["AM", "PM"]
+    assert sorted(option["series"][0]["data"]) == [[0, 0, 4], [0, 1, 5], [1, 0, 7.0]]
+    assert option["visualMap"]["min"] == 4 and option["visualMap"]["max"] == 7.0
+
+
+def test_sankey_aggregates_links_and_breaks_cycles():
+    rows = [
+        {"src": "A", "dst": "B", "cnt": 2},
+        {"src": "A", "dst": "B", "cnt": 3},
+        {"src": "B", "dst": "A", "cnt": 1},
+    ]
+    option = LocalChartBuilder.build(_result(rows), "sankey", {})
+    links = {(l["source"], l["target"]): l["value"] for l in option["series"][0]["links"]}
+    assert links == {("A", "B (dst)"): 5, ("B", "A (dst)"): 1}
+
+    rows = [{"channel": "Ads", "product": "P1", "users": 4}, {"channel": "SEO", "product": "P1", "users": 6}]
+    option = LocalChartBuilder.build(_result(rows), "sankey", {})
+    assert [n["name"] for n in option["series"][0]["data"]] == ["Ads", "P1", "SEO"]
+
+
+def test_candlestick_and_waterfall():
+    rows = [
+        {"trade_date": date(2024, 1, d), "open_price": 10 + d, "close_price": 11 + d, "low_price": 9 + d, "high_price": 12 + d}
+        for d in (1, 2)
+    ]
+    option = LocalChartBuilder.build(_result(rows), "candlestick", {})
+    assert option["xAxis"]["data"] == ["2024-01-01", "2024-01-02"]
+    assert option["series"][0]["data"][0] == [11, 12, 10, 13]
+
+    rows = [{"item": "Revenue", "delta": 100}, {"item": "Cost", "delta": -30}, {"item": "Total", "delta": 70}]
+    option = LocalChartBuilder.build(_result(rows), "waterfall", {})
+    base, inc, dec, total = (s["data"] for s in option["series"])
+    assert base == [0, 70, 0] and inc == [100, "-", "-"] and dec == ["-", 30, "-"] and total == ["-", "-", 70]
+
+
+def test_columnar_result_and_inference_fallback():
+    result = ColumnarResult.from_rows([{"month": 1, "sales": 10.5}, {"month": 2, "sales": 12.0}])
+    option = LocalChartBuilder.build(result, "area", {})
+    assert option["xAxis"]["data"] == ["1", "2"]
+    assert option["series"][0]["data"] == [10.5, 12.0]
+    # 没有可用的数值列时返回 None (由调用方回退 LLM)
+    assert LocalChartBuilder.build(_result([{"name": "a"}, {"name": "b"}]), "funnel", {}) is None
+
+
+if __name__ == "__main__":
+    test_boxplot_quartiles_and_outliers()
+    test_boxplot_needs_raw_values()
+    test_heatmap_pivots_long_table()
+    test_sankey_aggregates_links_and_breaks_cycles()
+    test_candlestick_and_waterfall()
+    test_columnar_result_and_inference_fallback()
+    print("✅ 本地图表构建测试通过")
@@ -0,0 +1,106 @@
+"""
+测试图表降采样 (LTTB / 网格抽稀 / top-N / 热力图分箱)
+"""
+import asyncio
+import math
+import sys
+from datetime import date, timedelta
+from pathlib import Path
+
+import numpy as np
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import services.chart_downsampling as ds
+from services.chart_downsampling import ChartDownsampler, lttb_indices
+from services.columnar_result import ColumnarResult
+
+
+def _result(rows):
+    return {"columns": list(rows[0].keys()), "rows": rows, "row_count": len(rows)}
+
+
+def test_lttb_keeps_endpoints_and_peaks():
+    xs = np.arange(10000, dtype=np.float64)
+    ys = np.sin(xs / 500)
+    ys[4321] = 50  # 尖峰必须保留
+    idx = lttb_indices(xs, ys, 200)
+    assert len(idx) == 200 and idx[0] == 0 and idx[-1] == 9999
+    assert 4321 in idx.tolist()
+    assert list(idx) == sorted(idx)
+
+
+def test_line_downsampled_with_meta():
+    start = date(2020, 1, 1)
+    rows = [{"day": start + timedelta(days=i), "sales": math.sin(i / 30) * 100} for i in range(5000)]
+    reduced, meta = ChartDownsampler.downsample(ColumnarResult.from_rows(rows), "line", {"x": "day", "y": "sales"})
+    assert meta == {"original_row_count": 5000, "point_count": ds.CHART_MAX_POINTS, "method": "lttb"}
+    assert reduced["rows"][0]["day"] == start and reduced["rows"][-1]["day"] == start + timedelta(days=4999)
+
+    small = _result(rows[:100])
+    assert ChartDownsampler.downsample(small, "line", {}) == (small, None)
+
+
+def test_line_lttb_per_series():
+    from services.chart_builders import LocalChartBuilder
+    start = date(2020, 1, 1)
+    regions = ["华东", "华北", "华南"]
+    rows = [{"day": start + timedelta(days=i), "region": r, "sales": math.sin(i / 30 + k) * 100 + k}
+            for i in range(3000) for k, r in enumerate(regions)]
+    rows[3 * 1234 + 2]["sales"] = 5000  # 华南的尖峰
+    viz = {"x": "day", "y": "sales", "series": "region"}
+    reduced, meta = ChartDownsampler.downsample(_result(rows), "area", viz)
+    assert meta["method"] == "lttb" and meta["point_count"] <= ds.CHART_MAX_POINTS
+    assert {r["region"] for r in reduced["rows"]} == set(regions)
+    assert any(r["sales"] == 5000 for r in reduced["rows"])
+
+    option = LocalChartBuilder.build(reduced, "area", viz)
+    assert [s["name"] for s in option["series"]] == regions
+    assert all(v is not None for s in option["series"] for v in s["data"])
+
+
+def test_scatter_grid_thinning_keeps_outlier():
+    rng = np.random.default_rng(0)
+    rows = [{"x": float(a), "y": float(b)} for a, b in rng.normal(size=(20000, 2))]
+    rows.append({"x": 100.0, "y": 100.0})
+    reduced, meta = ChartDownsampler.downsample(_result(rows), "scatter", {})
+    assert meta["method"] == "grid" and meta["point_count"] <= ds.CHART_MAX_POINTS
+    assert {"x": 100.0, "y": 100.0} in reduced["rows"]
+
+
+def test_bar_top_n_with_other_bucket():
+    rows = [{"city": f"c{i}", "amount": i} for i in range(100)]
+    reduced, meta = ChartDownsampler.downsample(_result(rows), "bar", {"x": "city", "y": "amount"})
+    n = ds.CHART_MAX_CATEGORIES
+    assert meta["method"] == "top_n" and reduced["row_count"] == n
+    assert reduced["rows"][0] == {"city": "c99", "amount": 99}
+    assert reduced["rows"][-1]["city"].startswith(ds.OTHER_LABEL)
+    assert sum(r["amount"] for r in reduced["rows"]) == sum(range(100))
+
+
+def test_heatmap_binning_preserves_total():
+    rows = [{"product": f"p{i}", "region": f"r{j}", "qty": 1} for i in range(200) for j in range(5)]
+    reduced, meta = ChartDownsampler.downsample(_result(rows), "heatmap", {"x": "product", "y": "qty"})
+    assert meta["method"] == "binning"
+    assert len({r["product"] for r in reduced["rows"]}) == ds.CHART_HEATMAP_MAX_BINS
+    assert sum(r["qty"] for r in reduced["rows"]) == 1000
+
+
+def test_chart_config_records_meta():
+    from agents.sql_agent import SQLAgent
+    rows = [{"t": i, "v": i % 7} for i in range(6000)]
+    config = asyncio.run(SQLAgent().generate_chart_config(_result(rows), "line", {"x": "t", "y": "v"}))
+    assert len(config["series"][0]["data"]) == ds.CHART_MAX_POINTS
+    assert config["_meta"]["original_row_count"] == 6000
+
+
+if __name__ == "__main__":
+    test_lttb_keeps_endpoints_and_peaks()
+    test_line_downsampled_with_meta()
+    test_line_lttb_per_series()
+    test_scatter_grid_thinning_keeps_outlier()
+    test_bar_top_n_with_other_bucket()
+    test_heatmap_binning_preserves_total()
+    test_chart_config_records_meta()
+    print("✅ 图表降采样测试通过")
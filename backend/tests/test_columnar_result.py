@@ -0,0 +1,101 @@
+"""
+测试列式查询结果 (ColumnarResult)
+"""
+import sys
+from decimal import Decimal
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from services.columnar_result import ColumnarResult, ColumnarResultBuilder
+from utils.json_utils import json_dumps
+
+
+def _build():
+    builder = ColumnarResultBuilder(["city", "orders", "amount"])
+    builder.append_rows([("北京", 10, Decimal("12.5")), ("上海", 7, None)])
+    builder.append_rows([("深圳", 3, Decimal("4"))])
+    return builder.build()
+
+
+def test_typed_columns():
+    result = _build()
+    assert result.row_count == 3
+    assert result.column_array("orders").dtype.kind == "i"
+    assert result.column_array("amount").dtype.kind == "f"
+    assert result.is_numeric("amount") and not result.is_numeric("city")
+    assert result.column("amount") == [12.5, None, 4.0]
+
+
+def test_dict_compatibility():
+    result = _build()
+    result["truncated"] = True
+    assert result["columns"] == ["city", "orders", "amount"]
+    assert result.get("row_count") == 3
+    assert result["rows"][1] == {"city": "上海", "orders": 7, "amount": None}
+    assert result.head(1) == [{"city": "北京", "orders": 10, "amount": 12.5}]
+    assert result.get("truncated") is True and result.get("missing") is None
+
+
+def test_compact_serialization():
+    payload = _build().to_compact()
+    assert payload["format"] == "columnar"
+    assert payload["data"][1] == ["上海", 7, None]
+    # CustomJSONEncoder 通过 to_dict 输出紧凑格式
+    assert '"data": [["北京", 10, 12.5]' in json_dumps(_build())
+
+
+def test_dataframe_without_records():
+    df = _build().to_dataframe()
+    assert list(df.columns) == ["city", "orders", "amount"]
+    assert df["orders"].sum() == 20
+
+
+def test_from_rows():
+    result = ColumnarResult.from_rows([{"a": 1, "b": "x"}, {"a": 2, "b": "y"}])
+    assert result.columns == ["a", "b"] and result.column("a") == [1, 2]
+
+
+def test_int_column_with_nulls_stays_int():
+    result = ColumnarResult.from_rows([{"id": 2**53 + 1}, {"id": None}])
+    assert result.column_array("id").dtype.kind == "i"
+    assert result.column("id") == [2**53 + 1, None]
+    assert result.to_compact()["data"] == [[2**53 + 1], [None]]
+    assert str(result.to_dataframe()["id"].dtype) == "Int64"
+
+
+def test_int_column_beyond_int64():
+    big = 2**64 - 1
+    result = ColumnarResult.from_rows([{"id": big}, {"id": None}])
+    assert result.column_array("id").dtype.kind == "u"
+    assert result.column("id") == [big, None]
+    assert str(result.to_dataframe()["id"].dtype) == "UInt64"
+
+    # 放不进 int64 / uint64 的整数保留为 object，不退化为 float
+    for values in ([-1, 2**63], [2**70, None]):
+        result = ColumnarResult.from_rows([{"id": v} for v in values])
+        assert result.column_array("id").dtype.kind == "O"
+        assert result.column("id") == values
+
+
+def test_format_uses_row_count_without_rows():
+    from services.sql_executor import SQLExecutor
+    builder = ColumnarResultBuilder(["a"])
+    builder.append_rows((i,) for i in range(100))
+    result = builder.build()
+    text = SQLExecutor.format_sql_result(result, max_rows=2)
+    assert "还有 98 行数据" in text
+    assert result._rows_cache is None
+
+
+if __name__ == "__main__":
+    test_typed_columns()
+    test_dict_compatibility()
+    test_compact_serialization()
+    test_dataframe_without_records()
+    test_from_rows()
+    test_int_column_with_nulls_stays_int()
+    test_int_column_beyond_int64()
+    test_format_uses_row_count_without_rows()
+    print("✅ ColumnarResult 测试全部通过")
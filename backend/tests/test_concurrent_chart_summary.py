@@ -0,0 +1,70 @@
+"""
+测试图表配置与摘要并发生成 (事件按到达顺序合并)
+"""
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from agents.sql_agent import SQLAgent
+
+
+async def _slow_chart():
+    await asyncio.sleep(0.2)
+    yield {"type": "chart", "config": {"chart_type": "heatmap"}}
+
+
+async def _summary(tokens=3, fail=False):
+    for i in range(tokens):
+        await asyncio.sleep(0.01)
+        yield {"type": "content", "content": f"t{i}"}
+    if fail:
+        raise RuntimeError("summary failed")
+    yield {"type": "done", "result": ""}
+
+
+async def _collect(*streams):
+    events = []
+    started = time.perf_counter()
+    first_token_at = None
+    async for event in SQLAgent._merge_streams(*streams):
+        if event["type"] == "content" and first_token_at is None:
+            first_token_at = time.perf_counter() - started
+        events.append(event["type"])
+    return events, first_token_at
+
+
+def test_summary_streams_while_chart_pending():
+    events, first_token_at = asyncio.run(_collect(_slow_chart(), _summary()))
+    assert events == ["content", "content", "content", "done", "chart"]
+    assert first_token_at < 0.1
+
+
+def test_source_error_propagates_and_cancels_others():
+    cancelled = []
+
+    async def endless_chart():
+        try:
+            await asyncio.sleep(10)
+            yield {"type": "chart", "config": {}}
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def run():
+        try:
+            await _collect(endless_chart(), _summary(fail=True))
+        except RuntimeError as e:
+            return str(e)
+
+    assert asyncio.run(run()) == "summary failed"
+    assert cancelled == [True]
+
+
+if __name__ == "__main__":
+    test_summary_streams_while_chart_pending()
+    test_source_error_propagates_and_cancels_others()
+    print("✅ 图表/摘要并发测试通过")
@@ -0,0 +1,154 @@
+"""
+测试数据库连接池：按库配置的连接池参数、新建连接时的会话级超时、获取连接的等待统计与预热
+基于 SQLite (aiosqlite) 的真实引擎
+"""
+import asyncio
+import sys
+import tempfile
+from pathlib import Path
+from typing import List, Optional
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from sqlalchemy import text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+from databases.base_adapter import BaseDatabaseAdapter
+from databases.mysql_adapter import MySQLAdapter
+from databases.postgresql_adapter import PostgreSQLAdapter
+
+
+class _SQLiteAdapter(BaseDatabaseAdapter):
+    """会话级超时用 busy_timeout 模拟，服务端连接 ID 固定为 42"""
+
+    def get_connection_string(self) -> str:
+        return f"sqlite+aiosqlite:///{self.config['path']}"
+
+    def get_session_init_statements(self) -> List[str]:
+        if self.statement_timeout_ms > 0:
+            return [f"PRAGMA busy_timeout = {self.statement_timeout_ms}"]
+        return []
+
+    def get_backend_id_sql(self) -> Optional[str]:
+        return "SELECT 42"
+
+
+def _run(check, **config):
+    async def run():
+        with tempfile.TemporaryDirectory() as tmp:
+            adapter = _SQLiteAdapter({"path": str(Path(tmp) / "t.db"), **config})
+            assert await adapter.connect()
+            try:
+                await check(adapter)
+            finally:
+                await adapter.disconnect()
+
+    asyncio.run(run())
+
+
+def test_pool_parameters_from_database_config():
+    async def check(adapter):
+        pool = adapter.engine.pool
+        assert pool.size() == 2 and pool._max_overflow == 1 and pool._timeout == 7
+        assert pool._recycle == 60
+        stats = adapter.get_pool_stats()
+        assert stats["pool_size"] == 2 and stats["max_overflow"] == 1 and stats["pool_timeout"] == 7
+        assert stats["statement_timeout_ms"] == 1500
+
+    _run(check, pool_size=2, max_overflow=1, pool_timeout=7, pool_recycle=60, statement_timeout_ms=1500)
+
+
+def test_on_connect_applies_session_statements():
+    async def check(adapter):
+        async with adapter._acquire() as conn:
+            assert (await conn.execute(text("PRAGMA busy_timeout"))).scalar() == 1500
+            assert await adapter._get_backend_id(conn) == 42
+        assert adapter.get_pool_stats()["connections_created"] >= 1
+
+    _run(check, statement_timeout_ms=1500)
+
+
+def test_adapter_session_timeouts():
+    mysql = MySQLAdapter({"statement_timeout_ms": 2000})
+    assert mysql.get_session_init_statements() == ["SET SESSION MAX_EXECUTION_TIME = 2000"]
+    assert MySQLAdapter({"statement_timeout_ms": 0}).get_session_init_statements() == []
+
+    pg = PostgreSQLAdapter({"statement_timeout_ms": 2000})
+    assert pg.get_connect_args() == {"server_settings": {"statement_timeout": "2000"}}
+    assert PostgreSQLAdapter({"statement_timeout_ms": 0}).get_connect_args() == {}
+
+
+def test_pool_stats_wait_accounting():
+    async def check(adapter):
+        for _ in range(3):
+            async with adapter._acquire():
+                pass
+        stats = adapter.get_pool_stats()
+        assert stats["acquire_count"] == 3 and stats["pool_timeouts"] == 0
+        assert "wait_p95_ms" in stats
+
+        # 唯一的连接被占用 0.2 秒，另一个请求需要排队等待
+        holding = asyncio.Event()
+
+        async def hold():
+            async with adapter._acquire():
+                holding.set()
+                assert adapter.get_pool_stats()["checked_out"] == 1
+                await asyncio.sleep(0.2)
+
+        async def wait():
+            await holding.wait()
+            async with adapter._acquire():
+                pass
+
+        await asyncio.gather(hold(), wait())
+        stats = adapter.get_pool_stats()
+        assert stats["acquire_count"] == 5
+        assert stats["wait_max_ms"] >= 150
+        assert stats["wait_avg_ms"] <= stats["wait_max_ms"]
+        assert stats["checked_out"] == 0 and stats["idle"] == 1
+
+    _run(check, pool_size=1, max_overflow=0)
+
+
+def test_pool_timeout_counted():
+    async def check(adapter):
+        async with adapter._acquire():
+            try:
+                async with adapter._acquire():
+                    raise AssertionError("连接池已满时应当超时")
+            except PoolTimeoutError:
+                pass
+        stats = adapter.get_pool_stats()
+        assert stats["pool_timeouts"] == 1 and stats["acquire_count"] == 1
+
+    _run(check, pool_size=1, max_overflow=0, pool_timeout=1)
+
+
+def test_warmup_fills_pool():
+    async def check(adapter):
+        created = adapter.get_pool_stats()["connections_created"]
+        # 预热数量不超过 pool_size
+        assert await adapter.warmup() == 3
+        stats = adapter.get_pool_stats()
+        assert stats["idle"] == 3 and stats["checked_out"] == 0
+        assert stats["connections_created"] == created + 2
+
+    _run(check, pool_size=3, warmup_connections=5)
+
+
+def test_warmup_without_engine():
+    adapter = _SQLiteAdapter({"path": ":memory:", "warmup_connections": 2})
+    assert asyncio.run(adapter.warmup()) == 0
+
+
+if __name__ == "__main__":
+    test_pool_parameters_from_database_config()
+    test_on_connect_applies_session_statements()
+    test_adapter_session_timeouts()
+    test_pool_stats_wait_accounting()
+    test_pool_timeout_counted()
+    test_warmup_fills_pool()
+    test_warmup_without_engine()
+    print("✅ 数据库连接池测试通过")
@@ -0,0 +1,68 @@
+"""
+本地意图分类器测试：规则命中、线性模型预测与模型持久化
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from services.intent_classifier import IntentClassifier
+
+
+def _classifier(tmp_dir: Path) -> IntentClassifier:
+    classifier = IntentClassifier(model_path=tmp_dir / "intent_model.json")
+    classifier.ensure_loaded()
+    return classifier
+
+
+def test_rules_short_confirmation_and_greeting():
+    assert IntentClassifier.match_rules("好的，执行吧！") == "confirmation"
+    assert IntentClassifier.match_rules("OK, go ahead") == "confirmation"
+    assert IntentClassifier.match_rules("你好") == "chat"
+    assert IntentClassifier.match_rules("Thanks!") == "chat"
+    assert IntentClassifier.match_rules("好的，再按城市统计一下销售额") is None
+
+
+def test_confirmation_needs_pending_plan(tmp_path):
+    classifier = IntentClassifier(model_path=tmp_path / "intent.json")
+    assert classifier.predict("可以", after_plan=True) == ("confirmation", 1.0)
+    # 没有待确认的方案时不信任确认类短回复，交给 LLM 判断
+    for reply in ("对", "do it", "go", "好的，执行吧"):
+        assert classifier.predict(reply)[1] < 0.5, reply
+
+
+def test_model_predicts_data_questions(tmp_path):
+    classifier = _classifier(tmp_path)
+    label, confidence = classifier.predict("按产品类别统计利润")
+    assert label == "sql_query" and confidence >= 0.8
+    label, _ = classifier.predict("你能帮我做什么")
+    assert label == "chat"
+
+
+def test_table_name_boosts_confidence(tmp_path):
+    classifier = _classifier(tmp_path)
+    label, confidence = classifier.predict("orders 表里每天的数量", tables=["orders", "users"])
+    assert label == "sql_query" and confidence >= 0.9
+
+
+def test_model_persisted_and_reloaded(tmp_path):
+    classifier = _classifier(tmp_path)
+    assert (tmp_path / "intent_model.json").exists()
+    classifier.train([("客单价的季度波动", "sql_query")] * 3)
+    classifier.save()
+
+    reloaded = IntentClassifier(model_path=tmp_path / "intent_model.json")
+    assert reloaded.load()
+    question = "各门店客单价的季度波动"
+    assert reloaded.predict(question)[0] == classifier.predict(question)[0]
+    assert abs(reloaded.predict(question)[1] - classifier.predict(question)[1]) < 1e-3
+
+
+if __name__ == "__main__":
+    import tempfile
+    test_rules_short_confirmation_and_greeting()
+    for test in (test_confirmation_needs_pending_plan, test_model_predicts_data_questions, test_table_name_boosts_confidence,
+                 test_model_persisted_and_reloaded):
+        with tempfile.TemporaryDirectory() as d:
+            test(Path(d))
+    print("✅ 意图分类器测试通过")
@@ -0,0 +1,85 @@
+"""
+测试用户自定义 API Key 的 LLM 客户端缓存 (LRU + 空闲 TTL + 淘汰后关闭)
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from config import ModelProvider
+from services.llm_factory import ClientCache, LLMFactory
+from services.user_context import set_user_api_keys
+
+
+class FakeClient:
+    def __init__(self):
+        self.closed = False
+
+    async def close(self):
+        self.closed = True
+
+
+def test_lru_eviction_closes_client():
+    async def run():
+        cache = ClientCache(max_entries=2, ttl=60, close_delay=0)
+        clients = [FakeClient() for _ in range(3)]
+        for i, client in enumerate(clients):
+            cache.put(("k", i), client)
+            cache.get(("k", 0))  # 0 最近使用，不应被淘汰
+        await asyncio.sleep(0.01)
+        assert cache.get(("k", 0)) is clients[0]
+        assert cache.get(("k", 1)) is None and clients[1].closed
+        assert not clients[2].closed
+        await cache.aclose()
+        assert clients[0].closed and clients[2].closed
+    asyncio.run(run())
+
+
+def test_idle_ttl_expires():
+    async def run():
+        cache = ClientCache(max_entries=10, ttl=0, close_delay=0)
+        client = FakeClient()
+        cache.put(("k",), client)
+        await asyncio.sleep(0.01)
+        assert cache.get(("k",)) is None
+        await asyncio.sleep(0.01)
+        assert client.closed and cache.evictions == 1
+    asyncio.run(run())
+
+
+def test_key_is_hashed():
+    key = ClientCache.make_key("openai", "deepseek", "sk-secret", "https://api.example.com")
+    assert "sk-secret" not in repr(key)
+    assert key == ClientCache.make_key("openai", "deepseek", "sk-secret", "https://api.example.com")
+    assert key != ClientCache.make_key("openai", "deepseek", "sk-other", "https://api.example.com")
+
+
+def test_factory_reuses_user_clients():
+    original = LLMFactory._user_clients
+
+    async def run():
+        LLMFactory._user_clients = ClientCache(max_entries=4, ttl=60, close_delay=0)
+        set_user_api_keys({"deepseek_api_key": "sk-user-a"})
+        first = LLMFactory.get_openai_client(ModelProvider.DEEPSEEK)
+        assert LLMFactory.get_openai_client(ModelProvider.DEEPSEEK) is first
+        lc = LLMFactory.get_langchain_model(ModelProvider.DEEPSEEK, model_name="deepseek-chat", temperature=0.1)
+        assert LLMFactory.get_langchain_model(ModelProvider.DEEPSEEK, model_name="deepseek-chat", temperature=0.1) is lc
+        assert LLMFactory.get_langchain_model(ModelProvider.DEEPSEEK, model_name="deepseek-chat", temperature=0.7) is not lc
+        set_user_api_keys({"deepseek_api_key": "sk-user-b"})
+        assert LLMFactory.get_openai_client(ModelProvider.DEEPSEEK) is not first
+        await LLMFactory._user_clients.aclose()
+        set_user_api_keys({})
+    try:
+        asyncio.run(run())
+    finally:
+        LLMFactory._user_clients = original
+
+
+if __name__ == "__main__":
+    test_lru_eviction_closes_client()
+    test_idle_ttl_expires()
+    test_key_is_hashed()
+    test_factory_reuses_user_clients()
+    print("✅ LLM 客户端缓存测试通过")
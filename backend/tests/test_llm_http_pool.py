@@ -0,0 +1,88 @@
+"""
+测试 LLM 共享 HTTP 连接池：按主机共享、keep-alive 复用与建连统计
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from config import ModelProvider
+from services.llm_factory import LLMFactory, _close_client
+from services.llm_http_pool import LLMHttpPool, llm_http_pool
+from services.metrics_service import MetricsService
+from services.user_context import set_user_api_keys
+
+
+async def _serve_ok(reader, writer):
+    """最小的 HTTP/1.1 keep-alive 服务端"""
+    try:
+        while True:
+            request = await reader.readuntil(b"\r\n\r\n")
+            if not request:
+                break
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\nContent-Type: text/plain\r\n\r\nok")
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionResetError):
+        pass
+    finally:
+        writer.close()
+
+
+def test_shared_per_host():
+    pool = LLMHttpPool(http2=False)
+    a = pool.get_client("https://api.deepseek.com/v1")
+    assert pool.get_client("https://API.deepseek.com") is a
+    assert pool.get_client("https://api.openai.com/v1") is not a
+    assert pool.is_shared(a) and not pool.is_shared(object())
+    asyncio.run(pool.aclose())
+
+
+def test_connections_reused():
+    async def run():
+        server = await asyncio.start_server(_serve_ok, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        pool = LLMHttpPool(http2=False, max_keepalive=4)
+        client = pool.get_client(f"http://127.0.0.1:{port}/v1")
+        for _ in range(5):
+            response = await client.get(f"http://127.0.0.1:{port}/v1/models")
+            assert response.text == "ok"
+        stats = pool.stats()[f"http://127.0.0.1:{port}"]
+        metrics = MetricsService()
+        pool.register_metrics(metrics)
+        text = metrics.render()
+        await pool.aclose()
+        server.close()
+        await server.wait_closed()
+        return port, stats, text
+    port, stats, text = asyncio.run(run())
+    assert stats["requests"] == 5
+    assert stats["connections"] == 1
+    assert stats["avg_connect_ms"] >= 0
+    # 建连统计导出到 Prometheus 指标
+    host = f'host="http://127.0.0.1:{port}"'
+    assert f"llm_http_requests_total{{{host}}} 5\n" in text
+    assert f"llm_http_connections_total{{{host}}} 1\n" in text
+    assert f"llm_http_connect_seconds_total{{{host}}} " in text and "# TYPE llm_http_tls_seconds_total counter" in text
+
+
+def test_factory_clients_use_shared_pool():
+    set_user_api_keys({"deepseek_api_key": "sk-test"})
+    try:
+        client = LLMFactory.get_openai_client(ModelProvider.DEEPSEEK)
+        model = LLMFactory.get_langchain_model(ModelProvider.DEEPSEEK, model_name="deepseek-chat")
+    finally:
+        set_user_api_keys({})
+    assert llm_http_pool.is_shared(client._client)
+    assert model.root_async_client._client is client._client
+    # 关闭单个客户端不影响共享连接池
+    asyncio.run(_close_client(client))
+    assert not client._client.is_closed
+
+
+if __name__ == "__main__":
+    test_shared_per_host()
+    test_connections_reused()
+    test_factory_clients_use_shared_pool()
+    print("✅ LLM 共享连接池测试通过")
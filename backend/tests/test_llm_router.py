@@ -0,0 +1,286 @@
+"""
+测试 LLM 多供应商路由：熔断、非流式对冲、流式首 token 前故障转移
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from services.llm_factory import LLMScheduler
+from services.llm_router import LLMRouter
+
+
+def _router(**kwargs) -> LLMRouter:
+    options = dict(
+        enabled=True,
+        providers=["deepseek", "openai", "claude"],
+        failure_threshold=2,
+        cooldown=60,
+        hedge_delay_min=0.01,
+        hedge_delay_max=0.05,
+        first_token_timeout=0.1,
+        has_credentials=lambda p: True,
+        default_model=lambda p, r: f"{p}-default",
+    )
+    options.update(kwargs)
+    return LLMRouter(**options)
+
+
+def test_circuit_opens_after_repeated_failures():
+    router = _router()
+    assert router.candidates("deepseek", "deepseek-chat")[0] == ("deepseek", "deepseek-chat")
+    for _ in range(2):
+        router.record_failure("deepseek", "deepseek-chat", RuntimeError("503"))
+    assert not router.available("deepseek")
+    routes = router.candidates("deepseek", "deepseek-chat")
+    assert routes[0] == ("openai", "openai-default") and ("deepseek", "deepseek-chat") not in routes
+    assert router.snapshot()["circuits"]["deepseek"]["state"] == "open"
+
+    router.cooldown = 0  # 冷却结束 -> half-open，放行试探请求
+    assert router.available("deepseek")
+    router.record_success("deepseek", "deepseek-chat", 0.2)
+    assert router.snapshot()["circuits"]["deepseek"]["state"] == "closed"
+
+
+def test_half_open_allows_single_probe():
+    router = _router()
+    for _ in range(2):
+        router.record_failure("deepseek", "deepseek-chat", RuntimeError("503"))
+    router.cooldown = 0
+    calls = []
+
+    async def fn(provider, model):
+        calls.append(provider)
+        await asyncio.sleep(0.02)
+        return provider
+
+    async def run():
+        return await asyncio.gather(*(router.call(fn, "deepseek", "deepseek-chat") for _ in range(3)))
+
+    results = asyncio.run(run())
+    # 只有一个请求作为试探发往 deepseek，其余直接切换
+    assert calls.count("deepseek") == 1
+    assert sorted(r[1] for r in results) == ["deepseek", "openai", "openai"]
+    assert router.snapshot()["circuits"]["deepseek"]["state"] == "closed"
+    assert not router._circuits["deepseek"].probing
+
+
+def test_hedges_slow_primary():
+    router = _router()
+    calls = []
+
+    async def fn(provider, model):
+        calls.append(provider)
+        await asyncio.sleep(1.0 if provider == "deepseek" else 0.01)
+        return f"from {provider}"
+
+    result, provider, _ = asyncio.run(router.call(fn, "deepseek", "deepseek-chat"))
+    assert result == "from openai" and provider == "openai"
+    assert calls == ["deepseek", "openai"]
+
+
+def test_failed_call_moves_to_next_provider():
+    router = _router()
+
+    async def fn(provider, model):
+        if provider != "claude":
+            raise ConnectionError(f"{provider} down")
+        return "ok"
+
+    result, provider, model = asyncio.run(router.call(fn, "deepseek", "deepseek-chat"))
+    assert (result, provider, model) == ("ok", "claude", "claude-default")
+    assert router.snapshot()["models"]["deepseek/deepseek-chat"]["error_rate"] == 1.0
+
+
+class _StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+def test_non_retryable_error_is_raised_without_failover():
+    router = _router()
+    calls = []
+
+    async def fn(provider, model):
+        calls.append(provider)
+        raise _StatusError(400)
+
+    for _ in range(3):
+        try:
+            asyncio.run(router.call(fn, "deepseek", "deepseek-chat"))
+        except _StatusError:
+            pass
+    assert calls == ["deepseek"] * 3
+    assert router.snapshot()["circuits"]["deepseek"] == {"state": "closed", "failures": 0}
+
+    async def open_stream(provider, model):
+        calls.append(provider)
+        raise _StatusError(401)
+        yield
+
+    async def run():
+        return [d async for d in router.stream(open_stream, "deepseek", "deepseek-chat")]
+
+    calls.clear()
+    try:
+        asyncio.run(run())
+    except _StatusError:
+        pass
+    assert calls == ["deepseek"]
+
+
+def test_rate_limit_and_server_errors_fail_over():
+    router = _router()
+
+    async def fn(provider, model):
+        if provider == "deepseek":
+            raise _StatusError(429)
+        if provider == "openai":
+            raise _StatusError(503)
+        return "ok"
+
+    assert asyncio.run(router.call(fn, "deepseek", "deepseek-chat"))[1] == "claude"
+
+
+def test_user_key_has_own_circuit_and_no_failover():
+    keys = {}
+    router = _router(user_key=lambda p: keys.get(p))
+    keys["deepseek"] = "sk-user"
+    assert router.candidates("deepseek", "deepseek-chat") == [("deepseek", "deepseek-chat")]
+    for _ in range(2):
+        router.record_failure("deepseek", "deepseek-chat", ConnectionError("reset"))
+    assert not router.available("deepseek")
+    # 服务端 Key 的熔断状态不受该用户影响
+    keys.clear()
+    assert router.available("deepseek")
+    assert router.snapshot()["circuits"]["deepseek"]["failures"] == 0
+
+
+def test_stream_fails_over_before_first_token():
+    router = _router()
+
+    async def open_stream(provider, model):
+        if provider == "deepseek":
+            await asyncio.sleep(1.0)  # 首 token 超时
+        if provider == "openai":
+            raise ConnectionError("reset")
+        for token in ("a", "b"):
+            yield {"reasoning_content": "", "content": f"{provider}:{token}"}
+
+    async def run():
+        return [d["content"] async for d in router.stream(open_stream, "deepseek", "deepseek-chat")]
+
+    assert asyncio.run(run()) == ["claude:a", "claude:b"]
+
+
+def test_stream_error_after_first_token_is_raised():
+    router = _router()
+
+    async def open_stream(provider, model):
+        yield {"reasoning_content": "", "content": "partial"}
+        raise RuntimeError("connection dropped")
+
+    async def run():
+        received = []
+        try:
+            async for delta in router.stream(open_stream, "deepseek", "deepseek-chat"):
+                received.append(delta["content"])
+        except RuntimeError:
+            return received
+        raise AssertionError("应抛出异常")
+
+    assert asyncio.run(run()) == ["partial"]
+
+
+def test_stream_closed_when_consumer_stops_early():
+    router = _router()
+    closed = []
+
+    async def open_stream(provider, model):
+        try:
+            for i in range(100):
+                yield {"reasoning_content": "", "content": str(i)}
+        finally:
+            closed.append(provider)
+
+    async def run():
+        stream = router.stream(open_stream, "deepseek", "deepseek-chat")
+        async for delta in stream:
+            if delta["content"] == "2":
+                break
+        await stream.aclose()
+        # 在事件循环回收未关闭的异步生成器之前就已关闭
+        assert closed == ["deepseek"]
+
+    asyncio.run(run())
+
+
+def _single_slot_scheduler() -> LLMScheduler:
+    return LLMScheduler(provider_limits={}, default_provider_limit=1, model_limit=10, tpm_limits={})
+
+
+def test_scheduler_wait_is_not_provider_latency():
+    router = _router()
+    scheduler = _single_slot_scheduler()
+    slot = lambda p, m: scheduler.slot(p, m)
+
+    async def open_stream(provider, model):
+        await asyncio.sleep(0.05)  # 首 token 0.05s < 超时 0.1s，但排队的请求要等前面的流结束
+        for token in ("a", "b"):
+            yield {"reasoning_content": "", "content": f"{provider}:{token}"}
+
+    async def consume():
+        return [d["content"] async for d in router.stream(open_stream, "deepseek", "deepseek-chat", slot=slot)]
+
+    async def run():
+        return await asyncio.gather(*(consume() for _ in range(4)))
+
+    assert asyncio.run(run()) == [["deepseek:a", "deepseek:b"]] * 4
+    snapshot = router.snapshot()
+    assert snapshot["models"]["deepseek/deepseek-chat"]["error_rate"] == 0.0
+    assert snapshot["models"]["deepseek/deepseek-chat"]["p95_ms"] < 100
+    assert all(c["state"] == "closed" and c["failures"] == 0 for c in snapshot["circuits"].values())
+
+
+def test_queued_call_is_not_hedged():
+    router = _router()
+    scheduler = _single_slot_scheduler()
+    calls = []
+
+    async def fn(provider, model):
+        calls.append(provider)
+        await asyncio.sleep(0.03)  # 低于对冲等待 0.05s
+        return provider
+
+    async def run():
+        return await asyncio.gather(*(
+            router.call(fn, "deepseek", "deepseek-chat", slot=lambda p, m: scheduler.slot(p, m)) for _ in range(4)
+        ))
+
+    results = asyncio.run(run())
+    assert [r[1] for r in results] == ["deepseek"] * 4 and calls == ["deepseek"] * 4
+
+
+def test_disabled_router_uses_primary_only():
+    router = _router(enabled=False)
+    assert router.candidates("gemini", "gemini-1.5-pro") == [("gemini", "gemini-1.5-pro")]
+
+
+if __name__ == "__main__":
+    test_circuit_opens_after_repeated_failures()
+    test_half_open_allows_single_probe()
+    test_hedges_slow_primary()
+    test_failed_call_moves_to_next_provider()
+    test_non_retryable_error_is_raised_without_failover()
+    test_rate_limit_and_server_errors_fail_over()
+    test_user_key_has_own_circuit_and_no_failover()
+    test_stream_fails_over_before_first_token()
+    test_stream_error_after_first_token_is_raised()
+    test_stream_closed_when_consumer_stops_early()
+    test_scheduler_wait_is_not_provider_latency()
+    test_queued_call_is_not_hedged()
+    test_disabled_router_uses_primary_only()
+    print("✅ LLM 路由测试通过")
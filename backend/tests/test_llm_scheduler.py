@@ -0,0 +1,131 @@
+"""
+测试 LLM 调度器：并发上限、交互优先、用户间公平轮转与 TPM 预算
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from services.llm_factory import LLMScheduler, INTERACTIVE, BACKGROUND
+from services.metrics_service import MetricsService
+
+
+def _scheduler(**kwargs) -> LLMScheduler:
+    options = dict(provider_limits={}, default_provider_limit=2, model_limit=10, tpm_limits={}, background_share=0.5)
+    options.update(kwargs)
+    return LLMScheduler(**options)
+
+
+async def _job(scheduler, order, name, priority=INTERACTIVE, user_id=None, tokens=0, hold=0.02, model="m"):
+    async with scheduler.slot("deepseek", model, priority=priority, user_id=user_id, tokens=tokens):
+        order.append(name)
+        await asyncio.sleep(hold)
+
+
+def test_concurrency_cap():
+    async def run():
+        scheduler = _scheduler(default_provider_limit=3)
+        peak = 0
+
+        async def job():
+            nonlocal peak
+            async with scheduler.slot("deepseek", "m"):
+                peak = max(peak, scheduler._active["deepseek"])
+                await asyncio.sleep(0.01)
+        await asyncio.gather(*(job() for _ in range(20)))
+        return peak, scheduler.snapshot()
+    peak, snapshot = asyncio.run(run())
+    assert peak == 3
+    assert snapshot["providers"]["deepseek"]["active"] == 0
+    assert snapshot["wait"]["interactive"]["count"] == 20
+
+
+def test_interactive_before_background():
+    async def run():
+        scheduler = _scheduler(default_provider_limit=2, background_share=1.0)
+        order = []
+        background = [asyncio.create_task(_job(scheduler, order, f"bg{i}", BACKGROUND)) for i in range(6)]
+        await asyncio.sleep(0.005)  # 后台任务已占满并发并排队
+        chat = asyncio.create_task(_job(scheduler, order, "chat", INTERACTIVE))
+        await asyncio.gather(chat, *background)
+        return order
+    order = asyncio.run(run())
+    assert order.index("chat") == 2  # 第一个空出的并发立刻给交互请求
+
+
+def test_background_share_leaves_room_for_chat():
+    async def run():
+        scheduler = _scheduler(default_provider_limit=4, background_share=0.5)
+        order = []
+        background = [asyncio.create_task(_job(scheduler, order, f"bg{i}", BACKGROUND, hold=0.2)) for i in range(6)]
+        await asyncio.sleep(0.01)
+        assert scheduler._active[("deepseek", BACKGROUND)] == 2
+        await _job(scheduler, order, "chat", INTERACTIVE, hold=0)
+        assert "chat" in order and len(order) == 3  # 无需等待后台任务
+        await asyncio.gather(*background)
+    asyncio.run(run())
+
+
+def test_fair_across_users():
+    async def run():
+        scheduler = _scheduler(default_provider_limit=1)
+        order = []
+        tasks = [asyncio.create_task(_job(scheduler, order, f"a{i}", user_id="a", hold=0.005)) for i in range(4)]
+        await asyncio.sleep(0)
+        tasks += [asyncio.create_task(_job(scheduler, order, f"b{i}", user_id="b", hold=0.005)) for i in range(2)]
+        await asyncio.gather(*tasks)
+        return order
+    order = asyncio.run(run())
+    # 用户 b 不必等用户 a 的全部任务完成
+    assert order.index("b0") <= 2 and order.index("b1") <= 4
+
+
+def test_tpm_budget_delays_requests():
+    async def run():
+        scheduler = _scheduler(default_provider_limit=10, tpm_limits={"deepseek": 100})
+        order = []
+        first = asyncio.create_task(_job(scheduler, order, "first", tokens=80, hold=0))
+        second = asyncio.create_task(_job(scheduler, order, "second", tokens=80, hold=0))
+        await asyncio.sleep(0.05)
+        snapshot = scheduler.snapshot()
+        for task in (first, second):
+            task.cancel()
+        await asyncio.gather(first, second, return_exceptions=True)
+        return order, snapshot
+    order, snapshot = asyncio.run(run())
+    assert order == ["first"]
+    assert snapshot["providers"]["deepseek"]["queued"]["interactive"] == 1
+    assert snapshot["providers"]["deepseek"]["tpm_used"] == 80
+
+
+def test_metrics_export_queue_and_wait():
+    async def run():
+        scheduler = _scheduler(default_provider_limit=1)
+        metrics = MetricsService()
+        scheduler.register_metrics(metrics)
+        order = []
+        first = asyncio.create_task(_job(scheduler, order, "first", hold=0.05))
+        second = asyncio.create_task(_job(scheduler, order, "second", hold=0))
+        await asyncio.sleep(0.01)
+        queued = metrics.render()
+        await asyncio.gather(first, second)
+        return queued, metrics.render()
+    queued, done = asyncio.run(run())
+    assert 'llm_scheduler_queued{provider="deepseek",priority="interactive"} 1\n' in queued
+    assert 'llm_scheduler_active{provider="deepseek"} 1\n' in queued
+    assert 'llm_scheduler_queued{provider="deepseek",priority="interactive"} 0\n' in done
+    assert 'llm_scheduler_wait_count_total{priority="interactive"} 2\n' in done
+    max_wait = next(l for l in done.splitlines() if l.startswith('llm_scheduler_wait_seconds_max{priority="interactive"}'))
+    assert float(max_wait.split()[-1]) >= 0.03
+
+
+if __name__ == "__main__":
+    test_concurrency_cap()
+    test_interactive_before_background()
+    test_background_share_leaves_room_for_chat()
+    test_fair_across_users()
+    test_tpm_budget_delays_requests()
+    test_metrics_export_queue_and_wait()
+    print("✅ LLM 调度器测试通过")
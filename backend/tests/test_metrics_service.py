@@ -0,0 +1,110 @@
+"""
+测试分阶段耗时指标：span 聚合、LLM 注解 (token / 首 token / 重试) 与 Prometheus 文本导出
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from config import ModelProvider
+from services.metrics_service import MetricsService, metrics_service
+
+
+def _sample(text: str, prefix: str) -> float:
+    for line in text.splitlines():
+        if line.startswith(prefix):
+            return float(line.rsplit(" ", 1)[1])
+    raise AssertionError(f"未找到指标: {prefix}")
+
+
+def test_span_records_histogram():
+    metrics = MetricsService(buckets=[0.01, 1])
+    for _ in range(3):
+        with metrics.span("sql_execution", db_key="classic_business"):
+            pass
+    text = metrics.render()
+    labels = 'stage="sql_execution",provider="",model="",db_key="classic_business",status="ok"'
+    assert _sample(text, f'chat_stage_duration_seconds_bucket{{{labels},le="0.01"}}') == 3
+    assert _sample(text, f'chat_stage_duration_seconds_bucket{{{labels},le="+Inf"}}') == 3
+    assert _sample(text, f"chat_stage_duration_seconds_count{{{labels}}}") == 3
+
+
+def test_error_status_and_retries():
+    metrics = MetricsService()
+    try:
+        with metrics.span("sql_generation", retries=1, provider="deepseek"):
+            raise ValueError("bad json")
+    except ValueError:
+        pass
+    text = metrics.render()
+    assert 'stage="sql_generation",provider="deepseek",model="",db_key="",status="error"' in text
+    assert _sample(text, 'chat_stage_retries_total{stage="sql_generation",provider="deepseek"') == 1
+
+
+def test_llm_annotations_reach_current_span():
+    metrics = MetricsService()
+
+    async def run():
+        with metrics.span("plan", provider="deepseek") as span:
+            # 对冲请求在独立任务中执行，仍写入同一个 span
+            await asyncio.gather(
+                asyncio.create_task(_llm(metrics, "deepseek", "deepseek-chat")),
+                asyncio.create_task(_llm(metrics, "openai", "gpt-4o")),
+            )
+            return span
+
+    span = asyncio.run(run())
+    assert span.prompt_tokens == 20 and span.completion_tokens == 10
+    assert span.ttft is not None and span.llm_calls == 2
+    text = metrics.render()
+    assert "chat_stage_ttft_seconds_count" in text
+    assert 'kind="completion"} 10' in text
+
+
+async def _llm(metrics, provider, model_name):
+    metrics.llm_call(provider, model_name)
+    metrics.mark_first_token()
+    metrics.add_tokens(10, 5)
+
+
+def test_bound_labels_and_escaping():
+    metrics = MetricsService()
+
+    async def run():
+        metrics.bind(db_key='odd"key', provider="claude")
+        await asyncio.create_task(_persist(metrics))
+
+    asyncio.run(run())
+    assert 'provider="claude",model="",db_key="odd\\"key"' in metrics.render()
+
+
+async def _persist(metrics):
+    with metrics.span("db_persist"):
+        await asyncio.sleep(0)
+
+
+def test_summary_stage_with_mock_provider():
+    from agents.sql_agent import SQLAgent
+    metrics_service.reset()
+
+    async def run():
+        agent = SQLAgent()
+        return [e async for e in agent.generate_summary_stream("city | sales", "bar", provider=ModelProvider.MOCK)]
+
+    events = asyncio.run(run())
+    assert events[-1]["type"] == "done" and events[-1]["result"]
+    text = metrics_service.render()
+    assert 'chat_stage_duration_seconds_count{stage="summary",provider="mock",model="mock-chat"' in text
+    assert 'chat_stage_ttft_seconds_count{stage="summary",provider="mock"' in text
+    assert 'chat_stage_tokens_total{stage="summary",provider="mock",model="mock-chat",db_key="",kind="prompt"}' in text
+
+
+if __name__ == "__main__":
+    test_span_records_histogram()
+    test_error_status_and_retries()
+    test_llm_annotations_reach_current_span()
+    test_bound_labels_and_escaping()
+    test_summary_stage_with_mock_provider()
+    print("✅ 分阶段耗时指标测试通过")
@@ -0,0 +1,85 @@
+"""
+测试 Mock LLM 供应商：录制响应匹配、流式回放、思考内容与工厂接入
+"""
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from config import ModelProvider
+from services.llm_factory import LLMFactory
+from services.mock_llm import MockChatModel, ResponseBook, split_tokens
+
+
+def test_split_tokens_round_trip():
+    text = "各城市 sales 合计：SUM(od.price) 为 182,000 元"
+    tokens = split_tokens(text)
+    assert "".join(tokens) == text
+    assert "各" in tokens and "sales" in tokens
+
+
+def test_rules_match_in_order():
+    rules = [
+        {"name": "confirm", "contains": ["判断其意图", "用户问题：可以"], "response": "a"},
+        {"name": "intent", "contains": ["判断其意图"], "response": "b"},
+    ]
+    assert ResponseBook.match(rules, "请判断其意图\n用户问题：可以")["name"] == "confirm"
+    assert ResponseBook.match(rules, "请判断其意图\n用户问题：销售额")["name"] == "intent"
+    assert ResponseBook.match(rules, "无关提示词")["name"] == "default"
+
+
+def test_stream_replays_recorded_sql():
+    model = MockChatModel(ttft=0.01, tokens_per_second=10000)
+    messages = [SystemMessage(content="将用户问题转换为 SQL 查询"), HumanMessage(content="各城市销售额")]
+
+    async def run():
+        chunks = [chunk async for chunk in model.astream(messages)]
+        full = await model.ainvoke(messages)
+        return chunks, full
+
+    chunks, full = asyncio.run(run())
+    streamed = "".join(chunk.content for chunk in chunks)
+    assert streamed == full.content and "SELECT" in streamed
+    assert full.usage_metadata["output_tokens"] == len(split_tokens(full.content))
+    assert not any(chunk.additional_kwargs.get("reasoning_content") for chunk in chunks)
+
+
+def test_reasoner_streams_reasoning_first():
+    model = MockChatModel(model_name="mock-reasoner", ttft=0.01, tokens_per_second=10000)
+    messages = [HumanMessage(content="将用户问题转换为 SQL 查询")]
+
+    async def run():
+        return [chunk async for chunk in model.astream(messages)]
+
+    chunks = asyncio.run(run())
+    assert chunks[0].additional_kwargs.get("reasoning_content")
+    assert chunks[0].content == ""
+
+
+def test_ttft_and_rate_are_simulated():
+    model = MockChatModel(ttft=0.1, tokens_per_second=10000)
+    started = time.perf_counter()
+    asyncio.run(model.ainvoke([HumanMessage(content="你好")]))
+    assert time.perf_counter() - started >= 0.1
+
+
+def test_factory_builds_mock_model_without_key():
+    assert LLMFactory.has_credentials(ModelProvider.MOCK)
+    model = LLMFactory.get_langchain_model(ModelProvider.MOCK, streaming=True)
+    assert isinstance(model, MockChatModel) and model.streaming
+    assert LLMFactory.get_model_params(ModelProvider.MOCK, is_reasoning=True)["model"] == "mock-reasoner"
+
+
+if __name__ == "__main__":
+    test_split_tokens_round_trip()
+    test_rules_match_in_order()
+    test_stream_replays_recorded_sql()
+    test_reasoner_streams_reasoning_first()
+    test_ttft_and_rate_are_simulated()
+    test_factory_builds_mock_model_without_key()
+    print("✅ Mock LLM 测试通过")
@@ -0,0 +1,109 @@
+"""
+测试按 token 预算组装提示词
+"""
+import asyncio
+import sys
+import threading
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from utils.prompt_builder import PromptBuilder, TokenCounter, fit_history, fit_schema, get_token_budget
+
+# 测试中不下载 tiktoken 编码文件，使用字符估算
+TokenCounter._failed = True
+
+TEMPLATE = "Schema:\n{schema}\n\nHistory:\n{history}\n\nQ: {question}"
+
+
+def _schema(n_tables: int, with_sample: bool = True) -> str:
+    blocks = []
+    for i in range(n_tables):
+        block = f"CREATE TABLE `t{i}` (\n" + ",\n".join(f"  `col_{j}` int" for j in range(20)) + "\n)"
+        if with_sample:
+            block += f"\n\n/*\n样本数据 (t{i}):\n" + "1 | 2 | 3\n" * 10 + "*/"
+        blocks.append(block)
+    return "\n\n".join(blocks)
+
+
+def test_within_budget_is_untouched():
+    builder = PromptBuilder("T", 10000)
+    builder.section("schema", _schema(2), priority=2, strategy="schema")
+    builder.section("history", "用户: 你好\n助手: 你好！", priority=1, strategy="history")
+    prompt = builder.build(TEMPLATE, question="各城市销售额")
+    assert prompt == TEMPLATE.format(schema=_schema(2), history="用户: 你好\n助手: 你好！", question="各城市销售额")
+    assert builder.report["total"] <= 10000
+
+
+def test_lowest_priority_trimmed_first():
+    history = "\n".join(f"用户: 第{i}个问题\n助手: " + "很长的回答" * 100 for i in range(20))
+    builder = PromptBuilder("T", 2000)
+    builder.section("schema", _schema(3), priority=2, strategy="schema")
+    builder.section("history", history, priority=1, strategy="history")
+    builder.build(TEMPLATE, question="q")
+    sections = builder.report["sections"]
+    assert sections["schema"]["tokens"] == sections["schema"]["original"]
+    assert sections["history"]["tokens"] < sections["history"]["original"]
+    assert builder.report["total"] <= 2000
+
+
+def test_history_keeps_most_recent_turns():
+    history = "\n".join(f"用户: 问题{i}\n助手: " + "回答" * 400 for i in range(10))
+    trimmed = fit_history(history, 600)
+    assert TokenCounter.count(trimmed) <= 600
+    assert "问题9" in trimmed and "问题0" not in trimmed
+
+
+def test_schema_drops_samples_then_tables():
+    schema = _schema(10)
+    no_samples = _schema(10, with_sample=False)
+    assert fit_schema(schema, TokenCounter.count(no_samples)) == no_samples
+    trimmed = fit_schema(schema, TokenCounter.count(no_samples) // 2)
+    assert "CREATE TABLE `t0`" in trimmed and "CREATE TABLE `t9`" not in trimmed
+    assert "t9" in trimmed.splitlines()[-1]
+
+
+def test_budget_lookup_by_model_prefix():
+    assert get_token_budget("deepseek-chat") == get_token_budget("deepseek-reasoner")
+    assert get_token_budget("unknown-model") > 0
+
+
+class _FakeEncoding:
+    def encode(self, text, disallowed_special=()):
+        return [0]
+
+
+def test_encoding_loads_off_event_loop():
+    loaded_in = []
+    original_load = TokenCounter.__dict__["load"]
+
+    def fake_load():
+        loaded_in.append(threading.current_thread())
+        TokenCounter._encoding = _FakeEncoding()
+
+    async def run():
+        # 加载完成前使用字符估算，不阻塞事件循环
+        before = TokenCounter.count("各城市销售额")
+        await TokenCounter._loading
+        return before, TokenCounter.count("各城市销售额")
+
+    TokenCounter.load = staticmethod(fake_load)
+    TokenCounter._failed, TokenCounter._encoding, TokenCounter._loading = False, None, None
+    try:
+        before, after = asyncio.run(run())
+    finally:
+        TokenCounter.load = original_load
+        TokenCounter._failed, TokenCounter._encoding, TokenCounter._loading = True, None, None
+    assert before == TokenCounter.estimate("各城市销售额") and after == 1
+    assert loaded_in and loaded_in[0] is not threading.main_thread()
+
+
+if __name__ == "__main__":
+    test_within_budget_is_untouched()
+    test_lowest_priority_trimmed_first()
+    test_history_keeps_most_recent_turns()
+    test_schema_drops_samples_then_tables()
+    test_budget_lookup_by_model_prefix()
+    test_encoding_loads_off_event_loop()
+    print("✅ 提示词预算测试通过")
@@ -0,0 +1,87 @@
+"""
+测试提示词前缀缓存布局：稳定前缀 (规则 + Schema) 与可变后缀 (知识库 / 历史 / 问题) 分离
+"""
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from config import ModelProvider
+from agents.sql_agent import SQLAgent
+from utils.prompt_builder import PromptBuilder, TokenCounter
+from utils.prompt_templates import get_prompt
+
+# 测试中不下载 tiktoken 编码文件，使用字符估算
+TokenCounter._failed = True
+
+SCHEMA = "CREATE TABLE `orders` (\n  `id` int,\n  `city` varchar(32),\n  `amount` decimal(10,2)\n)"
+
+
+def _sql_messages(question: str, history: str, knowledge: str, language: str = "zh"):
+    builder = PromptBuilder("SQL_GENERATION", 24000)
+    builder.section("schema", SCHEMA, priority=3, strategy="schema")
+    builder.section("knowledge_context", knowledge, priority=2, strategy="head")
+    builder.section("history", history, priority=1, strategy="history")
+    prefix, suffix = builder.build_split(
+        get_prompt("SQL_GENERATION_PREFIX", language),
+        get_prompt("SQL_GENERATION_SUFFIX", language),
+        database_name="shop",
+        database_type_info="MySQL",
+        database_version="8.0",
+        question=question
+    )
+    return SQLAgent._prefix_cached_messages("你是一个专业的数据分析助手。", prefix, suffix)
+
+
+def test_prefix_stable_across_questions():
+    first = _sql_messages("各城市销售额", "", "")
+    second = _sql_messages("上个月订单数", "用户: 你好\n助手: 你好！", "销售额 = amount 求和")
+    assert first[0] == second[0]
+    assert first[0]["cache"] is True
+    assert SCHEMA in first[0]["content"]
+    assert "上个月订单数" in second[1]["content"] and "销售额 = amount 求和" in second[1]["content"]
+    for lang in ("zh", "en"):
+        messages = _sql_messages("Q?", "", "", language=lang)
+        assert "Q?" not in messages[0]["content"]
+
+
+def test_full_template_matches_split():
+    fields = {
+        "database_name": "shop", "database_type_info": "MySQL", "database_version": "8.0",
+        "schema": SCHEMA, "knowledge_context": "", "history": "", "question": "Q"
+    }
+    prefix = get_prompt("SQL_GENERATION_PREFIX", "zh").format(**fields)
+    suffix = get_prompt("SQL_GENERATION_SUFFIX", "zh").format(**fields)
+    assert get_prompt("SQL_GENERATION", "zh").format(**fields) == prefix + "\n" + suffix
+
+
+def test_claude_gets_cache_control():
+    messages = SQLAgent._prefix_cached_messages("sys", "prefix", "suffix")
+    claude = SQLAgent._to_lc_messages(messages, ModelProvider.CLAUDE)
+    assert claude[0].content[0]["cache_control"] == {"type": "ephemeral"}
+    assert claude[1].content == "suffix"
+    gemini = SQLAgent._to_lc_messages(messages, ModelProvider.GEMINI)
+    assert gemini[0].content == "sys\n\nprefix"
+    assert all("cache" not in m for m in SQLAgent._to_openai_messages(messages))
+
+
+def test_usage_extraction():
+    deepseek = SimpleNamespace(prompt_tokens=1000, completion_tokens=50, prompt_tokens_details=None,
+                               model_extra={"prompt_cache_hit_tokens": 800})
+    assert SQLAgent._usage_from_openai(deepseek) == {"prompt_tokens": 1000, "cached_tokens": 800, "completion_tokens": 50}
+    openai = SimpleNamespace(prompt_tokens=1000, completion_tokens=50,
+                             prompt_tokens_details=SimpleNamespace(cached_tokens=640))
+    assert SQLAgent._usage_from_openai(openai)["cached_tokens"] == 640
+    claude = {"input_tokens": 900, "output_tokens": 20, "input_token_details": {"cache_read": 700}}
+    assert SQLAgent._usage_from_langchain(claude) == {"prompt_tokens": 900, "cached_tokens": 700, "completion_tokens": 20}
+    assert SQLAgent._usage_from_langchain(None) is None
+
+
+if __name__ == "__main__":
+    test_prefix_stable_across_questions()
+    test_full_template_matches_split()
+    test_claude_gets_cache_control()
+    test_usage_extraction()
+    print("✅ 提示词前缀缓存测试通过")
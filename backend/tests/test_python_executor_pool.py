@@ -0,0 +1,190 @@
+"""
+测试代码执行进程池：结果回传、超时 / 内存 / CPU 超限后杀掉并补充进程、补充失败时的重试与退化、
+工作进程环境变量清理、执行期间事件循环不被阻塞
+"""
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import pandas as pd
+
+from services.python_executor import ExecutorPool
+
+DF = pd.DataFrame({"city": ["Shanghai", "Beijing", "Shanghai"], "sales": [10, 20, 30]})
+
+
+def _run(pool: ExecutorPool, *jobs):
+    async def run():
+        try:
+            return [await pool.run(DF, code) for code in jobs], pool.stats()
+        finally:
+            await pool.aclose()
+    return asyncio.run(run())
+
+
+def test_runs_code_in_worker():
+    code = "result_data = df.groupby('city')['sales'].sum().to_dict()\nprint('rows', len(df))\nsummary_text = 'done'"
+    (result,), stats = _run(ExecutorPool(workers=1), code)
+    assert result["success"], result
+    assert result["data"] == {"Beijing": 20, "Shanghai": 40}
+    assert result["stdout"] == "rows 3\n" and result["summary"] == "done"
+    assert stats["jobs"] == 1 and stats["fallback"] is False
+
+
+def test_timeout_kills_and_respawns():
+    (timed_out, after), stats = _run(ExecutorPool(workers=1, timeout=1), "while True:\n    pass", "result_data = len(df)")
+    assert not timed_out["success"] and "执行超时" in timed_out["error"]
+    assert after["success"] and after["data"] == 3
+    assert stats["timeouts"] == 1
+
+
+def test_memory_limit():
+    code = "x = np.ones(60_000_000)\ns = 0\nwhile True:\n    s += 1"
+    (result,), stats = _run(ExecutorPool(workers=1, timeout=10, max_rss_mb=300), code)
+    assert not result["success"] and "内存超限" in result["error"]
+    assert stats["memory_kills"] == 1
+
+
+def test_memory_rlimit_raises_in_worker():
+    pool = ExecutorPool(workers=1, timeout=10, max_rss_mb=300)
+    code = "x = np.ones(60_000_000)\nresult_data = 1"
+    (failed, after), stats = _run(pool, code, "result_data = len(df)")
+    assert not failed["success"] and "内存超限" in failed["error"]
+    assert after["success"] and after["data"] == 3
+    assert stats["memory_kills"] == 1 and not pool._pending
+
+
+def test_cpu_limit():
+    (result,), stats = _run(ExecutorPool(workers=1, timeout=10, cpu_seconds=1), "while True:\n    pass")
+    assert not result["success"] and "CPU" in result["error"]
+    assert stats["cpu_kills"] == 1
+
+
+def test_event_loop_stays_responsive():
+    pool = ExecutorPool(workers=1, timeout=1)
+
+    async def run():
+        await pool.start()
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.05)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        await pool.run(DF, "while True:\n    pass")
+        task.cancel()
+        await pool.aclose()
+        return ticks
+
+    assert asyncio.run(run()) >= 10
+
+
+def test_fallback_to_thread():
+    (result,), stats = _run(ExecutorPool(workers=0), "result_data = int(df['sales'].sum())")
+    assert result["success"] and result["data"] == 60
+    assert stats["fallback"] is True
+
+
+def test_partial_start_failure_kills_spawned_workers():
+    pool = ExecutorPool(workers=2)
+    spawned, calls = [], []
+    real_spawn = pool._spawn
+
+    async def flaky_spawn():
+        calls.append(1)
+        if len(calls) > 1:
+            raise OSError("fork failed")
+        worker = await real_spawn()
+        spawned.append(worker)
+        return worker
+
+    pool._spawn = flaky_spawn
+    (result,), stats = _run(pool, "result_data = int(df['sales'].sum())")
+    assert result["success"] and result["data"] == 60
+    assert stats["fallback"] is True and stats["workers"] == 0
+    assert spawned[0].process.returncode is not None
+
+
+def _failing_respawn(pool: ExecutorPool, failures: int):
+    """首批进程正常启动，之后的前 failures 次补充失败"""
+    real_spawn, calls = pool._spawn, []
+
+    async def spawn():
+        if pool._idle is not None:
+            calls.append(1)
+            if len(calls) <= failures:
+                raise OSError("fork failed")
+        return await real_spawn()
+
+    pool._spawn = spawn
+    return calls
+
+
+def test_respawn_retries_with_backoff():
+    pool = ExecutorPool(workers=1, timeout=1, respawn_delay=0.05)
+    calls = _failing_respawn(pool, failures=2)
+    (timed_out, after), stats = _run(pool, "while True:\n    pass", "result_data = len(df)")
+    assert not timed_out["success"] and after["success"] and after["data"] == 3
+    assert len(calls) == 3
+    assert stats["fallback"] is False and stats["workers"] == 1
+
+
+def test_respawn_failure_falls_back_to_thread():
+    pool = ExecutorPool(workers=1, timeout=1, respawn_attempts=2, respawn_delay=0.05)
+    _failing_respawn(pool, failures=100)
+
+    async def run():
+        try:
+            await pool.run(DF, "while True:\n    pass")
+            # 唯一的进程被杀且无法补充：排队中的请求不能永远等待空闲进程
+            waiting = [pool.run(DF, "result_data = len(df)") for _ in range(2)]
+            return await asyncio.wait_for(asyncio.gather(*waiting), timeout=10), pool.stats()
+        finally:
+            await pool.aclose()
+    results, stats = asyncio.run(run())
+    assert all(r["success"] and r["data"] == 3 for r in results)
+    assert stats["fallback"] is True and stats["workers"] == 0
+
+
+def test_worker_env_excludes_secrets():
+    if not Path("/proc/self/environ").exists():
+        return
+    os.environ["DB_PASSWORD"] = "secret"
+    try:
+        pool = ExecutorPool(workers=1)
+
+        async def run():
+            try:
+                await pool.start()
+                worker = next(iter(pool._all))
+                with open(f"/proc/{worker.pid}/environ", "rb") as f:
+                    return dict(item.split(b"=", 1) for item in f.read().split(b"\0") if item)
+            finally:
+                await pool.aclose()
+        env = asyncio.run(run())
+    finally:
+        del os.environ["DB_PASSWORD"]
+    assert b"DB_PASSWORD" not in env
+    assert env[b"MPLBACKEND"] == b"Agg" and b"PATH" in env
+
+
+if __name__ == "__main__":
+    test_runs_code_in_worker()
+    test_timeout_kills_and_respawns()
+    test_memory_limit()
+    test_memory_rlimit_raises_in_worker()
+    test_cpu_limit()
+    test_event_loop_stays_responsive()
+    test_fallback_to_thread()
+    test_partial_start_failure_kills_spawned_workers()
+    test_respawn_retries_with_backoff()
+    test_respawn_failure_falls_back_to_thread()
+    test_worker_env_excludes_secrets()
+    print("✅ 代码执行进程池测试通过")
@@ -0,0 +1,105 @@
+"""
+测试查询中止：语句出错时连接正常归还，只有取消 / 超时 / 提前关闭才取消服务端语句并废弃连接
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from databases.base_adapter import BaseDatabaseAdapter
+
+
+class _Conn:
+    def __init__(self, execute):
+        self._execute = execute
+        self.invalidated = False
+        self.closed = False
+
+    async def get_raw_connection(self):
+        raise RuntimeError("no raw connection")
+
+    async def execute(self, *args):
+        return await self._execute()
+
+    async def stream(self, *args):
+        return await self._execute()
+
+    async def invalidate(self):
+        self.invalidated = True
+
+    async def close(self):
+        self.closed = True
+
+
+class _Engine:
+    def __init__(self, conn):
+        self.conn = conn
+
+    async def connect(self):
+        return self.conn
+
+
+class _Adapter(BaseDatabaseAdapter):
+    def get_connection_string(self) -> str:
+        return "fake://"
+
+
+def _adapter(execute):
+    adapter = _Adapter({})
+    adapter.engine = _Engine(_Conn(execute))
+    return adapter
+
+
+async def _fail():
+    raise ValueError("Unknown column 'x'")
+
+
+async def _hang():
+    await asyncio.sleep(10)
+
+
+def test_statement_error_keeps_connection():
+    for method in ("execute_query", "stream_query"):
+        adapter = _adapter(_fail)
+
+        async def run():
+            if method == "execute_query":
+                await adapter.execute_query("SELECT x")
+            else:
+                async for _ in adapter.stream_query("SELECT x"):
+                    pass
+
+        try:
+            asyncio.run(run())
+        except ValueError:
+            pass
+        conn = adapter.engine.conn
+        assert conn.closed and not conn.invalidated, method
+
+
+def test_timeout_invalidates_connection():
+    for method in ("execute_query", "stream_query"):
+        adapter = _adapter(_hang)
+
+        async def consume():
+            async for _ in adapter.stream_query("SELECT 1"):
+                pass
+
+        async def run():
+            call = adapter.execute_query("SELECT 1") if method == "execute_query" else consume()
+            await asyncio.wait_for(call, timeout=0.05)
+
+        try:
+            asyncio.run(run())
+        except asyncio.TimeoutError:
+            pass
+        conn = adapter.engine.conn
+        assert conn.closed and conn.invalidated, method
+
+
+if __name__ == "__main__":
+    test_statement_error_keeps_connection()
+    test_timeout_invalidates_connection()
+    print("✅ 查询中止测试通过")
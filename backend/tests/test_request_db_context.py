@@ -0,0 +1,41 @@
+"""
+测试请求级数据库上下文 (并发会话互不干扰)
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from services.schema_service import SchemaService
+
+
+async def _session(db_key: str, delay: float) -> str:
+    bound = SchemaService.use_database(db_key)
+    await asyncio.sleep(delay)
+    assert bound == db_key
+    return SchemaService.get_current_db_key()
+
+
+def test_concurrent_sessions_keep_their_database():
+    async def run():
+        return await asyncio.gather(
+            _session("classic_business", 0.02),
+            _session("global_analysis", 0.01),
+        )
+    assert asyncio.run(run()) == ["classic_business", "global_analysis"]
+
+
+def test_unknown_key_falls_back_to_default():
+    async def run():
+        return SchemaService.use_database("business")
+    assert asyncio.run(run()) == SchemaService._current_db_key
+    # 未绑定请求上下文时使用进程默认库
+    assert SchemaService.get_current_db_key() == SchemaService._current_db_key
+
+
+if __name__ == "__main__":
+    test_concurrent_sessions_keep_their_database()
+    test_unknown_key_falls_back_to_default()
+    print("✅ 请求级数据库上下文测试全部通过")
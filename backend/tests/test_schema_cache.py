@@ -0,0 +1,116 @@
+"""
+测试 Schema 指纹缓存：磁盘持久化与按表增量刷新
+"""
+import asyncio
+import sys
+import tempfile
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import services.schema_service as schema_module
+from databases.database_manager import DatabaseManager
+from services.schema_service import SchemaService
+
+DB_KEY = "_fake_schema_cache"
+
+
+class _FakeAdapter:
+    connected = True
+
+    def __init__(self):
+        self.fingerprints = {"orders": "v1", "customers": "v1"}
+        self.sampled = []
+        self.described = []
+
+    async def get_table_fingerprints(self):
+        return dict(self.fingerprints)
+
+    async def get_create_table_sqls(self, table_names=None):
+        names = list(self.fingerprints) if table_names is None else table_names
+        self.described.extend(names)
+        return {t: f"CREATE TABLE `{t}` (`id` int) -- {self.fingerprints[t]}" for t in names if t in self.fingerprints}
+
+    def quote_identifier(self, name):
+        return f"`{name}`"
+
+    async def execute_query(self, query, params=None):
+        self.sampled.append(query.split("`")[1])
+        return [{"id": 1}]
+
+
+def _reset_memory():
+    SchemaService._cached_schemas.pop(DB_KEY, None)
+    SchemaService._cached_tables.pop(DB_KEY, None)
+    SchemaService._entries.pop(DB_KEY, None)
+    SchemaService._checked_at.pop(DB_KEY, None)
+
+
+def test_persist_and_incremental_refresh():
+    original_dir = schema_module.SCHEMA_CACHE_DIR
+    adapter = _FakeAdapter()
+    DatabaseManager._adapters[DB_KEY] = adapter
+    with tempfile.TemporaryDirectory() as tmp:
+        schema_module.SCHEMA_CACHE_DIR = Path(tmp)
+        try:
+            first = asyncio.run(SchemaService.get_full_schema(db_key=DB_KEY))
+            assert sorted(adapter.sampled) == ["customers", "orders"]
+            cache_file = Path(tmp) / f"{DB_KEY}.json"
+            assert cache_file.exists()
+            # 样本数据 (业务数据) 默认不写入磁盘
+            assert "sample" not in cache_file.read_text(encoding="utf-8")
+
+            # 模拟重启：建表语句直接从磁盘恢复，只重新抓取样本
+            _reset_memory()
+            adapter.sampled.clear()
+            adapter.described.clear()
+            assert asyncio.run(SchemaService.get_full_schema(db_key=DB_KEY)) == first
+            assert adapter.described == [] and sorted(adapter.sampled) == ["customers", "orders"]
+
+            # 迁移只改动了 orders：只查询这张表与新增表的建表语句
+            _reset_memory()
+            adapter.sampled.clear()
+            adapter.fingerprints.update({"orders": "v2", "payments": "v1"})
+            schema = asyncio.run(SchemaService.get_full_schema(db_key=DB_KEY))
+            assert sorted(adapter.described) == ["orders", "payments"]
+            assert "-- v2" in schema and "payments" in schema
+
+            # 删除表：无需重新抓取
+            SchemaService._checked_at.pop(DB_KEY, None)
+            adapter.sampled.clear()
+            adapter.described.clear()
+            del adapter.fingerprints["customers"]
+            schema = asyncio.run(SchemaService.get_full_schema(db_key=DB_KEY))
+            assert "customers" not in schema and adapter.sampled == [] and adapter.described == []
+        finally:
+            schema_module.SCHEMA_CACHE_DIR = original_dir
+            DatabaseManager._adapters.pop(DB_KEY, None)
+            _reset_memory()
+
+
+
+def test_persist_samples_opt_in():
+    original_dir = schema_module.SCHEMA_CACHE_DIR
+    adapter = _FakeAdapter()
+    DatabaseManager._adapters[DB_KEY] = adapter
+    with tempfile.TemporaryDirectory() as tmp:
+        schema_module.SCHEMA_CACHE_DIR = Path(tmp)
+        schema_module.SCHEMA_CACHE_PERSIST_SAMPLES = True
+        try:
+            first = asyncio.run(SchemaService.get_full_schema(db_key=DB_KEY))
+            _reset_memory()
+            adapter.sampled.clear()
+            assert asyncio.run(SchemaService.get_full_schema(db_key=DB_KEY)) == first
+            assert adapter.sampled == []
+        finally:
+            schema_module.SCHEMA_CACHE_PERSIST_SAMPLES = False
+            schema_module.SCHEMA_CACHE_DIR = original_dir
+            DatabaseManager._adapters.pop(DB_KEY, None)
+            _reset_memory()
+
+
+if __name__ == "__main__":
+    test_persist_and_incremental_refresh()
+    test_persist_samples_opt_in()
+    print("✅ Schema 缓存测试全部通过")
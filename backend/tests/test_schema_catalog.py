@@ -0,0 +1,120 @@
+"""
+测试批量目录查询合成的建表语句与并发样本抓取
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from databases.base_adapter import ColumnInfo, ForeignKeyInfo, TableInfo
+from databases.database_manager import DatabaseManager
+from databases.mysql_adapter import MySQLAdapter
+from databases.postgresql_adapter import PostgreSQLAdapter
+from services.schema_service import SchemaService
+
+
+def _orders_table(column_type: str = "int") -> TableInfo:
+    return TableInfo(
+        name="orders",
+        comment="订单表",
+        columns=[
+            ColumnInfo(name="id", type=column_type, nullable=False, primary_key=True, extra="auto_increment"),
+            ColumnInfo(name="customer_id", type=column_type, nullable=False),
+            ColumnInfo(name="status", type="varchar(20)", default="new", comment="订单状态"),
+        ],
+        foreign_keys=[ForeignKeyInfo(
+            name="fk_orders_customer", columns=["customer_id"],
+            referred_table="customers", referred_columns=["id"]
+        )]
+    )
+
+
+def test_render_mysql_create_table():
+    ddl = MySQLAdapter.render_create_table(_orders_table())
+    assert ddl.startswith("CREATE TABLE `orders` (")
+    assert "`id` int NOT NULL auto_increment" in ddl
+    assert "`status` varchar(20) DEFAULT 'new' COMMENT '订单状态'" in ddl
+    assert "PRIMARY KEY (`id`)" in ddl
+    assert "FOREIGN KEY (`customer_id`) REFERENCES `customers` (`id`)" in ddl
+    assert ddl.endswith("COMMENT='订单表'")
+
+
+def test_render_postgresql_create_table():
+    table = _orders_table("integer")
+    table.columns[2].default = "'new'::character varying"
+    ddl = PostgreSQLAdapter.render_create_table(table)
+    assert ddl.startswith('-- 订单表\nCREATE TABLE "orders" (')
+    assert "\"status\" varchar(20) DEFAULT 'new'::character varying, -- 订单状态" in ddl
+    assert 'REFERENCES "customers" ("id")\n)' in ddl
+
+
+class _RecordingMySQLAdapter(MySQLAdapter):
+    def __init__(self):
+        super().__init__({})
+        self.engine = object()
+        self.queries = []
+
+    async def execute_query(self, query, params=None):
+        self.queries.append((query, params))
+        if "information_schema.TABLES" in query:
+            return [{"table_name": name, "table_comment": ""} for name in (params or {}).values()]
+        return []
+
+
+def test_create_table_sqls_for_selected_tables():
+    adapter = _RecordingMySQLAdapter()
+    ddls = asyncio.run(adapter.get_create_table_sqls(["orders", "payments"]))
+    assert sorted(ddls) == ["orders", "payments"]
+    assert len(adapter.queries) == 3
+    for query, params in adapter.queries:
+        assert "AND TABLE_NAME IN (:t0, :t1)" in query
+        assert params == {"t0": "orders", "t1": "payments"}
+
+    # 没有变化的表时不查询目录
+    adapter.queries.clear()
+    assert asyncio.run(adapter.get_create_table_sqls([])) == {} and adapter.queries == []
+
+
+class _FakeAdapter:
+    connected = True
+
+    def __init__(self):
+        self.active = 0
+        self.peak = 0
+
+    async def get_create_table_sqls(self):
+        return {f"t{i}": f"CREATE TABLE `t{i}` (`id` int)" for i in range(10)}
+
+    def quote_identifier(self, name):
+        return f"`{name}`"
+
+    async def execute_query(self, query, params=None):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        await asyncio.sleep(0.01)
+        self.active -= 1
+        return [{"id": 1}]
+
+
+def test_full_schema_bulk_and_bounded_samples():
+    adapter = _FakeAdapter()
+    DatabaseManager._adapters["_fake_catalog"] = adapter
+    try:
+        schema = asyncio.run(SchemaService.get_full_schema(db_key="_fake_catalog"))
+    finally:
+        DatabaseManager._adapters.pop("_fake_catalog", None)
+        SchemaService._cached_schemas.pop("_fake_catalog", None)
+        SchemaService._cached_tables.pop("_fake_catalog", None)
+    assert schema.count("CREATE TABLE") == 10
+    assert schema.count("样本数据") == 10
+    assert 1 < adapter.peak <= 4
+
+
+if __name__ == "__main__":
+    test_render_mysql_create_table()
+    test_render_postgresql_create_table()
+    test_create_table_sqls_for_selected_tables()
+    test_full_schema_bulk_and_bounded_samples()
+    print("✅ Schema 批量目录测试全部通过")
@@ -0,0 +1,87 @@
+"""
+测试 Schema 检索：按问题挑选相关表及外键邻居
+"""
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import services.schema_retriever as retriever_module
+from services.schema_retriever import SchemaRetriever, _SchemaIndex, _tokenize
+
+
+def _blocks():
+    blocks = {
+        "customers": "CREATE TABLE `customers` (\n  `id` int NOT NULL,\n  `city` varchar(50) COMMENT '所在城市'\n)",
+        "orders": (
+            "CREATE TABLE `orders` (\n  `id` int NOT NULL,\n  `customer_id` int,\n  `amount` decimal(10,2) COMMENT '订单金额',\n"
+            "  CONSTRAINT `fk_c` FOREIGN KEY (`customer_id`) REFERENCES `customers` (`id`)\n) COMMENT='销售订单'"
+        ),
+        "employees": "CREATE TABLE `employees` (\n  `id` int NOT NULL,\n  `salary` decimal(10,2) COMMENT '员工工资'\n)",
+    }
+    for i in range(20):
+        blocks[f"log_{i}"] = f"CREATE TABLE `log_{i}` (\n  `id` int NOT NULL,\n  `payload` text COMMENT '日志内容'\n)"
+    return blocks
+
+
+def test_tokenize_mixed_text():
+    tokens = _tokenize("OrderItems order_items 各城市销售额")
+    assert tokens.count("order") == 2 and "item" in tokens
+    assert "城市" in tokens and "销售" in tokens
+
+
+def test_rank_and_foreign_key_neighbours():
+    SchemaRetriever._embedder_failed = True  # 测试中只使用词法检索
+    index = _SchemaIndex(_blocks())
+    ranked = asyncio.run(SchemaRetriever.rank_tables(index, "统计各城市的订单金额"))
+    chosen = SchemaRetriever.select_tables(index, ranked)
+    assert chosen[0] == "orders"
+    assert "customers" in chosen
+    assert "employees" not in chosen and not any(t.startswith("log_") for t in chosen)
+
+
+def test_no_match_returns_empty():
+    SchemaRetriever._embedder_failed = True
+    index = _SchemaIndex(_blocks())
+    assert asyncio.run(SchemaRetriever.rank_tables(index, "你好")) == []
+
+
+def test_embedder_loads_off_event_loop():
+    def slow_load(cls):
+        time.sleep(0.2)
+        cls._embedder = "embedder"
+
+    original = SchemaRetriever.__dict__["load_embedder"]
+    original_flag = retriever_module.SCHEMA_RETRIEVAL_USE_EMBEDDINGS
+    SchemaRetriever.load_embedder = classmethod(slow_load)
+    retriever_module.SCHEMA_RETRIEVAL_USE_EMBEDDINGS = True
+    SchemaRetriever._embedder_failed = False
+
+    async def run():
+        started = time.perf_counter()
+        # 加载完成前返回 None，且不阻塞事件循环
+        assert SchemaRetriever.get_embedder() is None
+        assert SchemaRetriever.get_embedder() is None
+        assert time.perf_counter() - started < 0.1
+        await SchemaRetriever._embedder_loading
+        assert SchemaRetriever.get_embedder() == "embedder"
+
+    try:
+        asyncio.run(run())
+    finally:
+        SchemaRetriever.load_embedder = original
+        retriever_module.SCHEMA_RETRIEVAL_USE_EMBEDDINGS = original_flag
+        SchemaRetriever._embedder = None
+        SchemaRetriever._embedder_loading = None
+        SchemaRetriever._embedder_failed = True
+
+
+if __name__ == "__main__":
+    test_tokenize_mixed_text()
+    test_rank_and_foreign_key_neighbours()
+    test_no_match_returns_empty()
+    test_embedder_loads_off_event_loop()
+    print("✅ SchemaRetriever 测试全部通过")
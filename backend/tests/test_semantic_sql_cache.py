@@ -0,0 +1,137 @@
+"""
+测试问题 → SQL 语义缓存
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from agents.sql_agent import SemanticSQLCache, SQLAgent
+from services.schema_retriever import SchemaRetriever
+
+# 测试中不加载嵌入模型，使用 n-gram 向量
+SchemaRetriever._embedder_failed = True
+
+SQL = "SELECT city, SUM(amount) FROM orders GROUP BY city"
+
+
+def _cache(**kwargs) -> SemanticSQLCache:
+    cache = SemanticSQLCache(**kwargs)
+    asyncio.run(cache.store("上个月各城市销售额", "db1", "fp1", SQL, "bar", {"x": "city"}))
+    return cache
+
+
+def test_similar_question_hits():
+    cache = _cache(threshold=0.8)
+    hit = asyncio.run(cache.lookup("上个月各城市的销售额", "db1", "fp1"))
+    assert hit and hit["sql"] == SQL and hit["chart_type"] == "bar"
+    assert cache.get_stats()["hits"] == 1
+
+
+def test_scope_and_numbers_must_match():
+    cache = _cache(threshold=0.8)
+    assert asyncio.run(cache.lookup("上个月各城市销售额", "db2", "fp1")) is None
+    # 表结构变化后不再命中
+    assert asyncio.run(cache.lookup("上个月各城市销售额", "db1", "fp2")) is None
+
+    asyncio.run(cache.store("2023年各城市销售额", "db1", "fp1", SQL + " -- 2023", "bar", {}))
+    assert asyncio.run(cache.lookup("2024年各城市销售额", "db1", "fp1")) is None
+
+
+def test_entities_must_match():
+    cache = SemanticSQLCache(threshold=0.5)
+    asyncio.run(cache.store("北京各产品的销售额", "db1", "fp1", SQL + " -- 北京", "bar", {}))
+    assert asyncio.run(cache.lookup("上海各产品的销售额", "db1", "fp1")) is None
+    # 虚词差异不影响命中
+    assert asyncio.run(cache.lookup("北京各产品销售额", "db1", "fp1"))
+
+
+class _EmbeddingCache(SemanticSQLCache):
+    """用固定向量模拟嵌入模型：同组的问题视为同义改写"""
+    GROUPS = [
+        ("上个月各城市销售额", "last month's sales by city"),
+        ("北京各产品的销售额", "上海各产品的销售额", "各产品的销售额", "beijing sales by product"),
+    ]
+
+    async def _embed(self, question):
+        for i, group in enumerate(self.GROUPS):
+            if question in group:
+                return "embedding", [1.0 if j == i else 0.0 for j in range(len(self.GROUPS))]
+        return "embedding", [0.0] * len(self.GROUPS)
+
+
+def test_paraphrase_hits_with_embeddings():
+    cache = _EmbeddingCache(threshold=0.9)
+    asyncio.run(cache.store("上个月各城市销售额", "db1", "fp1", SQL, "bar", {}))
+    hit = asyncio.run(cache.lookup("last month's sales by city", "db1", "fp1"))
+    assert hit and hit["sql"] == SQL
+
+
+def test_filter_values_must_match_with_embeddings():
+    cache = _EmbeddingCache(threshold=0.9)
+    beijing = "SELECT product, SUM(amount) FROM orders WHERE city = '北京' GROUP BY product"
+    asyncio.run(cache.store("北京各产品的销售额", "db1", "fp1", beijing, "bar", {}))
+    # SQL 中来自问题的筛选值必须出现在新问题中
+    assert asyncio.run(cache.lookup("上海各产品的销售额", "db1", "fp1")) is None
+    assert asyncio.run(cache.lookup("beijing sales by product", "db1", "fp1")) is None
+
+    # 新问题多出已知的筛选值时，不能命中不带筛选的 SQL
+    everything = "SELECT product, SUM(amount) FROM orders GROUP BY product"
+    cache = _EmbeddingCache(threshold=0.9)
+    asyncio.run(cache.store("各产品的销售额", "db1", "fp1", everything, "bar", {}))
+    asyncio.run(cache.store("北京各产品的销售额", "db1", "fp1", beijing, "bar", {}))
+    assert asyncio.run(cache.lookup("北京各产品的销售额", "db1", "fp1"))["sql"] == beijing
+    assert asyncio.run(cache.lookup("各产品的销售额", "db1", "fp1"))["sql"] == everything
+
+
+def test_follow_up_needs_same_context():
+    cache = SemanticSQLCache(threshold=0.8)
+    history = "用户: 北京各产品的销售额\n助手: 好的"
+    context = SemanticSQLCache.context_key(history)
+    asyncio.run(cache.store("那上个月呢", "db1", "fp1", SQL + " -- 北京", "bar", {}, context=context))
+    assert asyncio.run(cache.lookup("那上个月呢", "db1", "fp1")) is None
+    other = SemanticSQLCache.context_key("用户: 上海各产品的销售额\n助手: 好的")
+    assert asyncio.run(cache.lookup("那上个月呢", "db1", "fp1", context=other)) is None
+    # 当前问题已写入历史时不计入上下文
+    current = SemanticSQLCache.context_key(history + "\n用户: 那上个月呢", "那上个月呢")
+    assert asyncio.run(cache.lookup("那上个月呢", "db1", "fp1", context=current))
+
+
+def test_confirmation_uses_question_before_plan():
+    history = "用户: 你好\n助手: 你好！\n用户: 各城市销售额\n助手: 分析方案：按城市汇总\n用户: 可以"
+    question, before = SQLAgent._original_question(history, "可以")
+    assert question == "各城市销售额"
+    assert SemanticSQLCache.context_key(before) == SemanticSQLCache.context_key("用户: 你好\n助手: 你好！")
+
+
+def test_follows_plan():
+    plan = "用户: 各城市销售额\n助手: 分析方案：按城市汇总订单金额\n这个分析方案是否可以？"
+    assert SQLAgent._follows_plan(plan + "\n用户: 对")
+    assert not SQLAgent._follows_plan("用户: 你好\n助手: 你好！有什么可以帮您？\n用户: 对")
+    assert not SQLAgent._follows_plan("")
+
+
+def test_lru_and_feedback_eviction():
+    cache = _cache(max_entries=2, threshold=0.8)
+    asyncio.run(cache.store("各产品库存", "db1", "fp1", "SELECT * FROM stock", "table", {}))
+    asyncio.run(cache.store("员工人数", "db1", "fp1", "SELECT COUNT(*) FROM employees", "card", {}))
+    assert cache.get_stats()["entries"] == 2
+    assert asyncio.run(cache.lookup("上个月各城市销售额", "db1", "fp1")) is None
+
+    assert cache.evict_sql("select count(*)   from employees;") == 1
+    assert asyncio.run(cache.lookup("员工人数", "db1", "fp1")) is None
+
+
+if __name__ == "__main__":
+    test_similar_question_hits()
+    test_scope_and_numbers_must_match()
+    test_entities_must_match()
+    test_paraphrase_hits_with_embeddings()
+    test_filter_values_must_match_with_embeddings()
+    test_follow_up_needs_same_context()
+    test_confirmation_uses_question_before_plan()
+    test_follows_plan()
+    test_lru_and_feedback_eviction()
+    print("✅ 语义 SQL 缓存测试全部通过")
@@ -0,0 +1,83 @@
+"""
+测试 SQL 查询结果缓存 (QueryResultCache)
+"""
+import sys
+import time
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from services.sql_executor import QueryResultCache
+
+
+def _result(n: int = 1):
+    return {"columns": ["city"], "rows": [{"city": f"c{i}"} for i in range(n)], "row_count": n}
+
+
+def test_normalize_sql():
+    a = QueryResultCache.normalize_sql("SELECT  city\n FROM orders WHERE name = 'Bob';")
+    b = QueryResultCache.normalize_sql("select city from ORDERS where name = 'Bob'  -- 注释")
+    assert a == b
+    # 字符串字面量保持大小写
+    assert "'Bob'" in a
+    assert QueryResultCache.normalize_sql("SELECT 'A'") != QueryResultCache.normalize_sql("SELECT 'a'")
+    # 字面量中的 -- 与 /* 不是注释
+    assert QueryResultCache.normalize_sql("SELECT * FROM t WHERE c = 'a--b'") != \
+        QueryResultCache.normalize_sql("SELECT * FROM t WHERE c = 'a--c'")
+    assert QueryResultCache.normalize_sql("SELECT '/*x*/' /* 注释 */ FROM t") == "select '/*x*/' from t"
+
+
+def test_extract_tables():
+    tables = QueryResultCache.extract_tables("SELECT * FROM `orders` o JOIN shop.customers c ON o.cid = c.id")
+    assert tables == ["orders", "customers"]
+
+
+def test_key_isolation_by_db_and_user():
+    cache = QueryResultCache(ttl=60, max_entries=10)
+    k1 = cache.make_key("SELECT 1", "classic_business", 1)
+    cache.set(k1, _result(), [], {})
+    assert cache.get(k1) is not None
+    assert cache.get(cache.make_key("SELECT 1", "global_analysis", 1)) is None
+    assert cache.get(cache.make_key("SELECT 1", "classic_business", 2)) is None
+
+
+def test_lru_eviction_and_ttl():
+    cache = QueryResultCache(ttl=60, max_entries=2)
+    keys = [cache.make_key(f"SELECT {i}", "db", None) for i in range(3)]
+    cache.set(keys[0], _result(), [], {})
+    cache.set(keys[1], _result(), [], {})
+    cache.get(keys[0])  # 访问后 keys[0] 变为最近使用
+    cache.set(keys[2], _result(), [], {})
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) is not None
+    assert cache.evictions == 1
+
+    short = QueryResultCache(ttl=0, max_entries=2)
+    short.set(keys[0], _result(), [], {})
+    time.sleep(0.01)
+    assert short.get(keys[0]) is None
+
+
+def test_invalidate_by_table_and_row_limit():
+    cache = QueryResultCache(ttl=60, max_entries=10, max_rows=5)
+    k1 = cache.make_key("SELECT * FROM orders", "db", None)
+    k2 = cache.make_key("SELECT * FROM users", "db", None)
+    cache.set(k1, _result(), ["orders"], {})
+    cache.set(k2, _result(), ["users"], {})
+    assert cache.invalidate(db_key="db", tables=["ORDERS"]) == 1
+    assert cache.get(k1) is None and cache.get(k2) is not None
+
+    # 超过 max_rows 的结果不缓存
+    k3 = cache.make_key("SELECT * FROM big", "db", None)
+    cache.set(k3, _result(10), ["big"], {})
+    assert cache.get(k3) is None
+
+
+if __name__ == "__main__":
+    test_normalize_sql()
+    test_extract_tables()
+    test_key_isolation_by_db_and_user()
+    test_lru_eviction_and_ttl()
+    test_invalidate_by_table_and_row_limit()
+    print("✅ QueryResultCache 测试全部通过")
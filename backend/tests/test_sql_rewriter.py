@@ -0,0 +1,64 @@
+"""
+测试 SQL LIMIT 下推改写 (SQLRewriter)
+"""
+import sys
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from services.sql_rewriter import SQLRewriter
+
+
+def test_inject_limit():
+    sql, limit = SQLRewriter.apply_limit("SELECT city, SUM(amount) FROM orders GROUP BY city;", 200)
+    assert limit == 200
+    assert sql.endswith("LIMIT 200")
+    assert ";" not in sql
+
+
+def test_tighten_and_keep_existing_limit():
+    sql, limit = SQLRewriter.apply_limit("SELECT * FROM orders ORDER BY id DESC LIMIT 100000", 500)
+    assert limit == 500 and sql.endswith("LIMIT 500")
+
+    # 用户自带且不超过上限的 LIMIT 不算截断
+    sql, limit = SQLRewriter.apply_limit("SELECT * FROM orders LIMIT 10;", 500)
+    assert limit is None and sql == "SELECT * FROM orders LIMIT 10;"
+
+    # MySQL 的 LIMIT offset, count 写法
+    sql, limit = SQLRewriter.apply_limit("SELECT * FROM orders LIMIT 20, 9999", 500)
+    assert sql.endswith("LIMIT 20, 500")
+
+
+def test_inner_limit_and_strings_are_ignored():
+    sql, limit = SQLRewriter.apply_limit(
+        "SELECT * FROM (SELECT * FROM orders LIMIT 5) t WHERE note = 'limit 3'", 100
+    )
+    assert limit == 100
+    assert "LIMIT 5)" in sql and sql.endswith("LIMIT 100")
+
+
+def test_trailing_comment_and_non_select():
+    sql, limit = SQLRewriter.apply_limit("SELECT * FROM orders -- 全部订单", 50)
+    assert sql.endswith("\nLIMIT 50")
+
+    sql, limit = SQLRewriter.apply_limit("SHOW TABLES", 50)
+    assert sql == "SHOW TABLES" and limit is None
+
+
+def test_build_count_sql():
+    count_sql = SQLRewriter.build_count_sql(
+        "SELECT city, SUM(x) OVER (ORDER BY d) FROM orders ORDER BY city LIMIT 10"
+    )
+    assert count_sql.startswith("SELECT COUNT(*) AS total_count FROM (")
+    assert "OVER (ORDER BY d)" in count_sql
+    assert "LIMIT 10" not in count_sql and "ORDER BY city" not in count_sql
+
+
+if __name__ == "__main__":
+    test_inject_limit()
+    test_tighten_and_keep_existing_limit()
+    test_inner_limit_and_strings_are_ignored()
+    test_trailing_comment_and_non_select()
+    test_build_count_sql()
+    print("✅ SQLRewriter 测试全部通过")
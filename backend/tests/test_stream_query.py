@@ -0,0 +1,123 @@
+"""
+测试流式查询：基于 SQLite (aiosqlite) 的真实引擎，验证分批大小、行数 / 字节上限与 truncated 标记
+"""
+import asyncio
+import sys
+import tempfile
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from sqlalchemy import text
+
+from databases.base_adapter import BaseDatabaseAdapter
+from routers.chat_router import _SqlResultCollector
+from services.sql_executor import SQLExecutor
+
+
+class _SQLiteAdapter(BaseDatabaseAdapter):
+    def get_connection_string(self) -> str:
+        return f"sqlite+aiosqlite:///{self.config['path']}"
+
+
+async def _collect(adapter, query="SELECT id, name FROM t ORDER BY id", **kwargs):
+    return [batch async for batch in adapter.stream_query(query, **kwargs)]
+
+
+def _run(check, rows=10):
+    async def run():
+        with tempfile.TemporaryDirectory() as tmp:
+            adapter = _SQLiteAdapter({"path": str(Path(tmp) / "t.db")})
+            assert await adapter.connect()
+            try:
+                async with adapter.engine.begin() as conn:
+                    await conn.execute(text("CREATE TABLE t (id INTEGER, name TEXT)"))
+                    for i in range(rows):
+                        # 每行估算 12 字节：整数 8 + 字符串 4
+                        await conn.execute(text("INSERT INTO t VALUES (:id, :name)"), {"id": i, "name": f"n{i:03d}"})
+                await check(adapter)
+            finally:
+                await adapter.disconnect()
+
+    asyncio.run(run())
+
+
+def test_batches_follow_batch_size():
+    async def check(adapter):
+        batches = await _collect(adapter, batch_size=4)
+        assert [len(b.rows) for b in batches] == [4, 4, 2]
+        assert batches[0].columns == ["id", "name"]
+        assert batches[0].rows[0] == (0, "n000")
+        assert not any(b.truncated for b in batches)
+
+    _run(check)
+
+
+def test_empty_result_yields_one_batch():
+    async def check(adapter):
+        batches = await _collect(adapter, "SELECT id, name FROM t WHERE id < 0")
+        assert len(batches) == 1
+        assert batches[0].columns == ["id", "name"] and batches[0].rows == []
+        assert not batches[0].truncated
+
+    _run(check)
+
+
+def test_max_rows_truncates():
+    async def check(adapter):
+        batches = await _collect(adapter, batch_size=4, max_rows=6)
+        assert [len(b.rows) for b in batches] == [4, 2]
+        assert [b.truncated for b in batches] == [False, True]
+
+        # 行数恰好等于上限时没有被丢弃的行，不算截断
+        batches = await _collect(adapter, batch_size=4, max_rows=10)
+        assert sum(len(b.rows) for b in batches) == 10
+        assert not any(b.truncated for b in batches)
+
+    _run(check)
+
+
+def test_max_bytes_truncates():
+    async def check(adapter):
+        batches = await _collect(adapter, batch_size=4, max_bytes=12 * 5)
+        assert [len(b.rows) for b in batches] == [4, 1]
+        assert batches[-1].truncated
+
+    _run(check)
+
+
+def test_connection_reusable_after_truncation():
+    async def check(adapter):
+        await _collect(adapter, batch_size=2, max_rows=1)
+        batches = await _collect(adapter, batch_size=100)
+        assert sum(len(b.rows) for b in batches) == 10
+
+    _run(check)
+
+
+def test_collector_reassembles_streamed_result():
+    full = {"columns": ["id", "name"], "rows": [{"id": i, "name": f"n{i}"} for i in range(3)],
+            "row_count": 3, "truncated": False}
+    meta = SQLExecutor.result_meta(full)
+    assert "rows" not in meta and meta["streamed"] and meta["row_count"] == 3
+
+    collector = _SqlResultCollector()
+    # 第一次执行尝试的批次在重试 (offset 重新为 0) 时被丢弃
+    collector.feed("sql_result_batch", {"columns": ["id", "name"], "rows": [[9, "x"]], "offset": 0})
+    collector.feed("sql_result_batch", {"columns": ["id", "name"], "rows": [[0, "n0"], [1, "n1"]], "offset": 0})
+    collector.feed("sql_result_batch", {"columns": ["id", "name"], "rows": [[2, "n2"]], "offset": 2})
+    assert collector.feed("sql_result", meta) == full
+
+    # 未逐批发送的结果 (例如缓存命中) 原样返回
+    assert _SqlResultCollector().feed("sql_result", full) is full
+
+
+if __name__ == "__main__":
+    test_batches_follow_batch_size()
+    test_empty_result_yields_one_batch()
+    test_max_rows_truncates()
+    test_max_bytes_truncates()
+    test_connection_reusable_after_truncation()
+    test_collector_reassembles_streamed_result()
+    print("✅ 流式查询测试通过")
@@ -1,13 +1,25 @@
 """
 日志配置模块
+所有 Handler 挂在 QueueListener 后台线程上，业务代码 (事件循环) 只做入队，不会阻塞在控制台 / 文件 I/O 上。
+LLM 提示词转储按比例采样，写入独立的滚动日志 (llm_prompts.log)，不进入控制台与 app.log。
 """
+import atexit
 import logging
+import logging.handlers
+import queue
+import random
 import sys
 import os
 from pathlib import Path
 from datetime import datetime
 import json
-from config import BASE_DIR
+from typing import Any, Optional
+from config import BASE_DIR, PROMPT_LOG_SAMPLE_RATE, PROMPT_LOG_MAX_BYTES, PROMPT_LOG_BACKUP_COUNT
+
+PROMPT_LOGGER_NAME = "llm.prompt"
+
+_listeners = []
+
 
 class JSONFormatter(logging.Formatter):
     """JSON 格式化器"""
@@ -20,25 +32,78 @@ class JSONFormatter(logging.Formatter):
         }
         if record.exc_info:
             log_data["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            log_data["exception"] = record.exc_text
         return json.dumps(log_data, ensure_ascii=False)
 
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    只入队、不格式化：消息拼接 (含 LazyJSON 等延迟参数) 在监听线程中完成。
+    因此记录日志后不要再修改传入的参数对象。
+    """
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.exc_info:
+            # 异常栈引用了帧对象，需在当前线程格式化后丢弃
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class LazyJSON:
+    """仅在真正输出时才执行 json.dumps 的日志参数"""
+    __slots__ = ("value",)
+
+    def __init__(self, value: Any):
+        self.value = value
+
+    def __str__(self) -> str:
+        return json.dumps(self.value, ensure_ascii=False, indent=2, default=str)
+
+
+def _start_listener(target: logging.Logger, *handlers: logging.Handler) -> logging.handlers.QueueListener:
+    log_queue = queue.SimpleQueue()
+    target.addHandler(DeferredQueueHandler(log_queue))
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    _listeners.append(listener)
+    return listener
+
+
+def stop_logging() -> None:
+    """停止后台监听线程并写完队列中剩余的日志 (进程退出前调用)"""
+    while _listeners:
+        listener = _listeners.pop()
+        try:
+            listener.stop()
+        except Exception:
+            pass
+        for handler in listener.handlers:
+            handler.close()
+
+
+atexit.register(stop_logging)
+
+
 def setup_logging(
     level: str = "INFO",
     log_file: str = None,
-    json_format: bool = False
+    json_format: bool = False,
+    prompt_log_file: Optional[str] = None
 ) -> None:
-    """配置日志系统 (多进程稳定版)"""
+    """配置日志系统 (多进程稳定版，异步写出)"""
     log_level = getattr(logging, level.upper(), logging.INFO)
     root_logger = logging.getLogger()
     root_logger.setLevel(log_level)
-    
-    # 清除旧 Handler
+
+    # 清除旧 Handler 与监听线程 (重复调用时)
+    stop_logging()
     root_logger.handlers.clear()
-    
+
     # 1. 控制台输出
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setLevel(log_level)
-    
+
     # 2. 格式化
     if json_format:
         formatter = JSONFormatter()
@@ -47,15 +112,15 @@ def setup_logging(
             fmt='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
             datefmt='%Y-%m-%d %H:%M:%S'
         )
-    
+
     console_handler.setFormatter(formatter)
-    root_logger.addHandler(console_handler)
-    
+    handlers = [console_handler]
+
     # 3. 文件输出 (使用标准 FileHandler 避免多进程滚动冲突)
     if log_file:
         log_path = Path(log_file)
         log_path.parent.mkdir(parents=True, exist_ok=True)
-        
+
         # 使用 mode='a' (追加模式)，确保多个进程都能写
         file_handler = logging.FileHandler(
             log_file,
@@ -65,15 +130,39 @@ def setup_logging(
         )
         file_handler.setLevel(log_level)
         file_handler.setFormatter(formatter)
-        root_logger.addHandler(file_handler)
+        handlers.append(file_handler)
+
+    # 4. 所有 Handler 在后台线程中执行，根 Logger 只挂一个入队 Handler
+    _start_listener(root_logger, *handlers)
 
-        # 核心：关闭所有 Handler 的缓冲区，强制实时落盘
-        for handler in root_logger.handlers:
-            if hasattr(handler, 'stream') and hasattr(handler.stream, 'flush'):
-                handler.flush()
+    # 5. 提示词转储：独立的滚动文件，不向上传播到控制台
+    prompt_logger = logging.getLogger(PROMPT_LOGGER_NAME)
+    prompt_logger.handlers.clear()
+    prompt_logger.propagate = False
+    if PROMPT_LOG_SAMPLE_RATE > 0:
+        prompt_path = Path(prompt_log_file) if prompt_log_file else (
+            Path(log_file).parent if log_file else BASE_DIR / "logs"
+        ) / "llm_prompts.log"
+        prompt_path.parent.mkdir(parents=True, exist_ok=True)
+        prompt_handler = logging.handlers.RotatingFileHandler(
+            prompt_path, maxBytes=PROMPT_LOG_MAX_BYTES, backupCount=PROMPT_LOG_BACKUP_COUNT, encoding='utf-8'
+        )
+        prompt_handler.setFormatter(logging.Formatter('%(asctime)s %(message)s', datefmt='%Y-%m-%d %H:%M:%S'))
+        prompt_logger.setLevel(logging.DEBUG)
+        _start_listener(prompt_logger, prompt_handler)
 
 def get_logger(name: str) -> logging.Logger:
     return logging.getLogger(name)
 
+
+def log_prompt(provider: str, messages: Any, stream: bool = False, sample_rate: Optional[float] = None) -> bool:
+    """按采样率把发送给模型的完整提示词写入提示词日志，返回是否记录"""
+    rate = PROMPT_LOG_SAMPLE_RATE if sample_rate is None else sample_rate
+    if rate <= 0 or not prompt_logger.isEnabledFor(logging.DEBUG) or random.random() >= rate:
+        return False
+    prompt_logger.debug("📤 [Prompt (%s)%s]\n%s", provider, " 流式请求" if stream else "", LazyJSON(messages))
+    return True
+
 # 默认日志实例
 logger = get_logger("app")
+prompt_logger = get_logger(PROMPT_LOGGER_NAME)
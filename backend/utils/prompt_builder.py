@@ -0,0 +1,267 @@
+"""
+按 token 预算组装提示词
+每个可变段落 (Schema / 历史对话 / 知识库等) 单独计数，超出预算时从优先级最低的段落开始裁剪或压缩，
+并以 DEBUG 级别记录每次调用的分段 token 明细。
+"""
+import asyncio
+import re
+from typing import Callable, Dict, List, Optional, Tuple
+from config import PROMPT_TOKEN_BUDGET_DEFAULT, PROMPT_TOKEN_BUDGETS, PROMPT_TOKENIZER
+from utils.logger import logger
+
+_CJK_RE = re.compile(r'[\u3000-\u303f\u4e00-\u9fff\uff00-\uffef]')
+
+
+class TokenCounter:
+    """
+    本地 token 计数：优先使用 tiktoken，不可用 (未安装 / 编码文件无法下载) 时使用字符估算
+    首次加载编码可能需要联网下载，服务启动时通过 preload() 在线程中完成；
+    事件循环中尚未加载完成时先用字符估算，不在请求路径上同步下载。
+    """
+
+    _encoding = None
+    _failed = PROMPT_TOKENIZER == "heuristic"
+    _loading: Optional[asyncio.Task] = None
+
+    @classmethod
+    def load(cls) -> None:
+        """同步加载 tiktoken 编码 (可能阻塞，不要在事件循环中直接调用)"""
+        if cls._encoding is not None or cls._failed:
+            return
+        try:
+            import tiktoken
+            cls._encoding = tiktoken.get_encoding(PROMPT_TOKENIZER)
+        except Exception as e:
+            print(f"⚠️ [PromptBuilder] tiktoken 不可用，使用字符估算 token: {str(e)[:100]}")
+            cls._failed = True
+
+    @classmethod
+    async def preload(cls) -> None:
+        """在线程中加载编码 (服务启动时调用)"""
+        await asyncio.to_thread(cls.load)
+
+    @classmethod
+    def _get_encoding(cls):
+        if cls._encoding is None and not cls._failed:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                # 没有事件循环 (脚本 / 离线任务)：直接加载
+                cls.load()
+            else:
+                if cls._loading is None:
+                    cls._loading = loop.create_task(cls.preload())
+        return cls._encoding
+
+    @staticmethod
+    def estimate(text: str) -> int:
+        """估算：中日韩字符按 1 token，其余按 4 字符 1 token (偏保守)"""
+        cjk = len(_CJK_RE.findall(text))
+        return cjk + (len(text) - cjk + 3) // 4
+
+    @classmethod
+    def count(cls, text: str) -> int:
+        if not text:
+            return 0
+        encoding = cls._get_encoding()
+        if encoding is not None:
+            return len(encoding.encode(text, disallowed_special=()))
+        return cls.estimate(text)
+
+
+def get_token_budget(model_name: Optional[str]) -> int:
+    """按模型名前缀 (最长匹配) 取提示词 token 预算"""
+    name = (model_name or "").lower()
+    matches = [prefix for prefix in PROMPT_TOKEN_BUDGETS if name.startswith(prefix)]
+    if not matches:
+        return PROMPT_TOKEN_BUDGET_DEFAULT
+    return PROMPT_TOKEN_BUDGETS[max(matches, key=len)]
+
+
+# ---------- 裁剪策略：(文本, 最大 token 数) -> 不超过预算的文本 ----------
+
+def fit_head(text: str, max_tokens: int) -> str:
+    """保留开头部分"""
+    if TokenCounter.count(text) <= max_tokens:
+        return text
+    if max_tokens <= 0:
+        return ""
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if TokenCounter.count(text[:mid]) + 2 <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    return text[:low] + "\n..." if low else ""
+
+
+def fit_tail(text: str, max_tokens: int) -> str:
+    """保留末尾部分"""
+    if TokenCounter.count(text) <= max_tokens:
+        return text
+    if max_tokens <= 0:
+        return ""
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if TokenCounter.count(text[-mid:]) + 2 <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    return "...\n" + text[-low:] if low else ""
+
+
+_TURN_RE = re.compile(r'^(?=(?:用户|助手|User|Assistant): )', re.M)
+
+
+def fit_history(text: str, max_tokens: int, assistant_chars: int = 300) -> str:
+    """
+    历史对话压缩：先截短较早的助手回复，再从最早的消息开始丢弃 (至少保留最近一问一答)，
+    仍超出时截短最近的回复，最后按 token 截取末尾
+    """
+    if TokenCounter.count(text) <= max_tokens:
+        return text
+    turns = [t for t in _TURN_RE.split(text) if t.strip()]
+
+    def shorten(turn: str, limit: int) -> str:
+        if turn.startswith(("助手: ", "Assistant: ")) and len(turn) > limit:
+            return turn[:limit].rstrip() + "...\n"
+        return turn
+
+    compressed = [shorten(t, assistant_chars) for t in turns[:-1]] + turns[-1:]
+    while len(compressed) > 2 and TokenCounter.count("".join(compressed)) > max_tokens:
+        compressed.pop(0)
+    if TokenCounter.count("".join(compressed)) > max_tokens:
+        compressed = [shorten(t, assistant_chars) for t in compressed]
+    result = "".join(compressed).rstrip("\n")
+    return fit_tail(result, max_tokens)
+
+
+_SAMPLE_RE = re.compile(r'\n\n/\*\n样本数据 \([^)]*\):\n.*?\n\*/', re.S)
+_TABLE_SPLIT_RE = re.compile(r'\n\n(?=CREATE TABLE)', re.I)
+_TABLE_NAME_RE = re.compile(r'CREATE TABLE\s+(?:IF NOT EXISTS\s+)?[`"]?([\w$.]+)[`"]?', re.I)
+
+
+def fit_schema(text: str, max_tokens: int) -> str:
+    """
+    Schema 压缩：先去掉样本数据，再从末尾开始整表省略 (保留被省略的表名，
+    SchemaRetriever 已把相关度高的表排在前面)
+    """
+    if TokenCounter.count(text) <= max_tokens:
+        return text
+    text = _SAMPLE_RE.sub("", text)
+    if TokenCounter.count(text) <= max_tokens:
+        return text
+    blocks = _TABLE_SPLIT_RE.split(text)
+    omitted: List[str] = []
+    while len(blocks) > 1:
+        dropped = blocks.pop()
+        omitted[:0] = _TABLE_NAME_RE.findall(dropped)[:1] or []
+        note = f"\n\n-- 因长度省略的表 (schema omitted): {', '.join(omitted)}" if omitted else ""
+        candidate = "\n\n".join(blocks) + note
+        if TokenCounter.count(candidate) <= max_tokens:
+            return candidate
+    return fit_head(blocks[0], max_tokens)
+
+
+_STRATEGIES: Dict[str, Callable[[str, int], str]] = {
+    "head": fit_head,
+    "tail": fit_tail,
+    "history": fit_history,
+    "schema": fit_schema,
+}
+
+
+class _Section:
+    def __init__(self, key: str, text: str, priority: int, strategy: str, min_tokens: int):
+        self.key = key
+        self.text = text or ""
+        self.priority = priority
+        self.strategy = strategy
+        self.min_tokens = min_tokens
+        self.original_tokens = TokenCounter.count(self.text)
+        self.tokens = self.original_tokens
+
+
+class _Breakdown:
+    """分段 token 明细，仅在日志真正输出时才拼接"""
+    __slots__ = ("sections",)
+
+    def __init__(self, sections: Dict[str, Dict[str, int]]):
+        self.sections = sections
+
+    def __str__(self) -> str:
+        return " ".join(
+            f"{key}={s['tokens']}" + (f"(原 {s['original']}, 已压缩)" if s["tokens"] < s["original"] else "")
+            for key, s in self.sections.items()
+        )
+
+
+class PromptBuilder:
+    """
+    用法：
+        builder = PromptBuilder("SQL_GENERATION", budget)
+        builder.section("schema", schema, priority=3, strategy="schema")
+        builder.section("history", history, priority=1, strategy="history")
+        prompt = builder.build(template, question=question, ...)
+    未登记为 section 的模板字段视为固定内容，不参与裁剪。
+    """
+
+    def __init__(self, name: str, budget: int):
+        self.name = name
+        self.budget = budget
+        self._sections: List[_Section] = []
+        self.report: Dict[str, object] = {}
+
+    def section(self, key: str, text: str, priority: int = 0, strategy: str = "head", min_tokens: int = 0) -> "PromptBuilder":
+        self._sections.append(_Section(key, text, priority, strategy, min_tokens))
+        return self
+
+    def build(self, template: str, **fields) -> str:
+        return self._build([template], fields)[0]
+
+    def build_split(self, prefix_template: str, suffix_template: str, **fields) -> Tuple[str, str]:
+        """
+        分别渲染稳定前缀与可变后缀 (两部分共用一个预算)
+        前缀放在请求最前面，便于命中模型供应商的提示词前缀缓存。
+        """
+        prefix, suffix = self._build([prefix_template, suffix_template], fields)
+        return prefix, suffix
+
+    def _build(self, templates: List[str], fields: Dict[str, object]) -> List[str]:
+        empty = {s.key: "" for s in self._sections}
+        base_tokens = sum(TokenCounter.count(t.format(**fields, **empty)) for t in templates)
+        total = base_tokens + sum(s.tokens for s in self._sections)
+
+        # 从优先级最低的段落开始，裁剪到刚好满足预算为止
+        for section in sorted(self._sections, key=lambda s: s.priority):
+            if total <= self.budget:
+                break
+            target = max(section.min_tokens, section.tokens - (total - self.budget))
+            if target >= section.tokens:
+                continue
+            section.text = _STRATEGIES[section.strategy](section.text, target)
+            new_tokens = TokenCounter.count(section.text)
+            total -= section.tokens - new_tokens
+            section.tokens = new_tokens
+
+        values = {s.key: s.text for s in self._sections}
+        rendered = [t.format(**fields, **values) for t in templates]
+        self.report = {
+            "name": self.name,
+            "budget": self.budget,
+            "total": total,
+            "base": base_tokens,
+            "sections": {
+                s.key: {"tokens": s.tokens, "original": s.original_tokens} for s in self._sections
+            }
+        }
+        breakdown = _Breakdown(self.report["sections"])
+        if total > self.budget:
+            logger.warning("⚠️ [PromptBuilder] %s | %s/%s tokens | 模板=%s %s | 仍超出预算",
+                           self.name, total, self.budget, base_tokens, breakdown)
+        else:
+            logger.debug("🧮 [PromptBuilder] %s | %s/%s tokens | 模板=%s %s",
+                         self.name, total, self.budget, base_tokens, breakdown)
+        return rendered
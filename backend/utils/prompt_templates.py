@@ -4,22 +4,9 @@ Prompt 模板管理 - 支持多语言 (ZH/EN)
 
 # ==================== ZH Prompts ====================
 
-SQL_GENERATION_PROMPT_ZH = """你是一个专业的数据分析助手，可以将用户的自然语言转换为 SQL 查询。
-
-【当前数据库】
-{database_name}
-{database_type_info}
-【数据库版本】
-{database_version}
-
-【数据库详细信息 (Schema & 样本数据)】
-{schema}
-
-【参考知识库内容 (RAG)】
-{knowledge_context}
-
-【对话历史】
-{history}
+# 提示词分为「稳定前缀」与「可变后缀」：前缀 (规则 + 数据库信息 + Schema) 对同一数据库的每次调用都相同，
+# 放在请求最前面以命中 DeepSeek / OpenAI 的自动前缀缓存和 Anthropic 的显式缓存；知识库、历史与问题放在后缀。
+SQL_GENERATION_PREFIX_ZH = """你是一个专业的数据分析助手，可以将用户的自然语言转换为 SQL 查询。
 
 【SQL 编写鲁棒性准则 - 极重要】
 1. **禁止硬编码最近日期**：如果用户提到"最近"，不要写死一个日期（如 '2025-01-01'）。请务必使用动态计算，例如：`WHERE order_date >= (SELECT DATE_SUB(MAX(order_date), INTERVAL 6 MONTH) FROM orders)`。
@@ -62,8 +49,6 @@ SQL_GENERATION_PROMPT_ZH = """你是一个专业的数据分析助手，可以
 - **map**: 当用户明确要求【地理地图、城市分布、地区热力图】时选择。SQL **必须**只按 `c.city` 分组（`GROUP BY c.city`），用 `AVG(c.latitude) AS latitude`、`AVG(c.longitude) AS longitude` 取城市平均坐标（同一城市不同客户坐标略有差异，若按 city+lat+lng 分组会产生大量重复点导致地图标签密集重叠），同时 SELECT 一个数值指标字段（如销售额、订单量）。
 - **table**: 当数据列数过多 (>4列) 或不符合上述特征时，选择 table。
 
-请根据用户的问题生成正确的 SQL 查询。
-
 重要规则 (绝对禁止违反)：
 1. 只允许生成 SELECT 语句进行数据查询。
 2. **严禁凭空想象表名**。你必须且只能使用下方【数据库详细信息】中明确列出的表。如果用户要求的需求在当前表中无法实现，请在 reasoning 中说明，并返回一个空的 sql 字段。
@@ -77,9 +62,29 @@ SQL_GENERATION_PROMPT_ZH = """你是一个专业的数据分析助手，可以
 6. 请务必仔细检查 Schema 中的外键关系，确保 JOIN 条件正确。
 7. 尽量在生成的 SQL 中包含对字段含义的理解。
 
+【当前数据库】
+{database_name}
+{database_type_info}
+【数据库版本】
+{database_version}
+
+【数据库详细信息 (Schema & 样本数据)】
+{schema}
+"""
+
+SQL_GENERATION_SUFFIX_ZH = """【参考知识库内容 (RAG)】
+{knowledge_context}
+
+【对话历史】
+{history}
+
+请根据用户的问题生成正确的 SQL 查询。
+
 用户问题：{question}
 """
 
+SQL_GENERATION_PROMPT_ZH = SQL_GENERATION_PREFIX_ZH + "\n" + SQL_GENERATION_SUFFIX_ZH
+
 INTENT_CLASSIFICATION_PROMPT_ZH = """你是一个智能助手，负责根据用户问题判断其意图。
 
 【核心背景】
@@ -96,55 +101,61 @@ INTENT_CLASSIFICATION_PROMPT_ZH = """你是一个智能助手，负责根据用
 输出：
 """
 
-PLAN_GENERATION_PROMPT_ZH = """你是一个专业的数据分析顾问。用户提出了一个分析需求，你需要根据现有的数据库表结构和提供的参考知识库内容，给出一个专业的分析方案供用户确认。
+PLAN_GENERATION_PREFIX_ZH = """你是一个专业的数据分析顾问。用户提出了一个分析需求，你需要根据现有的数据库表结构和提供的参考知识库内容，给出一个专业的分析方案供用户确认。
+
+【输出要求】
+1. 首先列出与该需求最相关的几张表或知识库内容（如上传的图片解析文本），并简要说明它们的作用。
+2. 给出你的分析思路：你打算如何关联这些数据？如果是数据库表，使用哪些字段？如果是知识库内容，如何从中提取信息并结合业务逻辑进行分析？
+3. 最后请明确询问用户："这个分析方案是否可以？如果确认，我将为您生成数据并分析。"
+4. **不要生成任何 SQL 语句**。
+5. 使用 Markdown 格式输出，确保清晰易读。
 
 【当前数据库】
 {database_name} ({database_type})
 
 【数据库表结构】
 {schema}
+"""
 
-【参考知识库内容 (RAG)】
+PLAN_GENERATION_SUFFIX_ZH = """【参考知识库内容 (RAG)】
 {knowledge_context}
 
 【对话历史】
 {history}
 
-【输出要求】
-1. 首先列出与该需求最相关的几张表或知识库内容（如上传的图片解析文本），并简要说明它们的作用。
-2. 给出你的分析思路：你打算如何关联这些数据？如果是数据库表，使用哪些字段？如果是知识库内容，如何从中提取信息并结合业务逻辑进行分析？
-3. 最后请明确询问用户："这个分析方案是否可以？如果确认，我将为您生成数据并分析。"
-4. **不要生成任何 SQL 语句**。
-5. 使用 Markdown 格式输出，确保清晰易读。
-
 用户需求：{question}
 """
 
-CHAT_RESPONSE_PROMPT_ZH = """你是一个智能数据分析助手的AI模型。
+PLAN_GENERATION_PROMPT_ZH = PLAN_GENERATION_PREFIX_ZH + "\n" + PLAN_GENERATION_SUFFIX_ZH
+
+CHAT_RESPONSE_PREFIX_ZH = """你是一个智能数据分析助手的AI模型。
 请根据你当前被赋予的角色，以及以下对话历史、数据库上下文和参考知识库内容，来回答用户的问题。
 
+【输出要求】
+以自然语言回答用户的问题。
+1. **核心指令**：如果【参考知识库内容 (RAG)】中有内容，请务必仔细阅读。如果其中包含用户需要的答案（如图片解析出的文本、表格等），请优先基于这些内容进行回答。
+2. 如果用户询问关于当前数据库、表结构或你能做什么，请如实回答。
+3. 如果问题是通用的闲聊或关于你自己的，请礼貌回答。
+4. 不要生成任何 SQL 语句。
+5. 不要提及自己是 AI 模型或受限。
+
 【当前数据库上下文】
 - 数据库名称: {database_name}
 - 数据库类型: {database_type}
 - 包含的表: {tables}
+"""
 
-【参考知识库内容 (RAG)】
+CHAT_RESPONSE_SUFFIX_ZH = """【参考知识库内容 (RAG)】
 {knowledge_context}
 
 【对话历史】
 {history}
 
-【输出要求】
-以自然语言回答用户的问题。
-1. **核心指令**：如果【参考知识库内容 (RAG)】中有内容，请务必仔细阅读。如果其中包含用户需要的答案（如图片解析出的文本、表格等），请优先基于这些内容进行回答。
-2. 如果用户询问关于当前数据库、表结构或你能做什么，请如实回答。
-3. 如果问题是通用的闲聊或关于你自己的，请礼貌回答。
-4. 不要生成任何 SQL 语句。
-5. 不要提及自己是 AI 模型或受限。
-
 用户问题：{question}
 """
 
+CHAT_RESPONSE_PROMPT_ZH = CHAT_RESPONSE_PREFIX_ZH + "\n" + CHAT_RESPONSE_SUFFIX_ZH
+
 SUMMARY_PROMPT_ZH = """你是一个专业的数据分析师，需要根据 SQL 查询结果生成自然语言总结。
 
 【查询结果】
@@ -230,22 +241,7 @@ VISUALIZATION_REPORT_PROMPT_ZH = r"""你是资深财务与数据分析专家。
 
 # ==================== EN Prompts ====================
 
-SQL_GENERATION_PROMPT_EN = """You are a professional data analysis assistant that can convert natural language questions into SQL queries.
-
-【Current Database】
-{database_name}
-{database_type_info}
-【Database Version】
-{database_version}
-
-【Database Details (Schema & Sample Data)】
-{schema}
-
-【Reference Knowledge (RAG)】
-{knowledge_context}
-
-【History】
-{history}
+SQL_GENERATION_PREFIX_EN = """You are a professional data analysis assistant that can convert natural language questions into SQL queries.
 
 【SQL Writing Robustness Guidelines - CRITICAL】
 1. **Never hardcode "recent" dates**: ALWAYS use dynamic functions.
@@ -273,9 +269,27 @@ JSON format only:
   "session_title": "Short title"
 }}
 
+【Current Database】
+{database_name}
+{database_type_info}
+【Database Version】
+{database_version}
+
+【Database Details (Schema & Sample Data)】
+{schema}
+"""
+
+SQL_GENERATION_SUFFIX_EN = """【Reference Knowledge (RAG)】
+{knowledge_context}
+
+【History】
+{history}
+
 Question: {question}
 """
 
+SQL_GENERATION_PROMPT_EN = SQL_GENERATION_PREFIX_EN + "\n" + SQL_GENERATION_SUFFIX_EN
+
 INTENT_CLASSIFICATION_PROMPT_EN = """Classify user intent (JSON only):
 - `sql_query`: DB query.
 - `confirmation`: Confirm plan.
@@ -284,14 +298,22 @@ INTENT_CLASSIFICATION_PROMPT_EN = """Classify user intent (JSON only):
 User: {question}
 """
 
-PLAN_GENERATION_PROMPT_EN = """Propose analysis plan.
-User: {question}
+PLAN_GENERATION_PREFIX_EN = """Propose analysis plan.
 """
 
-CHAT_RESPONSE_PROMPT_EN = """Answer user questions based on context.
-User: {question}
+PLAN_GENERATION_SUFFIX_EN = """User: {question}
 """
 
+PLAN_GENERATION_PROMPT_EN = PLAN_GENERATION_PREFIX_EN + PLAN_GENERATION_SUFFIX_EN
+
+CHAT_RESPONSE_PREFIX_EN = """Answer user questions based on context.
+"""
+
+CHAT_RESPONSE_SUFFIX_EN = """User: {question}
+"""
+
+CHAT_RESPONSE_PROMPT_EN = CHAT_RESPONSE_PREFIX_EN + CHAT_RESPONSE_SUFFIX_EN
+
 SUMMARY_PROMPT_EN = """Summarize SQL results.
 """
 
@@ -334,9 +356,15 @@ Input:
 PROMPTS = {
     "zh": {
         "SQL_GENERATION": SQL_GENERATION_PROMPT_ZH,
+        "SQL_GENERATION_PREFIX": SQL_GENERATION_PREFIX_ZH,
+        "SQL_GENERATION_SUFFIX": SQL_GENERATION_SUFFIX_ZH,
         "INTENT_CLASSIFICATION": INTENT_CLASSIFICATION_PROMPT_ZH,
         "PLAN_GENERATION": PLAN_GENERATION_PROMPT_ZH,
         "CHAT_RESPONSE": CHAT_RESPONSE_PROMPT_ZH,
+        "PLAN_GENERATION_PREFIX": PLAN_GENERATION_PREFIX_ZH,
+        "PLAN_GENERATION_SUFFIX": PLAN_GENERATION_SUFFIX_ZH,
+        "CHAT_RESPONSE_PREFIX": CHAT_RESPONSE_PREFIX_ZH,
+        "CHAT_RESPONSE_SUFFIX": CHAT_RESPONSE_SUFFIX_ZH,
         "SUMMARY": SUMMARY_PROMPT_ZH,
         "CHART_CONFIG": CHART_CONFIG_PROMPT_ZH,
         "SESSION_TITLE": SESSION_TITLE_PROMPT_ZH,
@@ -344,9 +372,15 @@ PROMPTS = {
     },
     "en": {
         "SQL_GENERATION": SQL_GENERATION_PROMPT_EN,
+        "SQL_GENERATION_PREFIX": SQL_GENERATION_PREFIX_EN,
+        "SQL_GENERATION_SUFFIX": SQL_GENERATION_SUFFIX_EN,
         "INTENT_CLASSIFICATION": INTENT_CLASSIFICATION_PROMPT_EN,
         "PLAN_GENERATION": PLAN_GENERATION_PROMPT_EN,
         "CHAT_RESPONSE": CHAT_RESPONSE_PROMPT_EN,
+        "PLAN_GENERATION_PREFIX": PLAN_GENERATION_PREFIX_EN,
+        "PLAN_GENERATION_SUFFIX": PLAN_GENERATION_SUFFIX_EN,
+        "CHAT_RESPONSE_PREFIX": CHAT_RESPONSE_PREFIX_EN,
+        "CHAT_RESPONSE_SUFFIX": CHAT_RESPONSE_SUFFIX_EN,
         "SUMMARY": SUMMARY_PROMPT_EN,
         "CHART_CONFIG": CHART_CONFIG_PROMPT_EN,
         "SESSION_TITLE": SESSION_TITLE_PROMPT_EN,
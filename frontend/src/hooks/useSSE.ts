@@ -108,6 +108,7 @@ export function useSSE() {
       let assistantChartCfg = ''
       let assistantModelThinking = ''
       let assistantData: any = null
+      let streamedRows: Record<string, any>[] = []   // sql_result_batch 逐批到达的行
       let assistantMessageId = generateId()
       let assistantMessageAdded = false
       let scientistSql = ''
@@ -739,11 +740,26 @@ export function useSSE() {
                   setCurrentSql(assistantSql)
                   handlers?.onSqlGenerated?.(eventData.sql)
                   break
-                case 'sql_result':
-                  assistantData = eventData
-                  setSqlResult(eventData)
-                  handlers?.onSqlResult?.(eventData)
+                case 'sql_result_batch': {
+                  // offset 为 0 表示重新开始 (上一次执行失败后重试)
+                  if (!eventData.offset) streamedRows = []
+                  const batchColumns: string[] = eventData.columns || []
+                  for (const row of eventData.rows || []) {
+                    const record: Record<string, any> = {}
+                    batchColumns.forEach((col, i) => { record[col] = row[i] })
+                    streamedRows.push(record)
+                  }
                   break
+                }
+                case 'sql_result': {
+                  // streamed: 行数据已通过 sql_result_batch 发送，这里只有元数据
+                  const { streamed, ...meta } = eventData
+                  const fullResult = streamed ? { ...meta, rows: streamedRows } : eventData
+                  assistantData = fullResult
+                  setSqlResult(fullResult)
+                  handlers?.onSqlResult?.(fullResult)
+                  break
+                }
                 case 'execution_result':
                   // 科学家模式专用：包含 plot_image_base64 / is_data_science / can_generate_report
                   assistantData = eventData
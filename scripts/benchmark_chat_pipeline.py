@@ -0,0 +1,246 @@
+"""
+benchmark_chat_pipeline.py — 使用 Mock LLM 离线测量聊天各模式的分阶段延迟
+
+直接驱动 routers/chat_router.py 中的 run_standard_mode / run_thinking_mode / run_rag_mode / run_scientist_mode，
+LLM 全部替换为 ModelProvider.MOCK (回放 backend/tests/fixtures/mock_llm_responses.json)，
+数据库使用本地 MySQL / PostgreSQL (会话库 + config.DATABASES 中的业务库)。
+
+每个模式按场景执行若干轮对话 (standard / thinking / rag：提问 -> 方案，"可以" -> 执行 SQL；scientist：单轮分析)，
+统计每一轮各阶段 (首个事件、首 token、sql_generated、sql_result、chart_ready、done、total) 的 p50 / p95 / p99。
+
+用法：
+  python scripts/benchmark_chat_pipeline.py --db classic_business --iterations 20 --concurrency 4
+  python scripts/benchmark_chat_pipeline.py --modes standard,thinking --output bench.json
+  python scripts/benchmark_chat_pipeline.py --baseline bench.json --tolerance 0.2   # 相对基线退化超过 20% 时退出码为 1
+  python scripts/benchmark_chat_pipeline.py --thresholds scripts/benchmark_thresholds.json  # 绝对阈值 (毫秒)
+
+需要 --user-id 对应的用户已存在 (可用 scripts/seed_test_user.py 创建)。
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT_DIR / 'backend'))
+
+QUESTION = "各城市的销售额分别是多少？"
+SAMPLE_ROWS = [
+    {"city": city, "sales": sales}
+    for city, sales in [("Shanghai", 182000), ("Beijing", 164500), ("Shenzhen", 120300), ("Hangzhou", 98700), ("Chengdu", 76400)]
+]
+# 模式 -> [(轮次名, ChatRequest 额外字段, 问题)]
+SCENARIOS = {
+    "standard": [("plan", {}, QUESTION), ("execute", {}, "可以")],
+    "thinking": [("plan", {"enable_thinking": True}, QUESTION), ("execute", {"enable_thinking": True}, "可以")],
+    "rag": [("plan", {"enable_rag": True}, QUESTION), ("execute", {"enable_rag": True}, "可以")],
+    "scientist": [("analysis", {"enable_data_science_agent": True, "external_data": SAMPLE_ROWS}, "比较各城市的销售额")],
+}
+TRACKED_EVENTS = ("sql_generated", "sql_result", "execution_result", "chart_ready", "done")
+PERCENTILES = (50, 95, 99)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="聊天链路离线延迟基准测试 (Mock LLM)")
+    parser.add_argument("--modes", default="standard,thinking,rag,scientist", help="逗号分隔：standard,thinking,rag,scientist")
+    parser.add_argument("--db", default="classic_business", help="业务数据库 key (config.DATABASES)")
+    parser.add_argument("--user-id", type=int, default=1)
+    parser.add_argument("--iterations", type=int, default=10, help="每个模式执行的场景次数")
+    parser.add_argument("--concurrency", type=int, default=1, help="同时进行的场景数")
+    parser.add_argument("--ttft", type=float, default=0.4, help="Mock LLM 首 token 延迟 (秒)")
+    parser.add_argument("--tps", type=float, default=60, help="Mock LLM 输出速率 (token/秒)")
+    parser.add_argument("--responses", help="自定义录制响应文件")
+    parser.add_argument("--with-cache", action="store_true", help="保留语义 SQL 缓存与查询结果缓存 (默认关闭以测量完整链路)")
+    parser.add_argument("--output", help="把结果写入 JSON 文件 (可作为之后的 --baseline)")
+    parser.add_argument("--baseline", help="基线结果 JSON")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="相对基线允许的退化比例")
+    parser.add_argument("--thresholds", help="绝对阈值 JSON：{\"standard/execute\": {\"total\": {\"p95\": 8000}}}")
+    parser.add_argument("--keep-sessions", action="store_true", help="保留测试产生的会话")
+    return parser.parse_args()
+
+
+def configure_env(args):
+    """必须在导入后端模块之前调用 (config 在导入时读取环境变量)"""
+    os.environ["DEFAULT_LLM_PROVIDER"] = "mock"
+    os.environ["LLM_FAILOVER_ENABLED"] = "false"  # 不对冲 / 切换到真实供应商
+    os.environ["MOCK_LLM_TTFT"] = str(args.ttft)
+    os.environ["MOCK_LLM_TOKENS_PER_SECOND"] = str(args.tps)
+    if args.responses:
+        os.environ["MOCK_LLM_RESPONSES_PATH"] = str(Path(args.responses).resolve())
+    if not args.with_cache:
+        os.environ["SQL_SEMANTIC_CACHE_ENABLED"] = "false"
+        os.environ["SQL_RESULT_CACHE_ENABLED"] = "false"
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    low = int(position)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+
+async def run_turn(mode, request, current_user, db_key):
+    """执行一轮请求并记录各事件首次出现的时间 (毫秒，自请求开始)"""
+    from routers import chat_router
+
+    started = time.perf_counter()
+    elapsed = lambda: (time.perf_counter() - started) * 1000
+    if mode == "scientist":
+        response = await chat_router.run_scientist_mode(request, current_user)
+    else:
+        handler = {"standard": chat_router.run_standard_mode, "thinking": chat_router.run_thinking_mode, "rag": chat_router.run_rag_mode}[mode]
+        response = await handler(request, current_user, db_key)
+
+    marks, error = {}, None
+    async for raw in response.body_iterator:
+        now = elapsed()
+        for line in raw.splitlines():
+            if not line.startswith("data: "):
+                continue
+            payload = json.loads(line[len("data: "):])
+            event = payload.get("event")
+            marks.setdefault("first_event", now)
+            if event in ("summary", "model_thinking"):
+                marks.setdefault("first_token", now)
+            if event in TRACKED_EVENTS:
+                marks.setdefault(event, now)
+            if event == "error":
+                error = payload.get("data", {}).get("content") or payload.get("data", {}).get("message")
+    marks["total"] = elapsed()
+    return marks, error
+
+
+async def run_scenario(mode, args, samples, errors):
+    from database.session_db import session_db
+    from models.message import ChatRequest
+    from services.schema_service import SchemaService
+    from services.user_context import set_current_user_id
+
+    set_current_user_id(args.user_id)
+    db_key = SchemaService.use_database(args.db)
+    session_id = await session_db.create_session(args.user_id, title=f"benchmark-{mode}", database_key=args.db)
+    current_user = {"id": args.user_id}
+    parent_id = None
+    try:
+        for turn, extra, question in SCENARIOS[mode]:
+            request = ChatRequest(session_id=session_id, question=question, parent_id=parent_id, model_provider="mock", **extra)
+            marks, error = await run_turn(mode, request, current_user, db_key)
+            key = f"{mode}/{turn}"
+            if error:
+                errors[key].append(error)
+                break
+            samples[key].append(marks)
+            latest = await session_db.get_messages(session_id)
+            parent_id = latest[-1]["id"] if latest else None
+    finally:
+        if not args.keep_sessions:
+            await asyncio.sleep(0.5)  # 等待后台的自动标题任务结束
+            await session_db.delete_session(session_id, args.user_id)
+
+
+def summarize(samples, errors):
+    results = {}
+    for key in sorted(set(samples) | set(errors)):
+        stages = defaultdict(list)
+        for marks in samples.get(key, []):
+            for stage, value in marks.items():
+                stages[stage].append(value)
+        results[key] = {
+            "count": len(samples.get(key, [])),
+            "errors": len(errors.get(key, [])),
+            "stages": {
+                stage: {f"p{q}": round(percentile(values, q), 1) for q in PERCENTILES}
+                for stage, values in stages.items()
+            },
+        }
+    return results
+
+
+def print_report(results):
+    print(f"\n{'轮次':<22}{'阶段':<18}" + "".join(f"{'p' + str(q) + ' (ms)':>14}" for q in PERCENTILES) + f"{'样本':>8}")
+    order = ["first_event", "first_token", *TRACKED_EVENTS, "total"]
+    for key, result in results.items():
+        stages = sorted(result["stages"], key=lambda s: order.index(s) if s in order else len(order))
+        for i, stage in enumerate(stages):
+            values = result["stages"][stage]
+            label = key if i == 0 else ""
+            count = f"{result['count']}" + (f" (失败 {result['errors']})" if result["errors"] and i == 0 else "")
+            print(f"{label:<22}{stage:<18}" + "".join(f"{values[f'p{q}']:>14.1f}" for q in PERCENTILES) + f"{count if i == 0 else '':>8}")
+
+
+def check_regressions(results, baseline=None, tolerance=0.2, thresholds=None):
+    """返回违规列表：相对基线退化超过 tolerance，或超过绝对阈值"""
+    violations = []
+    for key, result in results.items():
+        for stage, values in result["stages"].items():
+            for pct, value in values.items():
+                base = (((baseline or {}).get(key) or {}).get("stages", {}).get(stage) or {}).get(pct)
+                if base and value > base * (1 + tolerance):
+                    violations.append(f"{key} {stage} {pct}: {value:.0f}ms > 基线 {base:.0f}ms × {1 + tolerance:.2f}")
+                limit = (((thresholds or {}).get(key) or {}).get(stage) or {}).get(pct)
+                if limit and value > limit:
+                    violations.append(f"{key} {stage} {pct}: {value:.0f}ms > 阈值 {limit:.0f}ms")
+        if result["errors"]:
+            violations.append(f"{key}: {result['errors']} 次请求失败")
+    return violations
+
+
+async def main():
+    args = parse_args()
+    configure_env(args)
+
+    from database.session_db import session_db
+    await session_db.init_db()
+
+    modes = [m.strip() for m in args.modes.split(",") if m.strip() in SCENARIOS]
+    print(f"🏁 [Benchmark] 模式: {modes} | 每模式 {args.iterations} 次 | 并发 {args.concurrency} | "
+          f"Mock TTFT={args.ttft}s, {args.tps} token/s | 缓存: {'开启' if args.with_cache else '关闭'}")
+
+    samples, errors = defaultdict(list), defaultdict(list)
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def guarded(mode):
+        async with semaphore:
+            try:
+                await run_scenario(mode, args, samples, errors)
+            except Exception as e:
+                errors[f"{mode}/setup"].append(str(e))
+                print(f"❌ [Benchmark] {mode} 场景执行失败: {e}")
+
+    for mode in modes:
+        started = time.perf_counter()
+        await asyncio.gather(*(guarded(mode) for _ in range(args.iterations)))
+        print(f"✅ [Benchmark] {mode} 完成，用时 {time.perf_counter() - started:.1f}s")
+
+    results = summarize(samples, errors)
+    print_report(results)
+
+    for key, messages in errors.items():
+        print(f"⚠️ {key} 失败示例: {messages[0][:200]}")
+
+    if args.output:
+        report = {"config": {k: v for k, v in vars(args).items() if k not in ("output", "baseline", "thresholds")}, "results": results}
+        Path(args.output).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"💾 结果已写入 {args.output}")
+
+    baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))["results"] if args.baseline else None
+    thresholds = json.loads(Path(args.thresholds).read_text(encoding="utf-8")) if args.thresholds else None
+    violations = check_regressions(results, baseline, args.tolerance, thresholds)
+    if violations:
+        print("\n❌ 性能退化 / 超出阈值:")
+        for v in violations:
+            print(f"   - {v}")
+        sys.exit(1)
+    if baseline or thresholds:
+        print("\n✅ 未发现性能退化")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,125 @@
+"""
+eval_intent_classifier.py — 用历史消息离线评估 (并可重新训练) 本地意图分类器
+
+标签来自会话历史 (弱标注)：
+  - 助手回复带 SQL，且上一轮是方案 (无 SQL 的回复)  -> confirmation
+  - 助手回复带 SQL，其余情况 (语义缓存命中等)        -> sql_query
+  - 助手回复无 SQL，且下一轮用户确认后产出了 SQL      -> sql_query (生成了方案)
+  - 其余                                            -> chat
+
+用法：
+  python scripts/eval_intent_classifier.py            # 评估当前模型
+  python scripts/eval_intent_classifier.py --train    # 用 80% 历史训练、20% 评估，并保存模型
+  python scripts/eval_intent_classifier.py --train --all  # 用全部历史训练并保存
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT_DIR / 'backend'))
+
+from sqlalchemy import text
+from config import INTENT_CLASSIFIER_THRESHOLD
+from database.session_db import session_db
+from services.intent_classifier import IntentClassifier, LABELS
+
+
+def label_session(messages):
+    """按时间顺序的一条会话消息 -> [(问题, 弱标签)]"""
+    samples = []
+    for i, msg in enumerate(messages):
+        if msg.role != "user" or i + 1 >= len(messages) or messages[i + 1].role != "assistant":
+            continue
+        reply = messages[i + 1]
+        if reply.sql:
+            prev = messages[i - 1] if i > 0 else None
+            after_plan = prev is not None and prev.role == "assistant" and not prev.sql
+            samples.append((msg.content, "confirmation" if after_plan else "sql_query"))
+        else:
+            follow = messages[i + 3] if i + 3 < len(messages) else None
+            planned = (
+                follow is not None and follow.role == "assistant" and follow.sql
+                and messages[i + 2].role == "user"
+            )
+            samples.append((msg.content, "sql_query" if planned else "chat"))
+    return samples
+
+
+async def load_samples():
+    await session_db.init_db()
+    async with session_db.async_session() as session:
+        result = await session.execute(text(
+            "SELECT session_id, role, content, `sql` FROM messages "
+            "WHERE is_current = 1 ORDER BY session_id, created_at ASC"
+        ))
+        rows = result.fetchall()
+    sessions = defaultdict(list)
+    for row in rows:
+        sessions[row.session_id].append(row)
+    samples = []
+    for messages in sessions.values():
+        samples.extend(label_session(messages))
+    return samples
+
+
+def evaluate(classifier, samples, threshold):
+    confusion = Counter()
+    covered = correct_covered = correct = 0
+    started = time.perf_counter()
+    for question, label in samples:
+        predicted, confidence = classifier.predict(question)
+        confusion[(label, predicted)] += 1
+        correct += predicted == label
+        if confidence >= threshold:
+            covered += 1
+            correct_covered += predicted == label
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    total = len(samples) or 1
+    print(f"📊 样本数: {len(samples)} | 平均耗时: {elapsed_ms / total:.3f} ms/条")
+    print(f"   整体准确率: {correct / total:.1%}")
+    print(f"   本地覆盖率 (置信度 >= {threshold}): {covered / total:.1%}"
+          f" | 覆盖部分准确率: {(correct_covered / covered if covered else 0):.1%}")
+    print("   混淆矩阵 (行: 标签, 列: 预测)")
+    print("   " + "".join(f"{p:>14}" for p in LABELS))
+    for actual in LABELS:
+        print(f"   {actual:<12}" + "".join(f"{confusion[(actual, p)]:>14}" for p in LABELS))
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="离线评估本地意图分类器")
+    parser.add_argument("--train", action="store_true", help="用历史消息重新训练并保存模型")
+    parser.add_argument("--all", action="store_true", help="训练时使用全部样本 (不留出评估集)")
+    parser.add_argument("--threshold", type=float, default=INTENT_CLASSIFIER_THRESHOLD)
+    args = parser.parse_args()
+
+    samples = await load_samples()
+    print(f"🔍 从会话历史中得到 {len(samples)} 条弱标注样本: {dict(Counter(l for _, l in samples))}")
+    if not samples:
+        print("⚠️ 没有可用的历史消息")
+        return
+
+    classifier = IntentClassifier()
+    if not args.train:
+        classifier.ensure_loaded()
+        evaluate(classifier, samples, args.threshold)
+        return
+
+    random.Random(2025).shuffle(samples)
+    if args.all:
+        train_set, test_set = samples, samples
+    else:
+        split = int(len(samples) * 0.8)
+        train_set, test_set = samples[:split], samples[split:]
+    classifier.train(train_set)
+    evaluate(classifier, test_set, args.threshold)
+    classifier.save()
+    print(f"✅ 模型已保存到 {classifier.model_path}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())